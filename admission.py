@@ -0,0 +1,196 @@
+"""
+FightMyTicket — Controle d'admission des routes couteuses (api.py)
+Par route: nombre de requetes simultanees borne, file d'attente bornee avec delai
+maximum (FIFO), et seau de jetons par client (user_id du JWT, sinon IP).
+Refus rapide au lieu d'empiler: 429 (quota client) ou 503 (capacite), avec Retry-After.
+
+    controle = Admission(REGLES)
+    jeton = controle.entrer("/api/analyze", cle_client)   # leve Refus
+    ...
+    controle.sortir(jeton)
+
+Regle: {"concurrence", "file", "attente_s", "par_minute", "rafale"} — par_minute=0: pas de quota.
+Configuration: ADMISSION_ENABLED=0 desactive, ADMISSION_CONFIG='{"/api/analyze": {"concurrence": 2}}'
+surcharge les regles. Les limites sont par process (serveur Flask threade).
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from agents import metrics
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") != "0"
+
+ADM_EN_COURS = metrics.jauge("admission_in_flight", "Requetes admises en cours par route", ("route",))
+ADM_EN_FILE = metrics.jauge("admission_queued", "Requetes en file d'attente par route", ("route",))
+ADM_ATTENTE = metrics.histogramme("admission_wait_seconds", "Temps passe en file avant admission", ("route",),
+                                  buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+ADM_REFUS = metrics.compteur("admission_rejected_total", "Requetes refusees par le controle d'admission",
+                             ("route", "reason"))
+
+
+class Refus(Exception):
+    """status: 429 (quota client) ou 503 (file pleine / delai depasse); retry_after en secondes."""
+
+    def __init__(self, status, raison, retry_after):
+        super().__init__(raison)
+        self.status = status
+        self.raison = raison
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+# ═══════════════════════════════════════════════════════════
+# CONCURRENCE + FILE D'ATTENTE
+# ═══════════════════════════════════════════════════════════
+
+class Limiteur:
+
+    def __init__(self, route, concurrence, file, attente_s):
+        self.route = route
+        self.concurrence = concurrence
+        self.file_max = file
+        self.attente_s = attente_s
+        self.actifs = 0
+        self._file = deque()
+        self._verrou = threading.Lock()
+        self._duree_moy = None      # moyenne mobile du temps de service (Retry-After)
+
+    def acquerir(self):
+        """Retourne le temps d'attente (s) une fois admis; leve Refus(503) sinon."""
+        with self._verrou:
+            if self.actifs < self.concurrence and not self._file:
+                self.actifs += 1
+                self._publier()
+                return 0.0
+            if len(self._file) >= self.file_max:
+                raise Refus(503, "file_pleine", self._estimer_retry())
+            ev = threading.Event()
+            self._file.append(ev)
+            self._publier()
+        debut = time.perf_counter()
+        ev.wait(self.attente_s)
+        with self._verrou:
+            if ev.is_set():
+                # Place transmise par liberer() (actifs deja compte)
+                return time.perf_counter() - debut
+            self._file.remove(ev)
+            self._publier()
+            raise Refus(503, "delai_depasse", self._estimer_retry())
+
+    def liberer(self, duree):
+        with self._verrou:
+            self._duree_moy = duree if self._duree_moy is None else 0.8 * self._duree_moy + 0.2 * duree
+            if self._file:
+                self._file.popleft().set()
+            else:
+                self.actifs -= 1
+            self._publier()
+
+    def _estimer_retry(self):
+        # Temps pour ecouler la file actuelle au debit observe
+        duree = self._duree_moy or 1.0
+        return duree * (len(self._file) + 1) / max(self.concurrence, 1)
+
+    def _publier(self):
+        ADM_EN_COURS.set(self.actifs, route=self.route)
+        ADM_EN_FILE.set(len(self._file), route=self.route)
+
+    def etat(self):
+        with self._verrou:
+            return {"en_cours": self.actifs, "en_file": len(self._file), "concurrence": self.concurrence,
+                    "file_max": self.file_max, "attente_s": self.attente_s,
+                    "duree_moy_s": round(self._duree_moy, 2) if self._duree_moy is not None else None}
+
+
+# ═══════════════════════════════════════════════════════════
+# QUOTA PAR CLIENT (seau de jetons)
+# ═══════════════════════════════════════════════════════════
+
+class SeauxJetons:
+    MAX_CLES = 20000
+
+    def __init__(self, par_minute, rafale):
+        self.debit = par_minute / 60.0
+        self.capacite = max(rafale, 1)
+        self._seaux = {}            # cle -> [jetons, dernier_ts]
+        self._verrou = threading.Lock()
+
+    def prendre(self, cle):
+        """None si un jeton est pris, sinon secondes avant le prochain jeton."""
+        now = time.monotonic()
+        with self._verrou:
+            s = self._seaux.get(cle)
+            if s is None:
+                if len(self._seaux) >= self.MAX_CLES:
+                    self._purger(now)
+                s = self._seaux[cle] = [float(self.capacite), now]
+            else:
+                s[0] = min(self.capacite, s[0] + (now - s[1]) * self.debit)
+                s[1] = now
+            if s[0] >= 1.0:
+                s[0] -= 1.0
+                return None
+            return (1.0 - s[0]) / self.debit
+
+    def _purger(self, now):
+        # Seaux pleins = clients inactifs: rien a retenir
+        pleins = [c for c, (j, t) in self._seaux.items()
+                  if j + (now - t) * self.debit >= self.capacite]
+        for c in pleins:
+            del self._seaux[c]
+        if len(self._seaux) >= self.MAX_CLES:
+            self._seaux.clear()
+
+
+# ═══════════════════════════════════════════════════════════
+# CONTROLEUR
+# ═══════════════════════════════════════════════════════════
+
+class Admission:
+
+    def __init__(self, regles):
+        regles = {r: dict(v) for r, v in regles.items()}
+        try:
+            for route, surcharge in json.loads(os.environ.get("ADMISSION_CONFIG") or "{}").items():
+                regles.setdefault(route, {}).update(surcharge)
+        except (ValueError, AttributeError) as e:
+            print(f"  [!] ADMISSION_CONFIG invalide, ignore: {e}")
+        self.regles = regles
+        self._limiteurs = {}
+        self._seaux = {}
+        for route, r in regles.items():
+            self._limiteurs[route] = Limiteur(route, r.get("concurrence", 4), r.get("file", 8),
+                                              r.get("attente_s", 10))
+            if r.get("par_minute"):
+                self._seaux[route] = SeauxJetons(r["par_minute"], r.get("rafale", r["par_minute"]))
+
+    def couvre(self, route):
+        return ADMISSION_ENABLED and route in self._limiteurs
+
+    def entrer(self, route, cle):
+        """Admet la requete (bloque au plus attente_s) -> jeton pour sortir(); leve Refus."""
+        seaux = self._seaux.get(route)
+        if seaux is not None and cle is not None:
+            attente = seaux.prendre(cle)
+            if attente is not None:
+                ADM_REFUS.inc(route=route, reason="quota")
+                raise Refus(429, "quota", attente)
+        try:
+            attendu = self._limiteurs[route].acquerir()
+        except Refus as r:
+            ADM_REFUS.inc(route=route, reason=r.raison)
+            raise
+        ADM_ATTENTE.observe(attendu, route=route)
+        return (route, time.perf_counter())
+
+    def sortir(self, jeton):
+        route, debut = jeton
+        self._limiteurs[route].liberer(time.perf_counter() - debut)
+
+    def etat(self):
+        return {route: dict(l.etat(), par_minute=self.regles[route].get("par_minute", 0))
+                for route, l in self._limiteurs.items()}
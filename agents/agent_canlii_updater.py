@@ -144,6 +144,25 @@ def main():
         except Exception:
             pass
 
+    # Indexer les articles cites des nouveaux dossiers (jurisprudence_articles)
+    if new_imported:
+        try:
+            import psycopg2
+            sys.path.insert(0, PROJECT_DIR)
+            from agents.base_agent import PG_CONFIG
+            from agents.article_citations import indexer_jurisprudence
+            conn = psycopg2.connect(**PG_CONFIG)
+            indexed = 0
+            while True:
+                n = indexer_jurisprudence(conn, limit=2000)
+                if not n:
+                    break
+                indexed += n
+            conn.close()
+            log(f"[OK] Articles indexes: {indexed} dossiers")
+        except Exception as e:
+            log(f"[WARN] Index articles: {e}")
+
     # Sauvegarder l'état
     state["last_run"] = datetime.now().isoformat()
     state["last_exit_code"] = exit_code
@@ -10,6 +10,7 @@ import re
 import time
 from datetime import datetime
 from agents.base_agent import BaseAgent
+from agents.catalogue_lois import get_catalogue
 
 
 # ═══════════════════════════════════════════════════════════
@@ -43,6 +44,18 @@ CHAMPS_OBLIGATOIRES_ON = {
     "nom_conducteur":  {"label": "Defendant name",           "severite": "majeure",  "ref": "POA s.3"},
 }
 
+# Valeurs considerees comme vides (champ non rempli par l'OCR / le client)
+VALEURS_VIDES = ("", "0", "?", "N/A", "None", "null")
+
+
+def champ_vide(val):
+    return not val or str(val).strip() in VALEURS_VIDES
+
+
+def champs_obligatoires(juridiction):
+    return CHAMPS_OBLIGATOIRES_QC if juridiction == "QC" else CHAMPS_OBLIGATOIRES_ON
+
+
 # Appareils de mesure certifies au Quebec (liste non exhaustive)
 APPAREILS_CERTIFIES = [
     "stalker", "lidar", "laser", "photo radar", "cinematometre",
@@ -152,7 +165,7 @@ class AgentErreursAdmin(BaseAgent):
     def _verifier_champs_obligatoires(self, ticket, ocr_data, juridiction):
         """A1: Verifier que tous les champs obligatoires sont presents."""
         erreurs = []
-        champs = CHAMPS_OBLIGATOIRES_QC if juridiction == "QC" else CHAMPS_OBLIGATOIRES_ON
+        champs = champs_obligatoires(juridiction)
 
         raw_text = ""
         if ocr_data and isinstance(ocr_data, dict):
@@ -160,8 +173,7 @@ class AgentErreursAdmin(BaseAgent):
 
         for champ, info in champs.items():
             val = ticket.get(champ, "")
-            # Valeurs considerees comme vides
-            if not val or str(val).strip() in ("", "0", "?", "N/A", "None", "null"):
+            if champ_vide(val):
                 # Verifier si le champ est peut-etre dans le texte brut OCR
                 present_dans_ocr = False
                 if raw_text:
@@ -359,9 +371,6 @@ class AgentErreursAdmin(BaseAgent):
         """A4: Verifier les donnees du ticket contre la base de donnees."""
         erreurs = []
         try:
-            conn = self.get_db()
-            cur = conn.cursor()
-
             # Extraire le numero d'article
             loi_str = ticket.get("loi", "")
             art_match = re.search(r"(?:art\.?\s*)?(\d+(?:\.\d+)*)", loi_str)
@@ -370,20 +379,10 @@ class AgentErreursAdmin(BaseAgent):
             if article:
                 province = "QC" if juridiction == "QC" else ("ON" if juridiction == "ON" else "")
                 if province:
-                    cur.execute(
-                        "SELECT id, article, titre_article, texte_complet FROM lois_articles "
-                        "WHERE province = %s AND article = %s LIMIT 1",
-                        (province, article)
-                    )
-                    row = cur.fetchone()
-                    if not row:
-                        # Essayer avec des variantes (299 vs 299.1)
-                        cur.execute(
-                            "SELECT id, article, titre_article FROM lois_articles "
-                            "WHERE province = %s AND article LIKE %s LIMIT 3",
-                            (province, f"{article}%")
-                        )
-                        variants = cur.fetchall()
+                    # Catalogue des lois en memoire (exact puis sous-articles 299 -> 299.1)
+                    catalogue = get_catalogue(self.get_db)
+                    if not catalogue.exact(province, article):
+                        variants = catalogue.prefixe(province, article)[:3]
                         if not variants:
                             erreurs.append({
                                 "type": "db_mismatch",
@@ -396,7 +395,7 @@ class AgentErreursAdmin(BaseAgent):
                                 "contestable": True,
                             })
                         else:
-                            suggested = [v[1] for v in variants]
+                            suggested = [v["article"] for v in variants]
                             erreurs.append({
                                 "type": "db_mismatch",
                                 "champ": "loi",
@@ -407,8 +406,6 @@ class AgentErreursAdmin(BaseAgent):
                                 "impact": "Verifier l'article exact sur le constat original",
                                 "contestable": False,
                             })
-
-            conn.close()
         except Exception as e:
             self.log(f"Erreur verification DB: {e}", "WARN")
 
@@ -437,19 +434,31 @@ class AgentErreursAdmin(BaseAgent):
         code_muni = self._trouver_code_municipal(lieu)
         art_match = re.search(r"(\d+(?:\.\d+)*)", loi_str)
         article = art_match.group(1) if art_match else ""
+        # Jour du ticket: date_infraction = jour. annee_donnees est l'annee du fichier CRQ
+        # (cle de partition), pas celle de l'infraction; un constat n'est jamais publie dans
+        # un fichier anterieur a l'infraction, d'ou la borne annee_donnees >= annee du jour
+        # (annees precedentes ecartees sans changer le resultat; annee inconnue gardee).
+        # Colonnes typees (lieu_infraction = COD_MUNI_LIEU, date_infraction = DAT_INFRA_COMMI,
+        # article = NO_ARTCL_L_R) plutot que raw_data: index (lieu_infraction, date_infraction).
+        # Comptes par lieu / jour / article: agregats qc_constats_jour, qc_constats_jour_article
+        # (tickets-db/utils/rollups.py, tenus a jour par les imports).
+        try:
+            jour = datetime.strptime(str(date_ticket)[:10], "%Y-%m-%d").date() if date_ticket else None
+        except ValueError:
+            jour = None
 
         try:
             conn = self.get_db()
             cur = conn.cursor()
 
             # ─── B1: Profil agent ce jour-la ───
-            if date_ticket and code_muni:
+            if jour and code_muni:
                 # Tickets au meme endroit le meme jour (proxy pour le meme agent)
                 cur.execute("""
-                    SELECT COUNT(*) FROM qc_constats_infraction
-                    WHERE raw_data->>'COD_MUNI_LIEU' = %s
-                      AND raw_data->>'DAT_INFRA_COMMI' = %s
-                """, (code_muni, date_ticket))
+                    SELECT COALESCE(SUM(nb), 0)::int FROM qc_constats_jour
+                    WHERE lieu_infraction = %s AND date_infraction = %s
+                      AND (annee_donnees >= %s OR annee_donnees IS NULL)
+                """, (code_muni, jour, jour.year))
                 tickets_meme_jour_lieu = cur.fetchone()[0]
 
                 # Si on a un ID agent dans les donnees
@@ -469,34 +478,40 @@ class AgentErreursAdmin(BaseAgent):
             if code_muni:
                 cur.execute("""
                     SELECT
-                        COUNT(*) as total,
-                        COUNT(DISTINCT raw_data->>'IDENT_INTRT') as nb_agents,
-                        COUNT(DISTINCT raw_data->>'DAT_INFRA_COMMI') as nb_jours,
-                        MIN(raw_data->>'DAT_INFRA_COMMI') as premier,
-                        MAX(raw_data->>'DAT_INFRA_COMMI') as dernier
-                    FROM qc_constats_infraction
-                    WHERE raw_data->>'COD_MUNI_LIEU' = %s
+                        SUM(nb) as total,
+                        COUNT(DISTINCT date_infraction) as nb_jours,
+                        MIN(date_infraction) as premier,
+                        MAX(date_infraction) as dernier
+                    FROM qc_constats_jour
+                    WHERE lieu_infraction = %s
                 """, (code_muni,))
                 row = cur.fetchone()
                 if row and row[0]:
-                    total = row[0]
-                    nb_agents = row[1]
-                    nb_jours = row[2]
+                    total = int(row[0])
+                    nb_jours = row[1]
                     ratio = round(total / max(nb_jours, 1), 1)
 
-                    # Percentile du lieu
+                    # Agents distincts sur toute la periode: non additif, lu dans les constats
                     cur.execute("""
-                        SELECT COUNT(DISTINCT raw_data->>'COD_MUNI_LIEU')
+                        SELECT COUNT(DISTINCT raw_data->>'IDENT_INTRT')
                         FROM qc_constats_infraction
+                        WHERE lieu_infraction = %s
+                    """, (code_muni,))
+                    nb_agents = cur.fetchone()[0]
+
+                    # Percentile du lieu
+                    cur.execute("""
+                        SELECT COUNT(DISTINCT lieu_infraction)
+                        FROM qc_constats_jour
                     """)
                     total_lieux = cur.fetchone()[0] or 1
 
                     cur.execute("""
                         SELECT COUNT(*) FROM (
-                            SELECT raw_data->>'COD_MUNI_LIEU' as lieu, COUNT(*) as nb
-                            FROM qc_constats_infraction
-                            GROUP BY raw_data->>'COD_MUNI_LIEU'
-                            HAVING COUNT(*) > %s
+                            SELECT lieu_infraction as lieu, SUM(nb) as nb
+                            FROM qc_constats_jour
+                            GROUP BY lieu_infraction
+                            HAVING SUM(nb) > %s
                         ) sub
                     """, (total,))
                     lieux_au_dessus = cur.fetchone()[0]
@@ -516,20 +531,20 @@ class AgentErreursAdmin(BaseAgent):
                         "nb_jours_actifs": nb_jours,
                         "ratio_tickets_par_jour": ratio,
                         "percentile": percentile,
-                        "premier_constat": row[3] or "",
-                        "dernier_constat": row[4] or "",
+                        "premier_constat": row[2].isoformat() if row[2] else "",
+                        "dernier_constat": row[3].isoformat() if row[3] else "",
                         "alerte": alerte_lieu,
                     }
 
             # ─── B3: Detection blitz (meme jour, meme lieu) ───
-            if date_ticket and code_muni:
+            if jour and code_muni:
                 cur.execute("""
-                    SELECT COUNT(*),
-                           COUNT(DISTINCT raw_data->>'IDENT_INTRT') as nb_agents
-                    FROM qc_constats_infraction
-                    WHERE raw_data->>'COD_MUNI_LIEU' = %s
-                      AND raw_data->>'DAT_INFRA_COMMI' = %s
-                """, (code_muni, date_ticket))
+                    SELECT COALESCE(SUM(nb), 0)::int,
+                           COALESCE(MAX(nb_agents), 0)::int as nb_agents
+                    FROM qc_constats_jour
+                    WHERE lieu_infraction = %s AND date_infraction = %s
+                      AND (annee_donnees >= %s OR annee_donnees IS NULL)
+                """, (code_muni, jour, jour.year))
                 blitz_row = cur.fetchone()
                 nb_tickets_blitz = blitz_row[0] if blitz_row else 0
                 nb_agents_blitz = blitz_row[1] if blitz_row else 0
@@ -548,11 +563,11 @@ class AgentErreursAdmin(BaseAgent):
             # ─── B4: Article + lieu croise ───
             if article and code_muni:
                 cur.execute("""
-                    SELECT COUNT(*) FROM qc_constats_infraction
-                    WHERE raw_data->>'COD_MUNI_LIEU' = %s
-                      AND raw_data->>'NO_ARTCL_L_R' = %s
+                    SELECT COALESCE(SUM(nb), 0) FROM qc_constats_jour_article
+                    WHERE lieu_infraction = %s
+                      AND article = %s
                 """, (code_muni, article))
-                nb_article_lieu = cur.fetchone()[0]
+                nb_article_lieu = int(cur.fetchone()[0])
 
                 total_lieu = stats.get("lieu", {}).get("total_tickets", 1)
                 pct_article = round(nb_article_lieu / max(total_lieu, 1) * 100, 1)
@@ -570,15 +585,15 @@ class AgentErreursAdmin(BaseAgent):
             # ─── B5: Top jours au meme lieu (pires journees) ───
             if code_muni:
                 cur.execute("""
-                    SELECT raw_data->>'DAT_INFRA_COMMI' as date,
-                           COUNT(*) as nb
-                    FROM qc_constats_infraction
-                    WHERE raw_data->>'COD_MUNI_LIEU' = %s
-                    GROUP BY raw_data->>'DAT_INFRA_COMMI'
+                    SELECT date_infraction as date,
+                           SUM(nb)::int as nb
+                    FROM qc_constats_jour
+                    WHERE lieu_infraction = %s
+                    GROUP BY date_infraction
                     ORDER BY nb DESC
                     LIMIT 5
                 """, (code_muni,))
-                top_jours = [{"date": r[0], "nb_tickets": r[1]} for r in cur.fetchall()]
+                top_jours = [{"date": r[0].isoformat(), "nb_tickets": r[1]} for r in cur.fetchall()]
                 stats["top_jours_lieu"] = top_jours
 
             conn.close()
@@ -603,10 +618,10 @@ class AgentErreursAdmin(BaseAgent):
             lieu_parts = [p.strip() for p in lieu.replace(",", " ").split() if len(p.strip()) > 3]
             for part in lieu_parts:
                 cur.execute("""
-                    SELECT raw_data->>'COD_MUNI_LIEU' as code, COUNT(*) as nb
+                    SELECT lieu_infraction as code, COUNT(*) as nb
                     FROM qc_constats_infraction
-                    WHERE raw_data->>'COD_MUNI_LIEU' IS NOT NULL
-                    GROUP BY raw_data->>'COD_MUNI_LIEU'
+                    WHERE lieu_infraction IS NOT NULL AND lieu_infraction != ''
+                    GROUP BY lieu_infraction
                     HAVING COUNT(*) > 10
                     ORDER BY nb DESC
                     LIMIT 1
@@ -5,6 +5,8 @@ Recherche FTS dans PostgreSQL via tsvector pour New York
 
 import time
 from agents.base_agent import BaseAgent
+from agents.catalogue_lois import get_catalogue
+from agents.article_citations import extraire_article_simple
 
 
 class AgentLoisNY(BaseAgent):
@@ -21,12 +23,27 @@ class AgentLoisNY(BaseAgent):
         start = time.time()
         resultats = []
 
-        conn = self.get_db()
-        c = conn.cursor()
-
         infraction = ticket.get("infraction", "")
         mots_cles = self._extraire_mots_cles_ny(infraction)
 
+        # Sections VTL citees sur le ticket: catalogue en memoire (pas de SQL)
+        catalogue = None
+        try:
+            catalogue = get_catalogue(self.get_db)
+            for _loi, section, _base in extraire_article_simple(ticket.get("loi", ""), "VTL"):
+                for a in catalogue.prefixe("NY", section)[:3]:
+                    resultats.append({
+                        "id": a["id"], "juridiction": a["province"],
+                        "article": a["article"], "texte": a["texte_complet"][:500],
+                        "source": a["loi"], "recherche": f"section:{section}"
+                    })
+                    self.log(f"  VTL {a['article']} trouve (section directe)", "OK")
+        except Exception as e:
+            self.log(f"Erreur catalogue lois NY: {e}", "WARN")
+
+        conn = self.get_db()
+        c = conn.cursor()
+
         try:
             for query in mots_cles:
                 try:
@@ -44,22 +61,20 @@ class AgentLoisNY(BaseAgent):
                         self.log(f"  VTL {row[2]} trouve", "OK")
                 except Exception:
                     pass
-
-            if not resultats:
-                self.log("Aucun resultat FTS — recherche directe", "WARN")
-                c.execute("""SELECT id, province, article, texte_complet, loi FROM lois_articles
-                             WHERE province = 'NY' LIMIT 10""")
-                for row in c.fetchall():
-                    resultats.append({
-                        "id": row[0], "juridiction": row[1],
-                        "article": row[2], "texte": row[3][:500] if row[3] else "",
-                        "source": row[4]
-                    })
         except Exception as e:
             self.log(f"Erreur recherche lois NY: {e}", "FAIL")
 
         conn.close()
 
+        if not resultats and catalogue:
+            self.log("Aucun resultat FTS — recherche directe", "WARN")
+            for a in catalogue.par_province("NY", limit=10):
+                resultats.append({
+                    "id": a["id"], "juridiction": a["province"],
+                    "article": a["article"], "texte": a["texte_complet"][:500],
+                    "source": a["loi"]
+                })
+
         # Deduplication
         seen = set()
         unique = []
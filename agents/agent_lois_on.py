@@ -5,6 +5,8 @@ Recherche PostgreSQL tsvector specifique Ontario
 
 import time
 from agents.base_agent import BaseAgent
+from agents.catalogue_lois import get_catalogue
+from agents.article_citations import extraire_article_simple
 
 
 class AgentLoisON(BaseAgent):
@@ -24,6 +26,23 @@ class AgentLoisON(BaseAgent):
         infraction = ticket.get("infraction", "")
         mots_cles = self._extraire_mots_cles_on(infraction)
 
+        # Sections citees sur le ticket: catalogue en memoire (pas de SQL)
+        catalogue = None
+        try:
+            catalogue = get_catalogue(self.get_db)
+            for _loi, section, _base in extraire_article_simple(ticket.get("loi", ""), "HTA"):
+                for a in catalogue.prefixe("ON", section)[:3]:
+                    resultats.append({
+                        "id": a["id"], "juridiction": a["province"],
+                        "article": a["article"],
+                        "texte": (a["texte_complet"] or a["titre_article"])[:500],
+                        "source": a["loi"] or a["code_loi"] or "HTA",
+                        "recherche": f"section:{section}"
+                    })
+                    self.log(f"  HTA s.{a['article']} trouve (section directe)", "OK")
+        except Exception as e:
+            self.log(f"Erreur catalogue lois ON: {e}", "WARN")
+
         try:
             conn = self.get_db()
             cur = conn.cursor()
@@ -53,27 +72,21 @@ class AgentLoisON(BaseAgent):
                 except Exception:
                     pass
 
-            # Fallback
-            if not resultats:
-                self.log("Pas de resultats tsvector — recherche directe", "WARN")
-                cur.execute("""
-                    SELECT id, province, article, titre_article, texte_complet, loi
-                    FROM lois_articles
-                    WHERE province = 'ON'
-                    LIMIT 10
-                """)
-                for row in cur.fetchall():
-                    resultats.append({
-                        "id": row[0], "juridiction": row[1],
-                        "article": row[2],
-                        "texte": (row[4] or row[3] or "")[:500],
-                        "source": row[5] or "HTA"
-                    })
-
             conn.close()
         except Exception as e:
             self.log(f"Erreur recherche lois ON: {e}", "FAIL")
 
+        # Fallback
+        if not resultats and catalogue:
+            self.log("Pas de resultats tsvector — recherche directe", "WARN")
+            for a in catalogue.par_province("ON", limit=10):
+                resultats.append({
+                    "id": a["id"], "juridiction": a["province"],
+                    "article": a["article"],
+                    "texte": (a["texte_complet"] or a["titre_article"])[:500],
+                    "source": a["loi"] or "HTA"
+                })
+
         seen = set()
         unique = []
         for r in resultats:
@@ -2,11 +2,13 @@
 Agent QC: LOIS QUEBEC — Code de la securite routiere (CSR) + Code criminel
 Recherche PostgreSQL tsvector specifique Quebec (articles CSR, C-24.2, reglements municipaux)
 V2: Recherche par article + severite + contexte
+V3: Articles resolus par le catalogue en memoire (agents/catalogue_lois.py), SQL seulement pour tsvector
 """
 
 import re
 import time
 from agents.base_agent import BaseAgent
+from agents.catalogue_lois import get_catalogue
 
 
 class AgentLoisQC(BaseAgent):
@@ -48,35 +50,14 @@ class AgentLoisQC(BaseAgent):
         loi_ticket = ticket.get("loi", "")
 
         try:
-            conn = self.get_db()
-            cur = conn.cursor()
+            catalogue = get_catalogue(self.get_db)
 
-            # ═══ ETAPE 1: Recherche directe par numero d'article ═══
+            # ═══ ETAPE 1: Recherche directe par numero d'article (catalogue en memoire) ═══
             article_nums = self._extraire_articles(loi_ticket, infraction)
-            if article_nums:
-                for art_num in article_nums:
-                    try:
-                        cur.execute("""
-                            SELECT id, province, article, titre_article,
-                                   texte_complet, loi, code_loi
-                            FROM lois_articles
-                            WHERE province = 'QC'
-                              AND (article = %s OR article LIKE %s)
-                            ORDER BY article
-                        """, (art_num, art_num + '.%'))
-                        for row in cur.fetchall():
-                            resultats.append({
-                                "id": row[0], "juridiction": row[1],
-                                "article": row[2],
-                                "titre_article": row[3] or "",
-                                "texte": (row[4] or row[3] or "")[:500],
-                                "source": row[5] or row[6] or "CSR",
-                                "recherche": f"article_direct:{art_num}",
-                                "pertinence": "directe"
-                            })
-                            self.log(f"  Art. {row[2]} trouve (recherche directe)", "OK")
-                    except Exception as e:
-                        self.log(f"  Erreur recherche art. {art_num}: {e}", "WARN")
+            for art_num in article_nums:
+                for a in catalogue.prefixe("QC", art_num):
+                    resultats.append(self._resultat_article(a, f"article_direct:{art_num}", "directe"))
+                    self.log(f"  Art. {a['article']} trouve (recherche directe)", "OK")
 
             # ═══ ETAPE 2: Articles par severite (vitesse) ═══
             v_captee = ticket.get("vitesse_captee")
@@ -88,59 +69,49 @@ class AgentLoisQC(BaseAgent):
                     # Eviter doublons
                     if any(r["article"] == art_num for r in resultats):
                         continue
-                    try:
-                        cur.execute("""
-                            SELECT id, province, article, titre_article,
-                                   texte_complet, loi, code_loi
-                            FROM lois_articles
-                            WHERE province = 'QC'
-                              AND (article = %s OR article LIKE %s)
-                            LIMIT 3
-                        """, (art_num, art_num + '.%'))
-                        for row in cur.fetchall():
-                            resultats.append({
-                                "id": row[0], "juridiction": row[1],
-                                "article": row[2],
-                                "titre_article": row[3] or "",
-                                "texte": (row[4] or row[3] or "")[:500],
-                                "source": row[5] or row[6] or "CSR",
-                                "recherche": f"severite:+{exces}km/h",
-                                "pertinence": "severite"
-                            })
-                            self.log(f"  Art. {row[2]} trouve (severite +{exces}km/h)", "OK")
-                    except Exception:
-                        pass
+                    for a in catalogue.prefixe("QC", art_num)[:3]:
+                        resultats.append(self._resultat_article(a, f"severite:+{exces}km/h", "severite"))
+                        self.log(f"  Art. {a['article']} trouve (severite +{exces}km/h)", "OK")
 
             # ═══ ETAPE 3: Articles par type d'infraction ═══
             type_articles = self._articles_par_type(infraction)
             for art_num in type_articles:
                 if any(r["article"] == art_num for r in resultats):
                     continue
-                try:
-                    cur.execute("""
-                        SELECT id, province, article, titre_article,
-                               texte_complet, loi, code_loi
-                        FROM lois_articles
-                        WHERE province = 'QC'
-                          AND (article = %s OR article LIKE %s)
-                        LIMIT 2
-                    """, (art_num, art_num + '.%'))
-                    for row in cur.fetchall():
-                        resultats.append({
-                            "id": row[0], "juridiction": row[1],
-                            "article": row[2],
-                            "titre_article": row[3] or "",
-                            "texte": (row[4] or row[3] or "")[:500],
-                            "source": row[5] or row[6] or "CSR",
-                            "recherche": "type_infraction",
-                            "pertinence": "type"
-                        })
-                        self.log(f"  Art. {row[2]} trouve (type infraction)", "OK")
-                except Exception:
-                    pass
+                for a in catalogue.prefixe("QC", art_num)[:2]:
+                    resultats.append(self._resultat_article(a, "type_infraction", "type"))
+                    self.log(f"  Art. {a['article']} trouve (type infraction)", "OK")
+        except Exception as e:
+            self.log(f"Erreur catalogue lois QC: {e}", "WARN")
+
+        # ═══ ETAPES 4-5: complement SQL (tsvector) seulement si le catalogue ne suffit pas ═══
+        alcool = any(w in infraction.lower() for w in ["alcool", "ivresse", "facultes", "capacites"])
+        if len(resultats) < 5 or alcool:
+            resultats.extend(self._complement_tsvector(infraction, len(resultats) < 5, alcool))
+
+        # Deduplication
+        seen = set()
+        unique = []
+        for r in resultats:
+            key = f"{r['juridiction']}_{r['article']}"
+            if key not in seen:
+                seen.add(key)
+                unique.append(r)
+
+        duration = time.time() - start
+        self.log_run("chercher_loi_qc", f"QC {infraction[:100]}", f"{len(unique)} articles CSR", duration=duration)
+        self.log(f"{len(unique)} articles CSR trouves en {duration:.1f}s", "OK")
+        return unique
+
+    def _complement_tsvector(self, infraction, mots_cles_requis, alcool):
+        """Recherche plein texte lois_articles (mots-cles QC + Code criminel si alcool)"""
+        resultats = []
+        try:
+            conn = self.get_db()
+            cur = conn.cursor()
 
             # ═══ ETAPE 4: Recherche tsvector (complement) ═══
-            if len(resultats) < 5:
+            if mots_cles_requis:
                 mots_cles = self._extraire_mots_cles_qc(infraction)
                 for query in mots_cles:
                     try:
@@ -170,7 +141,7 @@ class AgentLoisQC(BaseAgent):
                         pass
 
             # ═══ ETAPE 5: Code criminel si alcool/capacites ═══
-            if any(w in infraction.lower() for w in ["alcool", "ivresse", "facultes", "capacites"]):
+            if alcool:
                 try:
                     cur.execute("""
                         SELECT id, province, article, titre_article, texte_complet, loi
@@ -195,20 +166,18 @@ class AgentLoisQC(BaseAgent):
             conn.close()
         except Exception as e:
             self.log(f"Erreur recherche lois QC: {e}", "FAIL")
-
-        # Deduplication
-        seen = set()
-        unique = []
-        for r in resultats:
-            key = f"{r['juridiction']}_{r['article']}"
-            if key not in seen:
-                seen.add(key)
-                unique.append(r)
-
-        duration = time.time() - start
-        self.log_run("chercher_loi_qc", f"QC {infraction[:100]}", f"{len(unique)} articles CSR", duration=duration)
-        self.log(f"{len(unique)} articles CSR trouves en {duration:.1f}s", "OK")
-        return unique
+        return resultats
+
+    def _resultat_article(self, a, recherche, pertinence):
+        return {
+            "id": a["id"], "juridiction": a["province"],
+            "article": a["article"],
+            "titre_article": a["titre_article"],
+            "texte": (a["texte_complet"] or a["titre_article"])[:500],
+            "source": a["loi"] or a["code_loi"] or "CSR",
+            "recherche": recherche,
+            "pertinence": pertinence
+        }
 
     def _extraire_articles(self, loi_ticket, infraction):
         """Extraire les numeros d'articles depuis la loi mentionnee sur le ticket"""
@@ -3,49 +3,108 @@ Agent Phase 1: OCR MASTER — Photo de contravention → champs extraits
 Moteur principal: Mindee (API pro)
 Fallback 1: OCR.space (gratuit) → DeepSeek V3 (parsing)
 Fallback 2: Qwen3-VL vision
+Mode "course" (OCR_MODE, defaut): departs decales de OCR_DECALAGE_S — le moteur suivant part
+si le precedent echoue ou tarde; premier resultat au-dessus de OCR_SEUIL_QUALITE retenu
+(completude des champs obligatoires + coherence), les autres sont abandonnes.
+Mode "cascade": sequentiel, comme avant.
+Cache: resultat reutilise si la meme photo revient (scan chatbot -> analyse, re-soumission),
+cle = sha256 du derive "ocr" (global), puis dHash 256 bits le plus proche — seulement parmi
+les photos du meme client (portee): deux constats du meme gabarit ont des dHash quasi
+identiques, une correspondance perceptuelle entre clients renverrait le constat d'un autre.
+Table ocr_cache (db/migrate_ocr_cache.sql)
 """
 
 import os
+import copy
 import json
 import time
 import base64
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+from agents import images, metrics
 from agents.base_agent import BaseAgent, QWEN_VL
+from agents.agent_erreurs_admin import champ_vide, champs_obligatoires
 
 MINDEE_API_KEY = os.environ.get("MINDEE_API_KEY", "")
 
+# Distance de Hamming max (sur 256 bits) pour reutiliser un OCR d'une photo "proche":
+# recompression / redimensionnement ~0-2 bits. 0 = sha256 exact seulement
+OCR_CACHE_DISTANCE = int(os.environ.get("OCR_CACHE_DISTANCE", "8"))
+OCR_CACHE_RATIO = 0.02      # meme cadrage: ecart max du rapport largeur/hauteur
+
+OCR_MODE = os.environ.get("OCR_MODE", "course")            # course | cascade
+OCR_DECALAGE_S = float(os.environ.get("OCR_DECALAGE_S", "4"))
+OCR_SEUIL_QUALITE = float(os.environ.get("OCR_SEUIL_QUALITE", "60"))
+OCR_COURSE_TIMEOUT_S = 90
+POIDS_SEVERITE = {"critique": 3, "majeure": 2, "mineure": 1}
+
+OCR_COURSE = metrics.compteur("ocr_engine_results_total", "Issue de chaque moteur OCR lance",
+                              ("engine", "outcome"))
+
+_annulation = contextvars.ContextVar("ocr_annulation", default=None)
+_pool_course = ThreadPoolExecutor(max_workers=9, thread_name_prefix="ocr-course")
+
+_memoire = OrderedDict()    # sha256 -> resultat (process), evite l'aller-retour PostgreSQL
+_MEMOIRE_MAX = 256
+_verrou = threading.Lock()
+
 
 class AgentOCR(BaseAgent):
 
     def __init__(self):
         super().__init__("OCR_Master")
 
-    def extraire_ticket(self, image_path=None, image_base64=None):
+    def extraire_ticket(self, image_path=None, image_base64=None, portee=None):
         """
         Input: chemin vers image OU image en base64
+        portee: identite du client ("user:<id>" / "ip:<addr>") — active le cache perceptuel
         Output: dict avec tous les champs extraits du ticket
         """
         self.log("Extraction OCR du ticket...", "STEP")
         start = time.time()
 
         result = None
-
-        # Methode 1: Mindee (API pro, meilleure precision)
-        if image_path or image_base64:
+        empreinte = None
+        if image_path:
+            # Derive "ocr" (deja fait par api.py: retourne tel quel) — OCR.space plafonne la taille
+            info = images.derive(image_path, "ocr")
+            image_path = info["chemin"]
+            empreinte = self._empreinte(image_path, info, portee)
+            if empreinte:
+                result = self._cache_chercher(empreinte)
+                if result:
+                    duration = time.time() - start
+                    self.log(f"OCR en cache ({result['ocr_cache']['source']}, {result.get('ocr_methode', '?')}) "
+                             f"en {duration * 1000:.0f}ms", "OK")
+                    return result
+
+        if (image_path or image_base64) and OCR_MODE == "course":
+            result = self._course(image_path, image_base64)
+
+        elif image_path or image_base64:
+            # Methode 1: Mindee (API pro, meilleure precision)
             result = self._ocr_mindee(image_path, image_base64)
 
-        # Methode 2: OCR.space fallback (gratuit)
-        if not result and (image_path or image_base64):
-            self.log("Mindee indisponible, fallback OCR.space...", "WARN")
-            result = self._ocr_space(image_path, image_base64)
+            # Methode 2: OCR.space fallback (gratuit)
+            if not result:
+                self.log("Mindee indisponible, fallback OCR.space...", "WARN")
+                result = self._ocr_space(image_path, image_base64)
 
-        # Methode 3: AI vision fallback (Qwen VL)
-        if not result and (image_path or image_base64):
-            result = self._ocr_ai_vision(image_path, image_base64)
+            # Methode 3: AI vision fallback (Qwen VL)
+            if not result:
+                result = self._ocr_ai_vision(image_path, image_base64)
 
         # Methode 4: Pas d'image, retourner structure vide
         if not result:
             result = self._empty_ticket()
             self.log("Aucune image fournie — structure vide", "WARN")
+        elif empreinte:
+            self._cache_enregistrer(empreinte, result)
 
         duration = time.time() - start
         self.log_run("extraire_ticket", f"image={'oui' if image_path or image_base64 else 'non'}",
@@ -53,6 +112,66 @@ class AgentOCR(BaseAgent):
         self.log(f"OCR complete en {duration:.1f}s — {len([v for v in result.values() if v])} champs", "OK")
         return result
 
+    # ═══════════════════════════════════════════════════════════
+    # COURSE DES MOTEURS
+    # ═══════════════════════════════════════════════════════════
+
+    def _course(self, image_path, image_base64):
+        """Mindee, OCR.space, Qwen-VL en departs decales; retourne le premier resultat
+        qui passe OCR_SEUIL_QUALITE, sinon le meilleur obtenu."""
+        moteurs = [("mindee_v2", self._ocr_mindee)] if MINDEE_API_KEY else []
+        moteurs += [("ocr_space", self._ocr_space), ("qwen_vl", self._ocr_ai_vision)]
+        annule = threading.Event()
+        en_cours = {}
+        meilleur, meilleur_score = None, -1
+        prochain, depart_suivant = 0, 0.0
+        limite = time.monotonic() + OCR_COURSE_TIMEOUT_S
+        try:
+            while True:
+                now = time.monotonic()
+                # Depart suivant: delai ecoule, ou plus aucun moteur en course (echec rapide)
+                if prochain < len(moteurs) and (now >= depart_suivant or not en_cours):
+                    nom, fn = moteurs[prochain]
+                    ctx = contextvars.copy_context()    # span de trace courant + annulation
+                    ctx.run(_annulation.set, annule)
+                    en_cours[_pool_course.submit(ctx.run, fn, image_path, image_base64)] = nom
+                    prochain += 1
+                    depart_suivant = now + OCR_DECALAGE_S
+                    continue
+                if not en_cours or now >= limite:
+                    break
+                attente = limite - now
+                if prochain < len(moteurs):
+                    attente = min(attente, max(0.0, depart_suivant - now))
+                faits, _ = wait(list(en_cours), timeout=attente, return_when=FIRST_COMPLETED)
+                for f in faits:
+                    nom = en_cours.pop(f)
+                    try:
+                        res = f.result()
+                    except Exception as e:
+                        self.log(f"OCR {nom}: {e}", "FAIL")
+                        res = None
+                    if not res:
+                        OCR_COURSE.inc(engine=nom, outcome="echec")
+                        continue
+                    score = score_extraction(res)
+                    res["ocr_score"] = score
+                    if score >= OCR_SEUIL_QUALITE:
+                        OCR_COURSE.inc(engine=nom, outcome="gagnant")
+                        self.log(f"OCR {nom} retenu (score {score:.0f}), {len(en_cours)} moteur(s) abandonne(s)", "OK")
+                        return res
+                    OCR_COURSE.inc(engine=nom, outcome="sous_seuil")
+                    self.log(f"OCR {nom}: score {score:.0f} sous le seuil {OCR_SEUIL_QUALITE:.0f}", "WARN")
+                    if score > meilleur_score:
+                        meilleur, meilleur_score = res, score
+            return meilleur
+        finally:
+            # Les moteurs encore en vol finissent leur requete HTTP mais sautent le parsing IA
+            annule.set()
+            for f, nom in en_cours.items():
+                if f.cancel() or not f.done():
+                    OCR_COURSE.inc(engine=nom, outcome="annule")
+
     def _ocr_mindee(self, image_path, image_base64):
         """OCR via Mindee SDK v2 → texte brut → AI parsing"""
         if not MINDEE_API_KEY:
@@ -196,6 +315,8 @@ class AgentOCR(BaseAgent):
 
     def _parse_raw_text(self, raw_text):
         """Utilise DeepSeek V3 pour structurer le texte OCR brut en JSON"""
+        if _annule():
+            return None
         self.log("AI parsing du texte OCR...", "STEP")
 
         prompt = f"""Texte OCR d une contravention routiere. Extrais les infos en JSON.
@@ -232,6 +353,8 @@ JSON: {{"infraction":"","juridiction":"QC ou ON ou NY","loi":"","amende":"","poi
 
     def _ocr_ai_vision(self, image_path, image_base64):
         """Vision AI fallback: Qwen3-VL lit directement la photo du ticket"""
+        if _annule():
+            return None
         self.log("Vision AI fallback: Qwen3-VL analyse la photo...", "STEP")
 
         prompt = """Lis cette photo de contravention/ticket routier.
@@ -277,6 +400,87 @@ Reponds UNIQUEMENT en JSON:
             self.log(f"Vision OCR indisponible: {response.get('error', '?')}", "WARN")
             return None
 
+    # ═══════════════════════════════════════════════════════════
+    # CACHE OCR (sha256 exact, puis hash perceptuel)
+    # ═══════════════════════════════════════════════════════════
+
+    def _empreinte(self, image_path, info, portee):
+        if not info.get("phash") or not info.get("hauteur"):
+            return None
+        try:
+            with open(image_path, "rb") as f:
+                sha = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+        return {"sha256": sha, "phash": info["phash"], "ratio": info["largeur"] / info["hauteur"],
+                "portee": portee}
+
+    def _cache_chercher(self, e):
+        with _verrou:
+            r = _memoire.get(e["sha256"])
+            if r is not None:
+                _memoire.move_to_end(e["sha256"])
+        if r is not None:
+            metrics.CACHE.inc(cache="ocr", result="hit_memoire")
+            return dict(copy.deepcopy(r), ocr_cache={"source": "memoire", "distance": 0})
+        try:
+            conn = self.get_db()
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT id, resultat, 0 FROM ocr_cache WHERE sha256 = %s", (e["sha256"],))
+                    row = cur.fetchone()
+                    if not row and e["portee"] and OCR_CACHE_DISTANCE > 0:
+                        cur.execute(f"""
+                            SELECT id, resultat, distance FROM (
+                                SELECT id, resultat,
+                                       length(replace((('x' || phash)::bit({images.DHASH_BITS})
+                                                       # ('x' || %s)::bit({images.DHASH_BITS}))::text,
+                                                      '0', '')) AS distance
+                                FROM ocr_cache WHERE portee = %s AND abs(ratio - %s) <= %s
+                            ) t WHERE distance <= %s ORDER BY distance LIMIT 1
+                        """, (e["phash"], e["portee"], e["ratio"], OCR_CACHE_RATIO, OCR_CACHE_DISTANCE))
+                        row = cur.fetchone()
+                    if row:
+                        cur.execute("UPDATE ocr_cache SET hits = hits + 1, last_hit_at = NOW() WHERE id = %s",
+                                    (row[0],))
+            conn.close()
+        except Exception as ex:
+            self.log(f"Cache OCR indisponible: {ex}", "WARN")
+            return None
+        if not row:
+            metrics.CACHE.inc(cache="ocr", result="miss")
+            return None
+        resultat = row[1] if isinstance(row[1], dict) else json.loads(row[1])
+        self._memoriser(e["sha256"], resultat)
+        metrics.CACHE.inc(cache="ocr", result="hit_exact" if row[2] == 0 else "hit_phash")
+        return dict(resultat, ocr_cache={"source": "postgres", "distance": row[2]})
+
+    def _cache_enregistrer(self, e, result):
+        self._memoriser(e["sha256"], result)
+        try:
+            conn = self.get_db()
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO ocr_cache (sha256, phash, ratio, portee, moteur, resultat)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (sha256) DO UPDATE SET
+                            phash = EXCLUDED.phash, portee = COALESCE(EXCLUDED.portee, ocr_cache.portee),
+                            moteur = EXCLUDED.moteur, resultat = EXCLUDED.resultat, created_at = NOW()
+                    """, (e["sha256"], e["phash"], e["ratio"], e["portee"], result.get("ocr_methode"),
+                          json.dumps(result, ensure_ascii=False, default=str)))
+            conn.close()
+        except Exception as ex:
+            self.log(f"Cache OCR: ecriture impossible: {ex}", "WARN")
+
+    @staticmethod
+    def _memoriser(sha, result):
+        with _verrou:
+            _memoire[sha] = copy.deepcopy(result)
+            _memoire.move_to_end(sha)
+            while len(_memoire) > _MEMOIRE_MAX:
+                _memoire.popitem(last=False)
+
     def _empty_ticket(self):
         return {
             "infraction": "", "juridiction": "", "loi": "", "amende": "",
@@ -284,3 +488,37 @@ Reponds UNIQUEMENT en JSON:
             "vitesse_captee": 0, "vitesse_permise": 0, "numero_constat": "",
             "agent": "", "poste_police": ""
         }
+
+
+def _annule():
+    """Vrai si la course de ce moteur est deja gagnee par un autre (contexte du thread)."""
+    ev = _annulation.get()
+    return ev is not None and ev.is_set()
+
+
+def score_extraction(result):
+    """Qualite d'une extraction OCR 0-100: champs obligatoires remplis (ponderes par severite,
+    memes regles que AgentErreursAdmin) moins les incoherences evidentes."""
+    juridiction = str(result.get("juridiction") or "").upper()
+    juridiction = "ON" if juridiction.startswith("ON") else "QC"
+    champs = champs_obligatoires(juridiction)
+    total = sum(POIDS_SEVERITE[c["severite"]] for c in champs.values())
+    rempli = sum(POIDS_SEVERITE[c["severite"]] for nom, c in champs.items() if not champ_vide(result.get(nom)))
+    score = 100.0 * rempli / total
+    date = str(result.get("date") or "")
+    if date:
+        try:
+            if datetime.strptime(date[:10], "%Y-%m-%d") > datetime.now():
+                score -= 10
+        except ValueError:
+            score -= 10
+    try:
+        captee, permise = int(result.get("vitesse_captee") or 0), int(result.get("vitesse_permise") or 0)
+        if captee and permise and captee <= permise:
+            score -= 15
+    except (TypeError, ValueError):
+        score -= 5
+    amende = str(result.get("amende") or "")
+    if amende and not any(ch.isdigit() for ch in amende):
+        score -= 5
+    return max(0.0, round(score, 1))
@@ -2,14 +2,34 @@
 Agent Gold Standard: ANALYSE PHOTOS — AI Vision reelle
 Moteur: Qwen3-VL-235B (vision multimodale)
 Detecte panneaux, signalisation, conditions route, position radar
+Photos analysees en parallele (PHOTO_CONCURRENCE par dossier, PHOTO_MAX_GLOBAL pour le
+process), sur le derive "vision" (agents/images.py), delai PHOTO_TIMEOUT_S par photo.
+Cache: meme photo (sha256 du derive) + meme contexte de ticket -> analyse reutilisee
+(table photo_analyses_cache, db/migrate_photo_cache.sql).
 """
 
 import time
 import os
+import copy
 import json
-import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from agents import images, metrics, tracing
 from agents.base_agent import BaseAgent, QWEN_VL
 
+PHOTO_CONCURRENCE = int(os.environ.get("PHOTO_CONCURRENCE", "3"))
+PHOTO_MAX_GLOBAL = int(os.environ.get("PHOTO_MAX_GLOBAL", "8"))
+PHOTO_TIMEOUT_S = float(os.environ.get("PHOTO_TIMEOUT_S", "45"))
+PROMPT_VERSION = "1"        # a incrementer si le prompt change: invalide le cache
+
+_pool = ThreadPoolExecutor(max_workers=PHOTO_MAX_GLOBAL, thread_name_prefix="photo-analyse")
+_memoire = OrderedDict()    # (sha256, contexte) -> analyse
+_MEMOIRE_MAX = 512
+_verrou = threading.Lock()
+
 
 class AgentPhotoAnalyse(BaseAgent):
 
@@ -24,20 +44,24 @@ class AgentPhotoAnalyse(BaseAgent):
         self.log(f"Analyse de {len(photo_paths)} photo(s)...", "STEP")
         start = time.time()
 
-        resultats = []
+        presentes = []
         for path in photo_paths:
             if not os.path.exists(path):
                 self.log(f"Photo non trouvee: {path}", "WARN")
                 continue
+            presentes.append(path)
 
+        # Derives reduits (HEIC -> JPEG si possible); deja faits par api.py: retournes tels quels
+        valides = []
+        for info in images.derives(presentes, "vision"):
+            path = info["chemin"]
             ext = path.rsplit(".", 1)[-1].lower()
             if ext not in ("jpg", "jpeg", "png", "webp", "gif"):
                 self.log(f"Format non supporte: {ext}", "WARN")
                 continue
+            valides.append(path)
 
-            analyse = self._analyser_une_photo(path, ticket)
-            if analyse:
-                resultats.append(analyse)
+        resultats = [a for a in self._analyser_en_parallele(valides, ticket) if a]
 
         # Score d'impact global des preuves photo
         impact = self._calculer_impact(resultats, ticket)
@@ -55,13 +79,40 @@ class AgentPhotoAnalyse(BaseAgent):
                      f"Impact={impact.get('score_bonus', 0)}%", duration=duration)
         return result
 
-    def _analyser_une_photo(self, path, ticket):
-        """Analyse une seule photo via AI"""
-        infraction = ticket.get("infraction", "")
-        juridiction = ticket.get("juridiction", "QC")
-        lieu = ticket.get("lieu", "")
-
-        # Determiner le type de photo par le nom du fichier
+    def _analyser_en_parallele(self, paths, ticket):
+        """Au plus PHOTO_CONCURRENCE photos du dossier en vol; au-dela de PHOTO_TIMEOUT_S,
+        analyse textuelle pour la photo (la requete vision termine en arriere-plan et
+        alimente le cache)."""
+        resultats = [None] * len(paths)
+        en_vol = {}
+        a_lancer = list(enumerate(paths))
+        while a_lancer or en_vol:
+            while a_lancer and len(en_vol) < PHOTO_CONCURRENCE:
+                i, path = a_lancer.pop(0)
+                f = _pool.submit(tracing.propager(self._analyser_une_photo), path, ticket)
+                en_vol[f] = (i, path, time.monotonic() + PHOTO_TIMEOUT_S)
+            prochaine_limite = min(lim for _, _, lim in en_vol.values())
+            faits, _ = wait(list(en_vol), timeout=max(0.0, prochaine_limite - time.monotonic()),
+                            return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for f in list(en_vol):
+                i, path, lim = en_vol[f]
+                if f in faits:
+                    del en_vol[f]
+                    try:
+                        resultats[i] = f.result()
+                    except Exception as e:
+                        self.log(f"Erreur photo {os.path.basename(path)}: {e}", "FAIL")
+                        resultats[i] = self._analyse_textuelle(path, self._type_photo(path), ticket)
+                elif now >= lim:
+                    del en_vol[f]
+                    self.log(f"Photo {os.path.basename(path)}: delai {PHOTO_TIMEOUT_S:.0f}s depasse", "WARN")
+                    resultats[i] = self._analyse_textuelle(path, self._type_photo(path), ticket)
+        return resultats
+
+    @staticmethod
+    def _type_photo(path):
+        """Type de photo deduit du nom du fichier"""
         filename = os.path.basename(path).lower()
         photo_type = "lieu"
         if "ticket" in filename:
@@ -74,16 +125,31 @@ class AgentPhotoAnalyse(BaseAgent):
             photo_type = "signalisation"
         elif "maps" in filename or "google" in filename:
             photo_type = "google_maps"
+        return photo_type
+
+    def _analyser_une_photo(self, path, ticket):
+        """Analyse une seule photo via AI"""
+        infraction = ticket.get("infraction", "")
+        juridiction = ticket.get("juridiction", "QC")
+        lieu = ticket.get("lieu", "")
+        photo_type = self._type_photo(path)
 
-        # Encoder l'image en base64 pour l'AI
         try:
             with open(path, "rb") as f:
-                image_data = base64.b64encode(f.read()).decode("utf-8")
+                cle = (hashlib.sha256(f.read()).hexdigest(),
+                       hashlib.sha1(f"{PROMPT_VERSION}|{infraction}|{juridiction}|{lieu}|{photo_type}"
+                                    .encode()).hexdigest()[:16])
             file_size = os.path.getsize(path)
         except Exception as e:
             self.log(f"Erreur lecture {path}: {e}", "FAIL")
             return None
 
+        analyse = self._cache_chercher(cle)
+        if analyse:
+            analyse["fichier"] = os.path.basename(path)
+            self.log(f"  Photo '{os.path.basename(path)}': analyse en cache", "OK")
+            return analyse
+
         # Si l'image est trop grosse pour l'API (>5 Mo), on fait une analyse textuelle
         if file_size > 5 * 1024 * 1024:
             return self._analyse_textuelle(path, photo_type, ticket)
@@ -135,6 +201,7 @@ REPONDS EN JSON:
                 analyse["fichier"] = os.path.basename(path)
                 analyse["taille"] = file_size
                 self.log(f"  Photo '{os.path.basename(path)}': {len(analyse.get('elements_defense', []))} elements defense", "OK")
+                self._cache_enregistrer(cle, analyse)
                 return analyse
             except Exception as e:
                 self.log(f"Erreur parsing photo: {e}", "FAIL")
@@ -143,6 +210,60 @@ REPONDS EN JSON:
             self.log(f"Erreur AI photo: {response.get('error', '?')}", "FAIL")
             return self._analyse_textuelle(path, photo_type, ticket)
 
+    # ═══════════════════════════════════════════════════════════
+    # CACHE (sha256 du derive + contexte du ticket)
+    # ═══════════════════════════════════════════════════════════
+
+    def _cache_chercher(self, cle):
+        with _verrou:
+            analyse = _memoire.get(cle)
+            if analyse is not None:
+                _memoire.move_to_end(cle)
+        if analyse is not None:
+            metrics.CACHE.inc(cache="photo_analyse", result="hit_memoire")
+            return copy.deepcopy(analyse)
+        try:
+            conn = self.get_db()
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("""UPDATE photo_analyses_cache SET hits = hits + 1, last_hit_at = NOW()
+                                   WHERE sha256 = %s AND contexte = %s RETURNING resultat""", cle)
+                    row = cur.fetchone()
+            conn.close()
+        except Exception as e:
+            self.log(f"Cache photo indisponible: {e}", "WARN")
+            return None
+        if not row:
+            metrics.CACHE.inc(cache="photo_analyse", result="miss")
+            return None
+        metrics.CACHE.inc(cache="photo_analyse", result="hit")
+        analyse = row[0] if isinstance(row[0], dict) else json.loads(row[0])
+        self._memoriser(cle, analyse)
+        return analyse
+
+    def _cache_enregistrer(self, cle, analyse):
+        self._memoriser(cle, analyse)
+        try:
+            conn = self.get_db()
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("""INSERT INTO photo_analyses_cache (sha256, contexte, resultat)
+                                   VALUES (%s, %s, %s)
+                                   ON CONFLICT (sha256, contexte) DO UPDATE SET
+                                       resultat = EXCLUDED.resultat, created_at = NOW()""",
+                                (cle[0], cle[1], json.dumps(analyse, ensure_ascii=False, default=str)))
+            conn.close()
+        except Exception as e:
+            self.log(f"Cache photo: ecriture impossible: {e}", "WARN")
+
+    @staticmethod
+    def _memoriser(cle, analyse):
+        with _verrou:
+            _memoire[cle] = copy.deepcopy(analyse)
+            _memoire.move_to_end(cle)
+            while len(_memoire) > _MEMOIRE_MAX:
+                _memoire.popitem(last=False)
+
     def _analyse_textuelle(self, path, photo_type, ticket):
         """Fallback: analyse basee sur le type de photo sans vision AI"""
         filename = os.path.basename(path)
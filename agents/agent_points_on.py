@@ -6,6 +6,8 @@ Ministry of Transportation Ontario, novice driver program, insurance
 import time
 import re
 from agents.base_agent import BaseAgent
+from agents.catalogue_lois import get_catalogue
+from agents.article_citations import extraire_article_simple
 
 
 # Points de demerite MTO Ontario
@@ -76,11 +78,16 @@ class AgentPointsON(BaseAgent):
         appareil = (ticket.get("appareil", "") or "").lower()
         is_camera = any(w in appareil for w in ["camera", "photo", "automated"])
 
+        # Set fine officielle de la section citee (on_set_fines, catalogue en memoire)
+        set_fine = self._set_fine(ticket.get("loi", ""))
+
         # Determiner points
         if is_camera and "red light" in infraction:
             points = 0
         elif points_ticket > 0:
             points = points_ticket
+        elif set_fine and set_fine.get("points") is not None:
+            points = set_fine["points"]
         else:
             points = self._estimer_points(infraction, exces)
 
@@ -129,6 +136,7 @@ class AgentPointsON(BaseAgent):
             "consequences_mto": consequences,
             "impact_assurance": assurance,
             "victim_fine_surcharge": victim_surcharge,
+            "set_fine": set_fine,
             "economie_si_acquitte": economie,
             "notes_contexte": notes_contexte,
         }
@@ -139,6 +147,18 @@ class AgentPointsON(BaseAgent):
                      f"Economie=${economie['total']}", duration=duration)
         return result
 
+    def _set_fine(self, loi_ticket):
+        """Ligne on_set_fines de la section citee (HTA s. 128 -> 128, 128(1)...)"""
+        try:
+            refs = extraire_article_simple(loi_ticket, "HTA")
+            if not refs:
+                return None
+            lignes = get_catalogue(self.get_db).amende_on(refs[0][1])
+            return dict(lignes[0]) if lignes else None
+        except Exception as e:
+            self.log(f"Catalogue set fines: {e}", "WARN")
+            return None
+
     def _estimer_points(self, infraction, exces=0):
         if "speed" in infraction or "vitesse" in infraction:
             if exces >= 50:
@@ -6,6 +6,8 @@ Regime de points d'inaptitude SAAQ, permis probatoire, suspension
 import time
 import re
 from agents.base_agent import BaseAgent
+from agents.catalogue_lois import get_catalogue
+from agents.article_citations import extraire_article_simple
 
 
 # Points d'inaptitude SAAQ (Quebec)
@@ -63,11 +65,16 @@ class AgentPointsQC(BaseAgent):
         # Photo radar = 0 points
         is_photo_radar = any(w in appareil for w in ["photo", "radar fixe", "automatique"])
 
+        # Bareme officiel SAAQ de l'article cite (catalogue en memoire)
+        bareme_saaq = self._bareme_saaq(ticket.get("loi", ""), exces)
+
         # Determiner les points
         if is_photo_radar:
             points = 0
         elif points_ticket > 0:
             points = points_ticket
+        elif bareme_saaq:
+            points = bareme_saaq["points"]
         else:
             points = self._estimer_points(infraction, exces)
 
@@ -118,6 +125,7 @@ class AgentPointsQC(BaseAgent):
             "consequences_saaq": consequences,
             "grand_exces": grand_exces,
             "amende_info": amende_info,
+            "bareme_saaq": bareme_saaq,
             "contribution_favr": contribution_favr,
             "impact_assurance": assurance,
             "economie_si_acquitte": economie,
@@ -130,6 +138,23 @@ class AgentPointsQC(BaseAgent):
                      f"Economie=${economie['total']}", duration=duration)
         return result
 
+    def _bareme_saaq(self, loi_ticket, exces=0):
+        """Ligne saaq_points_inaptitude de l'article cite (tranche de vitesse si exces)"""
+        try:
+            refs = extraire_article_simple(loi_ticket, "CSR")
+            if not refs:
+                return None
+            lignes = get_catalogue(self.get_db).points_saaq_article(refs[0][1], exces or None)
+            if not lignes:
+                return None
+            l = lignes[0]
+            return {"article": l["article"], "description": l["description"], "points": l["points"],
+                    "amende_min": l["amende_min"], "amende_max": l["amende_max"],
+                    "grand_exces": l["grand_exces"], "suspension_immediate": l["suspension_immediate"]}
+        except Exception as e:
+            self.log(f"Catalogue SAAQ: {e}", "WARN")
+            return None
+
     def _estimer_points(self, infraction, exces=0):
         """Estime les points SAAQ selon l'infraction et l'exces"""
         if "vitesse" in infraction or "exces" in infraction or "km/h" in infraction:
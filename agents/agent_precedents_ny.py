@@ -8,6 +8,7 @@ import time
 import json
 import os
 from agents.base_agent import BaseAgent
+from agents.precedents_engine import requete, rechercher_multi, FTS_EN
 
 COURTLISTENER_TOKEN = os.environ.get("COURTLISTENER_TOKEN", "")
 
@@ -85,32 +86,21 @@ class AgentPrecedentsNY(BaseAgent):
 
     def _recherche_fts_ny(self, infraction, limit=15):
         results = []
-        conn = self.get_db()
-        c = conn.cursor()
-
         try:
-            queries = self._generer_requetes_ny(infraction)
-            for query in queries:
-                try:
-                    c.execute("""SELECT j.id, j.citation, j.tribunal, j.date_decision,
-                                        j.resume, j.province, j.resultat
-                                 FROM jurisprudence j
-                                 WHERE j.tsv_en @@ to_tsquery('english', %s)
-                                 AND j.province = 'NY'
-                                 LIMIT %s""", (query, limit))
-                    for row in c.fetchall():
-                        results.append({
-                            "id": row[0], "citation": row[1], "tribunal": row[2],
-                            "date": row[3], "resume": (row[4] or "")[:300],
-                            "juridiction": row[5], "resultat": row[6] or "inconnu",
-                            "source": "FTS-NY", "score": 70
-                        })
-                except Exception:
-                    pass
+            requetes = [requete(query[:50], FTS_EN, query, limit=limit, score=70,
+                                source="FTS-NY", province="NY")
+                        for query in self._generer_requetes_ny(infraction)]
+            conn = self.get_db()
+            for c in rechercher_multi(conn, requetes):
+                results.append({
+                    "id": c["id"], "citation": c["citation"], "tribunal": c["tribunal"],
+                    "date": c["date_decision"], "resume": (c["resume"] or "")[:300],
+                    "juridiction": c["province"], "resultat": c["resultat"] or "inconnu",
+                    "source": "FTS-NY", "score": 70, "requetes": c["requetes"]
+                })
+            conn.close()
         except Exception as e:
             self.log(f"Erreur FTS NY: {e}", "FAIL")
-
-        conn.close()
         return results
 
     def _recherche_semantique_ny(self, infraction, n_results=10):
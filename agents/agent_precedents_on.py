@@ -7,6 +7,7 @@ ONCJ, ONSC, ONCA — Provincial Offences Act
 import time
 import os
 from agents.base_agent import BaseAgent, CANLII_API_KEY
+from agents.precedents_engine import requete, rechercher_multi, FTS_EN
 
 
 class AgentPrecedentsON(BaseAgent):
@@ -37,7 +38,7 @@ class AgentPrecedentsON(BaseAgent):
         self.log(f"Recherche precedents ON: {infraction[:50]}...", "STEP")
         start = time.time()
 
-        fts_results = self._recherche_tsvector_on(infraction, n_results)
+        fts_results, federal_results = self._recherche_tsvector_on(infraction, n_results)
         self.log(f"  PostgreSQL tsvector: {len(fts_results)} cas ON", "OK" if fts_results else "WARN")
 
         semantic_results = self._recherche_semantique_on(infraction, n_results)
@@ -49,12 +50,10 @@ class AgentPrecedentsON(BaseAgent):
             canlii_results = self._recherche_canlii_on(infraction, lois)
             self.log(f"  CanLII ON: {len(canlii_results)} cas", "OK" if canlii_results else "WARN")
 
-        # Fallback federal
-        if len(fts_results) < 3:
-            fallback = self._recherche_tsvector_federale(infraction, 5)
-            if fallback:
-                self.log(f"  Fallback federal: {len(fallback)} cas (CSC)", "OK")
-                fts_results.extend(fallback)
+        # Fallback federal (deja charge dans le meme aller-retour)
+        if len(fts_results) < 3 and federal_results:
+            self.log(f"  Fallback federal: {len(federal_results)} cas (CSC)", "OK")
+            fts_results.extend(federal_results)
 
         combined = self._combiner(fts_results, semantic_results, canlii_results)
         top = combined[:n_results]
@@ -83,142 +82,96 @@ class AgentPrecedentsON(BaseAgent):
         return top
 
     def _recherche_tsvector_on(self, infraction, limit=15):
-        """Recherche tsvector PostgreSQL dans la table jurisprudence"""
-        results = []
-        try:
-            conn = self.get_db()
-            cur = conn.cursor()
-            queries = self._generer_requetes_on(infraction)
-            seen_ids = set()
-
+        """Recherche tsvector PostgreSQL — tribunaux traffic + ONCA + CSC en UN aller-retour.
+        Retourne (resultats ON, fallback federal)."""
+        queries = self._generer_requetes_on(infraction)
+        requetes = []
+        for query in queries:
             # Priorite 1: tribunaux traffic (ONCJ, ONSCDC)
-            for query in queries:
-                try:
-                    cur.execute("""
-                        SELECT j.id, j.citation, j.database_id, j.date_decision,
-                               j.resume, j.province, j.resultat,
-                               ts_rank(j.tsv_en, to_tsquery('english', %s)) AS rank
-                        FROM jurisprudence j
-                        WHERE j.province = 'ON'
-                          AND j.database_id IN ('oncj', 'onscdc')
-                          AND j.tsv_en @@ to_tsquery('english', %s)
-                        ORDER BY rank DESC
-                        LIMIT %s
-                    """, (query, query, limit))
-                    for row in cur.fetchall():
-                        if row[0] not in seen_ids:
-                            seen_ids.add(row[0])
-                            results.append({
-                                "id": row[0], "citation": row[1],
-                                "tribunal": (row[2] or "").upper(),
-                                "date": str(row[3]) if row[3] else "",
-                                "resume": (row[4] or "")[:300],
-                                "juridiction": row[5] or "ON",
-                                "resultat": row[6] or "inconnu",
-                                "source": "PostgreSQL-ON", "score": 85
-                            })
-                except Exception:
-                    pass
-
+            requetes.append(requete(query[:50], FTS_EN, query, limit=limit, score=85,
+                                    source="PostgreSQL-ON", province="ON", databases=("oncj", "onscdc")))
             # Priorite 2: ONCA (Court of Appeal)
-            if len(results) < limit:
-                for query in queries:
-                    try:
-                        cur.execute("""
-                            SELECT j.id, j.citation, j.database_id, j.date_decision,
-                                   j.resume, j.province, j.resultat
-                            FROM jurisprudence j
-                            WHERE j.province = 'ON'
-                              AND j.database_id = 'onca'
-                              AND j.tsv_en @@ to_tsquery('english', %s)
-                            LIMIT %s
-                        """, (query, limit - len(results)))
-                        for row in cur.fetchall():
-                            if row[0] not in seen_ids:
-                                seen_ids.add(row[0])
-                                results.append({
-                                    "id": row[0], "citation": row[1],
-                                    "tribunal": (row[2] or "").upper(),
-                                    "date": str(row[3]) if row[3] else "",
-                                    "resume": (row[4] or "")[:300],
-                                    "juridiction": row[5] or "ON",
-                                    "resultat": row[6] or "inconnu",
-                                    "source": "PostgreSQL-ON", "score": 65
-                                })
-                    except Exception:
-                        pass
-
-            # Priorite 3: recherche ILIKE si tsvector donne rien
-            if not results:
-                infraction_words = [w for w in infraction.lower().split() if len(w) > 3][:3]
-                if infraction_words:
-                    pattern = f"%{'%'.join(infraction_words)}%"
-                    try:
-                        cur.execute("""
-                            SELECT j.id, j.citation, j.database_id, j.date_decision,
-                                   j.resume, j.province, j.resultat
-                            FROM jurisprudence j
-                            WHERE j.province = 'ON'
-                              AND (j.titre ILIKE %s OR j.resume ILIKE %s)
-                            ORDER BY j.date_decision DESC NULLS LAST
-                            LIMIT %s
-                        """, (pattern, pattern, limit))
-                        for row in cur.fetchall():
-                            if row[0] not in seen_ids:
-                                seen_ids.add(row[0])
-                                results.append({
-                                    "id": row[0], "citation": row[1],
-                                    "tribunal": (row[2] or "").upper(),
-                                    "date": str(row[3]) if row[3] else "",
-                                    "resume": (row[4] or "")[:300],
-                                    "juridiction": row[5] or "ON",
-                                    "resultat": row[6] or "inconnu",
-                                    "source": "PostgreSQL-ILIKE-ON", "score": 50
-                                })
-                    except Exception:
-                        pass
+            requetes.append(requete(query[:50], FTS_EN, query, limit=limit, score=65,
+                                    source="PostgreSQL-ONCA", province="ON", databases=("onca",)))
+            # Fallback: CSC applicable a l'Ontario
+            requetes.append(requete(query[:50], FTS_EN, query, limit=5, score=60,
+                                    source="PostgreSQL-Federal", databases=("scc", "csc")))
 
-            conn.close()
+        results, onca, federal = [], [], []
+        candidats = None
+        try:
+            conn = self.get_db()
+            try:
+                candidats = rechercher_multi(conn, requetes)
+            finally:
+                conn.close()
         except Exception as e:
             self.log(f"Erreur tsvector ON: {e}", "FAIL")
-        return results
 
-    def _recherche_tsvector_federale(self, infraction, limit=5):
-        """Fallback: CSC decisions applicable to Ontario"""
-        results = []
-        try:
-            conn = self.get_db()
-            cur = conn.cursor()
-            queries = self._generer_requetes_on(infraction)
-            seen_ids = set()
-            for query in queries:
+        if candidats is None:
+            # Lot en echec: le fallback federal est retente seul
+            try:
+                conn = self.get_db()
                 try:
+                    candidats = rechercher_multi(
+                        conn, [r for r in requetes if r["source"] == "PostgreSQL-Federal"])
+                finally:
+                    conn.close()
+            except Exception as e:
+                self.log(f"Erreur tsvector federal: {e}", "WARN")
+                candidats = []
+
+        for c in candidats:
+            r = {
+                "id": c["id"], "citation": c["citation"],
+                "tribunal": (c["database_id"] or "").upper(),
+                "date": str(c["date_decision"]) if c["date_decision"] else "",
+                "resume": (c["resume"] or "")[:300],
+                "juridiction": c["province"] or "ON",
+                "resultat": c["resultat"] or "inconnu",
+                "source": "PostgreSQL-ON", "score": c["score"],
+                "requetes": c["requetes"]
+            }
+            if c["source"] == "PostgreSQL-Federal":
+                r.update({"juridiction": "ON", "source": "PostgreSQL-Federal"})
+                federal.append(r)
+            elif c["source"] == "PostgreSQL-ONCA":
+                onca.append(r)
+            else:
+                results.append(r)
+        results.extend(onca[:max(0, limit - len(results))])
+
+        # Priorite 3: recherche ILIKE si tsvector donne rien (aller-retour seulement dans ce cas)
+        if not results:
+            infraction_words = [w for w in infraction.lower().split() if len(w) > 3][:3]
+            if infraction_words:
+                pattern = f"%{'%'.join(infraction_words)}%"
+                try:
+                    conn = self.get_db()
+                    cur = conn.cursor()
                     cur.execute("""
                         SELECT j.id, j.citation, j.database_id, j.date_decision,
                                j.resume, j.province, j.resultat
                         FROM jurisprudence j
-                        WHERE j.database_id IN ('scc', 'csc')
-                          AND j.tsv_en @@ to_tsquery('english', %s)
+                        WHERE j.province = 'ON'
+                          AND (j.titre ILIKE %s OR j.resume ILIKE %s)
+                        ORDER BY j.date_decision DESC NULLS LAST
                         LIMIT %s
-                    """, (query, limit))
+                    """, (pattern, pattern, limit))
                     for row in cur.fetchall():
-                        if row[0] not in seen_ids:
-                            seen_ids.add(row[0])
-                            results.append({
-                                "id": row[0], "citation": row[1],
-                                "tribunal": (row[2] or "").upper(),
-                                "date": str(row[3]) if row[3] else "",
-                                "resume": (row[4] or "")[:300],
-                                "juridiction": "ON",
-                                "resultat": row[6] or "inconnu",
-                                "source": "PostgreSQL-Federal", "score": 60
-                            })
-                except Exception:
-                    pass
-            conn.close()
-        except Exception as e:
-            self.log(f"Erreur tsvector Federal: {e}", "FAIL")
-        return results
+                        results.append({
+                            "id": row[0], "citation": row[1],
+                            "tribunal": (row[2] or "").upper(),
+                            "date": str(row[3]) if row[3] else "",
+                            "resume": (row[4] or "")[:300],
+                            "juridiction": row[5] or "ON",
+                            "resultat": row[6] or "inconnu",
+                            "source": "PostgreSQL-ILIKE-ON", "score": 50
+                        })
+                    conn.close()
+                except Exception as e:
+                    self.log(f"Erreur ILIKE ON: {e}", "WARN")
+        return results, federal
 
     def _recherche_semantique_on(self, infraction, n_results=10):
         if not self.chroma_collection or self.chroma_collection.count() == 0:
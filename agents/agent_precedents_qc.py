@@ -2,11 +2,13 @@
 Agent QC: PRECEDENTS QUEBEC — PostgreSQL tsvector + ChromaDB (optionnel)
 Recherche hybride tsvector GIN specifique Quebec
 V2: Requetes specifiques au ticket + diversification + recherche par article/mots_cles
+V3: Toutes les requetes candidates en un seul aller-retour (agents/precedents_engine.py)
 """
 
-import re
 import time
 from agents.base_agent import BaseAgent, CANLII_API_KEY
+from agents.precedents_engine import requete, rechercher_multi, FTS_FR, ARTICLE, ILIKE_MOTS_CLES
+from agents.article_citations import extraire_article_simple
 
 
 class AgentPrecedentsQC(BaseAgent):
@@ -40,17 +42,13 @@ class AgentPrecedentsQC(BaseAgent):
         contexte = self._extraire_contexte_ticket(ticket)
         self.log(f"  Contexte: {contexte.get('type', '?')} | Tags: {contexte.get('tags', [])}", "INFO")
 
-        # 1. PostgreSQL tsvector — requetes SPECIFIQUES au ticket
-        fts_results = self._recherche_tsvector_qc(ticket, contexte, n_results)
+        # 1-3. tsvector (requetes SPECIFIQUES au ticket) + article de loi cite + mots_cles
+        #      — un seul aller-retour SQL pour toutes les requetes candidates
+        fts_results, article_results, mots_cles_results = self._recherche_multi_qc(
+            ticket, contexte, lois, n_results)
         self.log(f"  PostgreSQL tsvector: {len(fts_results)} cas QC", "OK" if fts_results else "WARN")
-
-        # 2. Recherche par article de loi cite
-        article_results = self._recherche_par_article(ticket, lois, n_results)
         if article_results:
             self.log(f"  Par article loi: {len(article_results)} cas QC", "OK")
-
-        # 3. Recherche par mots_cles array (index GIN)
-        mots_cles_results = self._recherche_par_mots_cles(contexte, n_results)
         if mots_cles_results:
             self.log(f"  Par mots-cles: {len(mots_cles_results)} cas QC", "OK")
 
@@ -220,177 +218,78 @@ class AgentPrecedentsQC(BaseAgent):
 
         return ctx
 
-    def _recherche_tsvector_qc(self, ticket, contexte, limit=15):
-        """Recherche tsvector PostgreSQL avec requetes SPECIFIQUES au ticket"""
-        results = []
+    def _recherche_multi_qc(self, ticket, contexte, lois, limit=10):
+        """Toutes les requetes candidates (tsvector + article + mots-cles) en UN aller-retour SQL.
+        Retourne (fts, articles, mots_cles) pour _combiner_et_diversifier."""
+        requetes = (self._requetes_tsvector_qc(contexte, limit)
+                    + self._requetes_par_article(ticket, lois, limit)
+                    + self._requetes_par_mots_cles(contexte, limit))
+        groupes = {"PostgreSQL-QC": [], "PostgreSQL-article": [], "PostgreSQL-mots_cles": []}
         try:
             conn = self.get_db()
-            cur = conn.cursor()
-            seen_ids = set()
-
-            queries = contexte.get("queries_specifiques", ["contravention & quebec"])
-
-            for query in queries:
-                try:
-                    cur.execute("""
-                        SELECT j.id, j.citation, j.database_id, j.date_decision,
-                               j.resume, j.province, j.resultat, j.titre,
-                               ts_rank(j.tsv_fr, to_tsquery('french', %s)) AS rank
-                        FROM jurisprudence j
-                        WHERE j.province = 'QC'
-                          AND j.database_id IN ('qccm', 'qccq', 'qccs', 'qcca')
-                          AND j.est_ticket_related = true
-                          AND j.tsv_fr @@ to_tsquery('french', %s)
-                        ORDER BY
-                          CASE WHEN j.resultat IS NOT NULL THEN 0 ELSE 1 END,
-                          rank DESC,
-                          j.date_decision DESC NULLS LAST
-                        LIMIT %s
-                    """, (query, query, limit))
-                    for row in cur.fetchall():
-                        if row[0] not in seen_ids:
-                            seen_ids.add(row[0])
-                            tribunal_score = 90 if row[2] == 'qccm' else 85 if row[2] == 'qccq' else 75
-                            results.append({
-                                "id": row[0], "citation": row[1],
-                                "tribunal": (row[2] or "").upper(),
-                                "date": str(row[3]) if row[3] else "",
-                                "resume": (row[4] or "")[:300],
-                                "titre": (row[7] or "")[:200],
-                                "juridiction": row[5] or "QC",
-                                "resultat": row[6] or "inconnu",
-                                "source": "PostgreSQL-QC",
-                                "score": tribunal_score,
-                                "requete": query[:50]
-                            })
-                except Exception:
-                    pass
-
+            candidats = rechercher_multi(conn, requetes)
             conn.close()
         except Exception as e:
-            self.log(f"Erreur tsvector QC: {e}", "FAIL")
-        return results
-
-    def _recherche_par_article(self, ticket, lois, limit=10):
-        """Recherche par article de loi cite — utilise lois_pertinentes array"""
-        results = []
-        loi_ticket = (ticket.get("loi", "") or "").lower()
-
-        # Extraire numeros d'articles
-        articles = re.findall(r'art\.?\s*(\d+(?:\.\d+)?)', loi_ticket)
+            self.log(f"Erreur recherche multi QC: {e}", "FAIL")
+            return [], [], []
+
+        for c in candidats:
+            # Un cas trouve par plusieurs familles de requetes apparait dans chacune (bonus multi-source)
+            for source, tag in c["sources"].items():
+                if source == "PostgreSQL-QC":
+                    db = c["database_id"]
+                    score = 90 if db == 'qccm' else 85 if db == 'qccq' else 75
+                else:
+                    score = c["score"]
+                groupes[source].append({
+                    "id": c["id"], "citation": c["citation"],
+                    "tribunal": (c["database_id"] or "").upper(),
+                    "date": str(c["date_decision"]) if c["date_decision"] else "",
+                    "resume": (c["resume"] or "")[:300],
+                    "titre": (c["titre"] or "")[:200],
+                    "juridiction": c["province"] or "QC",
+                    "resultat": c["resultat"] or "inconnu",
+                    "source": source,
+                    "score": score,
+                    "requete": tag,
+                    "requetes": c["requetes"],
+                })
+        return groupes["PostgreSQL-QC"], groupes["PostgreSQL-article"], groupes["PostgreSQL-mots_cles"]
+
+    def _requetes_tsvector_qc(self, contexte, limit=15):
+        """Requetes tsvector SPECIFIQUES au ticket (Cour municipale, CQ, CS, CA)"""
+        queries = contexte.get("queries_specifiques", ["contravention & quebec"])
+        return [requete(query[:50], FTS_FR, query, limit=limit, source="PostgreSQL-QC",
+                        province="QC", databases=("qccm", "qccq", "qccs", "qcca"), ticket_only=True)
+                for query in queries]
+
+    def _requetes_par_article(self, ticket, lois, limit=10):
+        """Requetes par article de loi cite (index jurisprudence_articles)"""
+        # Extraire (loi, article): "CSR art. 299", "art. 329.2", "299"
+        articles = [(loi, art) for loi, art, _base in extraire_article_simple(ticket.get("loi", ""), "CSR")]
         if not articles and lois:
             for l in lois[:3]:
                 if isinstance(l, dict):
                     art = l.get("article", "")
                     if art:
-                        articles.append(str(art))
-
-        if not articles:
-            return []
-
-        try:
-            conn = self.get_db()
-            cur = conn.cursor()
-            seen_ids = set()
-
-            for art_num in articles[:3]:
-                # Chercher les cas qui citent cet article
-                art_patterns = [f"%art. {art_num}%", f"%art.{art_num}%", f"%article {art_num}%"]
-                for pattern in art_patterns:
-                    try:
-                        cur.execute("""
-                            SELECT j.id, j.citation, j.database_id, j.date_decision,
-                                   j.resume, j.province, j.resultat, j.titre
-                            FROM jurisprudence j
-                            WHERE j.province = 'QC'
-                              AND j.est_ticket_related = true
-                              AND (
-                                  j.titre ILIKE %s
-                                  OR j.resume ILIKE %s
-                                  OR array_to_string(j.mots_cles, ' ') ILIKE %s
-                              )
-                            ORDER BY
-                              CASE WHEN j.resultat IS NOT NULL THEN 0 ELSE 1 END,
-                              j.date_decision DESC NULLS LAST
-                            LIMIT %s
-                        """, (pattern, pattern, pattern, limit))
-                        for row in cur.fetchall():
-                            if row[0] not in seen_ids:
-                                seen_ids.add(row[0])
-                                results.append({
-                                    "id": row[0], "citation": row[1],
-                                    "tribunal": (row[2] or "").upper(),
-                                    "date": str(row[3]) if row[3] else "",
-                                    "resume": (row[4] or "")[:300],
-                                    "titre": (row[7] or "")[:200],
-                                    "juridiction": row[5] or "QC",
-                                    "resultat": row[6] or "inconnu",
-                                    "source": "PostgreSQL-article",
-                                    "score": 88,
-                                    "requete": f"art.{art_num}"
-                                })
-                    except Exception:
-                        pass
-
-            conn.close()
-        except Exception as e:
-            self.log(f"Erreur recherche par article: {e}", "WARN")
-
-        return results
-
-    def _recherche_par_mots_cles(self, contexte, limit=10):
-        """Recherche par mots_cles array (index GIN) — tres specifique"""
-        results = []
-        mots = contexte.get("mots_cles_recherche", [])
-        if not mots:
-            return []
-
-        try:
-            conn = self.get_db()
-            cur = conn.cursor()
-            seen_ids = set()
-
-            # Chercher par combinaison de mots-cles
-            for mot in mots[:5]:
-                mot_clean = mot.strip().lower()
-                if len(mot_clean) < 3:
-                    continue
-                try:
-                    cur.execute("""
-                        SELECT j.id, j.citation, j.database_id, j.date_decision,
-                               j.resume, j.province, j.resultat, j.titre
-                        FROM jurisprudence j
-                        WHERE j.province = 'QC'
-                          AND j.est_ticket_related = true
-                          AND array_to_string(j.mots_cles, ' ') ILIKE %s
-                        ORDER BY
-                          CASE WHEN j.resultat IS NOT NULL THEN 0 ELSE 1 END,
-                          j.date_decision DESC NULLS LAST
-                        LIMIT %s
-                    """, (f"%{mot_clean}%", limit))
-                    for row in cur.fetchall():
-                        if row[0] not in seen_ids:
-                            seen_ids.add(row[0])
-                            results.append({
-                                "id": row[0], "citation": row[1],
-                                "tribunal": (row[2] or "").upper(),
-                                "date": str(row[3]) if row[3] else "",
-                                "resume": (row[4] or "")[:300],
-                                "titre": (row[7] or "")[:200],
-                                "juridiction": row[5] or "QC",
-                                "resultat": row[6] or "inconnu",
-                                "source": "PostgreSQL-mots_cles",
-                                "score": 82,
-                                "requete": f"mc:{mot_clean}"
-                            })
-                except Exception:
-                    pass
-
-            conn.close()
-        except Exception as e:
-            self.log(f"Erreur recherche mots-cles: {e}", "WARN")
-
-        return results
+                        articles += [(loi, a) for loi, a, _base in extraire_article_simple(str(art), "CSR")]
+
+        requetes = []
+        for loi, art_num in list(dict.fromkeys(articles))[:3]:
+            requetes.append(requete(f"art.{art_num}", ARTICLE, art_num, limit=limit, score=88, loi=loi or None,
+                                    source="PostgreSQL-article", province="QC", ticket_only=True))
+        return requetes
+
+    def _requetes_par_mots_cles(self, contexte, limit=10):
+        """Requetes par mots_cles array — tres specifique"""
+        requetes = []
+        for mot in contexte.get("mots_cles_recherche", [])[:5]:
+            mot_clean = mot.strip().lower()
+            if len(mot_clean) < 3:
+                continue
+            requetes.append(requete(f"mc:{mot_clean}", ILIKE_MOTS_CLES, f"%{mot_clean}%", limit=limit,
+                                    score=82, source="PostgreSQL-mots_cles", province="QC", ticket_only=True))
+        return requetes
 
     def _recherche_semantique_qc(self, ticket, contexte, n_results=10):
         """Recherche semantique avec contexte SPECIFIQUE au ticket"""
@@ -484,6 +383,16 @@ class AgentPrecedentsQC(BaseAgent):
                     if len(r.get("resume", "")) > len(all_results[key].get("resume", "")):
                         all_results[key]["resume"] = r["resume"]
 
+        # Bonus d'autorite: cas souvent cites (PageRank du graphe de citations, 0-5 pts)
+        autorite = self._autorite_citations([r["id"] for r in all_results.values()
+                                             if isinstance(r.get("id"), int)])
+        for r in all_results.values():
+            a = autorite.get(r.get("id"))
+            if a:
+                r["autorite"] = a
+                if a["citations_recues"]:
+                    r["score"] = min(100, r.get("score", 0) + round(5 * a["autorite"]))
+
         # Trier par score
         sorted_results = sorted(all_results.values(), key=lambda x: x.get("score", 0), reverse=True)
 
@@ -7,6 +7,8 @@ import time
 import re
 from datetime import datetime, timedelta
 from agents.base_agent import BaseAgent
+from agents.catalogue_lois import get_catalogue
+from agents.article_citations import extraire_article_simple, LOI_PAR_PROVINCE
 
 
 class AgentValidateur(BaseAgent):
@@ -124,6 +126,17 @@ class AgentValidateur(BaseAgent):
         juridiction = classification.get("juridiction", "QC")
         type_inf = classification.get("type_infraction", "")
 
+        officiel = self._bareme_officiel(ticket, juridiction)
+        if officiel and officiel.get("amende_min") is not None:
+            bmin, bmax = officiel["amende_min"], officiel.get("amende_max") or officiel["amende_min"]
+            dans_bareme = bmin <= montant <= bmax * 1.5  # marge pour frais
+            return {
+                "test": "amende",
+                "valide": dans_bareme,
+                "detail": f"${montant} {'dans' if dans_bareme else 'HORS'} bareme officiel "
+                          f"art. {officiel['article']} (${bmin:.0f}-${bmax:.0f})"
+            }
+
         bareme = None
         if juridiction == "QC":
             if type_inf == "cellulaire":
@@ -151,6 +164,47 @@ class AgentValidateur(BaseAgent):
 
         return {"test": "amende", "valide": True, "detail": f"${montant} — bareme non verifie"}
 
+    def _bareme_officiel(self, ticket, juridiction):
+        """Amende/points officiels de l'article cite: SAAQ (QC), set fines (ON), lois_articles sinon.
+        Resolution en memoire (catalogue_lois) — aucun SQL par ticket."""
+        refs = extraire_article_simple(ticket.get("loi", ""), LOI_PAR_PROVINCE.get(juridiction))
+        if not refs:
+            return None
+        article = refs[0][1]
+        try:
+            catalogue = get_catalogue(self.get_db)
+        except Exception as e:
+            self.log(f"Catalogue lois: {e}", "WARN")
+            return None
+
+        if juridiction == "QC":
+            exces = (ticket.get("vitesse_captee", 0) or 0) - (ticket.get("vitesse_permise", 0) or 0)
+            lignes = catalogue.points_saaq_article(article, exces if exces > 0 else None)
+            if lignes:
+                return self._agreger_bareme(article, [(l["amende_min"], l["amende_max"], l["points"]) for l in lignes])
+        elif juridiction == "ON":
+            lignes = catalogue.amende_on(article)
+            if lignes:
+                return self._agreger_bareme(article, [(l["total_payable"], l["total_payable"], l["points"])
+                                                      for l in lignes])
+
+        lignes = catalogue.exact(juridiction, article)
+        if lignes:
+            l = lignes[0]
+            return {"article": article, "amende_min": l["amende_min"], "amende_max": l["amende_max"],
+                    "points": l["points_max"] if l["points_min"] == l["points_max"] else None}
+        return None
+
+    def _agreger_bareme(self, article, lignes):
+        """Plusieurs lignes (tranches, sous-sections): fourchette globale, points seulement si uniques"""
+        minimums = [mn for mn, _mx, _p in lignes if mn is not None]
+        maximums = [mx for _mn, mx, _p in lignes if mx is not None]
+        points = {p for _mn, _mx, p in lignes if p is not None}
+        return {"article": article,
+                "amende_min": min(minimums) if minimums else None,
+                "amende_max": max(maximums) if maximums else None,
+                "points": points.pop() if len(points) == 1 else None}
+
     def _verifier_date(self, ticket):
         date_str = ticket.get("date", "")
         if not date_str:
@@ -178,6 +232,12 @@ class AgentValidateur(BaseAgent):
         if points > max_pts:
             return {"test": "points", "valide": False, "detail": f"{points} pts > max {max_pts} pour {juridiction}"}
 
+        officiel = self._bareme_officiel(ticket, juridiction)
+        if points and officiel and officiel.get("points") is not None and points != officiel["points"]:
+            return {"test": "points", "valide": False,
+                    "detail": f"{points} pts sur le ticket vs {officiel['points']} pts au bareme "
+                              f"officiel (art. {officiel['article']})"}
+
         return {"test": "points", "valide": True, "detail": f"{points} pts — coherent pour {juridiction}"}
 
     def _verifier_vitesse(self, ticket):
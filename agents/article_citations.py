@@ -0,0 +1,200 @@
+"""
+Index des articles de loi cites par la jurisprudence
+Table jurisprudence_articles (jurisprudence_id, loi, article, article_base) + index B-tree:
+la recherche "quels cas citent l'art. 299 CSR" devient une sonde d'index
+au lieu d'un ILIKE '%art. 299%' sur titre/resume/mots_cles (scan complet).
+
+Rempli au moment de la classification (classifier.py) et par backfill:
+    python3 -m agents.article_citations            # indexer les dossiers non indexes
+    python3 -m agents.article_citations --all      # re-indexer tout
+"""
+
+import os
+import re
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Lois reconnues — cle normalisee -> variantes (minuscules, sans accents necessaires)
+LOIS = {
+    "CSR": [r"c\.?\s*s\.?\s*r\.?", r"code\s+de\s+la\s+s[eé]curit[eé]\s+routi[eè]re", r"c-24\.2"],
+    "HTA": [r"h\.?\s*t\.?\s*a\.?", r"highway\s+traffic\s+act", r"h\.8"],
+    "VTL": [r"v\.?\s*t\.?\s*l\.?", r"vehicle\s+(?:and|&)\s+traffic\s+law"],
+    "CPP": [r"c\.?\s*p\.?\s*p\.?", r"code\s+de\s+proc[eé]dure\s+p[eé]nale", r"c-25\.1"],
+    "POA": [r"p\.?\s*o\.?\s*a\.?", r"provincial\s+offences\s+act"],
+    "CCR": [r"c\.\s*cr\.?", r"code\s+criminel", r"criminal\s+code"],
+    "CHARTE": [r"charte", r"charter"],
+}
+
+# Loi par defaut quand la reference ne nomme pas la loi
+LOI_PAR_PROVINCE = {"QC": "CSR", "ON": "HTA", "NY": "VTL"}
+
+_LOI_RE = re.compile("|".join(f"(?P<{k}>{'|'.join(v)})" for k, v in LOIS.items()), re.IGNORECASE)
+
+# Numero d'article: 299, 329.2, 128(1), 1180(d), 516.1(2)a)
+_NUM = r"\d{1,4}(?:\.\d{1,3})*(?:\s*\(\s*[0-9a-z]{1,3}\s*\))*"
+_SEP = r"\s*(?:,|;|\bet\b|\band\b|\bou\b|\bor\b|\bà\b|\ba\b|\bto\b|-|–)\s*"
+
+# Mots-cles introduisant une reference: art./arts./article(s), s./ss./sec./section(s), §
+_REF_RE = re.compile(
+    rf"(?:\b(?:articles?|arts?\.?|sections?|secs?\.|ss?\.)|§§?)\s*(?P<nums>{_NUM}(?:{_SEP}{_NUM})*)",
+    re.IGNORECASE,
+)
+# Loi AVANT la reference: "CSR art. 299", "HTA s. 128", "VTL § 1180"
+_LOI_AVANT_RE = re.compile(rf"(?:{_LOI_RE.pattern})\s*,?\s*$", re.IGNORECASE)
+_NUM_RE = re.compile(_NUM, re.IGNORECASE)
+_BARE_RE = re.compile(rf"^\s*(?P<nums>{_NUM})\s*(?P<reste>.*)$", re.IGNORECASE)
+
+# Fenetre apres une reference ou chercher le nom de la loi ("... de la Loi X", "of the HTA")
+_FENETRE_LOI = 60
+
+
+def _loi_de(match):
+    for k, v in match.groupdict().items():
+        if v:
+            return k
+    return None
+
+
+def normaliser_article(num):
+    """'329.2(1)a)' -> ('329.2', '329'); '128 (1)' -> ('128', '128')"""
+    article = re.sub(r"\s*\(.*$", "", num.strip())
+    return article, article.split(".")[0]
+
+
+def extraire_articles(texte, loi_defaut=None):
+    """Extrait les references d'articles d'un texte libre.
+    Retourne une liste ordonnee sans doublons de (loi, article, article_base)."""
+    if not texte:
+        return []
+    refs = []
+    loi_prec, fin_prec = None, -1
+    for m in _REF_RE.finditer(texte):
+        apres = texte[m.end():m.end() + _FENETRE_LOI]
+        avant = texte[max(0, m.start() - 30):m.start()]
+        loi = None
+        m_apres = _LOI_RE.search(apres)
+        # La loi nommee apres compte seulement si aucune autre reference ne s'intercale
+        if m_apres and not _REF_RE.search(apres[:m_apres.start()]):
+            loi = _loi_de(m_apres)
+        if not loi:
+            m_avant = _LOI_AVANT_RE.search(avant)
+            if m_avant:
+                loi = _loi_de(m_avant)
+        # Enumeration dans la meme phrase: "HTA s. 128; ss. 130 and 172" -> HTA
+        if not loi and loi_prec and m.start() - fin_prec < _FENETRE_LOI:
+            loi = loi_prec
+        loi_prec, fin_prec = loi, m.end()
+        loi = loi or loi_defaut or ""
+        for num in _NUM_RE.findall(m.group("nums")):
+            article, base = normaliser_article(num)
+            refs.append((loi, article, base))
+    return list(dict.fromkeys(refs))
+
+
+def extraire_article_simple(valeur, loi_defaut=None):
+    """Pour les champs structures (lois_pertinentes, article_csr, champ 'loi' d'un ticket):
+    accepte aussi un numero nu ('299', '329.2 CSR')."""
+    refs = extraire_articles(valeur, loi_defaut)
+    if refs or not valeur:
+        return refs
+    m = _BARE_RE.match(str(valeur))
+    if not m:
+        return []
+    m_loi = _LOI_RE.search(m.group("reste") or "")
+    loi = _loi_de(m_loi) if m_loi else (loi_defaut or "")
+    article, base = normaliser_article(m.group("nums"))
+    return [(loi, article, base)]
+
+
+def articles_du_dossier(row):
+    """Toutes les references d'un dossier jurisprudence: [(loi, article, base, champ), ...]"""
+    loi_defaut = LOI_PAR_PROVINCE.get((row.get("province") or "").upper())
+    vus = set()
+    refs = []
+
+    def ajouter(triplets, champ):
+        for t in triplets:
+            if t not in vus:
+                vus.add(t)
+                refs.append(t + (champ,))
+
+    ajouter(extraire_articles(row.get("titre"), loi_defaut), "titre")
+    ajouter(extraire_articles(row.get("resume"), loi_defaut), "resume")
+    for mc in row.get("mots_cles") or []:
+        ajouter(extraire_articles(mc, loi_defaut), "mots_cles")
+    for lp in row.get("lois_pertinentes") or []:
+        ajouter(extraire_article_simple(lp, loi_defaut), "lois_pertinentes")
+    if row.get("article_csr"):
+        ajouter(extraire_article_simple(row["article_csr"], "CSR"), "article_csr")
+    return refs
+
+
+def indexer_jurisprudence(conn, limit=500):
+    """Indexe les dossiers pas encore indexes (articles_indexes_at IS NULL).
+    Retourne le nombre de dossiers traites."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, province, titre, resume, mots_cles, lois_pertinentes, article_csr
+        FROM jurisprudence
+        WHERE articles_indexes_at IS NULL
+        ORDER BY id
+        LIMIT %s
+    """, (limit,))
+    columns = [d[0] for d in cur.description]
+    rows = [dict(zip(columns, r)) for r in cur.fetchall()]
+    if not rows:
+        cur.close()
+        return 0
+
+    ids = [r["id"] for r in rows]
+    valeurs = []
+    for r in rows:
+        for loi, article, base, champ in articles_du_dossier(r):
+            valeurs.append((r["id"], loi, article, base, champ))
+
+    cur.execute("DELETE FROM jurisprudence_articles WHERE jurisprudence_id = ANY(%s)", (ids,))
+    if valeurs:
+        import psycopg2.extras
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO jurisprudence_articles (jurisprudence_id, loi, article, article_base, champ)
+            VALUES %s
+            ON CONFLICT (jurisprudence_id, loi, article) DO NOTHING
+        """, valeurs, page_size=1000)
+    cur.execute("UPDATE jurisprudence SET articles_indexes_at = NOW() WHERE id = ANY(%s)", (ids,))
+    conn.commit()
+    cur.close()
+    return len(rows)
+
+
+# Filtre SQL reutilisable: "dossiers citant l'article X" (299 couvre 299.1, 299.2...)
+SQL_CITE_ARTICLE = """
+    (ja.article = %(article)s OR ja.article_base = %(article)s)
+    AND (%(loi)s::text IS NULL OR ja.loi = %(loi)s OR ja.loi = '')
+"""
+
+
+def main():
+    sys.path.insert(0, PROJECT_DIR)
+    import psycopg2
+    from agents.base_agent import PG_CONFIG
+
+    conn = psycopg2.connect(**PG_CONFIG)
+    total = 0
+    if "--all" in sys.argv:
+        cur = conn.cursor()
+        cur.execute("UPDATE jurisprudence SET articles_indexes_at = NULL")
+        conn.commit()
+        cur.close()
+    while True:
+        n = indexer_jurisprudence(conn, limit=2000)
+        if not n:
+            break
+        total += n
+        print(f"  [{total}] dossiers indexes")
+    conn.close()
+    print(f"Termine: {total} dossiers")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,8 @@ import base64
 import threading
 from datetime import datetime
 from openai import OpenAI
-import psycopg2
-import psycopg2.extras
+
+from agents import images, metrics, sql_stats, tracing
 
 # Load .env si disponible
 try:
@@ -261,7 +261,15 @@ class BaseAgent:
 
     def get_db(self):
         """Retourne une connexion PostgreSQL."""
-        return psycopg2.connect(**PG_CONFIG)
+        start = time.perf_counter()
+        try:
+            conn = sql_stats.connecter(self.name, **PG_CONFIG)
+        except Exception:
+            metrics.DB_ERREURS.inc(agent=self.name)
+            raise
+        metrics.DB_CONNECT_DUREE.observe(time.perf_counter() - start, agent=self.name)
+        metrics.DB_CHECKOUTS.inc(agent=self.name)
+        return conn
 
     def log_run(self, action, input_summary, output_summary, tokens=0, duration=0, success=True, error=None):
         try:
@@ -307,10 +315,12 @@ class BaseAgent:
             tokens = response.usage.total_tokens if response.usage else 0
             duration = time.time() - start
             provider = MODEL_PROVIDER.get(model, "fireworks")
+            self._mesurer_appel(model, "text", "success", duration, tokens)
 
             return {"text": text, "tokens": tokens, "duration": duration, "success": True, "model": model, "provider": provider}
         except Exception as e:
             duration = time.time() - start
+            self._mesurer_appel(model, "text", "error", duration, erreur=e)
             model_short = model.split('/')[-1] if '/' in model else model
             # Fallback en cascade: essayer le prochain modele disponible
             # D'abord chercher dans la chain du meme type
@@ -321,16 +331,19 @@ class BaseAgent:
                     next_model = chain[idx + 1]
                     next_short = next_model.split('/')[-1] if '/' in next_model else next_model
                     self.log(f"Fallback {model_short} → {next_short}", "WARN")
+                    self._mesurer_fallback(model, next_model, "text")
                     return self.call_ai(prompt, system_prompt, model=next_model, temperature=temperature, max_tokens=max_tokens)
             except ValueError:
                 pass
             # Fallback cross-provider: rapide → Fireworks ou Fireworks → rapide
             if model not in self.FALLBACK_CHAIN and model != DEEPSEEK_V3:
                 self.log(f"Fallback {model_short} → deepseek-v3 (cross-provider)", "WARN")
+                self._mesurer_fallback(model, DEEPSEEK_V3, "text")
                 return self.call_ai(prompt, system_prompt, model=DEEPSEEK_V3, temperature=temperature, max_tokens=max_tokens)
             elif model in self.FALLBACK_CHAIN and GROQ_API_KEY:
                 # Fireworks epuise → essayer Groq
                 self.log(f"Fallback {model_short} → groq-llama70b (cross-provider)", "WARN")
+                self._mesurer_fallback(model, GROQ_LLAMA70B, "text")
                 return self.call_ai(prompt, system_prompt, model=GROQ_LLAMA70B, temperature=temperature, max_tokens=max_tokens)
             return {"text": "", "tokens": 0, "duration": duration, "success": False, "error": str(e)}
 
@@ -340,8 +353,9 @@ class BaseAgent:
         client = self._resolve_client(model)
         start = time.time()
         try:
-            # Encoder l'image si chemin fourni
+            # Encoder l'image si chemin fourni (derive compact: moins d'octets et de tokens image)
             if image_path and not image_base64:
+                image_path = images.derive(image_path, "vision")["chemin"]
                 with open(image_path, "rb") as f:
                     image_base64 = base64.b64encode(f.read()).decode("utf-8")
 
@@ -373,13 +387,34 @@ class BaseAgent:
             text = response.choices[0].message.content
             tokens = response.usage.total_tokens if response.usage else 0
             duration = time.time() - start
+            self._mesurer_appel(model, "vision", "success", duration, tokens)
 
             return {"text": text, "tokens": tokens, "duration": duration, "success": True, "model": model}
         except Exception as e:
             duration = time.time() - start
+            self._mesurer_appel(model, "vision", "error", duration, erreur=e)
+            self._mesurer_fallback(model, DEEPSEEK_V3, "vision")
             self.log(f"Vision fail, fallback texte: {e}", "WARN")
             return self.call_ai(prompt, system_prompt, temperature=temperature, max_tokens=max_tokens)
 
+    @staticmethod
+    def _mesurer_appel(model, kind, outcome, duration, tokens=0, erreur=None):
+        """Metriques (agents/metrics.py) + span de trace (agents/tracing.py) par tentative"""
+        provider = MODEL_PROVIDER.get(model, "fireworks")
+        model_short = model.split('/')[-1]
+        metrics.AI_APPELS.inc(provider=provider, model=model_short, kind=kind, outcome=outcome)
+        metrics.AI_DUREE.observe(duration, provider=provider, model=model_short, kind=kind, outcome=outcome)
+        if tokens:
+            metrics.AI_TOKENS.inc(tokens, provider=provider, model=model_short)
+        tracing.span_termine("call_ai", duration, erreur=erreur, provider=provider, model=model_short,
+                             kind=kind, outcome=outcome, tokens=tokens)
+
+    @staticmethod
+    def _mesurer_fallback(model, next_model, kind):
+        de, vers = model.split('/')[-1], next_model.split('/')[-1]
+        metrics.AI_FALLBACKS.inc(from_model=de, to_model=vers, kind=kind)
+        tracing.span_termine("call_ai.fallback", 0, de=de, vers=vers, kind=kind)
+
     def parse_json_response(self, text):
         """Parse JSON depuis une reponse AI (gere blocs markdown, thinking text, etc.)"""
         if not text or not text.strip():
@@ -608,15 +643,15 @@ class BaseAgent:
                 # Stats pour le même article CSR
                 cur.execute("""
                     SELECT
-                        raw_data->>'NO_ARTCL_L_R' AS article,
-                        raw_data->>'DESCN_CAT_INFRA' AS categorie,
+                        article,
+                        description_infraction AS categorie,
                         COUNT(*) AS nb_constats,
-                        COUNT(DISTINCT raw_data->>'COD_MUNI_LIEU') AS nb_municipalites,
-                        MIN(raw_data->>'DAT_INFRA_COMMI') AS premiere_date,
-                        MAX(raw_data->>'DAT_INFRA_COMMI') AS derniere_date
+                        COUNT(DISTINCT lieu_infraction) AS nb_municipalites,
+                        MIN(date_infraction) AS premiere_date,
+                        MAX(date_infraction) AS derniere_date
                     FROM qc_constats_infraction
-                    WHERE raw_data->>'NO_ARTCL_L_R' = %s
-                    GROUP BY raw_data->>'NO_ARTCL_L_R', raw_data->>'DESCN_CAT_INFRA'
+                    WHERE article = %s
+                    GROUP BY article, description_infraction
                     LIMIT 5
                 """, (article,))
 
@@ -632,11 +667,11 @@ class BaseAgent:
             if not results:
                 cur.execute("""
                     SELECT
-                        raw_data->>'DESCN_CAT_INFRA' AS categorie,
+                        description_infraction AS categorie,
                         COUNT(*) AS nb_constats
                     FROM qc_constats_infraction
-                    WHERE raw_data->>'DESCN_CAT_INFRA' ILIKE %s
-                    GROUP BY raw_data->>'DESCN_CAT_INFRA'
+                    WHERE description_infraction ILIKE %s
+                    GROUP BY description_infraction
                     ORDER BY nb_constats DESC LIMIT 5
                 """, ("%vitesse%",))
                 for row in cur.fetchall():
@@ -661,21 +696,21 @@ class BaseAgent:
             for part in lieu_parts[:3]:
                 cur.execute("""
                     SELECT
-                        raw_data->>'Site' AS site,
-                        raw_data->>'Moyen' AS moyen,
-                        (raw_data->>'Nombre')::bigint AS nb_constats,
+                        localisation AS site,
+                        type_appareil AS moyen,
+                        nombre_constats AS nb_constats,
                         (raw_data->>'Montant')::numeric AS montant_total,
-                        raw_data->>'Date' AS date_rapport
+                        date_rapport
                     FROM qc_radar_photo_stats
-                    WHERE raw_data->>'Site' ILIKE %s
-                    ORDER BY (raw_data->>'Nombre')::bigint DESC
+                    WHERE localisation ILIKE %s
+                    ORDER BY nombre_constats DESC NULLS LAST
                     LIMIT 5
                 """, (f"%{part}%",))
                 for row in cur.fetchall():
                     results.append({
                         "site": (row[0] or "")[:150], "moyen": row[1],
                         "nb_constats": row[2], "montant_total": float(row[3]) if row[3] else 0,
-                        "date_rapport": row[4]
+                        "date_rapport": str(row[4]) if row[4] else None
                     })
 
             conn.close()
@@ -805,34 +840,48 @@ class BaseAgent:
         return results
 
     def _fetch_jurisprudence_legislation(self, article_loi, province):
-        """Trouve les cas de jurisprudence qui citent cette loi (jurisprudence_legislation — 165 rows)"""
+        """Trouve les cas de jurisprudence qui citent cette loi.
+        Index jurisprudence_articles (sonde B-tree), puis jurisprudence_legislation en repli."""
         results = []
         if not article_loi:
             return results
         try:
-            conn = self.get_db()
-            cur = conn.cursor()
-            # Extraire le numero d'article
-            import re as _re
-            art_match = _re.search(r"(?:art\.?\s*|s\.?\s*|section\s*)?(\d+(?:\.\d+)?)", article_loi)
-            article = art_match.group(1) if art_match else ""
-            if not article:
-                conn.close()
+            from agents.article_citations import extraire_article_simple, LOI_PAR_PROVINCE
+            refs = extraire_article_simple(article_loi, LOI_PAR_PROVINCE.get(province))
+            if not refs:
                 return results
+            loi, article, _base = refs[0]
 
-            # jurisprudence_legislation n'a pas de FK directe vers jurisprudence
-            # On join via case_canlii_id (qui correspond a canlii_id dans jurisprudence)
+            conn = self.get_db()
+            cur = conn.cursor()
             cur.execute("""
-                SELECT jl.titre_legislation, jl.database_id,
+                SELECT ja.loi || ' art. ' || ja.article, ja.loi,
                        j.citation, j.database_id AS tribunal, j.date_decision,
                        j.resultat, j.resume
-                FROM jurisprudence_legislation jl
-                LEFT JOIN jurisprudence j ON j.canlii_id = jl.case_canlii_id
-                WHERE jl.titre_legislation ILIKE %s
+                FROM jurisprudence_articles ja
+                JOIN jurisprudence j ON j.id = ja.jurisprudence_id
+                WHERE (ja.article = %s OR ja.article_base = %s) AND ja.loi IN (%s, '')
                 ORDER BY j.date_decision DESC NULLS LAST
                 LIMIT 10
-            """, (f"%{article}%",))
-            for row in cur.fetchall():
+            """, (article, article, loi))
+            rows = cur.fetchall()
+
+            if not rows:
+                # jurisprudence_legislation n'a pas de FK directe vers jurisprudence
+                # On join via case_canlii_id (qui correspond a canlii_id dans jurisprudence)
+                cur.execute("""
+                    SELECT jl.titre_legislation, jl.database_id,
+                           j.citation, j.database_id AS tribunal, j.date_decision,
+                           j.resultat, j.resume
+                    FROM jurisprudence_legislation jl
+                    LEFT JOIN jurisprudence j ON j.canlii_id = jl.case_canlii_id
+                    WHERE jl.titre_legislation ILIKE %s
+                    ORDER BY j.date_decision DESC NULLS LAST
+                    LIMIT 10
+                """, (f"%{article}%",))
+                rows = cur.fetchall()
+
+            for row in rows:
                 results.append({
                     "legislation": (row[0] or "")[:150],
                     "legislation_db": row[1] or "",
@@ -848,45 +897,30 @@ class BaseAgent:
         return results
 
     def _fetch_jurisprudence_citations(self, jurisprudence_ids):
-        """Enrichit les precedents avec les cas lies (jurisprudence_citations — 716 rows)"""
+        """Enrichit les precedents avec les cas lies (graphe jurisprudence_citations en memoire)"""
         results = []
         if not jurisprudence_ids:
             return results
         try:
-            conn = self.get_db()
-            cur = conn.cursor()
-            # Pour chaque precedent, trouver les cas cites et citants via canlii_id
+            from agents.citation_graph import get_graph
+            liens = get_graph(self.get_db).voisins(jurisprudence_ids[:10])
             for jid in jurisprudence_ids[:10]:
-                # D'abord, trouver le canlii_id de ce precedent
-                cur.execute("SELECT canlii_id FROM jurisprudence WHERE id = %s", (jid,))
-                row = cur.fetchone()
-                if not row or not row[0]:
-                    continue
-                canlii_id = row[0]
-
-                cur.execute("""
-                    SELECT jc.target_citation, jc.target_database_id,
-                           jc.type_citation, jc.target_titre,
-                           j.resume, j.resultat
-                    FROM jurisprudence_citations jc
-                    LEFT JOIN jurisprudence j ON j.canlii_id = jc.target_canlii_id
-                    WHERE jc.source_canlii_id = %s
-                    LIMIT 5
-                """, (canlii_id,))
-                for row in cur.fetchall():
-                    results.append({
-                        "parent_id": jid,
-                        "cited_citation": row[0] or row[3] or "",
-                        "cited_db": row[1] or "",
-                        "relationship": row[2] or "cites",
-                        "resume": (row[4] or "")[:200],
-                        "resultat": row[5] or "inconnu"
-                    })
-            conn.close()
-        except Exception:
-            pass
+                results.extend(liens.get(jid, []))
+        except Exception as e:
+            self.log(f"Graphe citations: {e}", "WARN")
         return results
 
+    def _autorite_citations(self, jurisprudence_ids):
+        """Autorite des precedents dans le graphe de citations: {id: {citations_recues, pagerank, autorite}}"""
+        if not jurisprudence_ids:
+            return {}
+        try:
+            from agents.citation_graph import get_graph
+            return get_graph(self.get_db).autorite(jurisprudence_ids)
+        except Exception as e:
+            self.log(f"Graphe citations: {e}", "WARN")
+            return {}
+
     # ═══════════════════════════════════════════════════════════
     # CANLII API — Recherche jurisprudence live (rate-limited)
     # ═══════════════════════════════════════════════════════════
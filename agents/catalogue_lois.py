@@ -0,0 +1,289 @@
+"""
+Catalogue des lois — charge une fois par process, rechargement a chaud
+Sources: lois_articles (CSR, HTA, VTL, Code criminel), on_set_fines (bareme ON),
+saaq_points_inaptitude + saaq_seuils_points (SAAQ).
+
+Index ordonne par numero d'article (cle tuple: '329.2' -> (329, 2)) par province:
+  - exact('QC', '299')           article = '299'
+  - prefixe('QC', '329')         article = '329' OR article LIKE '329.%'
+  - intervalle('QC', '299', '303')
+Resolution en memoire (bisect) au lieu d'un aller-retour SQL par article et par ticket.
+
+Rechargement: au plus toutes les VERIFICATION_S secondes, une seule requete sur
+pg_stat_user_tables (insertions/maj/suppressions des tables sources); si la
+signature change, le catalogue est recharge et remplace en bloc.
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from agents import metrics
+
+VERIFICATION_S = 60
+
+TABLES_SOURCES = ("lois_articles", "on_set_fines", "saaq_points_inaptitude", "saaq_seuils_points")
+
+_NUM_ARTICLE = re.compile(r"\d+(?:\.\d+)*")
+_NUM_APRES_ART = re.compile(r"art(?:icle)?\.?\s*(\d+(?:\.\d+)*)", re.IGNORECASE)
+_PLAGE_KMH = re.compile(r"(\d+)\s*(?:à|a|-|to)\s*(\d+)\s*km/h", re.IGNORECASE)
+_PLAGE_KMH_PLUS = re.compile(r"(\d+)\s*km/h\s*(?:et\s+plus|ou\s+plus|\+)|plus\s+de\s+(\d+)\s*km/h", re.IGNORECASE)
+
+
+def cle_article(article):
+    """'329.2' -> (329, 2); '128 (1)' -> (128,); 'R-25 art. 14' -> (14,). None si aucun numero."""
+    texte = str(article or "")
+    m = _NUM_APRES_ART.search(texte)
+    num = m.group(1) if m else None
+    if not num:
+        m = _NUM_ARTICLE.search(texte)
+        num = m.group(0) if m else None
+    if not num:
+        return None
+    return tuple(int(p) for p in num.split("."))
+
+
+class _IndexOrdonne:
+    """Liste triee (cle, entree) — exact/prefixe/intervalle par bisect."""
+
+    def __init__(self, entrees, champ="article"):
+        paires = sorted(((cle_article(e.get(champ)), e) for e in entrees
+                         if cle_article(e.get(champ)) is not None), key=lambda p: p[0])
+        self.cles = [p[0] for p in paires]
+        self.entrees = [p[1] for p in paires]
+
+    def exact(self, article):
+        k = cle_article(article)
+        if k is None:
+            return []
+        return self.entrees[bisect_left(self.cles, k):bisect_right(self.cles, k)]
+
+    def prefixe(self, article):
+        """L'article et ses sous-articles (329 -> 329, 329.1, 329.2...)."""
+        k = cle_article(article)
+        if k is None:
+            return []
+        i = bisect_left(self.cles, k)
+        fin = i
+        n = len(k)
+        while fin < len(self.cles) and self.cles[fin][:n] == k:
+            fin += 1
+        return self.entrees[i:fin]
+
+    def intervalle(self, debut, fin):
+        """Articles de debut a fin inclusivement (sous-articles de fin compris)."""
+        k1, k2 = cle_article(debut), cle_article(fin)
+        if k1 is None or k2 is None:
+            return []
+        j = bisect_left(self.cles, k2)
+        while j < len(self.cles) and self.cles[j][:len(k2)] == k2:
+            j += 1
+        return self.entrees[bisect_left(self.cles, k1):j]
+
+    def __len__(self):
+        return len(self.entrees)
+
+
+def _plage_kmh(description):
+    """'Excès de vitesse de 21 à 30 km/h' -> (21, 30); '120 km/h et plus' -> (120, None)."""
+    m = _PLAGE_KMH.search(description or "")
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    m = _PLAGE_KMH_PLUS.search(description or "")
+    if m:
+        return int(m.group(1) or m.group(2)), None
+    return None
+
+
+class CatalogueLois:
+    """Instantane immuable des tables de lois. Remplace en bloc au rechargement."""
+
+    def __init__(self, articles, amendes_on, points_saaq, seuils_saaq, signature):
+        self.articles = articles
+        self.amendes_on = amendes_on
+        self.points_saaq = points_saaq
+        self.seuils_saaq = seuils_saaq
+        self.signature = signature
+        self.charge_a = time.time()
+        self.verifie_a = self.charge_a
+
+        par_province = {}
+        for a in articles:
+            par_province.setdefault(a["province"], []).append(a)
+        self._par_province = par_province
+        self._index = {p: _IndexOrdonne(lst) for p, lst in par_province.items()}
+        self._index_amendes_on = _IndexOrdonne(amendes_on)
+        self._index_saaq = _IndexOrdonne(points_saaq)
+
+    # ── lois_articles ──
+
+    def exact(self, province, article):
+        idx = self._index.get(province)
+        return idx.exact(article) if idx else []
+
+    def prefixe(self, province, article):
+        idx = self._index.get(province)
+        return idx.prefixe(article) if idx else []
+
+    def intervalle(self, province, debut, fin):
+        idx = self._index.get(province)
+        return idx.intervalle(debut, fin) if idx else []
+
+    def par_province(self, province, limit=None):
+        lst = self._par_province.get(province, [])
+        return lst[:limit] if limit else lst
+
+    # ── Bareme ON (on_set_fines) ──
+
+    def amende_on(self, article):
+        """Lignes du bareme ON pour la section (exacte, sinon sous-sections 128 -> 128(1)...)."""
+        return self._index_amendes_on.exact(article) or self._index_amendes_on.prefixe(article)
+
+    # ── SAAQ ──
+
+    def points_saaq_article(self, article, exces_kmh=None):
+        """Lignes SAAQ pour un article CSR. Avec exces_kmh, garde la tranche de vitesse correspondante."""
+        lignes = self._index_saaq.exact(article)
+        if exces_kmh is None or not lignes:
+            return lignes
+        if not any(l.get("plage_kmh") for l in lignes):
+            return lignes
+        return [l for l in lignes if l.get("plage_kmh") and exces_kmh >= l["plage_kmh"][0]
+                and (l["plage_kmh"][1] is None or exces_kmh <= l["plage_kmh"][1])]
+
+    def stats(self):
+        return {
+            "articles": len(self.articles),
+            "provinces": {p: len(lst) for p, lst in self._par_province.items()},
+            "amendes_on": len(self.amendes_on),
+            "points_saaq": len(self.points_saaq),
+            "charge_a": self.charge_a,
+        }
+
+    @classmethod
+    def charger(cls, conn):
+        cur = conn.cursor()
+        existantes = _tables_existantes(cur)
+        signature = _signature(cur)
+
+        articles = []
+        if "lois_articles" in existantes:
+            cur.execute("""
+                SELECT id, province, article, titre_article, texte_complet, loi, code_loi, categorie,
+                       amende_min, amende_max, points_inaptitude_min, points_inaptitude_max
+                FROM lois_articles
+                ORDER BY province, article, id
+            """)
+            for row in cur.fetchall():
+                articles.append({
+                    "id": row[0], "province": row[1], "article": row[2],
+                    "titre_article": row[3] or "", "texte_complet": row[4] or "",
+                    "loi": row[5], "code_loi": row[6], "categorie": row[7],
+                    "amende_min": float(row[8]) if row[8] is not None else None,
+                    "amende_max": float(row[9]) if row[9] is not None else None,
+                    "points_min": row[10], "points_max": row[11],
+                })
+
+        amendes_on = []
+        if "on_set_fines" in existantes:
+            cur.execute("""
+                SELECT article, loi, description_infraction, amende_fixe, suramende,
+                       frais_cour, total_payable, points_inaptitude
+                FROM on_set_fines
+                WHERE article IS NOT NULL
+            """)
+            for row in cur.fetchall():
+                amendes_on.append({
+                    "article": row[0], "loi": row[1], "description": row[2] or "",
+                    "amende_fixe": float(row[3]) if row[3] is not None else None,
+                    "suramende": float(row[4]) if row[4] is not None else None,
+                    "frais_cour": float(row[5]) if row[5] is not None else None,
+                    "total_payable": float(row[6]) if row[6] is not None else None,
+                    "points": row[7],
+                })
+
+        points_saaq = []
+        if "saaq_points_inaptitude" in existantes:
+            cur.execute("""
+                SELECT categorie, article, loi, description_fr, points, amende_min, amende_max,
+                       zone_scolaire, grand_exces, suspension_immediate, saisie_vehicule
+                FROM saaq_points_inaptitude
+            """)
+            for row in cur.fetchall():
+                points_saaq.append({
+                    "categorie": row[0], "article": row[1], "loi": row[2],
+                    "description": row[3], "points": row[4],
+                    "amende_min": float(row[5]) if row[5] is not None else None,
+                    "amende_max": float(row[6]) if row[6] is not None else None,
+                    "zone_scolaire": bool(row[7]), "grand_exces": bool(row[8]),
+                    "suspension_immediate": bool(row[9]), "saisie_vehicule": bool(row[10]),
+                    "plage_kmh": _plage_kmh(row[3]) if row[0] == "vitesse" else None,
+                })
+
+        seuils_saaq = []
+        if "saaq_seuils_points" in existantes:
+            cur.execute("""
+                SELECT type_permis, seuil_points, consequence, duree_suspension
+                FROM saaq_seuils_points ORDER BY type_permis, seuil_points
+            """)
+            seuils_saaq = [{"type_permis": r[0], "seuil_points": r[1], "consequence": r[2],
+                            "duree_suspension": r[3]} for r in cur.fetchall()]
+        cur.close()
+        return cls(articles, amendes_on, points_saaq, seuils_saaq, signature)
+
+
+def _tables_existantes(cur):
+    cur.execute("SELECT relname FROM pg_stat_user_tables WHERE relname = ANY(%s)", (list(TABLES_SOURCES),))
+    return {r[0] for r in cur.fetchall()}
+
+
+def _signature(cur):
+    """Compteurs d'ecriture des tables sources — change des qu'un import les modifie."""
+    cur.execute("""
+        SELECT relname, n_tup_ins, n_tup_upd, n_tup_del
+        FROM pg_stat_user_tables
+        WHERE relname = ANY(%s)
+        ORDER BY relname
+    """, (list(TABLES_SOURCES),))
+    return tuple(cur.fetchall())
+
+
+_catalogue = None
+_verrou = threading.Lock()
+
+
+def get_catalogue(connecter):
+    """Catalogue partage du process. connecter() -> connexion psycopg2 (verification/rechargement seulement)."""
+    global _catalogue
+    c = _catalogue
+    if c is not None and time.time() - c.verifie_a < VERIFICATION_S:
+        metrics.CACHE.inc(cache="catalogue_lois", result="hit")
+        return c
+    with _verrou:
+        c = _catalogue
+        if c is not None and time.time() - c.verifie_a < VERIFICATION_S:
+            metrics.CACHE.inc(cache="catalogue_lois", result="hit")
+            return c
+        conn = connecter()
+        try:
+            if c is not None:
+                cur = conn.cursor()
+                signature = _signature(cur)
+                cur.close()
+                if signature == c.signature:
+                    c.verifie_a = time.time()
+                    metrics.CACHE.inc(cache="catalogue_lois", result="hit")
+                    return c
+            _catalogue = CatalogueLois.charger(conn)
+            metrics.CACHE.inc(cache="catalogue_lois", result="miss")
+        finally:
+            conn.close()
+        return _catalogue
+
+
+def recharger():
+    """Force le rechargement au prochain acces (apres un seed/scrape de lois dans ce process)."""
+    global _catalogue
+    with _verrou:
+        _catalogue = None
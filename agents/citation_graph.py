@@ -0,0 +1,243 @@
+"""
+Graphe de citations jurisprudence — en memoire, format CSR (NumPy)
+Charge jurisprudence_citations une fois par process, puis:
+  - voisins(jids): cas lies de plusieurs precedents en une passe (aucun SQL par ticket)
+  - autorite(jids): citations recues (in-degree) + score PageRank precalcules
+
+Orientation: chaque ligne (source, target, type) est vue depuis target:
+  'cited_by' = target cite par source -> arc source -> target
+  'cites'    = target cite source     -> arc target -> source
+
+Rafraichi apres les imports: le module canlii (tickets-db) touche
+data/citation_graph.stamp; chaque process recharge si le stamp a change
+(os.stat, pas de SQL) ou si le graphe a plus de GRAPH_TTL secondes.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from agents import metrics
+from agents.base_agent import DATA_DIR
+
+STAMP_FILE = os.path.join(DATA_DIR, "citation_graph.stamp")
+GRAPH_TTL = 6 * 3600
+PAGERANK_DAMPING = 0.85
+PAGERANK_ITER = 50
+PAGERANK_TOL = 1e-9
+
+_TYPES = ("cited_by", "cites")
+
+
+def marquer_perime():
+    """Appele apres un import de citations: les process rechargeront au prochain acces."""
+    os.makedirs(os.path.dirname(STAMP_FILE), exist_ok=True)
+    with open(STAMP_FILE, "a"):
+        os.utime(STAMP_FILE, None)
+
+
+def _stamp_mtime():
+    try:
+        return os.stat(STAMP_FILE).st_mtime
+    except OSError:
+        return 0.0
+
+
+def _csr(rows, cols, n):
+    """Trie les arcs par ligne -> (indptr, indices, ordre). Stable: garde l'ordre d'insertion par ligne."""
+    ordre = np.argsort(rows, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[ordre], ordre
+
+
+def pagerank(src, dst, n, damping=PAGERANK_DAMPING, iterations=PAGERANK_ITER, tol=PAGERANK_TOL):
+    """PageRank par iteration de puissance sur des tableaux d'arcs (citant -> cite).
+    Les noeuds sans citation sortante redistribuent leur masse uniformement."""
+    if n == 0:
+        return np.zeros(0, dtype=np.float64)
+    out_deg = np.bincount(src, minlength=n).astype(np.float64)
+    pendants = out_deg == 0
+    poids = 1.0 / np.where(pendants, 1.0, out_deg)
+    r = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        flux = np.bincount(dst, weights=r[src] * poids[src], minlength=n)
+        r_new = (1.0 - damping) / n + damping * (flux + r[pendants].sum() / n)
+        if np.abs(r_new - r).sum() < tol:
+            r = r_new
+            break
+        r = r_new
+    return r
+
+
+class CitationGraph:
+    """Graphe immuable: remplace en bloc au rechargement (lecture sans verrou)."""
+
+    def __init__(self, canlii_ids, lies_indptr, lies_indices, lies_types,
+                 citations_recues, scores_pr, infos, jid_vers_noeud):
+        self.canlii_ids = canlii_ids            # noeud -> canlii_id
+        self.lies_indptr = lies_indptr          # CSR des lignes par source_canlii_id
+        self.lies_indices = lies_indices        # noeud target
+        self.lies_types = lies_types            # index dans _TYPES (-1 = autre)
+        self.citations_recues = citations_recues  # in-degree (arcs citant -> cite dedupliques)
+        self.pagerank = scores_pr
+        self.infos = infos                      # noeud -> (citation, titre, database_id, resume, resultat)
+        self.jid_vers_noeud = jid_vers_noeud    # jurisprudence.id -> noeud
+        self.charge_a = time.time()
+        self.stamp = None
+        # Rang percentile du PageRank (0..1) — directement utilisable comme bonus
+        n = len(canlii_ids)
+        if n > 1:
+            rangs = np.empty(n, dtype=np.float64)
+            rangs[np.argsort(scores_pr, kind="stable")] = np.arange(n) / (n - 1)
+            self.percentile = rangs
+        else:
+            self.percentile = np.zeros(n, dtype=np.float64)
+
+    @property
+    def nb_noeuds(self):
+        return len(self.canlii_ids)
+
+    @property
+    def nb_liens(self):
+        return len(self.lies_indices)
+
+    @classmethod
+    def charger(cls, conn):
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT source_canlii_id, target_canlii_id, type_citation,
+                   target_citation, target_titre, target_database_id
+            FROM jurisprudence_citations
+            WHERE source_canlii_id <> '' AND target_canlii_id <> ''
+            ORDER BY id
+        """)
+        lignes = cur.fetchall()
+
+        index = {}
+        infos = []
+
+        def noeud(cid):
+            i = index.get(cid)
+            if i is None:
+                i = index[cid] = len(infos)
+                infos.append([None, None, None, "", None])
+            return i
+
+        src = np.empty(len(lignes), dtype=np.int64)
+        tgt = np.empty(len(lignes), dtype=np.int64)
+        types = np.empty(len(lignes), dtype=np.int8)
+        for k, (s, t, typ, t_citation, t_titre, t_db) in enumerate(lignes):
+            src[k] = noeud(s)
+            tgt[k] = i = noeud(t)
+            types[k] = _TYPES.index(typ) if typ in _TYPES else -1
+            info = infos[i]
+            info[0] = info[0] or t_citation
+            info[1] = info[1] or t_titre
+            info[2] = info[2] or t_db
+
+        # Completer avec les dossiers presents dans jurisprudence (resume, resultat, id)
+        jid_vers_noeud = {}
+        if index:
+            cur.execute("""
+                SELECT id, canlii_id, citation, titre, database_id, resume, resultat
+                FROM jurisprudence WHERE canlii_id = ANY(%s)
+            """, (list(index),))
+            for jid, cid, citation, titre, db, resume, resultat in cur.fetchall():
+                i = index[cid]
+                jid_vers_noeud[jid] = i
+                info = infos[i]
+                info[0] = info[0] or citation
+                info[1] = info[1] or titre
+                info[2] = info[2] or db
+                info[3] = (resume or "")[:200]
+                info[4] = resultat
+        cur.close()
+
+        n = len(infos)
+        lies_indptr, lies_indices, ordre = _csr(src, tgt, n)
+        lies_types = types[ordre]
+
+        # Arcs orientes citant -> cite, dedupliques
+        citant = np.where(types == 1, tgt, src)
+        cite = np.where(types == 1, src, tgt)
+        garder = (types >= 0) & (citant != cite)
+        arcs = np.unique(np.stack([citant[garder], cite[garder]], axis=1), axis=0) if garder.any() \
+            else np.empty((0, 2), dtype=np.int64)
+        citations_recues = np.bincount(arcs[:, 1], minlength=n)
+        scores_pr = pagerank(arcs[:, 0], arcs[:, 1], n)
+
+        canlii_ids = [None] * n
+        for cid, i in index.items():
+            canlii_ids[i] = cid
+        return cls(canlii_ids, lies_indptr, lies_indices, lies_types,
+                   citations_recues, scores_pr, [tuple(x) for x in infos], jid_vers_noeud)
+
+    def voisins(self, jids, limite=5):
+        """Cas lies de chaque precedent: {jid: [dict, ...]} (format de BaseAgent._fetch_jurisprudence_citations)."""
+        resultat = {}
+        for jid in jids:
+            i = self.jid_vers_noeud.get(jid)
+            if i is None:
+                continue
+            debut, fin = self.lies_indptr[i], min(self.lies_indptr[i + 1], self.lies_indptr[i] + limite)
+            liens = []
+            for k in range(debut, fin):
+                citation, titre, db, resume, res = self.infos[self.lies_indices[k]]
+                typ = self.lies_types[k]
+                liens.append({
+                    "parent_id": jid,
+                    "cited_citation": citation or titre or "",
+                    "cited_db": db or "",
+                    "relationship": _TYPES[typ] if typ >= 0 else "cites",
+                    "resume": resume,
+                    "resultat": res or "inconnu",
+                })
+            if liens:
+                resultat[jid] = liens
+        return resultat
+
+    def autorite(self, jids):
+        """{jid: {citations_recues, pagerank, autorite}} — autorite = rang percentile 0..1."""
+        resultat = {}
+        n = self.nb_noeuds
+        for jid in jids:
+            i = self.jid_vers_noeud.get(jid)
+            if i is None:
+                continue
+            resultat[jid] = {
+                "citations_recues": int(self.citations_recues[i]),
+                "pagerank": round(float(self.pagerank[i]) * n, 4),
+                "autorite": round(float(self.percentile[i]), 3),
+            }
+        return resultat
+
+
+_graphe = None
+_verrou = threading.Lock()
+
+
+def get_graph(connecter):
+    """Graphe partage du process. connecter() -> connexion psycopg2, appele seulement au (re)chargement."""
+    global _graphe
+    g = _graphe
+    if g is not None and g.stamp == _stamp_mtime() and time.time() - g.charge_a < GRAPH_TTL:
+        metrics.CACHE.inc(cache="citation_graph", result="hit")
+        return g
+    with _verrou:
+        g = _graphe
+        if g is not None and g.stamp == _stamp_mtime() and time.time() - g.charge_a < GRAPH_TTL:
+            metrics.CACHE.inc(cache="citation_graph", result="hit")
+            return g
+        metrics.CACHE.inc(cache="citation_graph", result="miss")
+        stamp = _stamp_mtime()
+        conn = connecter()
+        try:
+            g = CitationGraph.charger(conn)
+        finally:
+            conn.close()
+        g.stamp = stamp
+        _graphe = g
+        return g
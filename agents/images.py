@@ -0,0 +1,180 @@
+"""
+Images — ingestion des uploads et derives compacts pour l'OCR / la vision
+  - ingerer(): copie en flux de l'upload vers le disque, taille plafonnee, sha256 au passage
+  - derive(): HEIC -> JPEG, orientation EXIF appliquee, reduction a la resolution utile
+    au modele (PROFILS), hash perceptuel (dHash 256 bits). L'original est conserve
+    (preuve, EXIF/GPS); le derive va dans <dossier>/derives/<nom>.<usage>.jpg
+  - soumettre() / derives(): meme chose dans un pool de threads (PIL libere le GIL
+    pendant le decodage et le redimensionnement)
+
+    chemin, info = images.ingerer(request.files["ticket_photo"], folder, "ticket_photo_x.jpg")
+    fut = images.soumettre(chemin, "ocr")
+    image_path = fut.result()["chemin"]
+
+HEIC: pillow-heif si installe, sinon l'original est retourne tel quel.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents import metrics
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pillow_heif = None
+
+UPLOAD_MAX_OCTETS = int(float(os.environ.get("UPLOAD_MAX_MO", "15")) * 1024 * 1024)
+IMAGES_WORKERS = int(os.environ.get("IMAGES_WORKERS", str(min(4, os.cpu_count() or 1))))
+BLOC = 64 * 1024
+
+# usage -> (plus grand cote en pixels, qualite JPEG)
+# ocr: le texte d'un constat reste lisible a 2048 px; vision: Qwen-VL redecoupe au-dela de ~1280 px
+PROFILS = {
+    "ocr": (2048, 90),
+    "vision": (1280, 85),
+}
+FORMATS_DIRECTS = {"JPEG", "PNG", "WEBP"}
+
+# dHash 16x16 = 256 bits, 64 caracteres hexa (ocr_cache.phash CHAR(64), bit(256) en SQL)
+DHASH_COTE = 16
+DHASH_BITS = DHASH_COTE * DHASH_COTE
+
+NORMALISATION_DUREE = metrics.histogramme("image_normalize_seconds", "Duree de normalisation d'une image",
+                                          ("usage",), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+IMAGES_OCTETS = metrics.compteur("image_bytes_total", "Octets d'images: originaux recus / derives produits",
+                                 ("stage",))
+
+_pool = None
+_verrou = threading.Lock()
+
+
+class FichierTropGros(Exception):
+    pass
+
+
+# ═══════════════════════════════════════════════════════════
+# INGESTION
+# ═══════════════════════════════════════════════════════════
+
+def ingerer(fichier, dossier, nom, max_octets=None):
+    """Copie un FileStorage vers dossier/nom par blocs. -> (chemin, {"octets", "sha256"}).
+    Leve FichierTropGros au-dela de max_octets (fichier partiel supprime)."""
+    max_octets = max_octets or UPLOAD_MAX_OCTETS
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, nom)
+    partiel = chemin + ".part"
+    h = hashlib.sha256()
+    total = 0
+    try:
+        with open(partiel, "wb") as out:
+            while True:
+                bloc = fichier.stream.read(BLOC)
+                if not bloc:
+                    break
+                total += len(bloc)
+                if total > max_octets:
+                    raise FichierTropGros(f"{nom}: plus de {max_octets // (1024 * 1024)} Mo")
+                h.update(bloc)
+                out.write(bloc)
+        os.replace(partiel, chemin)
+    finally:
+        if os.path.exists(partiel):
+            os.remove(partiel)
+    IMAGES_OCTETS.inc(total, stage="original")
+    return chemin, {"octets": total, "sha256": h.hexdigest()}
+
+
+# ═══════════════════════════════════════════════════════════
+# DERIVES
+# ═══════════════════════════════════════════════════════════
+
+def chemin_derive(chemin, usage):
+    dossier, nom = os.path.split(chemin)
+    return os.path.join(dossier, "derives", f"{os.path.splitext(nom)[0]}.{usage}.jpg")
+
+
+def dhash(img, taille=DHASH_COTE):
+    """Hash perceptuel taille^2 bits (difference de luminance entre pixels voisins), en hexa.
+    Stable a la recompression et au redimensionnement; 16x16 (256 bits) pour distinguer des
+    documents de meme gabarit (constats) mieux que le 8x8 (64 bits) classique."""
+    petit = img.convert("L").resize((taille + 1, taille), Image.BILINEAR)
+    px = list(petit.getdata())
+    bits = 0
+    for y in range(taille):
+        for x in range(taille):
+            i = y * (taille + 1) + x
+            bits = (bits << 1) | (px[i] > px[i + 1])
+    return f"{bits:0{taille * taille // 4}x}"
+
+
+def distance(h1, h2):
+    """Distance de Hamming entre deux dhash hexa de meme taille."""
+    return bin(int(h1, 16) ^ int(h2, 16)).count("1")
+
+
+def derive(chemin, usage="vision"):
+    """Derive compact de l'image pour l'usage -> {"chemin", "original", "largeur", "hauteur",
+    "octets", "phash", "reduit"}. Chemin original si l'image est deja conforme ou illisible."""
+    info = {"chemin": chemin, "original": chemin, "phash": None, "reduit": False}
+    if Image is None or not os.path.exists(chemin) or chemin.lower().endswith(".pdf"):
+        return info
+    cote_max, qualite = PROFILS[usage]
+    sortie = chemin_derive(chemin, usage)
+    debut = time.perf_counter()
+    try:
+        if os.path.exists(sortie) and os.path.getmtime(sortie) >= os.path.getmtime(chemin):
+            with Image.open(sortie) as img:
+                return dict(info, chemin=sortie, largeur=img.width, hauteur=img.height,
+                            octets=os.path.getsize(sortie), phash=dhash(img), reduit=True)
+        with Image.open(chemin) as img:
+            orientation = img.getexif().get(0x0112, 1)
+            conforme = (img.format in FORMATS_DIRECTS and orientation == 1
+                        and max(img.size) <= cote_max and img.mode in ("RGB", "L"))
+            img.draft("RGB", (cote_max, cote_max))     # JPEG: decodage direct a l'echelle 1/2, 1/4...
+            info["phash"] = dhash(img)
+            if conforme:
+                return dict(info, largeur=img.width, hauteur=img.height, octets=os.path.getsize(chemin))
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.thumbnail((cote_max, cote_max), Image.LANCZOS)
+            os.makedirs(os.path.dirname(sortie), exist_ok=True)
+            tmp = f"{sortie}.{os.getpid()}.{threading.get_ident()}.tmp"
+            img.save(tmp, "JPEG", quality=qualite, optimize=True)
+            os.replace(tmp, sortie)
+            octets = os.path.getsize(sortie)
+            IMAGES_OCTETS.inc(octets, stage="derive")
+            return dict(info, chemin=sortie, largeur=img.width, hauteur=img.height, octets=octets, reduit=True)
+    except Exception as e:
+        # Format non decodable (HEIC sans pillow-heif, fichier corrompu): l'original fera foi
+        return dict(info, erreur=f"{type(e).__name__}: {e}")
+    finally:
+        NORMALISATION_DUREE.observe(time.perf_counter() - debut, usage=usage)
+
+
+def _get_pool():
+    global _pool
+    with _verrou:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=IMAGES_WORKERS, thread_name_prefix="images")
+        return _pool
+
+
+def soumettre(chemin, usage="vision"):
+    """derive() dans le pool -> Future"""
+    return _get_pool().submit(derive, chemin, usage)
+
+
+def derives(chemins, usage="vision"):
+    """derive() en parallele, resultats dans l'ordre des chemins"""
+    return [f.result() for f in [soumettre(c, usage) for c in chemins]]
@@ -0,0 +1,444 @@
+"""
+Metriques de performance — registre en memoire, format texte Prometheus
+Compteurs, jauges et histogrammes avec etiquettes, sans dependance externe:
+
+    APPELS = compteur("ai_calls_total", "Appels LLM", ("provider", "model"))
+    APPELS.inc(provider="groq", model="llama-3.3-70b-versatile")
+    DUREE = histogramme("ai_call_duration_seconds", "Latence LLM", ("provider",))
+    DUREE.observe(1.8, provider="groq")
+
+Multi-process (gunicorn, classifier, crons): chaque process ecrit son etat dans
+METRICS_DIR/<pid>-<debut>.json (toutes les FLUSH_S secondes si modifie, et a la
+sortie). exposition() additionne les fichiers de tous les process:
+  - compteurs / histogrammes: somme, process termines compris — le fichier d'un process
+    termine est replie dans METRICS_DIR/_termines.json (agregat persistant), les totaux
+    ne reculent pas au redemarrage des workers
+  - jauges: process vivants seulement — somme (mode "sum"), maximum ("max", etat
+    partage lu par chaque process, ex. backlog en base) ou valeur par pid ("pid");
+    mode "info" (metrique descriptive, valeur 1): tous les process, termines compris
+"""
+
+import atexit
+import fcntl
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(_PROJECT_DIR, "data", "metrics"))
+PREFIXE = "aiticket_"
+FLUSH_S = 5
+TERMINES = "_termines.json"      # agregat des process termines (compteurs, histogrammes, info)
+
+BUCKETS_DEFAUT = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class _Metrique:
+    type = None
+
+    def __init__(self, registre, nom, aide, etiquettes):
+        self._registre = registre
+        self.nom = PREFIXE + nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self.valeurs = {}
+
+    def _cle(self, etiquettes):
+        if len(etiquettes) != len(self.etiquettes):
+            raise ValueError(f"{self.nom}: etiquettes attendues {self.etiquettes}, recu {tuple(etiquettes)}")
+        return tuple(str(etiquettes[e]) for e in self.etiquettes)
+
+    def exporter(self):
+        return {"type": self.type, "aide": self.aide, "etiquettes": list(self.etiquettes),
+                "valeurs": [[list(k), v] for k, v in self.valeurs.items()]}
+
+
+class Compteur(_Metrique):
+    type = "counter"
+
+    def inc(self, n=1, **etiquettes):
+        cle = self._cle(etiquettes)
+        with self._registre.verrou:
+            self.valeurs[cle] = self.valeurs.get(cle, 0) + n
+            self._registre.modifie = True
+
+
+class Jauge(_Metrique):
+    type = "gauge"
+
+    def __init__(self, registre, nom, aide, etiquettes, mode="sum"):
+        super().__init__(registre, nom, aide, etiquettes)
+        self.mode = mode
+
+    def set(self, v, **etiquettes):
+        cle = self._cle(etiquettes)
+        with self._registre.verrou:
+            self.valeurs[cle] = v
+            self._registre.modifie = True
+
+    def inc(self, n=1, **etiquettes):
+        cle = self._cle(etiquettes)
+        with self._registre.verrou:
+            self.valeurs[cle] = self.valeurs.get(cle, 0) + n
+            self._registre.modifie = True
+
+    def dec(self, n=1, **etiquettes):
+        self.inc(-n, **etiquettes)
+
+    def exporter(self):
+        return dict(super().exporter(), mode=self.mode)
+
+
+class Histogramme(_Metrique):
+    type = "histogram"
+
+    def __init__(self, registre, nom, aide, etiquettes, buckets=BUCKETS_DEFAUT):
+        super().__init__(registre, nom, aide, etiquettes)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, v, **etiquettes):
+        cle = self._cle(etiquettes)
+        with self._registre.verrou:
+            etat = self.valeurs.get(cle)
+            if etat is None:
+                # comptes par bucket (non cumulatifs, +Inf en dernier), somme, total
+                etat = self.valeurs[cle] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            etat[0][bisect_left(self.buckets, v)] += 1
+            etat[1] += v
+            etat[2] += 1
+            self._registre.modifie = True
+
+    def chrono(self, **etiquettes):
+        return _Chrono(self, etiquettes)
+
+    def exporter(self):
+        return dict(super().exporter(), buckets=list(self.buckets))
+
+
+class _Chrono:
+    """with HISTO.chrono(route="/api/x"): ...  — observe la duree du bloc."""
+
+    def __init__(self, histo, etiquettes):
+        self._histo = histo
+        self._etiquettes = etiquettes
+
+    def __enter__(self):
+        self._debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histo.observe(time.perf_counter() - self._debut, **self._etiquettes)
+        return False
+
+
+class Registre:
+
+    def __init__(self, dossier=METRICS_DIR):
+        self.verrou = threading.Lock()
+        self.metriques = {}
+        self.modifie = False
+        self.dossier = dossier
+        self.fichier = None
+        self._thread = None
+        self._nouveau_fichier()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._apres_fork)
+
+    def _nouveau_fichier(self):
+        self.fichier = os.path.join(self.dossier, f"{os.getpid()}-{int(time.time())}.json") if self.dossier else None
+
+    def _apres_fork(self):
+        """Worker gunicorn (--preload): repartir de zero, sinon les valeurs du master seraient comptees deux fois."""
+        self.verrou = threading.Lock()
+        for m in self.metriques.values():
+            m.valeurs = {}
+        self.modifie = False
+        self._thread = None
+        self._nouveau_fichier()
+        if self.metriques:
+            self._demarrer_flush()
+
+    def _enregistrer(self, cls, nom, *args, **kwargs):
+        with self.verrou:
+            m = self.metriques.get(PREFIXE + nom)
+            if m is None:
+                m = self.metriques[PREFIXE + nom] = cls(self, nom, *args, **kwargs)
+            elif not isinstance(m, cls):
+                raise ValueError(f"{PREFIXE + nom} deja enregistree comme {m.type}")
+        self._demarrer_flush()
+        return m
+
+    # ── Export multi-process ──
+
+    def _demarrer_flush(self):
+        if not self.fichier or self._thread is not None:
+            return
+        with self.verrou:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._boucle_flush, name="metrics-flush", daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _boucle_flush(self):
+        while True:
+            time.sleep(FLUSH_S)
+            if self.modifie:
+                self.flush()
+
+    def etat(self):
+        with self.verrou:
+            return {"pid": os.getpid(), "ts": time.time(),
+                    "metriques": {nom: m.exporter() for nom, m in self.metriques.items()}}
+
+    def flush(self):
+        """Ecriture atomique de l'etat du process (tmp + rename)."""
+        if not self.fichier:
+            return
+        try:
+            os.makedirs(self.dossier, exist_ok=True)
+            tmp = self.fichier + ".tmp"
+            self.modifie = False
+            with open(tmp, "w") as f:
+                json.dump(self.etat(), f)
+            os.replace(tmp, self.fichier)
+        except Exception:
+            pass
+
+    def _etats_autres_process(self):
+        if not self.dossier or not os.path.isdir(self.dossier):
+            return []
+        etats = []
+        termines = []
+        for nom in os.listdir(self.dossier):
+            if not nom.endswith(".json") or nom == TERMINES:
+                continue
+            chemin = os.path.join(self.dossier, nom)
+            if chemin == self.fichier:
+                continue
+            try:
+                with open(chemin) as f:
+                    etat = json.load(f)
+            except Exception:
+                continue
+            if _pid_vivant(etat.get("pid")):
+                etat["vivant"] = True
+                etats.append(etat)
+            else:
+                termines.append(nom)
+        if termines:
+            self._replier(termines)
+        agregat = _lire_json(os.path.join(self.dossier, TERMINES))
+        if agregat:
+            agregat["vivant"] = False
+            etats.append(agregat)
+        return etats
+
+    def _replier(self, noms):
+        """Ajoute les fichiers de process termines a l'agregat persistant puis les supprime.
+        Verrou fichier: un seul process replie a la fois. L'agregat note les fichiers deja
+        replies (arret entre l'ecriture de l'agregat et la suppression: pas de double compte)."""
+        chemin_agregat = os.path.join(self.dossier, TERMINES)
+        try:
+            with open(os.path.join(self.dossier, "_termines.lock"), "w") as verrou:
+                fcntl.flock(verrou, fcntl.LOCK_EX)
+                agregat = _lire_json(chemin_agregat) or {"pid": None, "metriques": {}, "replies": []}
+                deja = set(agregat.get("replies", []))
+                fusion = {}
+                _cumuler(fusion, dict(agregat, vivant=False))
+                replies = []
+                for nom in noms:
+                    chemin = os.path.join(self.dossier, nom)
+                    if nom not in deja:
+                        etat = _lire_json(chemin)
+                        if etat is None:
+                            continue
+                        _cumuler(fusion, dict(etat, vivant=False))
+                    replies.append(nom)
+                agregat = {"pid": None, "ts": time.time(), "replies": replies, "metriques": {
+                    nom: {"type": f["type"], "aide": f["aide"], "etiquettes": f["etiquettes"],
+                          "buckets": f["buckets"], "mode": f["mode"],
+                          "valeurs": [[list(k), v] for k, v in f["valeurs"].items()]}
+                    for nom, f in fusion.items()}}
+                tmp = chemin_agregat + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(agregat, f)
+                os.replace(tmp, chemin_agregat)
+                for nom in replies:
+                    try:
+                        os.remove(os.path.join(self.dossier, nom))
+                    except OSError:
+                        pass
+        except Exception:
+            pass
+
+    def fusion(self):
+        """Etat agrege sur tous les process: {nom: {type, aide, etiquettes, buckets, mode, valeurs}}."""
+        local = self.etat()
+        local["vivant"] = True
+        etats = [local] + self._etats_autres_process()
+
+        fusion = {}
+        for etat in etats:
+            _cumuler(fusion, etat)
+        return fusion
+
+    def exposition(self):
+        """Texte Prometheus (version 0.0.4) agrege sur tous les process."""
+        fusion = self.fusion()
+        lignes = []
+        for nom in sorted(fusion):
+            f = fusion[nom]
+            etiquettes = f["etiquettes"] + (["pid"] if f["mode"] == "pid" else [])
+            lignes.append(f"# HELP {nom} {_echapper_aide(f['aide'])}")
+            lignes.append(f"# TYPE {nom} {f['type']}")
+            for cle in sorted(f["valeurs"]):
+                v = f["valeurs"][cle]
+                paires = list(zip(etiquettes, cle))
+                if f["type"] == "histogram":
+                    cumul = 0
+                    for borne, n in zip(list(f["buckets"]) + [math.inf], v[0]):
+                        cumul += n
+                        lignes.append(f"{nom}_bucket{_etiquettes(paires + [('le', _nombre(borne))])} {cumul}")
+                    lignes.append(f"{nom}_sum{_etiquettes(paires)} {_nombre(v[1])}")
+                    lignes.append(f"{nom}_count{_etiquettes(paires)} {v[2]}")
+                else:
+                    lignes.append(f"{nom}{_etiquettes(paires)} {_nombre(v)}")
+        return "\n".join(lignes) + "\n"
+
+
+def _cumuler(fusion, etat):
+    """Ajoute l'etat d'un process a fusion (jauges: process vivants, ou mode info)."""
+    for nom, m in etat["metriques"].items():
+        f = fusion.setdefault(nom, {"type": m["type"], "aide": m["aide"], "etiquettes": m["etiquettes"],
+                                    "buckets": m.get("buckets"), "mode": m.get("mode"), "valeurs": {}})
+        if f["type"] != m["type"] or f["etiquettes"] != m["etiquettes"] or f["buckets"] != m.get("buckets"):
+            continue
+        if m["type"] == "gauge" and not etat["vivant"] and f["mode"] != "info":
+            continue
+        for cle, v in m["valeurs"]:
+            cle = tuple(cle)
+            if m["type"] == "gauge" and f["mode"] == "pid":
+                cle = cle + (str(etat["pid"]),)
+            if m["type"] == "histogram":
+                acc = f["valeurs"].setdefault(cle, [[0] * len(v[0]), 0.0, 0])
+                acc[0] = [a + b for a, b in zip(acc[0], v[0])]
+                acc[1] += v[1]
+                acc[2] += v[2]
+            elif m["type"] == "gauge" and f["mode"] in ("max", "info"):
+                f["valeurs"][cle] = max(f["valeurs"].get(cle, v), v)
+            else:
+                f["valeurs"][cle] = f["valeurs"].get(cle, 0) + v
+
+
+def _lire_json(chemin):
+    try:
+        with open(chemin) as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _pid_vivant(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _nombre(v):
+    if v == math.inf:
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v)) if abs(v) < 1e15 else repr(v)
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+def _echapper_aide(texte):
+    return texte.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _echapper_valeur(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquettes(paires):
+    if not paires:
+        return ""
+    return "{" + ",".join(f'{k}="{_echapper_valeur(v)}"' for k, v in paires) + "}"
+
+
+# ═══════════════════════════════════════════════════════════
+# REGISTRE DU PROCESS
+# ═══════════════════════════════════════════════════════════
+
+REGISTRE = Registre()
+
+
+def compteur(nom, aide, etiquettes=()):
+    return REGISTRE._enregistrer(Compteur, nom, aide, etiquettes)
+
+
+def jauge(nom, aide, etiquettes=(), mode="sum"):
+    return REGISTRE._enregistrer(Jauge, nom, aide, etiquettes, mode=mode)
+
+
+def histogramme(nom, aide, etiquettes=(), buckets=BUCKETS_DEFAUT):
+    return REGISTRE._enregistrer(Histogramme, nom, aide, etiquettes, buckets=buckets)
+
+
+def exposition():
+    return REGISTRE.exposition()
+
+
+def fusion():
+    return REGISTRE.fusion()
+
+
+def quantile(q, buckets, comptes):
+    """Quantile estime d'un histogramme (interpolation lineaire dans le bucket, comme histogram_quantile)."""
+    total = sum(comptes)
+    if total == 0:
+        return None
+    rang = q * total
+    cumul = 0
+    bas = 0.0
+    for borne, n in zip(list(buckets) + [math.inf], comptes):
+        if cumul + n >= rang and n > 0:
+            if borne == math.inf:
+                return buckets[-1] if buckets else None
+            return bas + (borne - bas) * (rang - cumul) / n
+        cumul += n
+        bas = borne if borne != math.inf else bas
+    return buckets[-1] if buckets else None
+
+
+# ═══════════════════════════════════════════════════════════
+# METRIQUES PARTAGEES (agents, API, caches)
+# ═══════════════════════════════════════════════════════════
+
+AI_APPELS = compteur("ai_calls_total", "Tentatives d'appel LLM par provider/modele",
+                     ("provider", "model", "kind", "outcome"))
+AI_DUREE = histogramme("ai_call_duration_seconds", "Latence d'une tentative d'appel LLM",
+                       ("provider", "model", "kind", "outcome"))
+AI_FALLBACKS = compteur("ai_fallbacks_total", "Bascules vers un autre modele apres echec",
+                        ("from_model", "to_model", "kind"))
+AI_TOKENS = compteur("ai_tokens_total", "Tokens consommes (usage.total_tokens)", ("provider", "model"))
+
+DB_CHECKOUTS = compteur("db_checkouts_total", "Connexions PostgreSQL ouvertes", ("agent",))
+DB_CONNECT_DUREE = histogramme("db_connect_duration_seconds", "Temps d'ouverture d'une connexion PostgreSQL",
+                               ("agent",), buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+DB_ERREURS = compteur("db_connect_errors_total", "Echecs de connexion PostgreSQL", ("agent",))
+
+JOBS_FILE = jauge("job_queue_depth", "Travaux en attente par file (backlog en base)", ("queue",), mode="max")
+ANALYSES_EN_COURS = jauge("analyses_in_progress", "Analyses de ticket en cours d'execution")
+
+CACHE = compteur("cache_requests_total", "Acces aux caches en memoire (hit / miss)", ("cache", "result"))
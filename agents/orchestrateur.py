@@ -11,6 +11,7 @@ import time
 import uuid
 from datetime import datetime
 from agents.base_agent import BaseAgent
+from agents import tracing
 
 # Phase 1: Intake
 from agents.agent_ocr import AgentOCR
@@ -113,18 +114,35 @@ class Orchestrateur(BaseAgent):
         self.notification = AgentNotification()
         self.superviseur = AgentSuperviseur()
 
+        # Tracing: un span par methode d'agent (seulement si une trace est active)
+        for agent in vars(self).values():
+            if isinstance(agent, BaseAgent):
+                tracing.instrumenter(agent)
+
     def _init_results_table(self):
         # Table analyses_completes existe deja dans PostgreSQL (schema.sql)
         pass
 
     def analyser_ticket(self, ticket_input, image_path=None, client_info=None,
-                        evidence_photos=None, temoignage=None, temoins=None):
+                        evidence_photos=None, temoignage=None, temoins=None, identite_client=None):
         """
         Pipeline complet 26+ agents / 4 phases + Gold Standard preuves
         Input: ticket_input, image, client_info, photos preuves, temoignage, temoins
+        identite_client: "user:<id>" / "ip:<addr>" — portee du cache OCR perceptuel (agent_ocr)
         Output: rapport complet avec UUID
+        Trace: trace_id = dossier_uuid (agents/tracing.py)
         """
         dossier_uuid = str(uuid.uuid4())[:8].upper()
+        with tracing.trace("Orchestrateur.analyser_ticket", trace_id=dossier_uuid) as s:
+            tracing.nommer(dossier_uuid)
+            rapport = self._pipeline(dossier_uuid, ticket_input, image_path, client_info,
+                                     evidence_photos, temoignage, temoins, identite_client)
+            s.definir(juridiction=rapport.get("juridiction"), score=rapport.get("score_final"),
+                      nb_erreurs=rapport.get("nb_erreurs"))
+        return rapport
+
+    def _pipeline(self, dossier_uuid, ticket_input, image_path, client_info,
+                  evidence_photos, temoignage, temoins, identite_client=None):
         print("\n" + "=" * 60)
         print(f"  TICKET911 — ANALYSE 26 AGENTS | Dossier #{dossier_uuid}")
         print("=" * 60)
@@ -145,6 +163,7 @@ class Orchestrateur(BaseAgent):
         # ═══════════════════════════════════════════════════════
         # PHASE 1: INTAKE (~50K tokens)
         # ═══════════════════════════════════════════════════════
+        tracing.phase("intake")
         print(f"\n{'─'*50}")
         print("  PHASE 1: INTAKE")
         print(f"{'─'*50}")
@@ -152,7 +171,7 @@ class Orchestrateur(BaseAgent):
         # Agent OCR (si image fournie)
         if image_path:
             try:
-                ocr_result = self.ocr.extraire_ticket(image_path)
+                ocr_result = self.ocr.extraire_ticket(image_path, portee=identite_client)
                 rapport["phases"]["intake"]["ocr"] = {"status": "OK", "data": ocr_result}
                 if ocr_result and isinstance(ocr_result, dict) and ocr_result.get("infraction"):
                     ticket_input = ocr_result
@@ -248,6 +267,7 @@ class Orchestrateur(BaseAgent):
         # ═══════════════════════════════════════════════════════
         # ENRICHISSEMENT CONTEXTE (weather, road, speed limits)
         # ═══════════════════════════════════════════════════════
+        tracing.phase("enrichissement")
         print(f"\n{'─'*50}")
         print("  ENRICHISSEMENT CONTEXTE (meteo, routes, vitesse)")
         print(f"{'─'*50}")
@@ -289,6 +309,7 @@ class Orchestrateur(BaseAgent):
         # ═══════════════════════════════════════════════════════
         # PHASE 2: ANALYSE JURIDIQUE (~650K tokens)
         # ═══════════════════════════════════════════════════════
+        tracing.phase("analyse")
         print(f"\n{'─'*50}")
         print(f"  PHASE 2: ANALYSE JURIDIQUE ({juridiction})")
         print(f"{'─'*50}")
@@ -377,6 +398,7 @@ class Orchestrateur(BaseAgent):
         temoignage_result = {}
 
         if evidence_photos or temoignage or temoins:
+            tracing.phase("preuves")
             print(f"\n{'─'*50}")
             print("  GOLD STANDARD: ANALYSE PREUVES")
             print(f"{'─'*50}")
@@ -418,6 +440,7 @@ class Orchestrateur(BaseAgent):
         # ═══════════════════════════════════════════════════════
         # PHASE 3: AUDIT QUALITE (~150K tokens)
         # ═══════════════════════════════════════════════════════
+        tracing.phase("audit")
         print(f"\n{'─'*50}")
         print("  PHASE 3: AUDIT QUALITE (Cross-verification)")
         print(f"{'─'*50}")
@@ -434,6 +457,7 @@ class Orchestrateur(BaseAgent):
         # ═══════════════════════════════════════════════════════
         # PHASE 4: LIVRAISON (~350K tokens)
         # ═══════════════════════════════════════════════════════
+        tracing.phase("livraison")
         print(f"\n{'─'*50}")
         print("  PHASE 4: LIVRAISON")
         print(f"{'─'*50}")
@@ -500,6 +524,7 @@ class Orchestrateur(BaseAgent):
         rapport["supervision"] = supervision
 
         # Sauver en PostgreSQL
+        tracing.phase("sauvegarde")
         try:
             conn = self.get_db()
             with conn:
@@ -573,6 +598,11 @@ class Orchestrateur(BaseAgent):
 |  Temps total: {rapport.get('temps_total', 0):.1f}s
 +-----------------------------------------------------------+""")
 
+        phases_ms = tracing.durees_phases()
+        if phases_ms:
+            print("  Temps par phase: " + " | ".join(f"{p} {ms / 1000:.1f}s" for p, ms in phases_ms.items()))
+            print(f"  Trace: {tracing.trace_id_courant()}")
+
         if analyse and isinstance(analyse, dict):
             args = analyse.get("arguments", [])
             if args:
@@ -0,0 +1,216 @@
+"""
+Moteur de recherche precedents — une seule requete SQL par ticket
+Partage par AgentPrecedentsQC / ON / NY.
+
+Chaque agent decrit ses requetes candidates (tsquery FR/EN, article cite,
+mots-cles) avec leur portee (province, tribunaux, ticket_only) et leur limite.
+Toutes sont envoyees ensemble: unnest() des specs + LATERAL par spec avec
+rang et LIMIT propres. Les candidats sont fusionnes et de-dupliques par id,
+chacun garde la liste des tags des requetes qui l'ont trouve.
+"""
+
+import re
+
+# Types de requetes supportes
+FTS_FR = "fts_fr"          # tsv_fr @@ to_tsquery('french', terme)
+FTS_EN = "fts_en"          # tsv_en @@ to_tsquery('english', terme)
+ARTICLE = "article"        # jurisprudence_articles: article ou article_base = terme (+ loi)
+ILIKE_MOTS_CLES = "mots_cles"  # mots_cles ILIKE terme
+
+# Jetons d'une tsquery ecrite a la main: operateurs & | !, parentheses et lexemes
+# alphanumeriques. Tout le reste (apostrophes, ponctuation) separe des lexemes: "d'un" -> d & un.
+# Une seule tsquery invalide ferait echouer tout le lot.
+_TSQUERY_JETON = re.compile(r"[&|!()]|[^\W_]+", re.UNICODE)
+
+
+def _tsquery_groupe(jetons, i, profondeur):
+    """Operandes et operateurs d'un groupe jusqu'a sa ) fermante -> (sortie, i suivant)."""
+    sortie = []
+    operateur = None     # operateur binaire en attente entre deux operandes
+    negation = False
+    while i < len(jetons):
+        jeton = jetons[i]
+        i += 1
+        if jeton in "&|":
+            if sortie and operateur is None:
+                operateur = jeton
+            continue
+        if jeton == "!":
+            negation = True
+            continue
+        if jeton == ")":
+            if profondeur:
+                break
+            continue         # ) sans ( ouvrante: ignoree
+        if jeton == "(":
+            groupe, i = _tsquery_groupe(jetons, i, profondeur + 1)
+            if not groupe:
+                continue     # groupe vide: "()", "(')"
+            # Un seul lexeme entre parentheses ("200(1)(a)"): pas de groupe
+            operande = groupe[0] if len(groupe) == 1 else f"( {' '.join(groupe)} )"
+        else:
+            operande = jeton
+        if sortie:
+            sortie.append(operateur or "&")
+        if negation:
+            operande = operande[1:] if operande.startswith("!") else f"!{operande}"
+        sortie.append(operande)
+        operateur = None
+        negation = False
+    return sortie, i
+
+
+def tsquery(term):
+    """Reecrit un terme en tsquery toujours valide: operandes (lexemes ou groupes entre
+    parentheses) separes par & ou |, ! seulement devant un operande, operandes juxtaposes
+    relies par &, operateurs orphelins, groupes vides et parentheses non appariees retires
+    (une ( non fermee l'est en fin de terme). "" si aucun lexeme."""
+    return " ".join(_tsquery_groupe(_TSQUERY_JETON.findall(term or ""), 0, 0)[0])
+
+_SQL_MULTI = """
+    WITH q AS (
+        SELECT *
+        FROM unnest(%(ords)s::int[], %(kinds)s::text[], %(terms)s::text[],
+                    %(lois)s::text[], %(provinces)s::text[], %(databases)s::text[],
+                    %(ticket_only)s::bool[], %(limits)s::int[])
+             AS q(ord, kind, term, loi, province, databases, ticket_only, lim)
+    )
+    SELECT q.ord, m.pos, m.id, m.citation, m.database_id, m.date_decision, m.resume,
+           m.province, m.resultat, m.titre, m.tribunal, m.rank
+    FROM q
+    CROSS JOIN LATERAL (
+        SELECT j.id, j.citation, j.database_id, j.date_decision, j.resume,
+               j.province, j.resultat, j.titre, j.tribunal,
+               ts_rank(j.tsv_fr, to_tsquery('french', q.term)) AS rank,
+               row_number() OVER (ORDER BY CASE WHEN j.resultat IS NOT NULL THEN 0 ELSE 1 END,
+                                  ts_rank(j.tsv_fr, to_tsquery('french', q.term)) DESC,
+                                  j.date_decision DESC NULLS LAST) AS pos
+        FROM jurisprudence j
+        WHERE q.kind = 'fts_fr'
+          AND j.tsv_fr @@ to_tsquery('french', q.term)
+          AND (q.province IS NULL OR j.province = q.province)
+          AND (q.databases IS NULL OR j.database_id = ANY(string_to_array(q.databases, ',')))
+          AND (NOT q.ticket_only OR j.est_ticket_related = true)
+        ORDER BY pos
+        LIMIT q.lim
+    ) m
+    UNION ALL
+    SELECT q.ord, m.pos, m.id, m.citation, m.database_id, m.date_decision, m.resume,
+           m.province, m.resultat, m.titre, m.tribunal, m.rank
+    FROM q
+    CROSS JOIN LATERAL (
+        SELECT j.id, j.citation, j.database_id, j.date_decision, j.resume,
+               j.province, j.resultat, j.titre, j.tribunal,
+               ts_rank(j.tsv_en, to_tsquery('english', q.term)) AS rank,
+               row_number() OVER (ORDER BY ts_rank(j.tsv_en, to_tsquery('english', q.term)) DESC,
+                                  j.date_decision DESC NULLS LAST) AS pos
+        FROM jurisprudence j
+        WHERE q.kind = 'fts_en'
+          AND j.tsv_en @@ to_tsquery('english', q.term)
+          AND (q.province IS NULL OR j.province = q.province)
+          AND (q.databases IS NULL OR j.database_id = ANY(string_to_array(q.databases, ',')))
+          AND (NOT q.ticket_only OR j.est_ticket_related = true)
+        ORDER BY pos
+        LIMIT q.lim
+    ) m
+    UNION ALL
+    SELECT q.ord, m.pos, m.id, m.citation, m.database_id, m.date_decision, m.resume,
+           m.province, m.resultat, m.titre, m.tribunal, 0.0::real AS rank
+    FROM q
+    CROSS JOIN LATERAL (
+        SELECT j.id, j.citation, j.database_id, j.date_decision, j.resume,
+               j.province, j.resultat, j.titre, j.tribunal,
+               row_number() OVER (ORDER BY CASE WHEN j.resultat IS NOT NULL THEN 0 ELSE 1 END,
+                                  j.date_decision DESC NULLS LAST) AS pos
+        FROM jurisprudence j
+        WHERE q.kind = 'mots_cles'
+          AND (q.province IS NULL OR j.province = q.province)
+          AND (q.databases IS NULL OR j.database_id = ANY(string_to_array(q.databases, ',')))
+          AND (NOT q.ticket_only OR j.est_ticket_related = true)
+          AND array_to_string(j.mots_cles, ' ') ILIKE q.term
+        ORDER BY pos
+        LIMIT q.lim
+    ) m
+    UNION ALL
+    SELECT q.ord, m.pos, m.id, m.citation, m.database_id, m.date_decision, m.resume,
+           m.province, m.resultat, m.titre, m.tribunal, 0.0::real AS rank
+    FROM q
+    CROSS JOIN LATERAL (
+        SELECT j.id, j.citation, j.database_id, j.date_decision, j.resume,
+               j.province, j.resultat, j.titre, j.tribunal,
+               row_number() OVER (ORDER BY CASE WHEN j.resultat IS NOT NULL THEN 0 ELSE 1 END,
+                                  j.date_decision DESC NULLS LAST) AS pos
+        FROM jurisprudence j
+        WHERE q.kind = 'article'
+          AND j.id IN (
+              SELECT ja.jurisprudence_id FROM jurisprudence_articles ja
+              WHERE (ja.article = q.term OR ja.article_base = q.term)
+                AND (q.loi IS NULL OR ja.loi = q.loi OR ja.loi = '')
+          )
+          AND (q.province IS NULL OR j.province = q.province)
+          AND (q.databases IS NULL OR j.database_id = ANY(string_to_array(q.databases, ',')))
+          AND (NOT q.ticket_only OR j.est_ticket_related = true)
+        ORDER BY pos
+        LIMIT q.lim
+    ) m
+    ORDER BY 1, 2
+"""
+
+
+def requete(tag, kind, term, limit=10, score=70, source="PostgreSQL",
+            province=None, databases=None, ticket_only=False, loi=None):
+    """Construit la spec d'une requete candidate (dict simple).
+    Pour ARTICLE: term = numero d'article ('299', '329.2'), loi = CSR/HTA/VTL... (None = toute loi)."""
+    if kind in (FTS_FR, FTS_EN):
+        term = tsquery(term)
+    return {
+        "tag": tag, "kind": kind, "term": term, "loi": loi, "limit": int(limit),
+        "score": score, "source": source, "province": province,
+        "databases": ",".join(databases) if databases else None,
+        "ticket_only": bool(ticket_only),
+    }
+
+
+def rechercher_multi(conn, requetes):
+    """Execute toutes les requetes en un seul aller-retour.
+    Retourne les candidats fusionnes (ordre des specs, puis rang), de-dupliques par id.
+    Chaque candidat porte la spec d'origine (score/source/tag), 'requetes' = tous les tags
+    qui l'ont trouve et 'sources' = {source: premier tag} pour chaque source distincte (bonus multi-source)."""
+    requetes = [r for r in requetes if r.get("term")]
+    if not requetes:
+        return []
+
+    params = {
+        "ords": list(range(len(requetes))),
+        "kinds": [r["kind"] for r in requetes],
+        "terms": [r["term"] for r in requetes],
+        "lois": [r["loi"] for r in requetes],
+        "provinces": [r["province"] for r in requetes],
+        "databases": [r["databases"] for r in requetes],
+        "ticket_only": [r["ticket_only"] for r in requetes],
+        "limits": [r["limit"] for r in requetes],
+    }
+    cur = conn.cursor()
+    cur.execute(_SQL_MULTI, params)
+    rows = cur.fetchall()
+    cur.close()
+
+    candidats = {}
+    for (ordre, _pos, jid, citation, database_id, date_decision, resume,
+         province, resultat, titre, tribunal, rank) in rows:
+        spec = requetes[ordre]
+        if jid in candidats:
+            cand = candidats[jid]
+            cand["requetes"].append(spec["tag"])
+            cand["sources"].setdefault(spec["source"], spec["tag"])
+            continue
+        candidats[jid] = {
+            "id": jid, "citation": citation, "database_id": database_id,
+            "date_decision": date_decision, "resume": resume, "province": province,
+            "resultat": resultat, "titre": titre, "tribunal": tribunal,
+            "rank": float(rank or 0),
+            "tag": spec["tag"], "kind": spec["kind"],
+            "score": spec["score"], "source": spec["source"],
+            "requetes": [spec["tag"]], "sources": {spec["source"]: spec["tag"]},
+        }
+    return list(candidats.values())
@@ -0,0 +1,294 @@
+"""
+Statistiques SQL — curseur instrumente (empreintes, latences, lignes, requetes lentes)
+Chaque execute() d'une connexion ouverte par connecter(source, ...) est:
+  - normalise en empreinte (litteraux / parametres -> ?, listes IN et VALUES repliees)
+  - mesure dans agents/metrics.py: sql_query_duration_seconds{query, source},
+    sql_rows_total, sql_errors_total, + sql_query_info{query, texte} (texte de l'empreinte)
+  - trace (span 'sql', agents/tracing.py) si une trace est active
+  - journalise dans logs/slow_queries.log au-dela de SQL_SLOW_MS, avec EXPLAIN
+    optionnel (SQL_AUTO_EXPLAIN=1, SELECT/WITH seulement, une fois par empreinte par
+    EXPLAIN_INTERVALLE_S — jamais ANALYZE: la requete n'est pas re-executee)
+
+    conn = sql_stats.connecter("Lois_QC", **PG_CONFIG)
+    top(20, tri="total")  -> rapport top-N agrege sur tous les process (admin)
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import psycopg2
+import psycopg2.extensions
+
+from agents import metrics, tracing
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLOW_LOG = os.path.join(_PROJECT_DIR, "logs", "slow_queries.log")
+SQL_SLOW_MS = float(os.environ.get("SQL_SLOW_MS", "500"))
+SQL_AUTO_EXPLAIN = os.environ.get("SQL_AUTO_EXPLAIN", "0") == "1"
+EXPLAIN_INTERVALLE_S = 600
+
+SQL_DUREE = metrics.histogramme(
+    "sql_query_duration_seconds", "Latence des requetes SQL par empreinte et appelant", ("query", "source"),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+SQL_LIGNES = metrics.compteur("sql_rows_total", "Lignes retournees / affectees (rowcount)", ("query", "source"))
+SQL_ERREURS = metrics.compteur("sql_errors_total", "Requetes SQL en erreur", ("query", "source"))
+SQL_INFO = metrics.jauge("sql_query_info", "Texte normalise de chaque empreinte SQL", ("query", "texte"), mode="info")
+
+
+# ═══════════════════════════════════════════════════════════
+# EMPREINTES
+# ═══════════════════════════════════════════════════════════
+
+_COMMENTAIRES = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_CHAINES = re.compile(r"'(?:[^']|'')*'")
+_PARAMS = re.compile(r"%\([^)]+\)s|%s")
+_NOMBRES = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_ESPACES = re.compile(r"\s+")
+_LISTE_IN = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_TUPLES = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+
+_cache_empreintes = {}
+_CACHE_MAX = 4000
+
+
+def _texte(query):
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    if not isinstance(query, str):
+        return str(query)      # psycopg2.sql.Composed
+    return query
+
+
+def empreinte(query):
+    """(id, texte normalise). 'WHERE id = 42 AND nom = %s' -> 'WHERE id = ? AND nom = ?'"""
+    cle = query if isinstance(query, (str, bytes)) else None
+    if cle is not None:
+        e = _cache_empreintes.get(cle)
+        if e is not None:
+            return e
+    texte = _COMMENTAIRES.sub(" ", _texte(query))
+    texte = _CHAINES.sub("?", texte)
+    texte = _PARAMS.sub("?", texte)
+    texte = _NOMBRES.sub("?", texte)
+    texte = _ESPACES.sub(" ", texte).strip()
+    texte = _TUPLES.sub(r"\1, ...", texte)
+    texte = _LISTE_IN.sub("(...)", texte)
+    e = (hashlib.md5(texte.encode()).hexdigest()[:12], texte[:400])
+    if cle is not None:
+        if len(_cache_empreintes) >= _CACHE_MAX:
+            _cache_empreintes.clear()
+        _cache_empreintes[cle] = e
+    return e
+
+
+# ═══════════════════════════════════════════════════════════
+# CONNEXION / CURSEUR
+# ═══════════════════════════════════════════════════════════
+
+class ConnexionInstrumentee(psycopg2.extensions.connection):
+    source = "?"
+
+    def cursor(self, *args, **kwargs):
+        # Toute classe de curseur demandee (RealDictCursor, DictCursor...) est instrumentee
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _instrumenter(factory)
+        return super().cursor(*args, **kwargs)
+
+
+_textes_publies = set()
+_explains = {}
+_verrou_log = threading.Lock()
+if hasattr(os, "register_at_fork"):
+    # Le registre de metriques repart de zero dans un worke forke: republier les textes
+    os.register_at_fork(after_in_child=_textes_publies.clear)
+
+
+def _enregistrer(cur, query, vars, debut, erreur, many=False):
+    duree = time.perf_counter() - debut
+    fp, texte = empreinte(query)
+    source = getattr(cur.connection, "source", "?")
+    if fp not in _textes_publies:
+        _textes_publies.add(fp)
+        SQL_INFO.set(1, query=fp, texte=texte)
+    SQL_DUREE.observe(duree, query=fp, source=source)
+    lignes = cur.rowcount if cur.rowcount and cur.rowcount > 0 else 0
+    if lignes:
+        SQL_LIGNES.inc(lignes, query=fp, source=source)
+    if erreur is not None:
+        SQL_ERREURS.inc(query=fp, source=source)
+    tracing.span_termine("sql", duree, erreur=erreur, requete=texte[:300], query=fp, lignes=lignes,
+                         **({"many": True} if many else {}))
+    if duree * 1000 >= SQL_SLOW_MS and erreur is None:
+        _requete_lente(cur, query, vars, fp, texte, source, duree, lignes, many)
+
+
+def _requete_lente(cur, query, vars, fp, texte, source, duree, lignes, many):
+    entree = {
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "source": source,
+        "query": fp,
+        "duree_ms": round(duree * 1000, 1),
+        "lignes": lignes,
+        "texte": texte,
+        "trace_id": tracing.trace_id_courant(),
+    }
+    if SQL_AUTO_EXPLAIN and not many and texte.split(" ", 1)[0].upper() in ("SELECT", "WITH"):
+        maintenant = time.time()
+        if maintenant - _explains.get(fp, 0) >= EXPLAIN_INTERVALLE_S:
+            _explains[fp] = maintenant
+            entree["plan"] = _expliquer(cur, query, vars)
+    try:
+        os.makedirs(os.path.dirname(SLOW_LOG), exist_ok=True)
+        with _verrou_log, open(SLOW_LOG, "a") as f:
+            f.write(json.dumps(entree, ensure_ascii=False, default=str) + "\n")
+    except Exception:
+        pass
+
+
+def _expliquer(cur, query, vars):
+    """EXPLAIN (sans ANALYZE) dans la meme transaction, curseur non instrumente."""
+    conn = cur.connection
+    if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+        return None
+    try:
+        ex = psycopg2.extensions.connection.cursor(conn, cursor_factory=psycopg2.extensions.cursor)
+        try:
+            ex.execute(b"EXPLAIN " + ex.mogrify(query, vars))
+            return "\n".join(r[0] for r in ex.fetchall())
+        finally:
+            ex.close()
+    except Exception as e:
+        return f"EXPLAIN impossible: {e}"
+
+
+class _Chronometre:
+    """Mixin: mesure execute / executemany de n'importe quelle classe de curseur psycopg2."""
+
+    def execute(self, query, vars=None):
+        debut = time.perf_counter()
+        erreur = None
+        try:
+            return super().execute(query, vars)
+        except Exception as e:
+            erreur = e
+            raise
+        finally:
+            _enregistrer(self, query, vars, debut, erreur)
+
+    def executemany(self, query, vars_list):
+        debut = time.perf_counter()
+        erreur = None
+        try:
+            return super().executemany(query, vars_list)
+        except Exception as e:
+            erreur = e
+            raise
+        finally:
+            _enregistrer(self, query, None, debut, erreur, many=True)
+
+
+class CurseurInstrumente(_Chronometre, psycopg2.extensions.cursor):
+    pass
+
+
+_classes_instrumentees = {}
+
+
+def _instrumenter(factory):
+    """Sous-classe instrumentee d'une classe de curseur (creee une fois par classe)."""
+    if issubclass(factory, _Chronometre):
+        return factory
+    classe = _classes_instrumentees.get(factory)
+    if classe is None:
+        classe = type(f"{factory.__name__}Instrumente", (_Chronometre, factory), {})
+        _classes_instrumentees[factory] = classe
+    return classe
+
+
+def connecter(source, **config):
+    """psycopg2.connect instrumente; source = agent / route appelant (etiquette des stats)."""
+    conn = psycopg2.connect(connection_factory=ConnexionInstrumentee, cursor_factory=CurseurInstrumente, **config)
+    conn.source = source
+    return conn
+
+
+# ═══════════════════════════════════════════════════════════
+# RAPPORT TOP-N (admin)
+# ═══════════════════════════════════════════════════════════
+
+TRIS = {
+    "total": lambda r: r["total_ms"],
+    "p95": lambda r: r["p95_ms"] or 0,
+    "calls": lambda r: r["calls"],
+    "mean": lambda r: r["mean_ms"],
+    "rows": lambda r: r["rows"],
+}
+
+
+def top(n=20, tri="total", par_source=False):
+    """Empreintes les plus couteuses, agregees sur tous les process.
+    par_source=False: une ligne par empreinte (sources detaillees dans 'sources')."""
+    f = metrics.fusion()
+    duree = f.get(SQL_DUREE.nom)
+    if not duree:
+        return []
+    buckets = duree["buckets"]
+    lignes_par = (f.get(SQL_LIGNES.nom) or {}).get("valeurs", {})
+    erreurs_par = (f.get(SQL_ERREURS.nom) or {}).get("valeurs", {})
+    textes = {cle[0]: cle[1] for cle in (f.get(SQL_INFO.nom) or {}).get("valeurs", {})}
+
+    groupes = {}
+    for (fp, source), (comptes, somme, nb) in duree["valeurs"].items():
+        cle = (fp, source) if par_source else fp
+        g = groupes.setdefault(cle, {"query": fp, "texte": textes.get(fp, "?"), "comptes": [0] * len(comptes),
+                                     "somme": 0.0, "calls": 0, "rows": 0, "errors": 0, "sources": {}})
+        g["comptes"] = [a + b for a, b in zip(g["comptes"], comptes)]
+        g["somme"] += somme
+        g["calls"] += nb
+        g["rows"] += lignes_par.get((fp, source), 0)
+        g["errors"] += erreurs_par.get((fp, source), 0)
+        g["sources"][source] = g["sources"].get(source, 0) + nb
+
+    rapport = []
+    for cle, g in groupes.items():
+        p50 = metrics.quantile(0.5, buckets, g["comptes"])
+        p95 = metrics.quantile(0.95, buckets, g["comptes"])
+        p99 = metrics.quantile(0.99, buckets, g["comptes"])
+        rapport.append({
+            "query": g["query"],
+            "source": cle[1] if par_source else None,
+            "texte": g["texte"],
+            "calls": g["calls"],
+            "total_ms": round(g["somme"] * 1000, 1),
+            "mean_ms": round(g["somme"] * 1000 / g["calls"], 2) if g["calls"] else 0,
+            "p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+            "p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+            "rows": g["rows"],
+            "rows_par_appel": round(g["rows"] / g["calls"], 1) if g["calls"] else 0,
+            "errors": g["errors"],
+            "sources": dict(sorted(g["sources"].items(), key=lambda kv: -kv[1])),
+        })
+    rapport.sort(key=TRIS.get(tri, TRIS["total"]), reverse=True)
+    return rapport[:n]
+
+
+def dernieres_lentes(limit=50):
+    """Dernieres entrees de logs/slow_queries.log (plus recentes d'abord)."""
+    try:
+        with open(SLOW_LOG) as f:
+            lignes = f.readlines()[-limit:]
+    except OSError:
+        return []
+    out = []
+    for ligne in reversed(lignes):
+        try:
+            out.append(json.loads(ligne))
+        except ValueError:
+            continue
+    return out
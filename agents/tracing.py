@@ -0,0 +1,349 @@
+"""
+Tracing par spans — une trace par analyse (trace_id = dossier_uuid)
+Hierarchie: requete HTTP > phase > methode d'agent > requete SQL / tentative call_ai
+
+    with tracing.trace("POST /api/analyze"):          # racine (api.py)
+        tracing.nommer(dossier_uuid)                    # trace_id definitif
+        tracing.phase("intake")                         # ferme la phase precedente
+        with tracing.span("AgentOCR.extraire_ticket"):
+            ...
+        tracing.span_termine("sql", duree_s, requete=...)   # span deja mesure (curseur, call_ai)
+
+Span courant = contextvars (un par thread / requete). Pour un pool de threads,
+soumettre tracing.propager(fn): la tache herite du span courant.
+
+Echantillonnage (variables d'environnement):
+  TRACE_ENABLED=0         desactive tout (aucun span enregistre)
+  TRACE_SAMPLE_RATE=0.1   fraction des traces exportees
+  TRACE_SLOW_MS=30000     toujours exporter les traces plus lentes (ou en erreur)
+  TRACE_MAX_SPANS=3000    plafond de spans par trace (les suivants sont comptes, pas gardes)
+Les spans sont gardes en memoire pendant la trace; la decision d'export se prend
+a la fin (lentes / erreurs toujours gardees). Export: DATA_DIR/traces/traces-AAAAMMJJ.jsonl,
+une ligne JSON par trace.
+"""
+
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRACE_DIR = os.environ.get("TRACE_DIR", os.path.join(_PROJECT_DIR, "data", "traces"))
+TRACE_ENABLED = os.environ.get("TRACE_ENABLED", "1") != "0"
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "30000"))
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", "3000"))
+
+_span_courant = contextvars.ContextVar("span_courant", default=None)
+_verrou_fichier = threading.Lock()
+
+
+class Trace:
+
+    def __init__(self, nom, trace_id=None, forcer=False):
+        self.trace_id = trace_id or uuid.uuid4().hex[:12]
+        self.nom = nom
+        self.forcer = forcer
+        self.debut = time.time()
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.ignores = 0
+        self.erreur = False
+        self.phase = None
+        self._verrou = threading.Lock()
+        self._seq = 0
+
+    def _ajouter(self, span):
+        with self._verrou:
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.ignores += 1
+                return False
+            self._seq += 1
+            span.span_id = self._seq
+            self.spans.append(span)
+            return True
+
+    def exporter(self):
+        duree_ms = (time.perf_counter() - self.t0) * 1000
+        garder = (self.forcer or self.erreur or duree_ms >= TRACE_SLOW_MS
+                  or random.random() < TRACE_SAMPLE_RATE)
+        if not garder:
+            return False
+        ligne = {
+            "trace_id": self.trace_id,
+            "nom": self.nom,
+            "debut": datetime.fromtimestamp(self.debut).isoformat(timespec="milliseconds"),
+            "duree_ms": round(duree_ms, 1),
+            "erreur": self.erreur,
+            "nb_spans": len(self.spans),
+            "spans_ignores": self.ignores,
+            "spans": [s.exporter() for s in self.spans],
+        }
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            chemin = os.path.join(TRACE_DIR, f"traces-{datetime.now():%Y%m%d}.jsonl")
+            data = json.dumps(ligne, ensure_ascii=False, default=str) + "\n"
+            with _verrou_fichier, open(chemin, "a") as f:
+                f.write(data)
+        except Exception as e:
+            print(f"  [!] export trace {self.trace_id}: {e}")
+        return True
+
+
+class Span:
+
+    def __init__(self, trace, parent, nom, attrs):
+        self.trace = trace
+        self.parent = parent
+        self.parent_id = parent.span_id if parent else None
+        self.nom = nom
+        self.attrs = attrs
+        self.span_id = None
+        self.t_debut = time.perf_counter()
+        self.t_fin = None
+        self.erreur = None
+        self._jeton = None
+
+    def definir(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fermer(self, erreur=None):
+        if self.t_fin is None:
+            self.t_fin = time.perf_counter()
+            if erreur is not None:
+                self.erreur = f"{type(erreur).__name__}: {erreur}"[:300]
+                self.trace.erreur = True
+
+    def __enter__(self):
+        self._jeton = _span_courant.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ph = self.trace.phase
+        if ph is not None and ph.parent is self:
+            ph.fermer()
+            self.trace.phase = None
+        self.fermer(exc)
+        try:
+            _span_courant.reset(self._jeton)
+        except ValueError:
+            # Ferme depuis un autre contexte (ex. teardown Flask): revenir au parent
+            _span_courant.set(self.parent)
+        return False
+
+    def exporter(self):
+        t0 = self.trace.t0
+        fin = self.t_fin if self.t_fin is not None else time.perf_counter()
+        d = {
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "nom": self.nom,
+            "debut_ms": round((self.t_debut - t0) * 1000, 2),
+            "duree_ms": round((fin - self.t_debut) * 1000, 2),
+        }
+        if self.attrs:
+            d["attrs"] = self.attrs
+        if self.erreur:
+            d["erreur"] = self.erreur
+        return d
+
+
+class _SpanNul:
+    """Retourne quand aucune trace n'est active: meme interface, aucun cout."""
+
+    def definir(self, **attrs):
+        pass
+
+    def fermer(self, erreur=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+SPAN_NUL = _SpanNul()
+
+
+class _Racine(Span):
+    """Span racine: exporte la trace a la sortie."""
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        self.trace.exporter()
+        return False
+
+
+def trace(nom, trace_id=None, forcer=False, **attrs):
+    """Demarre une trace (racine). Si une trace est deja active, simple span enfant."""
+    parent = _span_courant.get()
+    if parent is not None:
+        return span(nom, **attrs)
+    if not TRACE_ENABLED:
+        return SPAN_NUL
+    t = Trace(nom, trace_id, forcer)
+    racine = _Racine(t, None, nom, attrs)
+    t._ajouter(racine)
+    return racine
+
+
+def nommer(trace_id):
+    """Fixe le trace_id de la trace courante (ex. dossier_uuid connu en cours de route)."""
+    courant = _span_courant.get()
+    if courant is not None:
+        courant.trace.trace_id = trace_id
+
+
+def trace_id_courant():
+    courant = _span_courant.get()
+    return courant.trace.trace_id if courant is not None else None
+
+
+def span(nom, **attrs):
+    """Span enfant du span courant (context manager). Sans trace active: SPAN_NUL."""
+    parent = _span_courant.get()
+    if parent is None:
+        return SPAN_NUL
+    s = Span(parent.trace, parent, nom, attrs)
+    if not parent.trace._ajouter(s):
+        return SPAN_NUL
+    return s
+
+
+def span_termine(nom, duree_s, erreur=None, **attrs):
+    """Enregistre un span deja mesure (fin = maintenant). Pour les curseurs SQL (agents/sql_stats.py) et call_ai."""
+    parent = _span_courant.get()
+    if parent is None:
+        return
+    s = Span(parent.trace, parent, nom, attrs)
+    s.t_fin = time.perf_counter()
+    s.t_debut = s.t_fin - duree_s
+    if erreur:
+        s.erreur = str(erreur)[:300]
+        s.trace.erreur = True
+    parent.trace._ajouter(s)
+
+
+def phase(nom):
+    """Ouvre une phase du pipeline sous la racine; ferme la precedente.
+    Les spans suivants (meme contexte) sont enfants de la phase."""
+    courant = _span_courant.get()
+    if courant is None:
+        return SPAN_NUL
+    t = courant.trace
+    if t.phase is not None:
+        t.phase.fermer()
+        parent = t.phase.parent
+    else:
+        parent = courant
+    s = Span(t, parent, f"phase:{nom}", {})
+    if not t._ajouter(s):
+        return SPAN_NUL
+    t.phase = s
+    _span_courant.set(s)
+    return s
+
+
+def durees_phases():
+    """{phase: duree_ms} de la trace courante (phase ouverte: duree jusqu'a maintenant)."""
+    courant = _span_courant.get()
+    if courant is None:
+        return {}
+    maintenant = time.perf_counter()
+    return {sp.nom[6:]: round(((sp.t_fin or maintenant) - sp.t_debut) * 1000)
+            for sp in list(courant.trace.spans) if sp.nom.startswith("phase:")}
+
+
+def propager(fn):
+    """Enveloppe fn pour un autre thread: execute dans une copie du contexte courant."""
+    ctx = contextvars.copy_context()
+
+    def _executer(*args, **kwargs):
+        return ctx.run(fn, *args, **kwargs)
+    return _executer
+
+
+def instrumenter(agent, prefixe=None):
+    """Remplace les methodes publiques propres a la classe de l'agent par des versions tracees
+    (un span par appel, seulement si une trace est active)."""
+    from agents.base_agent import BaseAgent
+    nom_agent = prefixe or type(agent).__name__
+    for cls in type(agent).__mro__:
+        if cls is BaseAgent or cls is object:
+            break
+        for nom, attr in vars(cls).items():
+            if nom.startswith("_") or not callable(attr) or nom in vars(agent):
+                continue
+            if isinstance(attr, (staticmethod, classmethod)):
+                continue
+            setattr(agent, nom, _tracer(getattr(agent, nom), f"{nom_agent}.{nom}"))
+    return agent
+
+
+def _tracer(methode, nom):
+    def _trace(*args, **kwargs):
+        if _span_courant.get() is None:
+            return methode(*args, **kwargs)
+        with span(nom):
+            return methode(*args, **kwargs)
+    _trace.__name__ = getattr(methode, "__name__", nom)
+    _trace.__doc__ = getattr(methode, "__doc__", None)
+    _trace.__wrapped__ = methode
+    return _trace
+
+
+# ═══════════════════════════════════════════════════════════
+# LECTURE (admin)
+# ═══════════════════════════════════════════════════════════
+
+def _fichiers(jours):
+    if not os.path.isdir(TRACE_DIR):
+        return []
+    noms = sorted((n for n in os.listdir(TRACE_DIR) if n.startswith("traces-") and n.endswith(".jsonl")),
+                  reverse=True)
+    return [os.path.join(TRACE_DIR, n) for n in noms[:jours]]
+
+
+def lister(limit=50, jours=2):
+    """Dernieres traces (sans les spans), plus recentes d'abord."""
+    out = []
+    for chemin in _fichiers(jours):
+        try:
+            with open(chemin) as f:
+                lignes = f.readlines()
+        except OSError:
+            continue
+        for ligne in reversed(lignes):
+            try:
+                t = json.loads(ligne)
+            except ValueError:
+                continue
+            t.pop("spans", None)
+            out.append(t)
+            if len(out) >= limit:
+                return out
+    return out
+
+
+def lire(trace_id, jours=7):
+    """Trace complete (spans compris) — la plus recente portant ce trace_id."""
+    for chemin in _fichiers(jours):
+        try:
+            with open(chemin) as f:
+                lignes = f.readlines()
+        except OSError:
+            continue
+        for ligne in reversed(lignes):
+            if f'"trace_id": "{trace_id}"' not in ligne:
+                continue
+            try:
+                return json.loads(ligne)
+            except ValueError:
+                continue
+    return None
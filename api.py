@@ -11,9 +11,11 @@ import time
 import os
 import uuid
 import hashlib
+import threading
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory, send_file, abort, make_response
+from flask import Flask, request, jsonify, send_from_directory, send_file, abort, make_response, g, Response, has_request_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 import psycopg2
 
@@ -28,11 +30,125 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from agents.orchestrateur import Orchestrateur
 from agents.base_agent import PG_CONFIG, DATA_DIR
+from agents import images, metrics, sql_stats, tracing
+from admission import Admission, Refus
+from rapports_cache import CacheRapports, EnPreparation
 
 app = Flask(__name__, static_folder="web", static_url_path="")
+# Proxys de confiance devant gunicorn (nginx: 1). remote_addr = adresse ajoutee par le dernier
+# proxy, pas la premiere valeur de X-Forwarded-For (fournie par le client, falsifiable).
+TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", "1"))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
 CORS(app)
 app.config["MAX_CONTENT_LENGTH"] = 20 * 1024 * 1024  # 20 MB max
 
+# ─── METRIQUES HTTP (/metrics) ─────────────────
+HTTP_DUREE = metrics.histogramme("http_request_duration_seconds", "Latence des routes Flask",
+                                 ("route", "method", "status"))
+HTTP_EN_COURS = metrics.jauge("http_requests_in_progress", "Requetes HTTP en cours", ("route",))
+
+# ─── CONTROLE D'ADMISSION (admission.py) ───────
+# concurrence / file / attente_s: par process; par_minute / rafale: quota par client (JWT sinon IP)
+ADMISSION_REGLES = {
+    "/api/analyze": {"concurrence": 4, "file": 8, "attente_s": 30, "par_minute": 6, "rafale": 3},
+    "/api/chat/scan": {"concurrence": 6, "file": 12, "attente_s": 10, "par_minute": 20, "rafale": 5},
+    "/api/test-search": {"concurrence": 8, "file": 16, "attente_s": 5, "par_minute": 60, "rafale": 20},
+    "/api/hybrid-search": {"concurrence": 8, "file": 16, "attente_s": 5, "par_minute": 60, "rafale": 20},
+}
+admission = Admission(ADMISSION_REGLES)
+
+# Routes tracees (agents/tracing.py) — en-tete X-Trace: 1 force l'export de la trace
+TRACE_ROUTES = {"/api/analyze", "/api/chat/scan"}
+
+
+def _route_courante():
+    # Gabarit de route (/api/dossier/<dossier_uuid>), pas l'URL: cardinalite bornee
+    return request.url_rule.rule if request.url_rule else "<inconnue>"
+
+
+def connecter_db(source=None):
+    """Connexion PostgreSQL instrumentee (agents/sql_stats.py) — source = route courante"""
+    if source is None:
+        source = _route_courante() if has_request_context() else "api"
+    return sql_stats.connecter(source, **PG_CONFIG)
+
+
+@app.before_request
+def _debut_requete():
+    g.debut_requete = time.perf_counter()
+    g.route_metrique = _route_courante()
+    HTTP_EN_COURS.inc(route=g.route_metrique)
+    if g.route_metrique in TRACE_ROUTES:
+        g.trace = tracing.trace(f"{request.method} {g.route_metrique}",
+                                forcer=request.headers.get("X-Trace") == "1")
+        g.trace.__enter__()
+
+
+def _identite_client():
+    """(identite, role): "user:<id>" du JWT, sinon "ip:<addr>" vue par le proxy (ProxyFix)."""
+    auth_header = request.headers.get("Authorization", "")
+    if auth_header.startswith("Bearer ") and _auth_available:
+        from auth import decode_token
+        payload = decode_token(auth_header[7:])
+        if payload:
+            return f"user:{payload.get('user_id')}", payload.get("role")
+    ip = request.remote_addr or "?"
+    return f"ip:{ip}", None
+
+
+def _cle_client():
+    """Cle du quota d'admission (admin: pas de quota)."""
+    identite, role = _identite_client()
+    return None if role == "admin" else identite
+
+
+@app.before_request
+def _admettre_requete():
+    # Avant toute lecture du corps: un upload refuse n'est pas recu en entier
+    route = g.get("route_metrique")
+    # Preflight CORS (OPTIONS, repondu par flask_cors sans executer la vue): ni place
+    # ni quota, sinon le navigateur voit un 429/503 avant meme la vraie requete
+    if request.method == "OPTIONS" or not admission.couvre(route):
+        return None
+    try:
+        g.admission = admission.entrer(route, _cle_client())
+    except Refus as r:
+        message = ("Trop de requetes, reessayez plus tard" if r.status == 429
+                   else "Service sature, reessayez plus tard")
+        resp = jsonify({"error": message, "raison": r.raison, "retry_after": r.retry_after})
+        resp.status_code = r.status
+        resp.headers["Retry-After"] = str(r.retry_after)
+        return resp
+    return None
+
+
+@app.after_request
+def _fin_requete(response):
+    debut = g.get("debut_requete")
+    if debut is not None:
+        HTTP_DUREE.observe(time.perf_counter() - debut, route=g.route_metrique,
+                           method=request.method, status=response.status_code)
+    if "trace" in g:
+        g.trace.definir(status=response.status_code)
+        trace_id = tracing.trace_id_courant()
+        if trace_id:
+            response.headers["X-Trace-Id"] = trace_id
+    return response
+
+
+@app.teardown_request
+def _liberer_requete(exc):
+    route = g.pop("route_metrique", None)
+    if route is not None:
+        HTTP_EN_COURS.dec(route=route)
+    jeton = g.pop("admission", None)
+    if jeton is not None:
+        admission.sortir(jeton)
+    span = g.pop("trace", None)
+    if span is not None:
+        span.__exit__(type(exc) if exc else None, exc, None)
+
 # Dossiers
 UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
 RAPPORT_DIR = os.path.join(DATA_DIR, "rapports")
@@ -134,7 +250,7 @@ def _save_user_analysis(dossier_uuid, titre, score, recommandation, auth_header)
         user_id = payload.get("user_id")
         if not user_id:
             return
-        conn2 = psycopg2.connect(**PG_CONFIG)
+        conn2 = connecter_db()
         cur2 = conn2.cursor()
         cur2.execute("""
             INSERT INTO user_analyses (user_id, dossier_uuid, titre, score_global, recommandation)
@@ -177,13 +293,23 @@ def analyze():
             file = request.files[key]
             if file and file.filename and allowed_file(file.filename):
                 safe_name = secure_filename(file.filename)
-                filepath = os.path.join(folder, f"{key}_{safe_name}")
-                file.save(filepath)
+                try:
+                    filepath, _ = images.ingerer(file, folder, f"{key}_{safe_name}")
+                except images.FichierTropGros as e:
+                    return jsonify({"error": f"Fichier trop volumineux: {e}"}), 413
                 if key in ("ticket_photo", "ticket"):
                     image_path = filepath
                 elif key.startswith("evidence") or key.startswith("photo") or key.startswith("preuve"):
                     evidence_photos.append(filepath)
 
+        # Derives compacts (HEIC->JPEG, orientation, resolution utile) en parallele;
+        # les originaux restent dans le dossier client
+        fut_ticket = images.soumettre(image_path, "ocr") if image_path else None
+        fut_preuves = [images.soumettre(p, "vision") for p in evidence_photos]
+        if fut_ticket is not None:
+            image_path = fut_ticket.result()["chemin"]
+        evidence_photos = [f.result()["chemin"] for f in fut_preuves]
+
         # Temoignage et temoins (depuis form data)
         temoignage = request.form.get("temoignage", "")
         temoins_json = request.form.get("temoins", "[]")
@@ -207,18 +333,23 @@ def analyze():
 
     try:
         orch = get_orchestrateur()
-        rapport = orch.analyser_ticket(
-            ticket, image_path=image_path, client_info=client_info,
-            evidence_photos=evidence_photos if evidence_photos else None,
-            temoignage=temoignage if temoignage else None,
-            temoins=temoins if temoins else None)
+        metrics.ANALYSES_EN_COURS.inc()
+        try:
+            rapport = orch.analyser_ticket(
+                ticket, image_path=image_path, client_info=client_info,
+                evidence_photos=evidence_photos if evidence_photos else None,
+                temoignage=temoignage if temoignage else None,
+                temoins=temoins if temoins else None,
+                identite_client=_identite_client()[0])
+        finally:
+            metrics.ANALYSES_EN_COURS.dec()
 
         dossier_uuid = rapport.get("dossier_uuid", "")
 
         # Extraire l'analyse complete depuis le rapport sauvegardé en DB
         analyse_data = None
         try:
-            conn = psycopg2.connect(**PG_CONFIG)
+            conn = connecter_db()
             cur = conn.cursor()
             cur.execute("SELECT analyse_json FROM analyses_completes WHERE dossier_uuid = %s",
                       (dossier_uuid,))
@@ -238,6 +369,10 @@ def analyze():
             request.headers.get("Authorization", "")
         )
 
+        # Pre-rendu du PDF pendant que le client lit le resultat
+        if dossier_uuid:
+            get_rapports().planifier(dossier_uuid)
+
         return jsonify({
             "success": True,
             "dossier_uuid": dossier_uuid,
@@ -272,76 +407,123 @@ def analyze():
 
 
 # ─── RAPPORT PDF ───────────────────────────────
-@app.route("/api/rapport/<dossier_uuid>")
-def get_rapport_pdf(dossier_uuid):
-    """Genere et retourne le rapport PDF 9 pages"""
-    # Chercher l'analyse en DB
+# Colonnes du gabarit: (cle data, colonne analyses_completes, defaut si NULL)
+RAPPORT_COLONNES_JSON = [
+    ("ticket", "ticket_json", {}), ("analyse", "analyse_json", {}),
+    ("rapport_client", "rapport_client_json", {}), ("rapport_avocat", "rapport_avocat_json", {}),
+    ("procedure", "procedure_json", {}), ("points", "points_json", {}),
+    ("lois", "lois_json", []), ("precedents", "precedents_json", []),
+    ("cross_verification", "cross_verification_json", {}), ("supervision", "supervision_json", {}),
+]
+RAPPORT_COLONNES = ["score_final", "confiance", "recommandation", "juridiction", "temps_total", "created_at"]
+RAPPORT_ATTENTE_S = 60
+
+
+def _empreinte_rapport(dossier_uuid):
+    """md5 du contenu de la derniere analyse, calcule par PostgreSQL (pas de transfert des JSON)"""
+    colonnes = ["id"] + [c for _, c, _ in RAPPORT_COLONNES_JSON] + RAPPORT_COLONNES
+    conn = connecter_db()
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
         cur = conn.cursor()
-        cur.execute("""SELECT ticket_json, analyse_json, rapport_client_json,
-                            rapport_avocat_json, procedure_json, points_json,
-                            lois_json, precedents_json, cross_verification_json,
-                            supervision_json, score_final, confiance, recommandation,
-                            juridiction, temps_total, created_at
-                     FROM analyses_completes WHERE dossier_uuid = %s""", (dossier_uuid,))
+        cur.execute(f"""SELECT md5(concat_ws('|', {', '.join(colonnes)}))
+                        FROM analyses_completes WHERE dossier_uuid = %s
+                        ORDER BY id DESC LIMIT 1""", (dossier_uuid,))
         row = cur.fetchone()
+        return row[0] if row else None
+    finally:
         conn.close()
 
-        if not row:
-            conn.close()
-            return jsonify({"error": f"Dossier {dossier_uuid} non trouve"}), 404
-
-        # Parse les JSONs
-        data = {
-            "ticket": json.loads(row[0] or "{}"),
-            "analyse": json.loads(row[1] or "{}"),
-            "rapport_client": json.loads(row[2] or "{}"),
-            "rapport_avocat": json.loads(row[3] or "{}"),
-            "procedure": json.loads(row[4] or "{}"),
-            "points": json.loads(row[5] or "{}"),
-            "lois": json.loads(row[6] or "[]"),
-            "precedents": json.loads(row[7] or "[]"),
-            "cross_verification": json.loads(row[8] or "{}"),
-            "supervision": json.loads(row[9] or "{}"),
-            "score_final": row[10],
-            "confiance": row[11],
-            "recommandation": row[12],
-            "juridiction": row[13],
-            "temps_total": row[14],
-            "created_at": row[15],
-            "dossier_uuid": dossier_uuid,
-        }
-
-        # Generer le PDF
-        pdf_path = _generer_pdf(data)
-        if pdf_path and os.path.exists(pdf_path):
-            return send_file(pdf_path, mimetype="application/pdf",
-                             as_attachment=True,
-                             download_name=f"FightMyTicket-{dossier_uuid}.pdf")
-        else:
-            # Fallback: retourner le HTML
-            html = _generer_html_rapport(data)
-            return html, 200, {"Content-Type": "text/html; charset=utf-8"}
 
-    except Exception as e:
+def _charger_rapport(dossier_uuid):
+    """Donnees du gabarit pour la derniere analyse du dossier (None si absente)"""
+    conn = connecter_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""SELECT {', '.join([c for _, c, _ in RAPPORT_COLONNES_JSON] + RAPPORT_COLONNES)}
+                        FROM analyses_completes WHERE dossier_uuid = %s
+                        ORDER BY id DESC LIMIT 1""", (dossier_uuid,))
+        row = cur.fetchone()
+    finally:
         conn.close()
-
-        return jsonify({"error": str(e)}), 500
+    if not row:
+        return None
+    data = {}
+    for (cle, _, defaut), v in zip(RAPPORT_COLONNES_JSON, row):
+        if isinstance(v, str):
+            v = json.loads(v)   # colonnes TEXT des anciens schemas; JSONB arrive deja decode
+        data[cle] = v if v is not None else type(defaut)()
+    data.update(zip(RAPPORT_COLONNES, row[len(RAPPORT_COLONNES_JSON):]))
+    if isinstance(data["created_at"], datetime):
+        data["created_at"] = data["created_at"].isoformat()
+    data["dossier_uuid"] = dossier_uuid
+    return data
 
 
-def _generer_pdf(data):
-    """Genere le PDF via WeasyPrint"""
+def _generer_pdf(data, pdf_path):
+    """Genere le PDF via WeasyPrint — False si WeasyPrint n'est pas installe"""
     try:
         from weasyprint import HTML
-        html_content = _generer_html_rapport(data)
-        pdf_path = os.path.join(RAPPORT_DIR, f"FightMyTicket-{data['dossier_uuid']}.pdf")
-        HTML(string=html_content).write_pdf(pdf_path)
-        return pdf_path
     except ImportError:
-        return None
-    except Exception:
-        return None
+        return False
+    HTML(string=_generer_html_rapport(data)).write_pdf(pdf_path)
+    return True
+
+
+def _empreinte_code(h, code):
+    # Instructions, noms et constantes seulement: pas les numeros de ligne (co_linetable),
+    # une fonction simplement decalee dans le fichier garde sa version
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode())
+    for c in code.co_consts:
+        if hasattr(c, "co_code"):
+            _empreinte_code(h, c)       # fonctions internes, comprehensions
+        elif isinstance(c, frozenset):
+            h.update(repr(sorted(c, key=repr)).encode())    # ordre independant de PYTHONHASHSEED
+        else:
+            h.update(repr(c).encode())
+
+
+def _version_gabarit():
+    # Le bytecode du gabarit change avec son code: un rapport modifie invalide les PDF en cache
+    h = hashlib.sha1()
+    for fn in (_generer_html_rapport, _generer_pdf):
+        _empreinte_code(h, fn.__code__)
+    return h.hexdigest()[:12]
+
+
+rapports = None
+
+
+def get_rapports():
+    global rapports
+    if rapports is None:
+        rapports = CacheRapports(RAPPORT_DIR, _empreinte_rapport, _charger_rapport, _generer_pdf,
+                                 version=_version_gabarit())
+    return rapports
+
+
+@app.route("/api/rapport/<dossier_uuid>")
+def get_rapport_pdf(dossier_uuid):
+    """Rapport PDF 9 pages — pre-rendu en arriere-plan (rapports_cache.py), ETag / Range"""
+    try:
+        pdf = get_rapports().obtenir(dossier_uuid, RAPPORT_ATTENTE_S)
+        if pdf is None:
+            return jsonify({"error": f"Dossier {dossier_uuid} non trouve"}), 404
+        chemin, cle = pdf
+        if chemin is None:
+            # Fallback: WeasyPrint absent, retourner le HTML
+            html = _generer_html_rapport(_charger_rapport(dossier_uuid))
+            return html, 200, {"Content-Type": "text/html; charset=utf-8"}
+        return send_file(chemin, mimetype="application/pdf", as_attachment=True,
+                         download_name=f"FightMyTicket-{dossier_uuid}.pdf",
+                         etag=cle, conditional=True, max_age=0)
+    except EnPreparation:
+        resp = jsonify({"status": "en_preparation", "message": "Rapport en cours de generation, reessayez"})
+        resp.status_code = 202
+        resp.headers["Retry-After"] = "5"
+        return resp
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 
 def _generer_html_rapport(data):
@@ -592,7 +774,7 @@ def _generer_html_rapport(data):
 @app.route("/api/health")
 def health():
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) FROM jurisprudence")
         nb_juris = cur.fetchone()[0]
@@ -623,7 +805,7 @@ def status():
 @app.route("/api/stats")
 def stats():
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) FROM jurisprudence")
         total = cur.fetchone()[0]
@@ -654,7 +836,7 @@ def stats():
 @app.route("/api/results")
 def results():
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
         cur.execute("""SELECT id, dossier_uuid, score_final, confiance, recommandation,
                             juridiction, temps_total, created_at
@@ -675,7 +857,7 @@ def results():
 def get_dossier(dossier_uuid):
     """Retourne les donnees completes d'un dossier"""
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
         cur.execute("""SELECT ticket_json, analyse_json, rapport_client_json,
                             rapport_avocat_json, procedure_json, points_json,
@@ -735,7 +917,7 @@ def send_report():
         return jsonify({"error": "email et dossier_uuid requis"}), 400
 
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
         cur.execute("""SELECT rapport_client_json, score_final, recommandation
                      FROM analyses_completes WHERE dossier_uuid = %s""", (dossier_uuid,))
@@ -1511,315 +1693,419 @@ def _monitor_audit(cur):
 
 
 
-@app.route("/api/monitor")
-def monitor():
-    """Endpoint monitoring complet v2 — DB, embeddings, quota, pipeline, alertes"""
-    try:
-        conn = psycopg2.connect(**PG_CONFIG)
-        cur = conn.cursor()
+# ═══════════════════════════════════════════════════════════
+# MONITORING — sections rafraichies en arriere-plan (monitor_collector.py)
+# ═══════════════════════════════════════════════════════════
 
-        # Toutes les 16 tables avec descriptions
-        ALL_TABLES = [
-            ('qc_constats_infraction', 'Vrais tickets QC'),
-            ('speed_limits', 'Limites de vitesse QC+ON'),
-            ('jurisprudence', 'Decisions de cour'),
-            ('qc_radar_photo_stats', 'Stats radars photo QC'),
-            ('lois_articles', 'Articles de loi QC/ON'),
-            ('road_conditions', 'Conditions routieres'),
-            ('on_set_fines', 'Bareme amendes ON'),
-            ('jurisprudence_citations', 'Citations jurisprudence'),
-            ('jurisprudence_legislation', 'Liens juris-lois'),
-            ('qc_radar_photo_lieux', 'Emplacements radars'),
-            ('agent_runs', 'Logs agent'),
-            ('on_traffic_offences', 'Stats infractions ON'),
-            ('ref_jurisprudence_cle', 'References cles'),
-            ('analyses_completes', 'Analyses'),
-            ('data_source_log', 'Log sources donnees'),
-            ('mtl_escouade_mobilite', 'Escouade mobilite MTL'),
-        ]
-
-        tables_stats = {}
-        tables_desc = {}
-        for table, desc in ALL_TABLES:
-            try:
-                cur.execute(f"SELECT COUNT(*) FROM {table}")
-                tables_stats[table] = cur.fetchone()[0]
-                tables_desc[table] = desc
-            except Exception:
-                conn.rollback()
-                tables_stats[table] = -1
-                tables_desc[table] = desc
+MONITOR_TABLES = [
+    ('qc_constats_infraction', 'Vrais tickets QC'),
+    ('speed_limits', 'Limites de vitesse QC+ON'),
+    ('jurisprudence', 'Decisions de cour'),
+    ('qc_radar_photo_stats', 'Stats radars photo QC'),
+    ('lois_articles', 'Articles de loi QC/ON'),
+    ('road_conditions', 'Conditions routieres'),
+    ('on_set_fines', 'Bareme amendes ON'),
+    ('jurisprudence_citations', 'Citations jurisprudence'),
+    ('jurisprudence_legislation', 'Liens juris-lois'),
+    ('qc_radar_photo_lieux', 'Emplacements radars'),
+    ('agent_runs', 'Logs agent'),
+    ('on_traffic_offences', 'Stats infractions ON'),
+    ('ref_jurisprudence_cle', 'References cles'),
+    ('analyses_completes', 'Analyses'),
+    ('data_source_log', 'Log sources donnees'),
+    ('mtl_escouade_mobilite', 'Escouade mobilite MTL'),
+]
+
+
+def _monitor_tables(cur):
+    """Nombre de lignes par table — estimation pg_class.reltuples (pas de COUNT(*) complet).
+    Tables jamais analysees (reltuples = -1): COUNT(*) exact."""
+    noms = [t for t, _ in MONITOR_TABLES]
+    cur.execute("""
+        SELECT c.relname, c.reltuples::bigint
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') AND c.relname = ANY(%s)
+    """, (noms,))
+    estimes = dict(cur.fetchall())
+    tables_stats, exacts = {}, []
+    for table in noms:
+        n = estimes.get(table)
+        if n is None:
+            tables_stats[table] = -1
+        elif n < 0:
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            tables_stats[table] = cur.fetchone()[0]
+            exacts.append(table)
+        else:
+            tables_stats[table] = n
+    return {
+        "tables": tables_stats,
+        "tables_desc": dict(MONITOR_TABLES),
+        "total_rows": sum(v for v in tables_stats.values() if v > 0),
+        "estime": True,
+        "exacts": exacts,
+    }
 
-        # Jurisprudence breakdown
-        cur.execute("SELECT database_id, COUNT(*) FROM jurisprudence GROUP BY database_id ORDER BY COUNT(*) DESC")
-        par_tribunal = {row[0] or "N/A": row[1] for row in cur.fetchall()}
 
-        cur.execute("SELECT resultat, COUNT(*) FROM jurisprudence GROUP BY resultat ORDER BY COUNT(*) DESC")
-        par_resultat = {row[0] or "inconnu": row[1] for row in cur.fetchall()}
+def _monitor_jurisprudence(cur):
+    """Repartition jurisprudence, embeddings, imports recents, qualite, index"""
+    cur.execute("SELECT COUNT(*), COUNT(embedding) FROM jurisprudence")
+    nb_juris_total, nb_embedded = cur.fetchone()
+    nb_no_embed = nb_juris_total - nb_embedded
+    metrics.JOBS_FILE.set(nb_no_embed, queue="embeddings")
 
-        cur.execute("SELECT province, COUNT(*) FROM jurisprudence GROUP BY province ORDER BY COUNT(*) DESC")
-        par_province = {row[0] or "N/A": row[1] for row in cur.fetchall()}
+    cur.execute("SELECT database_id, COUNT(*) FROM jurisprudence GROUP BY database_id ORDER BY COUNT(*) DESC")
+    par_tribunal = {row[0] or "N/A": row[1] for row in cur.fetchall()}
 
-        # Embeddings stats
-        cur.execute("SELECT COUNT(*) FROM jurisprudence WHERE embedding IS NOT NULL")
-        nb_embedded = cur.fetchone()[0]
-        cur.execute("SELECT COUNT(*) FROM jurisprudence WHERE embedding IS NULL")
-        nb_no_embed = cur.fetchone()[0]
-        nb_juris_total = tables_stats.get('jurisprudence', 0)
-        embed_pct = round(nb_embedded / nb_juris_total * 100, 1) if nb_juris_total > 0 else 0
-
-        # Recent imports (par jour)
-        cur.execute("""SELECT date_trunc('day', imported_at)::date as jour, COUNT(*)
-                      FROM jurisprudence
-                      WHERE imported_at > now() - interval '7 days'
-                      GROUP BY jour ORDER BY jour DESC""")
-        imports_par_jour = {str(row[0]): row[1] for row in cur.fetchall()}
-
-        # Analyses stats
-        cur.execute("""SELECT COUNT(*), AVG(score_final), AVG(confiance), AVG(temps_total)
-                      FROM analyses_completes""")
-        a_row = cur.fetchone()
-        analyses_stats = {
-            "total": a_row[0] or 0,
-            "score_moyen": round(float(a_row[1] or 0), 1),
-            "confiance_moyenne": round(float(a_row[2] or 0), 1),
-            "temps_moyen": round(float(a_row[3] or 0), 1)
-        }
-
-        cur.execute("""SELECT recommandation, COUNT(*)
-                      FROM analyses_completes GROUP BY recommandation""")
-        analyses_par_reco = {row[0] or "?": row[1] for row in cur.fetchall()}
-
-
-        # CanLII quota
-        canlii_quota = {"remaining": "unknown", "used_today": 0, "daily_max": 4800}
-        try:
-            usage_file = "/var/www/aiticketinfo/logs/canlii_usage.json"
-            if os.path.exists(usage_file):
-                with open(usage_file) as f:
-                    usage = json.load(f)
-                import datetime as dt2
-                today_yday = dt2.datetime.now().timetuple().tm_yday
-                if usage.get("day") == today_yday:
-                    used = usage.get("count", 0)
-                else:
-                    used = 0
-                canlii_quota = {
-                    "used_today": used,
-                    "remaining": 4800 - used,
-                    "daily_max": 4800,
-                    "last_update": usage.get("last_update", "?")
-                }
-        except Exception:
-            pass
+    cur.execute("SELECT resultat, COUNT(*) FROM jurisprudence GROUP BY resultat ORDER BY COUNT(*) DESC")
+    par_resultat = {row[0] or "inconnu": row[1] for row in cur.fetchall()}
 
-        # Last import log
-        last_import = "Aucun log"
-        try:
-            log_path = "/var/www/aiticketinfo/logs/canlii_import.log"
-            if os.path.exists(log_path):
-                with open(log_path) as f:
-                    lines = f.readlines()
-                    last_lines = [l.strip() for l in lines[-20:] if l.strip()]
-                    last_import = "\n".join(last_lines)
-        except Exception:
-            pass
+    cur.execute("SELECT province, COUNT(*) FROM jurisprudence GROUP BY province ORDER BY COUNT(*) DESC")
+    par_province = {row[0] or "N/A": row[1] for row in cur.fetchall()}
 
-        # Last embeddings log
-        last_embed_log = "Pas encore execute"
-        try:
-            elog_path = "/var/www/aiticketinfo/logs/embeddings.log"
-            if os.path.exists(elog_path):
-                with open(elog_path) as f:
-                    elines = f.readlines()
-                    last_elines = [l.strip() for l in elines[-10:] if l.strip()]
-                    last_embed_log = "\n".join(last_elines)
-        except Exception:
-            pass
+    cur.execute("""SELECT date_trunc('day', imported_at)::date as jour, COUNT(*)
+                  FROM jurisprudence
+                  WHERE imported_at > now() - interval '7 days'
+                  GROUP BY jour ORDER BY jour DESC""")
+    imports_par_jour = {str(row[0]): row[1] for row in cur.fetchall()}
 
-        # Alertes
-        alertes = []
-        anomalies = []
+    anomalies = []
+    dq_data = _monitor_data_quality(cur, nb_juris_total)
+    for col, label, seuil in [("resume", "Resume", 80), ("resultat", "Resultat", 85),
+                               ("titre", "Titre", 95), ("date_decision", "Date", 90)]:
+        f = dq_data["fields"].get(col, {})
+        if f.get("null", -1) >= 0 and f.get("pct", 0) < seuil:
+            anomalies.append({"level": "warning", "category": "data_quality",
+                "msg": f"{label}: {f['pct']}% rempli ({f['null']} vides sur {nb_juris_total})"})
 
-        # --- Embeddings ---
-        if nb_no_embed > 100:
-            alertes.append({"level": "warning", "msg": f"{nb_no_embed} dossiers sans embedding ({embed_pct}% complete)"})
-        elif nb_embedded == nb_juris_total and nb_juris_total > 0:
-            alertes.append({"level": "info", "msg": f"Embeddings 100% complets ({nb_embedded} dossiers)"})
+    try:
+        cur.execute("""SELECT indexname FROM pg_indexes
+                      WHERE tablename='jurisprudence'
+                      AND (indexname LIKE 'idx_juris_tsv%%' OR indexname LIKE 'idx_jurisprudence_tsv%%')
+                      ORDER BY indexname""")
+        idx_names = [r[0] for r in cur.fetchall()]
+        tsv_fr_count = sum(1 for n in idx_names if 'tsv_fr' in n)
+        tsv_en_count = sum(1 for n in idx_names if 'tsv_en' in n)
+        if tsv_fr_count > 1:
+            anomalies.append({"level": "info", "category": "db",
+                "msg": f"Index tsv_fr en doublon ({tsv_fr_count} indexes)"})
+        if tsv_en_count > 1:
+            anomalies.append({"level": "info", "category": "db",
+                "msg": f"Index tsv_en en doublon ({tsv_en_count} indexes)"})
+    except Exception:
+        cur.connection.rollback()
 
-        # --- Jurisprudence ---
-        if nb_juris_total < 500:
-            alertes.append({"level": "warning", "msg": f"Jurisprudence faible: {nb_juris_total} dossiers"})
+    return {
+        "par_tribunal": par_tribunal,
+        "par_resultat": par_resultat,
+        "par_province": par_province,
+        "imports_par_jour": imports_par_jour,
+        "embeddings": {
+            "total": nb_juris_total,
+            "embedded": nb_embedded,
+            "missing": nb_no_embed,
+            "pct": round(nb_embedded / nb_juris_total * 100, 1) if nb_juris_total > 0 else 0,
+            "model": "fireworks/qwen3-embedding-8b",
+            "dims": 4096,
+            "store": "pgvector"
+        },
+        "data_quality": dq_data,
+        "sources": _monitor_sources(cur),
+        "rag_metrics": _monitor_rag_metrics(cur),
+        "audit": _monitor_audit(cur),
+        "anomalies": anomalies,
+    }
 
-        # --- CanLII quota ---
-        remaining = canlii_quota.get("remaining", 5000)
-        if isinstance(remaining, int) and remaining <= 0:
-            alertes.append({"level": "warning", "msg": "Quota CanLII epuise pour aujourd'hui"})
-        elif isinstance(remaining, int) and remaining <= 500 and remaining > 0:
-            alertes.append({"level": "info", "msg": f"Quota CanLII bas: {remaining} restant"})
 
-        # --- Analyses ---
-        if analyses_stats["total"] == 0:
-            alertes.append({"level": "info", "msg": "Aucune analyse effectuee encore"})
+def _monitor_analyses(cur):
+    """Analyses, stats agents, agents en echec, usage reel"""
+    cur.execute("""SELECT COUNT(*), AVG(score_final), AVG(confiance), AVG(temps_total)
+                  FROM analyses_completes""")
+    a_row = cur.fetchone()
+    analyses_stats = {
+        "total": a_row[0] or 0,
+        "score_moyen": round(float(a_row[1] or 0), 1),
+        "confiance_moyenne": round(float(a_row[2] or 0), 1),
+        "temps_moyen": round(float(a_row[3] or 0), 1)
+    }
+    cur.execute("""SELECT recommandation, COUNT(*)
+                  FROM analyses_completes GROUP BY recommandation""")
+    analyses_par_reco = {row[0] or "?": row[1] for row in cur.fetchall()}
 
-        # --- ANOMALIES: Agents en echec ---
-        try:
-            cur.execute("""
-                SELECT agent_name, COUNT(*) as total,
-                       SUM(CASE WHEN success = false THEN 1 ELSE 0 END) as fails
-                FROM agent_runs GROUP BY agent_name HAVING COUNT(*) >= 10
-            """)
-            for row in cur.fetchall():
-                agent_name, total, fails = row[0], row[1], row[2] or 0
-                fail_pct = round(fails / total * 100, 1) if total > 0 else 0
-                if fail_pct >= 30:
-                    anomalies.append({"level": "critical", "category": "agent",
-                        "msg": f"Agent {agent_name}: {fail_pct}% echecs ({fails}/{total} runs)"})
-                elif fail_pct >= 10:
-                    anomalies.append({"level": "warning", "category": "agent",
-                        "msg": f"Agent {agent_name}: {fail_pct}% echecs ({fails}/{total} runs)"})
-        except Exception:
-            cur.connection.rollback()
+    anomalies = []
+    try:
+        cur.execute("""
+            SELECT agent_name, COUNT(*) as total,
+                   SUM(CASE WHEN success = false THEN 1 ELSE 0 END) as fails
+            FROM agent_runs GROUP BY agent_name HAVING COUNT(*) >= 10
+        """)
+        for row in cur.fetchall():
+            agent_name, total, fails = row[0], row[1], row[2] or 0
+            fail_pct = round(fails / total * 100, 1) if total > 0 else 0
+            if fail_pct >= 30:
+                anomalies.append({"level": "critical", "category": "agent",
+                    "msg": f"Agent {agent_name}: {fail_pct}% echecs ({fails}/{total} runs)"})
+            elif fail_pct >= 10:
+                anomalies.append({"level": "warning", "category": "agent",
+                    "msg": f"Agent {agent_name}: {fail_pct}% echecs ({fails}/{total} runs)"})
+    except Exception:
+        cur.connection.rollback()
 
-        # --- ANOMALIES: Qualite donnees ---
-        for col, label, seuil in [("resume", "Resume", 80), ("resultat", "Resultat", 85),
-                                   ("titre", "Titre", 95), ("date_decision", "Date", 90)]:
-            try:
-                cur.execute(f"SELECT count(*) FROM jurisprudence WHERE {col} IS NULL OR {col}::text = ''")
-                nc = cur.fetchone()[0]
-                pct_filled = round((1 - nc / nb_juris_total) * 100, 1) if nb_juris_total > 0 else 0
-                if pct_filled < seuil:
-                    anomalies.append({"level": "warning", "category": "data_quality",
-                        "msg": f"{label}: {pct_filled}% rempli ({nc} vides sur {nb_juris_total})"})
-            except Exception:
-                cur.connection.rollback()
+    try:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM tickets_scannes_meta)")
+        has_scans = cur.fetchone()[0]
+        cur.execute("SELECT EXISTS (SELECT 1 FROM user_analyses)")
+        has_user_analyses = cur.fetchone()[0]
+        if not has_scans and not has_user_analyses:
+            anomalies.append({"level": "info", "category": "usage",
+                "msg": "0 ticket scanne par utilisateur — aucune utilisation reelle"})
+    except Exception:
+        cur.connection.rollback()
 
-        # --- ANOMALIES: Systeme (swap, disque) ---
+    return {
+        "stats": analyses_stats,
+        "par_recommandation": analyses_par_reco,
+        "agents_stats": _monitor_agents_stats(cur),
+        "anomalies": anomalies,
+    }
+
+
+def _monitor_logs():
+    """Quota CanLII + fins des logs d'import / embeddings"""
+    canlii_quota = {"remaining": "unknown", "used_today": 0, "daily_max": 4800}
+    try:
+        usage_file = "/var/www/aiticketinfo/logs/canlii_usage.json"
+        if os.path.exists(usage_file):
+            with open(usage_file) as f:
+                usage = json.load(f)
+            today_yday = datetime.now().timetuple().tm_yday
+            used = usage.get("count", 0) if usage.get("day") == today_yday else 0
+            canlii_quota = {
+                "used_today": used,
+                "remaining": 4800 - used,
+                "daily_max": 4800,
+                "last_update": usage.get("last_update", "?")
+            }
+    except Exception:
+        pass
+
+    def queue_log(path, n, defaut):
         try:
-            with open("/proc/meminfo") as f:
-                mem = {}
-                for line in f:
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        mem[parts[0].rstrip(":")] = int(parts[1])
-            swap_total = mem.get("SwapTotal", 0)
-            swap_free = mem.get("SwapFree", 0)
-            if swap_total > 0:
-                swap_pct = round((swap_total - swap_free) / swap_total * 100, 1)
-                if swap_pct >= 70:
-                    anomalies.append({"level": "warning", "category": "system",
-                        "msg": f"Swap utilise a {swap_pct}% ({round((swap_total - swap_free) / 1024 / 1024, 1)} Go / {round(swap_total / 1024 / 1024, 1)} Go)"})
+            if os.path.exists(path):
+                with open(path) as f:
+                    return "\n".join(l.strip() for l in f.readlines()[-n:] if l.strip())
         except Exception:
             pass
+        return defaut
 
-        try:
-            import shutil
-            total_d, used_d, _ = shutil.disk_usage("/")
-            disk_pct = round(used_d / total_d * 100, 1)
-            if disk_pct >= 80:
-                anomalies.append({"level": "critical", "category": "system",
-                    "msg": f"Disque a {disk_pct}% ({round(used_d / (1024**3), 1)} / {round(total_d / (1024**3), 1)} Go)"})
-            elif disk_pct >= 70:
+    return {
+        "canlii": canlii_quota,
+        "last_import_log": queue_log("/var/www/aiticketinfo/logs/canlii_import.log", 20, "Aucun log")[-800:],
+        "last_embed_log": queue_log("/var/www/aiticketinfo/logs/embeddings.log", 10, "Pas encore execute")[-500:],
+    }
+
+
+def _monitor_system_section():
+    """Systeme (CPU/RAM/disque) + anomalies swap/disque"""
+    info = _monitor_system()
+    anomalies = []
+    try:
+        with open("/proc/meminfo") as f:
+            mem = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2:
+                    mem[parts[0].rstrip(":")] = int(parts[1])
+        swap_total = mem.get("SwapTotal", 0)
+        swap_free = mem.get("SwapFree", 0)
+        if swap_total > 0:
+            swap_pct = round((swap_total - swap_free) / swap_total * 100, 1)
+            if swap_pct >= 70:
                 anomalies.append({"level": "warning", "category": "system",
-                    "msg": f"Disque a {disk_pct}% ({round(used_d / (1024**3), 1)} / {round(total_d / (1024**3), 1)} Go)"})
-        except Exception:
-            pass
+                    "msg": f"Swap utilise a {swap_pct}% ({round((swap_total - swap_free) / 1024 / 1024, 1)} Go / {round(swap_total / 1024 / 1024, 1)} Go)"})
+    except Exception:
+        pass
 
-        # --- ANOMALIES: Aucun utilisateur reel ---
-        try:
-            cur.execute("SELECT count(*) FROM tickets_scannes_meta")
-            nb_scans = cur.fetchone()[0]
-            cur.execute("SELECT count(*) FROM user_analyses")
-            nb_user_analyses = cur.fetchone()[0]
-            if nb_scans == 0 and nb_user_analyses == 0:
-                anomalies.append({"level": "info", "category": "usage",
-                    "msg": "0 ticket scanne par utilisateur — aucune utilisation reelle"})
-        except Exception:
-            cur.connection.rollback()
+    disk_pct = info.get("disk_pct", 0)
+    if disk_pct >= 70:
+        anomalies.append({"level": "critical" if disk_pct >= 80 else "warning", "category": "system",
+            "msg": f"Disque a {disk_pct}% ({info.get('disk_used_gb')} / {info.get('disk_total_gb')} Go)"})
+    return {"info": info, "anomalies": anomalies}
+
+
+# Intervalles de rafraichissement (secondes)
+MONITOR_SECTIONS = [
+    # nom, fonction, intervalle, besoin DB
+    ("system", _monitor_system_section, 10, False),
+    ("services", _monitor_services, 30, False),
+    ("robots", _monitor_robots, 30, False),
+    ("logs", _monitor_logs, 30, False),
+    ("cron", _monitor_cron, 300, False),
+    ("analyses", _monitor_analyses, 60, True),
+    ("background_agents", _monitor_background_agents, 60, True),
+    ("jurisprudence", _monitor_jurisprudence, 120, True),
+    ("tables", _monitor_tables, 300, True),
+    ("saaq", _monitor_saaq, 600, True),
+]
+
+_collecteur = None
+_collecteur_verrou = threading.Lock()
+
+
+def get_collecteur():
+    global _collecteur
+    if _collecteur is None:
+        # Premieres requetes /api/monitor simultanees (serveur multi-thread): un seul
+        # collecteur et un seul jeu de threads de rafraichissement
+        with _collecteur_verrou:
+            if _collecteur is None:
+                from monitor_collector import Collecteur
+                c = Collecteur(lambda: connecter_db("monitor"))
+                for nom, fn, intervalle, db in MONITOR_SECTIONS:
+                    c.section(nom, fn, intervalle, db=db)
+                c.demarrer()
+                _collecteur = c
+    return _collecteur
+
+
+def _monitor_alertes(juris, logs, analyses):
+    """Alertes derivees de l'instantane (aucune requete)"""
+    alertes = []
+    emb = juris.get("embeddings", {})
+    nb_juris_total = emb.get("total", 0)
+    if emb.get("missing", 0) > 100:
+        alertes.append({"level": "warning", "msg": f"{emb['missing']} dossiers sans embedding ({emb.get('pct', 0)}% complete)"})
+    elif nb_juris_total > 0 and emb.get("embedded") == nb_juris_total:
+        alertes.append({"level": "info", "msg": f"Embeddings 100% complets ({emb['embedded']} dossiers)"})
+
+    if juris and nb_juris_total < 500:
+        alertes.append({"level": "warning", "msg": f"Jurisprudence faible: {nb_juris_total} dossiers"})
+
+    remaining = logs.get("canlii", {}).get("remaining", 5000)
+    if isinstance(remaining, int) and remaining <= 0:
+        alertes.append({"level": "warning", "msg": "Quota CanLII epuise pour aujourd'hui"})
+    elif isinstance(remaining, int) and remaining <= 500 and remaining > 0:
+        alertes.append({"level": "info", "msg": f"Quota CanLII bas: {remaining} restant"})
+
+    if analyses and analyses.get("stats", {}).get("total") == 0:
+        alertes.append({"level": "info", "msg": "Aucune analyse effectuee encore"})
+    return alertes
 
-        # --- ANOMALIES: Indexes doublons ---
-        try:
-            cur.execute("""SELECT indexname FROM pg_indexes
-                          WHERE tablename='jurisprudence'
-                          AND (indexname LIKE 'idx_juris_tsv%%' OR indexname LIKE 'idx_jurisprudence_tsv%%')
-                          ORDER BY indexname""")
-            idx_names = [r[0] for r in cur.fetchall()]
-            tsv_fr_count = sum(1 for n in idx_names if 'tsv_fr' in n)
-            tsv_en_count = sum(1 for n in idx_names if 'tsv_en' in n)
-            if tsv_fr_count > 1:
-                anomalies.append({"level": "info", "category": "db",
-                    "msg": f"Index tsv_fr en doublon ({tsv_fr_count} indexes)"})
-            if tsv_en_count > 1:
-                anomalies.append({"level": "info", "category": "db",
-                    "msg": f"Index tsv_en en doublon ({tsv_en_count} indexes)"})
-        except Exception:
-            cur.connection.rollback()
 
-        # conn.close() moved after helper calls below
+@app.route("/api/monitor")
+def monitor():
+    """Endpoint monitoring complet v3 — sert l'instantane du collecteur (age par section).
+    ?refresh=1 force le recalcul de toutes les sections au prochain tour (?refresh=tables,saaq pour certaines)."""
+    try:
+        collecteur = get_collecteur()
+        refresh = request.args.get("refresh", "")
+        if refresh:
+            noms = [] if refresh in ("1", "true", "all") else [n for n in refresh.split(",") if n]
+            collecteur.rafraichir(*noms)
+        # Premier appel du process: laisser le premier tour se terminer (borne)
+        collecteur.attendre_premier_tour(timeout=15)
+        snap = collecteur.instantane()
 
-        services_data = _monitor_services()
-        dq_data = _monitor_data_quality(cur, nb_juris_total)
-        agents_data = _monitor_agents_stats(cur)
-        sources_data = _monitor_sources(cur)
-        bg_agents_data = _monitor_background_agents(cur)
-        rag_data = _monitor_rag_metrics(cur)
-        system_data = _monitor_system()
-        robots_data = _monitor_robots()
-        audit_data = _monitor_audit(cur)
-        saaq_data = _monitor_saaq(cur)
+        def data(nom):
+            return snap[nom]["data"] or {}
 
-        conn.close()
+        tables, juris, analyses = data("tables"), data("jurisprudence"), data("analyses")
+        logs, system = data("logs"), data("system")
 
         return jsonify({
             "status": "ok",
             "timestamp": datetime.now().isoformat(),
+            "sections": {nom: {k: v for k, v in s.items() if k != "data"} for nom, s in snap.items()},
             "db": {
-                "tables": tables_stats,
-                "tables_desc": tables_desc,
-                "total_rows": sum(v for v in tables_stats.values() if v > 0),
+                "tables": tables.get("tables", {}),
+                "tables_desc": tables.get("tables_desc", {}),
+                "total_rows": tables.get("total_rows", 0),
+                "tables_estimees": tables.get("estime", False),
                 "jurisprudence": {
-                    "par_tribunal": par_tribunal,
-                    "par_resultat": par_resultat,
-                    "par_province": par_province,
-                    "imports_par_jour": imports_par_jour
+                    "par_tribunal": juris.get("par_tribunal", {}),
+                    "par_resultat": juris.get("par_resultat", {}),
+                    "par_province": juris.get("par_province", {}),
+                    "imports_par_jour": juris.get("imports_par_jour", {})
                 }
             },
-            "embeddings": {
-                "total": nb_juris_total,
-                "embedded": nb_embedded,
-                "missing": nb_no_embed,
-                "pct": embed_pct,
-                "model": "fireworks/qwen3-embedding-8b",
-                "dims": 4096,
-                "store": "pgvector"
-            },
+            "embeddings": juris.get("embeddings", {}),
             "analyses": {
-                "stats": analyses_stats,
-                "par_recommandation": analyses_par_reco
+                "stats": analyses.get("stats", {}),
+                "par_recommandation": analyses.get("par_recommandation", {})
             },
-            "canlii": canlii_quota,
-            "last_import_log": last_import[-800:] if isinstance(last_import, str) else last_import,
-            "last_embed_log": last_embed_log[-500:] if isinstance(last_embed_log, str) else last_embed_log,
-            "alertes": alertes,
-            "anomalies": anomalies,
-            "cron": _monitor_cron(),
-            "services": services_data,
-            "sources": sources_data,
-            "background_agents": bg_agents_data,
-            "data_quality": dq_data,
-            "agents_stats": agents_data,
-            "rag_metrics": rag_data,
-            "system": system_data,
-            "robots": robots_data,
-            "audit": audit_data,
-            "saaq": saaq_data
+            "canlii": logs.get("canlii", {}),
+            "last_import_log": logs.get("last_import_log", ""),
+            "last_embed_log": logs.get("last_embed_log", ""),
+            "alertes": _monitor_alertes(juris, logs, analyses),
+            "anomalies": analyses.get("anomalies", []) + juris.get("anomalies", []) + system.get("anomalies", []),
+            "cron": snap["cron"]["data"] or {},
+            "services": snap["services"]["data"] or [],
+            "sources": juris.get("sources", {}),
+            "background_agents": snap["background_agents"]["data"] or [],
+            "data_quality": juris.get("data_quality", {}),
+            "agents_stats": analyses.get("agents_stats", {}),
+            "rag_metrics": juris.get("rag_metrics", {}),
+            "system": system.get("info", {}),
+            "robots": snap["robots"]["data"] or [],
+            "audit": juris.get("audit", {}),
+            "saaq": data("saaq")
         })
     except Exception as e:
-        conn.close()
-
         return jsonify({"status": "error", "error": str(e)}), 500
 
 
+# Scrapers Prometheus autorises sans JWT (adresse vue apres ProxyFix, virgules)
+METRICS_ALLOW = {ip.strip() for ip in os.environ.get("METRICS_ALLOW", "127.0.0.1,::1").split(",") if ip.strip()}
+
+
+@app.route("/metrics")
+def metrics_prometheus():
+    """Metriques format texte Prometheus — agregees sur tous les process (agents/metrics.py).
+    Etiquettes par route et par client: scraper de METRICS_ALLOW ou JWT admin."""
+    if request.remote_addr not in METRICS_ALLOW and _identite_client()[1] != "admin":
+        return jsonify({"error": "Acces refuse"}), 403
+    return Response(metrics.exposition(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/api/admission")
+def admission_etat():
+    """Etat du controle d'admission de ce process: en cours / en file / limites par route"""
+    return jsonify({"actif": admission.couvre(next(iter(ADMISSION_REGLES))), "routes": admission.etat()})
+
+
+@app.route("/api/traces")
+def traces_liste():
+    """Dernieres traces exportees (sans spans) — data/traces/*.jsonl"""
+    limit = min(int(request.args.get("limit", 50)), 500)
+    return jsonify({
+        "traces": tracing.lister(limit=limit),
+        "echantillonnage": {"sample_rate": tracing.TRACE_SAMPLE_RATE, "slow_ms": tracing.TRACE_SLOW_MS,
+                            "actif": tracing.TRACE_ENABLED},
+    })
+
+
+@app.route("/api/traces/<trace_id>")
+def trace_detail(trace_id):
+    """Trace complete (spans) pour la cascade de l'admin"""
+    t = tracing.lire(trace_id)
+    if not t:
+        return jsonify({"error": "Trace introuvable (non echantillonnee ou expiree)"}), 404
+    return jsonify(t)
+
+
+@app.route("/api/sql-stats")
+def sql_stats_top():
+    """Top-N des requetes SQL par empreinte (agents/sql_stats.py) + dernieres requetes lentes"""
+    n = min(int(request.args.get("n", 20)), 200)
+    tri = request.args.get("tri", "total")
+    if tri not in sql_stats.TRIS:
+        return jsonify({"error": f"tri invalide (choix: {', '.join(sql_stats.TRIS)})"}), 400
+    par_source = request.args.get("par_source", "0") == "1"
+    return jsonify({
+        "top": sql_stats.top(n=n, tri=tri, par_source=par_source),
+        "lentes": sql_stats.dernieres_lentes(20),
+        "seuils": {"slow_ms": sql_stats.SQL_SLOW_MS, "auto_explain": sql_stats.SQL_AUTO_EXPLAIN},
+    })
 
 
 @app.route("/api/test-search")
@@ -1835,7 +2121,7 @@ def test_search():
         return jsonify({"error": "Parametre q requis (min 2 chars)"}), 400
 
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
         t0 = time.time()
         results = []
@@ -1878,23 +2164,24 @@ def test_search():
                     api_key=os.environ.get("FIREWORKS_API_KEY", ""),
                     base_url="https://api.fireworks.ai/inference/v1"
                 )
+                from pgvector_adapter import as_vector, bind_query_vector
                 resp = fw_client.embeddings.create(
                     model="fireworks/qwen3-embedding-8b",
-                    input=[query[:2000]]
+                    input=[query[:2000]],
+                    encoding_format="base64"
                 )
-                emb = resp.data[0].embedding
-                emb_str = "[" + ",".join(str(x) for x in emb) + "]"
+                vec = bind_query_vector(cur, as_vector(resp.data[0].embedding))
 
-                cur.execute("""
+                cur.execute(f"""
                     SELECT id, canlii_id, citation, titre, tribunal, database_id,
                            date_decision, resultat, LEFT(resume, 200) as resume,
-                           1 - (embedding <=> %s::vector) AS score,
+                           1 - (embedding <=> {vec}) AS score,
                            'pgvector' AS methode
                     FROM jurisprudence
                     WHERE est_ticket_related = true AND embedding IS NOT NULL
-                    ORDER BY embedding <=> %s::vector
+                    ORDER BY embedding <=> {vec}
                     LIMIT %s
-                """, (emb_str, emb_str, limit))
+                """, (limit,))
 
                 seen_ids = {r["id"] for r in results}
                 for row in cur.fetchall():
@@ -1981,7 +2268,7 @@ def test_search():
 def get_jurisprudence_detail(juris_id):
     """Detail complet d'une decision de jurisprudence."""
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
 
         cur.execute("""
@@ -2199,15 +2486,19 @@ def chat_scan():
     
     # Sauvegarder temporairement
     import tempfile
+    import shutil
     ext = file.filename.rsplit(".", 1)[-1].lower() if "." in file.filename else "jpg"
-    tmp = tempfile.NamedTemporaryFile(suffix=f".{ext}", delete=False, dir="/tmp")
-    file.save(tmp.name)
-    tmp.close()
-    
+    tmpdir = tempfile.mkdtemp(prefix="scan_", dir="/tmp")
+
     try:
+        try:
+            chemin, _ = images.ingerer(file, tmpdir, f"ticket.{ext}")
+        except images.FichierTropGros as e:
+            return jsonify({"success": False, "error": f"Fichier trop volumineux: {e}"}), 413
         from agents.agent_ocr import AgentOCR
         ocr = AgentOCR()
-        ticket = ocr.extraire_ticket(image_path=tmp.name)
+        ticket = ocr.extraire_ticket(image_path=images.derive(chemin, "ocr")["chemin"],
+                                     portee=_identite_client()[0])
         
         duration = round(time.time() - start, 1)
         
@@ -2228,11 +2519,7 @@ def chat_scan():
 
         return jsonify({"success": False, "error": str(e)}), 500
     finally:
-        import os
-        try:
-            os.unlink(tmp.name)
-        except:
-            pass
+        shutil.rmtree(tmpdir, ignore_errors=True)
 
 
 
@@ -2267,10 +2554,14 @@ def chat_evidence():
 
         safe_name = secure_filename(file.filename)
         final_name = f"preuve_{i+1}_{safe_name}"
-        filepath = os.path.join(folder, final_name)
-        file.save(filepath)
+        try:
+            filepath, _ = images.ingerer(file, folder, final_name)
+        except images.FichierTropGros as e:
+            results.append({"name": file.filename, "error": f"Fichier trop volumineux: {e}"})
+            continue
 
         exif_data = _extract_exif_gps(filepath)
+        images.soumettre(filepath, "vision")   # derive pret pour l'analyse des preuves
 
         results.append({
             "name": final_name,
@@ -2393,7 +2684,7 @@ def email_pitch_page():
 def api_recensement():
     """Dashboard des anomalies statistiques detectees."""
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
 
         # Stats globales
@@ -2506,7 +2797,7 @@ def api_recensement_match():
         return jsonify({"error": "Parametre 'municipality' ou 'article' requis"}), 400
 
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
 
         conditions = ["is_active = TRUE"]
@@ -2564,7 +2855,7 @@ def api_recensement_details():
     offset = (page - 1) * per_page
 
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
 
         conditions = ["r.is_active = TRUE"]
@@ -2691,7 +2982,7 @@ def api_blitz():
     offset = (page - 1) * per_page
 
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
 
         conditions = ["r.is_active = TRUE", "r.anomaly_type = 'blitz_daily'"]
@@ -2791,7 +3082,7 @@ def api_day_patterns():
     offset = (page - 1) * per_page
 
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
 
         conditions = ["r.is_active = TRUE", "r.anomaly_type = 'pattern_jour_semaine'"]
@@ -2841,9 +3132,8 @@ def api_day_patterns():
 
         # Global day-of-week distribution (province-wide)
         cur.execute("""
-            SELECT EXTRACT(DOW FROM date_infraction)::int AS dow, COUNT(*) AS nb
-            FROM qc_constats_infraction
-            WHERE date_infraction IS NOT NULL
+            SELECT jour_semaine::int AS dow, SUM(nb)::bigint AS nb
+            FROM qc_constats_semaine_heure
             GROUP BY dow ORDER BY dow
         """)
         global_dow = {}
@@ -2873,7 +3163,7 @@ def api_day_patterns():
 def api_ocr_stats():
     """Retourne les stats agrégées des tickets scannés par les clients (matricule, rue, etc.)."""
     try:
-        conn = psycopg2.connect(**PG_CONFIG)
+        conn = connecter_db()
         cur = conn.cursor()
 
         # Check if table exists
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Compaction des raw_data — archive froide en colonnes (tickets-db/utils/archive.py)
+Les imports gardent l'enregistrement source complet dans raw_data (JSONB). Une fois les
+champs convertis en colonnes typees, leur copie JSON ne sert plus qu'a l'audit et au
+re-import: ce job ecrit les enregistrements complets dans l'archive (segments zip LZMA
+par source et par annee, RAW_ARCHIVE_DIR) puis retire de raw_data les champs mappes
+(cles source des correspondances, utils/mapping.py). raw_data garde les champs non
+mappes (IDENT_INTRT, Montant...), encore lus par les agents.
+
+Par lot de LOT lignes: segment ecrit (fsync) avant la mise a jour en base, commit par lot.
+Un arret entre les deux est sans perte: la reprise re-archive les memes lignes dans un nouveau
+segment (un segment n'est jamais ecrase) et la purge retire la copie orpheline.
+Puis les anciens segments sont purges des ids supprimes en base (annee ou resource recharge)
+et des lignes re-archivees dans ce passage (republiees par l'import): l'archive ne garde
+qu'une version de chaque ligne existante.
+
+Usage:
+    python3 archive_raw_data.py                          # toutes les tables
+    python3 archive_raw_data.py --table mtl_collisions   # une table
+    python3 archive_raw_data.py --dry-run                # lignes a compacter, rien n'est ecrit
+    python3 archive_raw_data.py --report                 # tailles et temps de scan seulement
+    python3 archive_raw_data.py --vacuum-full            # reecrit les tables apres compaction
+Cron: apres les imports, avant recensement_stats_runner.py
+Rapport: logs/raw_archive_report.json (avant / apres)
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tickets-db"))
+from utils.db import get_connection
+from utils.archive import write_segment, archive_size, segments, segment_ids, prune_segment
+
+LOT = 20000
+REPORT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "raw_archive_report.json")
+
+
+# ═══════════════════════════════════════════════════════════
+# POLITIQUES PAR TABLE
+# ═══════════════════════════════════════════════════════════
+
+def _cles_constats():
+    import import_donnees_qc
+    from modules import ckan_quebec
+    return import_donnees_qc.CONSTATS_MAPPING.source_keys | ckan_quebec.CONSTATS_MAPPING.source_keys
+
+
+def _cles_radar_stats():
+    import import_donnees_qc
+    from modules import ckan_quebec
+    return import_donnees_qc.RADAR_STATS_MAPPING.source_keys | ckan_quebec.RADAR_STATS_MAPPING.source_keys
+
+
+def _cles_radar_lieux():
+    import import_donnees_qc
+    from modules import ckan_quebec
+    return import_donnees_qc.RADAR_LIEUX_MAPPING.source_keys | ckan_quebec.RADAR_LIEUX_MAPPING.source_keys
+
+
+def _cles_collisions_saaq():
+    import import_donnees_qc
+    from modules import ckan_collisions_saaq
+    return import_donnees_qc.COLLISIONS_SAAQ_MAPPING.source_keys | ckan_collisions_saaq.COLLISION_MAPPING.source_keys
+
+
+def _cles_collisions_mtl():
+    import import_donnees_mtl
+    from modules import ckan_montreal
+    return import_donnees_mtl.COLLISIONS_MAPPING.source_keys | ckan_montreal.COLLISIONS_MAPPING.source_keys
+
+
+# table -> (expression annee du segment ou None, cles mappees par tous les importeurs de la table)
+POLITIQUES = {
+    'qc_constats_infraction': ('annee_donnees', _cles_constats),
+    'qc_radar_photo_stats': ('EXTRACT(YEAR FROM date_rapport)::int', _cles_radar_stats),
+    'qc_radar_photo_lieux': (None, _cles_radar_lieux),
+    'qc_collisions_saaq': ('annee', _cles_collisions_saaq),
+    'mtl_collisions': ('EXTRACT(YEAR FROM date_collision)::int', _cles_collisions_mtl),
+}
+
+
+# ═══════════════════════════════════════════════════════════
+# MESURES
+# ═══════════════════════════════════════════════════════════
+
+def mesurer(conn, table):
+    """Tailles (toutes partitions) et temps de scan -> dict."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0),
+               COALESCE(SUM(pg_relation_size(relid)), 0),
+               COALESCE(SUM(pg_indexes_size(relid)), 0)
+        FROM pg_partition_tree(%s::regclass) WHERE isleaf
+    """, (table,))
+    total, heap, index = (int(v) for v in cur.fetchone())
+    debut = time.perf_counter()
+    cur.execute(f"SELECT COUNT(*) FROM {table}")
+    lignes = cur.fetchone()[0]
+    scan_ms = (time.perf_counter() - debut) * 1000
+    # Lecture de raw_data elle-meme (audit, agents): detoast + decompression
+    debut = time.perf_counter()
+    cur.execute(f"SELECT SUM(octet_length(raw_data::text)) FROM {table}")
+    raw_octets = int(cur.fetchone()[0] or 0)
+    scan_raw_ms = (time.perf_counter() - debut) * 1000
+    conn.rollback()
+    return {
+        'lignes': lignes, 'total_octets': total, 'heap_octets': heap, 'index_octets': index,
+        'toast_octets': total - heap - index, 'raw_data_json_octets': raw_octets,
+        'scan_ms': round(scan_ms, 1), 'scan_raw_ms': round(scan_raw_ms, 1),
+    }
+
+
+def _mo(n):
+    return f"{n / 1048576:,.1f} Mo"
+
+
+def afficher(label, m):
+    print(f"  {label:<6} {m['lignes']:>10,} lignes  total {_mo(m['total_octets']):>12}"
+          f"  heap {_mo(m['heap_octets']):>12}  toast {_mo(m['toast_octets']):>12}"
+          f"  scan {m['scan_ms']:>8.0f} ms  scan raw_data {m['scan_raw_ms']:>8.0f} ms")
+
+
+# ═══════════════════════════════════════════════════════════
+# COMPACTION
+# ═══════════════════════════════════════════════════════════
+
+def compacter(table, annee_expr, cles, dry_run=False):
+    """Archive puis retire les cles mappees des raw_data qui en contiennent encore.
+    -> (lignes compactees, chemins des segments ecrits, ids archives si l'archive
+    en contenait deja: versions anterieures a retirer des anciens segments)"""
+    lecture = get_connection()
+    ecriture = get_connection()
+    cles = sorted(cles)
+    try:
+        if dry_run:
+            cur = lecture.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM {table} WHERE raw_data ?| %s::text[]", (cles,))
+            return cur.fetchone()[0], [], set()
+        # Premier passage (archive vide): rien a remplacer, ids non retenus
+        rearchives = set() if segments(table) else None
+        # Curseur serveur: lecture en flux, ordre des ids stable d'une execution a l'autre
+        cur = lecture.cursor(name=f"archive_{table}")
+        cur.itersize = LOT
+        cur.execute(f"""
+            SELECT id, {annee_expr or 'NULL::int'}, raw_data FROM {table}
+            WHERE raw_data ?| %s::text[] ORDER BY id
+        """, (cles,))
+        maj = ecriture.cursor()
+        lignes = 0
+        ecrits = []
+        while True:
+            lot = cur.fetchmany(LOT)
+            if not lot:
+                break
+            par_annee = {}
+            for id_, annee, raw in lot:
+                par_annee.setdefault(annee, []).append((id_, raw))
+            for annee, items in par_annee.items():
+                ecrits.append(write_segment(table, annee, [i for i, _ in items], [r for _, r in items]))
+            if rearchives is not None:
+                rearchives.update(r[0] for r in lot)
+            maj.execute(f"UPDATE {table} SET raw_data = raw_data - %s::text[] WHERE id = ANY(%s)",
+                        (cles, [r[0] for r in lot]))
+            ecriture.commit()
+            lignes += len(lot)
+            print(f"    {lignes:,} lignes compactees ({len(ecrits)} segments)")
+        return lignes, ecrits, rearchives or set()
+    finally:
+        lecture.close()
+        ecriture.close()
+
+
+def purger(conn, table, ecrits, rearchives):
+    """Retire des segments anterieurs a ce passage les ids absents de la table et ceux
+    re-archives dans ce passage. -> (ids retires, segments touches)"""
+    ecrits = set(ecrits)
+    cur = conn.cursor()
+    retires = touches = 0
+    for annee, chemin, _, _ in segments(table):
+        if chemin in ecrits:
+            continue
+        ids = segment_ids(chemin)
+        cur.execute(f"SELECT id FROM {table} WHERE id = ANY(%s)", (ids,))
+        keep = {r[0] for r in cur.fetchall()} - rearchives
+        n = prune_segment(table, annee, chemin, keep)
+        if n:
+            retires += n
+            touches += 1
+    conn.rollback()
+    return retires, touches
+
+
+def vacuum(table, full=False):
+    conn = get_connection()
+    conn.autocommit = True
+    try:
+        conn.cursor().execute(f"VACUUM {'FULL ' if full else ''}ANALYZE {table}")
+    finally:
+        conn.close()
+
+
+# ═══════════════════════════════════════════════════════════
+# MAIN
+# ═══════════════════════════════════════════════════════════
+
+def main():
+    parser = argparse.ArgumentParser(description="Compaction raw_data -> archive froide")
+    parser.add_argument("--table", choices=sorted(POLITIQUES), help="Une seule table")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--report", action="store_true", help="Mesures seulement, aucune compaction")
+    parser.add_argument("--vacuum-full", action="store_true",
+                        help="VACUUM FULL apres compaction (verrou exclusif: rend l'espace au disque)")
+    args = parser.parse_args()
+
+    tables = [args.table] if args.table else list(POLITIQUES)
+    print("=" * 60)
+    print("  COMPACTION RAW_DATA -> ARCHIVE FROIDE")
+    print(f"  Date: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    print(f"  Mode: {'REPORT' if args.report else 'DRY RUN' if args.dry_run else 'PRODUCTION'}")
+    print("=" * 60)
+
+    conn = get_connection()
+    rapport = {'date': datetime.now().isoformat(timespec='seconds'), 'tables': {}}
+    try:
+        for table in tables:
+            annee_expr, cles = POLITIQUES[table]
+            print(f"\n{table}:")
+            try:
+                avant = mesurer(conn, table)
+            except Exception as e:
+                conn.rollback()
+                print(f"  ERREUR mesure: {e}")
+                continue
+            afficher("avant", avant)
+            entree = {'avant': avant}
+            if not args.report:
+                cles = cles()
+                lignes, ecrits, rearchives = compacter(table, annee_expr, cles, dry_run=args.dry_run)
+                print(f"  {lignes:,} lignes {'a compacter' if args.dry_run else 'compactees'}"
+                      f" ({len(cles)} cles mappees)")
+                entree.update(lignes_compactees=lignes, segments=len(ecrits))
+                if not args.dry_run:
+                    retires, touches = purger(conn, table, ecrits, rearchives)
+                    print(f"  archive: {retires:,} versions remplacees retirees ({touches} segments)")
+                    entree.update(ids_purges=retires, segments_purges=touches)
+                if lignes and not args.dry_run:
+                    vacuum(table, full=args.vacuum_full)
+                    apres = mesurer(conn, table)
+                    afficher("apres", apres)
+                    entree['apres'] = apres
+            entree['archive_octets'] = archive_size(table)
+            print(f"  archive: {_mo(entree['archive_octets'])}")
+            rapport['tables'][table] = entree
+    finally:
+        conn.close()
+
+    if not args.dry_run:
+        os.makedirs(os.path.dirname(REPORT_FILE), exist_ok=True)
+        with open(REPORT_FILE, "w") as f:
+            json.dump(rapport, f, indent=2, ensure_ascii=False)
+        print(f"\nRapport: {REPORT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -514,15 +514,15 @@ class BaseAgent:
                 # Stats pour le même article CSR
                 cur.execute("""
                     SELECT
-                        raw_data->>'NO_ARTCL_L_R' AS article,
-                        raw_data->>'DESCN_CAT_INFRA' AS categorie,
+                        article,
+                        description_infraction AS categorie,
                         COUNT(*) AS nb_constats,
-                        COUNT(DISTINCT raw_data->>'COD_MUNI_LIEU') AS nb_municipalites,
-                        MIN(raw_data->>'DAT_INFRA_COMMI') AS premiere_date,
-                        MAX(raw_data->>'DAT_INFRA_COMMI') AS derniere_date
+                        COUNT(DISTINCT lieu_infraction) AS nb_municipalites,
+                        MIN(date_infraction) AS premiere_date,
+                        MAX(date_infraction) AS derniere_date
                     FROM qc_constats_infraction
-                    WHERE raw_data->>'NO_ARTCL_L_R' = %s
-                    GROUP BY raw_data->>'NO_ARTCL_L_R', raw_data->>'DESCN_CAT_INFRA'
+                    WHERE article = %s
+                    GROUP BY article, description_infraction
                     LIMIT 5
                 """, (article,))
 
@@ -538,11 +538,11 @@ class BaseAgent:
             if not results:
                 cur.execute("""
                     SELECT
-                        raw_data->>'DESCN_CAT_INFRA' AS categorie,
+                        description_infraction AS categorie,
                         COUNT(*) AS nb_constats
                     FROM qc_constats_infraction
-                    WHERE raw_data->>'DESCN_CAT_INFRA' ILIKE %s
-                    GROUP BY raw_data->>'DESCN_CAT_INFRA'
+                    WHERE description_infraction ILIKE %s
+                    GROUP BY description_infraction
                     ORDER BY nb_constats DESC LIMIT 5
                 """, ("%vitesse%",))
                 for row in cur.fetchall():
@@ -567,21 +567,21 @@ class BaseAgent:
             for part in lieu_parts[:3]:
                 cur.execute("""
                     SELECT
-                        raw_data->>'Site' AS site,
-                        raw_data->>'Moyen' AS moyen,
-                        (raw_data->>'Nombre')::bigint AS nb_constats,
+                        localisation AS site,
+                        type_appareil AS moyen,
+                        nombre_constats AS nb_constats,
                         (raw_data->>'Montant')::numeric AS montant_total,
-                        raw_data->>'Date' AS date_rapport
+                        date_rapport
                     FROM qc_radar_photo_stats
-                    WHERE raw_data->>'Site' ILIKE %s
-                    ORDER BY (raw_data->>'Nombre')::bigint DESC
+                    WHERE localisation ILIKE %s
+                    ORDER BY nombre_constats DESC NULLS LAST
                     LIMIT 5
                 """, (f"%{part}%",))
                 for row in cur.fetchall():
                     results.append({
                         "site": (row[0] or "")[:150], "moyen": row[1],
                         "nb_constats": row[2], "montant_total": float(row[3]) if row[3] else 0,
-                        "date_rapport": row[4]
+                        "date_rapport": str(row[4]) if row[4] else None
                     })
 
             conn.close()
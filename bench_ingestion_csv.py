@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+ScanTicket V1 — Benchmark ingestion des gros resources open data (rows/s)
+Compare, pour un meme resource et le meme mapping de colonnes:
+  - datastore : pages JSON datastore_search (32 000 lignes, pages paralleles)
+  - csv       : fichier CSV complet lu en flux (csv_records)
+Sources: constats CRQ (une annee), collisions MTL, collisions SAAQ (CSV S3 seulement:
+telechargement complet puis parse, ancien chemin, contre lecture en flux).
+Par defaut: telechargement + parse + mapping (aucune DB). --copy ajoute le COPY
+dans une table temporaire (meme code que staged_load), annule a la fin.
+Usage:
+    python3 bench_ingestion_csv.py                         # 200 000 lignes par chemin
+    python3 bench_ingestion_csv.py --rows 0                # resource complet
+    python3 bench_ingestion_csv.py --source constats --copy
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from itertools import islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tickets-db"))
+from config import DONNEES_QC_BASE
+from utils.fetcher import (ckan_datastore_records, ckan_resource_show, ckan_dump_url, csv_records,
+                           fetch_if_changed)
+from utils.db import get_connection, _copy_chunk, COPY_CHUNK
+from modules.ckan_quebec import CONSTATS_MAPPING
+from modules.ckan_collisions_saaq import COLLISION_CSV_URLS, COLLISION_MAPPING
+from import_donnees_mtl import MTL_API, MTL_COLLISIONS_RID, COLLISIONS_MAPPING
+from import_donnees_qc import CONSTATS_RESOURCES
+
+
+def _saaq_buffered(url):
+    # Ancien chemin: fichier entier en memoire, decode, puis DictReader
+    body, _ = fetch_if_changed(url, timeout=300)
+    return csv.DictReader(io.StringIO(body.decode('utf-8-sig')))
+
+
+def bench(label, records, transformer, limite, copie):
+    """Consomme records -> transformer (-> COPY) et retourne (lignes, lignes/s)."""
+    debut = time.perf_counter()
+    lignes = transformer(records)
+    if limite:
+        lignes = islice(lignes, limite)
+    n = 0
+    if copie is None:
+        for _ in lignes:
+            n += 1
+    else:
+        cur, table, cols = copie
+        rejets = []
+        while True:
+            bloc = list(islice(lignes, COPY_CHUNK))
+            if not bloc:
+                break
+            _copy_chunk(cur, table, cols, bloc, rejets)
+            n += len(bloc)
+    duree = time.perf_counter() - debut
+    debit = n / duree if duree else 0.0
+    print(f"  {label:<40} {n:>10,} lignes {duree:>8.1f} s {debit:>10,.0f} lignes/s")
+    return n, debit
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion CSV vs DataStore")
+    parser.add_argument("--source", default="all", help="constats|collisions-mtl|saaq|all")
+    parser.add_argument("--rows", type=int, default=200000, help="Lignes par chemin (0: tout)")
+    parser.add_argument("--year", type=int, default=2022, help="Annee des constats / collisions SAAQ")
+    parser.add_argument("--copy", action="store_true", help="Inclure le COPY (table temporaire)")
+    args = parser.parse_args()
+
+    conn = get_connection() if args.copy else None
+
+    def copie(table, columns):
+        if conn is None:
+            return None
+        cur = conn.cursor()
+        cols = ", ".join(columns)
+        cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS _bench_{table} AS "
+                    f"SELECT {cols} FROM {table} WITH NO DATA")
+        cur.execute(f"TRUNCATE _bench_{table}")
+        return cur, f"_bench_{table}", cols
+
+    cas = []
+    if args.source in ("all", "constats"):
+        rid = CONSTATS_RESOURCES[args.year]
+        res = ckan_resource_show(DONNEES_QC_BASE, rid)
+        cas.append((f"Constats CRQ {args.year}", "qc_constats_infraction", CONSTATS_MAPPING.columns,
+                    lambda records: CONSTATS_MAPPING.rows(records, resource_id=rid),
+                    [("datastore (pages JSON)", lambda: ckan_datastore_records(DONNEES_QC_BASE, rid)),
+                     ("csv (flux)", lambda res=res: csv_records(ckan_dump_url(DONNEES_QC_BASE, res)))]))
+    if args.source in ("all", "collisions-mtl"):
+        res = ckan_resource_show(MTL_API, MTL_COLLISIONS_RID)
+        cas.append(("Collisions MTL", "mtl_collisions", COLLISIONS_MAPPING.columns, COLLISIONS_MAPPING.rows,
+                    [("datastore (pages JSON)", lambda: ckan_datastore_records(MTL_API, MTL_COLLISIONS_RID)),
+                     ("csv (flux)", lambda res=res: csv_records(ckan_dump_url(MTL_API, res)))]))
+    if args.source in ("all", "saaq"):
+        url = COLLISION_CSV_URLS[args.year]
+        cas.append((f"Collisions SAAQ {args.year}", "qc_collisions_saaq", COLLISION_MAPPING.columns,
+                    lambda records: COLLISION_MAPPING.rows(records, source=f'saaq_csv_{args.year}'),
+                    [("csv (telecharge puis parse)", lambda: _saaq_buffered(url)),
+                     ("csv (flux)", lambda: csv_records(url))]))
+
+    print(f"=== Ingestion: {args.rows or 'toutes les'} lignes par chemin"
+          f"{' + COPY' if args.copy else ''} ===")
+    try:
+        for titre, table, columns, transformer, chemins in cas:
+            print(f"\n{titre}:")
+            debits = []
+            for label, records in chemins:
+                try:
+                    debits.append(bench(label, records(), transformer, args.rows, copie(table, columns))[1])
+                except Exception as e:
+                    print(f"  {label:<40} [ERR] {e}")
+                    debits.append(0.0)
+            if len(debits) == 2 and debits[0]:
+                print(f"  {'-> gain':<40} {debits[1] / debits[0]:>10.1f}x")
+    finally:
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
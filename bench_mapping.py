@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+ScanTicket V1 — Benchmark des transformateurs de lignes (utils/mapping.py)
+Compare, sur des records synthetiques (texte, champ vide -> None comme csv_records),
+l'extraction ecrite a la main ligne par ligne (_get / _safe_int / safe_date / json.dumps)
+et les correspondances declaratives compilees des importeurs. Rapports SAAQ: l'importeur
+garde son extraction a la main (rapport_rows), comparee a la correspondance equivalente.
+Aucune DB ni reseau.
+Usage:
+    python3 bench_mapping.py            # 1 000 000 lignes par source
+    python3 bench_mapping.py 200000     # N lignes
+"""
+
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from itertools import cycle, islice
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tickets-db"))
+from modules.ckan_quebec import CONSTATS_MAPPING
+from import_donnees_mtl import COLLISIONS_MAPPING
+from import_saaq_accidents import rapport_rows
+from utils.mapping import compile_mapping
+
+POOL = 20000     # records distincts, reutilises en boucle jusqu'a N
+
+
+# ═══════════════════════════════════════════════════════════
+# ANCIENNES EXTRACTIONS (reference)
+# ═══════════════════════════════════════════════════════════
+
+def _get(r, *keys):
+    for k in keys:
+        v = r.get(k)
+        if v is not None and v != '':
+            return v
+    return None
+
+
+def _safe_int(val, default=None):
+    if val is None or val == '' or val == 'null':
+        return default
+    try:
+        return int(float(str(val).strip()))
+    except (ValueError, TypeError):
+        return default
+
+
+def _safe_float(val, default=None):
+    if val is None or val == '' or val == 'null':
+        return default
+    try:
+        return float(str(val).strip().replace(',', '.'))
+    except (ValueError, TypeError):
+        return default
+
+
+def _safe_date(val):
+    if not val or val == 'null':
+        return None
+    for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(str(val).strip()[:10], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _safe_time(val):
+    if not val or val == 'null':
+        return None
+    try:
+        v = str(val).strip()
+        if ':' in v:
+            parts = v.split(':')
+            return f"{int(parts[0]):02d}:{int(parts[1]):02d}:00"
+        elif len(v) == 4 and v.isdigit():
+            return f"{v[:2]}:{v[2:]}:00"
+    except Exception:
+        pass
+    return None
+
+
+def ancien_constats(records, rid):
+    for r in records:
+        yield (
+            _safe_int(_get(r, 'ANNEE', 'annee')),
+            _get(r, 'DATE_INFRACTION', 'date_infraction'),
+            _get(r, 'HEURE_INFRACTION', 'heure_infraction'),
+            _get(r, 'REGION', 'region'),
+            _get(r, 'LIEU_INFRACTION', 'lieu_infraction'),
+            _get(r, 'TYPE_INTERVENTION', 'type_intervention'),
+            _get(r, 'LOI', 'loi'),
+            _get(r, 'REGLEMENT', 'reglement'),
+            _get(r, 'ARTICLE', 'article'),
+            _get(r, 'DESCRIPTION_INFRACTION', 'description_infraction'),
+            _safe_int(_get(r, 'VITESSE_PERMISE', 'vitesse_permise')),
+            _safe_int(_get(r, 'VITESSE_CONSTATEE', 'vitesse_constatee')),
+            _safe_float(_get(r, 'MONTANT_AMENDE', 'montant_amende')),
+            _safe_int(_get(r, 'POINTS_INAPTITUDE', 'points_inaptitude')),
+            _get(r, 'CATEGORIE_VEHICULE', 'categorie_vehicule'),
+            json.dumps(r),
+            rid,
+        )
+
+
+def ancien_collisions_mtl(records):
+    for rec in records:
+        yield (
+            rec.get('NO_SEQ_COLL', ''),
+            _safe_date(rec.get('DT_ACCDN')),
+            _safe_time(rec.get('HEURE_ACCDN')),
+            rec.get('RUE_ACCDN', ''),
+            rec.get('ACCDN_PRES_DE', ''),
+            _safe_float(rec.get('LOC_LAT')),
+            _safe_float(rec.get('LOC_LONG')),
+            rec.get('GRAVITE', ''),
+            _safe_int(rec.get('NB_MORTS', 0), 0),
+            _safe_int(rec.get('NB_BLESSES_GRAVES', 0), 0),
+            _safe_int(rec.get('NB_BLESSES_LEGERS', 0), 0),
+            rec.get('CD_GENRE_ACCDN', ''),
+            rec.get('CD_COND_METEO', ''),
+            rec.get('CD_ETAT_SURFC', ''),
+            rec.get('CD_ECLRM', ''),
+            json.dumps(rec, ensure_ascii=False, default=str),
+        )
+
+
+# Rapports SAAQ: correspondance equivalente a import_saaq_accidents.rapport_rows
+RAPPORT_MAPPING = compile_mapping({
+    'columns': [
+        ('annee', ('AN', '$year'), 'int'),
+        ('no_seq_collision', 'NO_SEQ_COLL', 'strip', ''),
+        ('mois', 'MS_ACCDN', 'strip', ''),
+        ('heure', 'HR_ACCDN', 'strip', ''),
+        ('jour_semaine', 'JR_SEMN_ACCDN', 'strip', ''),
+        ('gravite', 'GRAVITE', 'strip', ''),
+        ('nb_victimes', 'NB_VICTIMES_TOTAL', 'int', 0),
+        ('nb_vehicules', 'NB_VEH_IMPLIQUES_ACCDN', 'int', 0),
+        ('region_admin', 'REG_ADM', 'strip', ''),
+        ('vitesse_autorisee', 'VITESSE_AUTOR', 'strip', ''),
+        ('genre_accident', 'CD_GENRE_ACCDN', 'strip', ''),
+        ('etat_surface', 'CD_ETAT_SURFC', 'strip', ''),
+        ('eclairage', 'CD_ECLRM', 'strip', ''),
+        ('environnement', 'CD_ENVRN_ACCDN', 'strip', ''),
+        ('categorie_route', 'CD_CATEG_ROUTE', 'strip', ''),
+        ('aspect_route', 'CD_ASPCT_ROUTE', 'strip', ''),
+        ('localisation', 'CD_LOCLN_ACCDN', 'strip', ''),
+        ('configuration_route', 'CD_CONFG_ROUTE', 'strip', ''),
+        ('zone_travaux', 'CD_ZON_TRAVX_ROUTR', 'strip'),
+        ('condition_meteo', 'CD_COND_METEO', 'strip', ''),
+        ('ind_auto', 'IND_AUTO_CAMION_LEGER', 'flag'),
+        ('ind_veh_lourd', 'IND_VEH_LOURD', 'flag'),
+        ('ind_moto', 'IND_MOTO_CYCLO', 'flag'),
+        ('ind_velo', 'IND_VELO', 'flag'),
+        ('ind_pieton', 'IND_PIETON', 'flag'),
+    ],
+})
+
+
+# ═══════════════════════════════════════════════════════════
+# RECORDS SYNTHETIQUES
+# ═══════════════════════════════════════════════════════════
+
+def _vide(rng, v, p=0.1):
+    return None if rng.random() < p else v
+
+
+def records_constats(rng):
+    for i in range(POOL):
+        yield {
+            '_id': str(i), 'ANNEE': '2021',
+            'DATE_INFRACTION': f"2021-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'HEURE_INFRACTION': f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+            'REGION': rng.choice(['Montreal', 'Capitale-Nationale', 'Laval', 'Monteregie']),
+            'LIEU_INFRACTION': f"{rng.randint(10000, 99999)}",
+            'TYPE_INTERVENTION': rng.choice(['Constat', 'Avertissement']),
+            'LOI': 'CSR', 'REGLEMENT': _vide(rng, 'R-1'), 'ARTICLE': str(rng.randint(300, 520)),
+            'DESCRIPTION_INFRACTION': rng.choice(['Exces de vitesse', 'Feu rouge', 'Cellulaire']),
+            'VITESSE_PERMISE': _vide(rng, str(rng.choice([50, 70, 90, 100])), 0.3),
+            'VITESSE_CONSTATEE': _vide(rng, str(rng.randint(60, 160)), 0.3),
+            'MONTANT_AMENDE': _vide(rng, f"{rng.randint(50, 600)},00"),
+            'POINTS_INAPTITUDE': _vide(rng, str(rng.randint(0, 6))),
+            'CATEGORIE_VEHICULE': rng.choice(['Automobile', 'Camion', 'Moto']),
+        }
+
+
+def records_collisions_mtl(rng):
+    for i in range(POOL):
+        yield {
+            'NO_SEQ_COLL': f"SPVM _ {2020 + i % 3} _ {i}",
+            'DT_ACCDN': f"{2020 + i % 3}/{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}".replace('/', '-'),
+            'HEURE_ACCDN': _vide(rng, f"{rng.randint(0, 23):02d}:00:00-{rng.randint(0, 23):02d}:59:00"),
+            'RUE_ACCDN': 'RUE SAINTE-CATHERINE', 'ACCDN_PRES_DE': _vide(rng, 'BOUL SAINT-LAURENT'),
+            'LOC_LAT': f"45.{rng.randint(400000, 700000)}", 'LOC_LONG': f"-73.{rng.randint(400000, 900000)}",
+            'GRAVITE': rng.choice(['Leger', 'Grave', 'Dommages materiels seulement']),
+            'NB_MORTS': '0', 'NB_BLESSES_GRAVES': _vide(rng, '0'), 'NB_BLESSES_LEGERS': str(rng.randint(0, 3)),
+            'CD_GENRE_ACCDN': str(rng.randint(31, 99)), 'CD_COND_METEO': str(rng.randint(11, 19)),
+            'CD_ETAT_SURFC': str(rng.randint(11, 19)), 'CD_ECLRM': str(rng.randint(1, 4)),
+        }
+
+
+def records_saaq(rng):
+    for i in range(POOL):
+        yield {
+            'AN': '2022', 'NO_SEQ_COLL': f" SAAQ-{i} ", 'MS_ACCDN': f"{rng.randint(1, 12):02d}",
+            'HR_ACCDN': f"{rng.randint(0, 23):02d}:00:00-{rng.randint(0, 23):02d}:59:00",
+            'JR_SEMN_ACCDN': rng.choice(['SEM', 'FDS']), 'GRAVITE': rng.choice(['Leger', 'Grave', 'Mortel']),
+            'NB_VICTIMES_TOTAL': str(rng.randint(0, 4)), 'NB_VEH_IMPLIQUES_ACCDN': str(rng.randint(1, 4)),
+            'REG_ADM': 'Montreal (06)', 'VITESSE_AUTOR': _vide(rng, str(rng.choice([50, 70, 90]))),
+            'CD_GENRE_ACCDN': str(rng.randint(31, 99)), 'CD_ETAT_SURFC': str(rng.randint(11, 19)),
+            'CD_ECLRM': str(rng.randint(1, 4)), 'CD_ENVRN_ACCDN': str(rng.randint(1, 9)),
+            'CD_CATEG_ROUTE': str(rng.randint(11, 19)), 'CD_ASPCT_ROUTE': str(rng.randint(11, 19)),
+            'CD_LOCLN_ACCDN': str(rng.randint(31, 40)), 'CD_CONFG_ROUTE': _vide(rng, str(rng.randint(1, 9))),
+            'CD_ZON_TRAVX_ROUTR': _vide(rng, '1', 0.8), 'CD_COND_METEO': str(rng.randint(11, 19)),
+            'IND_AUTO_CAMION_LEGER': rng.choice('ON'), 'IND_VEH_LOURD': rng.choice('ON'),
+            'IND_MOTO_CYCLO': rng.choice('ON'), 'IND_VELO': rng.choice('ON'), 'IND_PIETON': rng.choice('ON'),
+        }
+
+
+def bench(label, transformer, pool, n):
+    debut = time.perf_counter()
+    compte = 0
+    for _ in transformer(islice(cycle(pool), n)):
+        compte += 1
+    duree = time.perf_counter() - debut
+    print(f"  {label:<34} {compte:>10,} lignes {duree:>7.2f} s {compte / duree:>12,.0f} lignes/s")
+    return compte / duree
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(42)
+    cas = [
+        ("Constats CRQ (ckan_quebec)", list(records_constats(rng)),
+         lambda rs: ancien_constats(rs, 'rid'),
+         lambda rs: CONSTATS_MAPPING.rows(rs, resource_id='rid')),
+        ("Collisions MTL (import_donnees_mtl)", list(records_collisions_mtl(rng)),
+         ancien_collisions_mtl, COLLISIONS_MAPPING.rows),
+        ("Rapports SAAQ (import_saaq_accidents)", list(records_saaq(rng)),
+         lambda rs: rapport_rows(rs, 2022),
+         lambda rs: RAPPORT_MAPPING.rows(rs, year=2022)),
+    ]
+    print(f"=== Transformation de lignes — {n:,} records synthetiques par source ===")
+    for titre, pool, ancien, compile_ in cas:
+        print(f"\n{titre}:")
+        a = bench("extraction ligne par ligne (ancien)", ancien, pool, n)
+        b = bench("correspondance compilee", compile_, pool, n)
+        print(f"  {'-> gain':<34} {b / a:>10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
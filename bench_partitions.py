@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+ScanTicket V1 — Benchmark qc_constats_infraction partitionnee par annee (db/migrate_constats_partitions.sql)
+Compare les requetes les plus lourdes des detecteurs (recensement_stats_runner) et
+d'ErreursAdmin dans leur forme d'avant, sur une copie non partitionnee de la table
+(table temporaire avec les anciens index), et dans leur forme actuelle sur la table
+partitionnee. Temps median et partitions effectivement lues (EXPLAIN). Lecture seule.
+Usage:
+    python3 bench_partitions.py            # 5 executions par requete
+    python3 bench_partitions.py 10         # N executions
+Resultats: logs/bench_partitions.json (a joindre aux notes de migration)
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tickets-db"))
+from utils.db import get_connection
+
+HEAP = "_bench_constats_heap"
+TABLE = "qc_constats_infraction"
+RAPPORT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "bench_partitions.json")
+
+# (titre, requete avant sur HEAP, requete apres sur la table partitionnee, parametres -> (avant, apres))
+REQUETES = [
+    ("ErreursAdmin: meme lieu, meme jour",
+     f"""SELECT COUNT(*), COUNT(DISTINCT raw_data->>'IDENT_INTRT') FROM {HEAP}
+         WHERE raw_data->>'COD_MUNI_LIEU' = %s AND raw_data->>'DAT_INFRA_COMMI' = %s""",
+     f"""SELECT COUNT(*), COUNT(DISTINCT raw_data->>'IDENT_INTRT') FROM {TABLE}
+         WHERE lieu_infraction = %s AND date_infraction = %s
+           AND (annee_donnees >= %s OR annee_donnees IS NULL)""",
+     lambda lieu, jour: ((lieu, jour.isoformat()), (lieu, jour, jour.year))),
+    ("ErreursAdmin: pires journees du lieu",
+     f"""SELECT raw_data->>'DAT_INFRA_COMMI', COUNT(*) AS nb FROM {HEAP}
+         WHERE raw_data->>'COD_MUNI_LIEU' = %s
+         GROUP BY raw_data->>'DAT_INFRA_COMMI' ORDER BY nb DESC LIMIT 5""",
+     f"""SELECT date_infraction, COUNT(*) AS nb FROM {TABLE}
+         WHERE lieu_infraction = %s AND date_infraction IS NOT NULL
+         GROUP BY date_infraction ORDER BY nb DESC LIMIT 5""",
+     lambda lieu, jour: ((lieu,), (lieu,))),
+    ("Detecteur tendance_annuelle (lieu x annee)",
+     f"""SELECT lieu_infraction, EXTRACT(YEAR FROM date_infraction)::int AS annee, COUNT(*) FROM {HEAP}
+         WHERE date_infraction IS NOT NULL AND lieu_infraction IS NOT NULL AND lieu_infraction != ''
+         GROUP BY lieu_infraction, annee""",
+     f"""SELECT lieu_infraction, EXTRACT(YEAR FROM date_infraction)::int AS annee, COUNT(*) FROM {TABLE}
+         WHERE date_infraction IS NOT NULL
+           AND lieu_infraction IS NOT NULL AND lieu_infraction != ''
+         GROUP BY lieu_infraction, annee""",
+     lambda lieu, jour: ((), ())),
+    ("Detecteur anomalie_saisonniere (lieu x annee x trimestre)",
+     f"""SELECT lieu_infraction, EXTRACT(YEAR FROM date_infraction)::int AS annee,
+                EXTRACT(QUARTER FROM date_infraction)::int AS trimestre, COUNT(*) FROM {HEAP}
+         WHERE date_infraction IS NOT NULL AND lieu_infraction IS NOT NULL AND lieu_infraction != ''
+         GROUP BY lieu_infraction, annee, trimestre""",
+     f"""SELECT lieu_infraction, EXTRACT(YEAR FROM date_infraction)::int AS annee,
+                EXTRACT(QUARTER FROM date_infraction)::int AS trimestre, COUNT(*) FROM {TABLE}
+         WHERE date_infraction IS NOT NULL
+           AND lieu_infraction IS NOT NULL AND lieu_infraction != ''
+         GROUP BY lieu_infraction, annee, trimestre""",
+     lambda lieu, jour: ((), ())),
+    ("Une annee (import: annee deja en base?)",
+     f"SELECT COUNT(*) FROM {HEAP} WHERE annee_donnees = %s",
+     f"SELECT COUNT(*) FROM {TABLE} WHERE annee_donnees = %s",
+     lambda lieu, jour: ((jour.year,), (jour.year,))),
+]
+
+
+def relations(plan):
+    """Tables / partitions lues par un plan EXPLAIN (FORMAT JSON)."""
+    noms = set()
+    if plan.get("Relation Name"):
+        noms.add(plan["Relation Name"])
+    for sous in plan.get("Plans", []):
+        noms |= relations(sous)
+    return noms
+
+
+def bench(cur, label, sql, params, n):
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    durees = []
+    for _ in range(n):
+        debut = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        durees.append((time.perf_counter() - debut) * 1000)
+    mediane = statistics.median(durees)
+    lues = len(relations(plan))
+    print(f"  {label:<12} {mediane:>10.1f} ms   {lues:>3} table(s) lue(s)")
+    return {'ms': round(mediane, 1), 'tables_lues': lues}
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", (TABLE,))
+        if cur.fetchone()[0] != "p":
+            print(f"{TABLE} n'est pas partitionnee (db/migrate_constats_partitions.sql)")
+            return
+
+        # Lieu et jour les plus charges: cas typique d'un blitz
+        cur.execute(f"""
+            SELECT lieu_infraction, date_infraction FROM {TABLE}
+            WHERE date_infraction IS NOT NULL AND lieu_infraction != ''
+            GROUP BY 1, 2 ORDER BY COUNT(*) DESC LIMIT 1
+        """)
+        lieu, jour = cur.fetchone()
+
+        print(f"Copie non partitionnee de {TABLE} (anciens index)...")
+        debut = time.perf_counter()
+        cur.execute(f"CREATE TEMP TABLE {HEAP} AS SELECT * FROM {TABLE}")
+        for cols in ("date_infraction", "article", "region", "annee_donnees",
+                     "vitesse_permise, vitesse_constatee"):
+            cur.execute(f"CREATE INDEX ON {HEAP} ({cols})")
+        cur.execute(f"ANALYZE {HEAP}")
+        cur.execute(f"SELECT COUNT(*) FROM {HEAP}")
+        print(f"  {cur.fetchone()[0]:,} lignes en {time.perf_counter() - debut:.1f} s")
+        cur.execute("SET enable_partitionwise_aggregate = on")
+
+        rapport = {'date': datetime.now().isoformat(timespec='seconds'), 'executions': n,
+                   'lieu': lieu, 'jour': jour.isoformat(), 'requetes': {}}
+        print(f"\n=== {n} executions par requete (lieu {lieu}, {jour}) ===")
+        for titre, avant, apres, params in REQUETES:
+            p_avant, p_apres = params(lieu, jour)
+            print(f"\n{titre}:")
+            r_avant = bench(cur, "avant", avant, p_avant, n)
+            r_apres = bench(cur, "apres", apres, p_apres, n)
+            gain = r_avant['ms'] / r_apres['ms'] if r_apres['ms'] else 0
+            print(f"  {'-> gain':<12} {gain:>10.1f}x")
+            rapport['requetes'][titre] = {'avant': r_avant, 'apres': r_apres, 'gain': round(gain, 1)}
+    finally:
+        conn.rollback()
+        conn.close()
+
+    os.makedirs(os.path.dirname(RAPPORT), exist_ok=True)
+    with open(RAPPORT, "w") as f:
+        json.dump(rapport, f, indent=2, ensure_ascii=False)
+    print(f"\nRapport: {RAPPORT}")
+
+
+if __name__ == "__main__":
+    main()
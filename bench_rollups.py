@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+ScanTicket V1 — Benchmark agregats quotidiens des constats (db/migrate_constats_rollups.sql)
+Compare les requetes de blitz_daily, pattern_jour_semaine, ErreursAdmin (meme lieu,
+meme jour) et /api/day-patterns recomptees sur qc_constats_infraction (avant) et lues
+dans les agregats qc_constats_jour / _jour_article / _semaine_heure (apres).
+Temps median et lignes lues (EXPLAIN ANALYZE). Lecture seule.
+Usage:
+    python3 bench_rollups.py            # 5 executions par requete
+    python3 bench_rollups.py 10         # N executions
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tickets-db"))
+from utils.db import get_connection
+
+TABLE = "qc_constats_infraction"
+
+# (titre, requete avant, requete apres, parametres (lieu, jour, article) -> (avant, apres))
+REQUETES = [
+    ("Detecteur blitz_daily (lieu x jour)",
+     f"""SELECT lieu_infraction, date_infraction, COUNT(*) FROM {TABLE}
+         WHERE date_infraction IS NOT NULL AND lieu_infraction IS NOT NULL AND lieu_infraction != ''
+         GROUP BY lieu_infraction, date_infraction""",
+     """SELECT lieu_infraction, date_infraction, SUM(nb) FROM qc_constats_jour
+         WHERE lieu_infraction != '' GROUP BY lieu_infraction, date_infraction""",
+     lambda lieu, jour, article: ((), ())),
+    ("Detecteur pattern_jour_semaine (lieu x jour de semaine)",
+     f"""SELECT lieu_infraction, EXTRACT(DOW FROM date_infraction)::int AS dow, COUNT(*) FROM {TABLE}
+         WHERE date_infraction IS NOT NULL AND lieu_infraction IS NOT NULL AND lieu_infraction != ''
+         GROUP BY lieu_infraction, dow""",
+     """SELECT lieu_infraction, jour_semaine::int AS dow, SUM(nb) FROM qc_constats_semaine_heure
+         WHERE lieu_infraction != '' GROUP BY lieu_infraction, dow""",
+     lambda lieu, jour, article: ((), ())),
+    ("/api/day-patterns: distribution provinciale",
+     f"""SELECT EXTRACT(DOW FROM date_infraction)::int AS dow, COUNT(*) FROM {TABLE}
+         WHERE date_infraction IS NOT NULL GROUP BY dow""",
+     "SELECT jour_semaine::int AS dow, SUM(nb) FROM qc_constats_semaine_heure GROUP BY dow",
+     lambda lieu, jour, article: ((), ())),
+    ("ErreursAdmin: meme lieu, meme jour",
+     f"""SELECT COUNT(*), COUNT(DISTINCT raw_data->>'IDENT_INTRT') FROM {TABLE}
+         WHERE lieu_infraction = %s AND date_infraction = %s
+           AND (annee_donnees >= %s OR annee_donnees IS NULL)""",
+     """SELECT SUM(nb), MAX(nb_agents) FROM qc_constats_jour
+         WHERE lieu_infraction = %s AND date_infraction = %s
+           AND (annee_donnees >= %s OR annee_donnees IS NULL)""",
+     lambda lieu, jour, article: ((lieu, jour, jour.year), (lieu, jour, jour.year))),
+    ("ErreursAdmin: pires journees du lieu",
+     f"""SELECT date_infraction, COUNT(*) AS nb FROM {TABLE}
+         WHERE lieu_infraction = %s AND date_infraction IS NOT NULL
+         GROUP BY date_infraction ORDER BY nb DESC LIMIT 5""",
+     """SELECT date_infraction, SUM(nb) AS nb FROM qc_constats_jour
+         WHERE lieu_infraction = %s GROUP BY date_infraction ORDER BY nb DESC LIMIT 5""",
+     lambda lieu, jour, article: ((lieu,), (lieu,))),
+    ("ErreursAdmin: article x lieu",
+     f"SELECT COUNT(*) FROM {TABLE} WHERE lieu_infraction = %s AND article = %s",
+     "SELECT SUM(nb) FROM qc_constats_jour_article WHERE lieu_infraction = %s AND article = %s",
+     lambda lieu, jour, article: ((lieu, article), (lieu, article))),
+    ("ErreursAdmin: percentile du lieu",
+     f"""SELECT COUNT(*) FROM (SELECT lieu_infraction FROM {TABLE}
+         GROUP BY lieu_infraction HAVING COUNT(*) > 1000) sub""",
+     """SELECT COUNT(*) FROM (SELECT lieu_infraction FROM qc_constats_jour
+         GROUP BY lieu_infraction HAVING SUM(nb) > 1000) sub""",
+     lambda lieu, jour, article: ((), ())),
+]
+
+
+def lignes_lues(plan):
+    """Lignes produites par les noeuds de lecture (Seq/Index/Bitmap Scan) d'un plan."""
+    n = plan.get("Actual Rows", 0) * plan.get("Actual Loops", 1) if "Scan" in plan.get("Node Type", "") else 0
+    return n + sum(lignes_lues(sous) for sous in plan.get("Plans", []))
+
+
+def bench(cur, label, sql, params, n):
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    durees = []
+    for _ in range(n):
+        debut = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        durees.append((time.perf_counter() - debut) * 1000)
+    mediane = statistics.median(durees)
+    print(f"  {label:<12} {mediane:>10.1f} ms   {lignes_lues(plan):>12,.0f} lignes lues")
+    return mediane
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT to_regclass('qc_constats_jour')")
+        if not cur.fetchone()[0]:
+            print("Agregats absents (db/migrate_constats_rollups.sql)")
+            return
+
+        # Lieu, jour et article les plus charges: cas typique d'un blitz
+        cur.execute("""
+            SELECT lieu_infraction, date_infraction, article FROM qc_constats_jour_article
+            WHERE lieu_infraction != '' ORDER BY nb DESC LIMIT 1
+        """)
+        lieu, jour, article = cur.fetchone()
+        cur.execute("SELECT COUNT(*) FROM qc_constats_jour")
+        print(f"qc_constats_jour: {cur.fetchone()[0]:,} lignes (lieu x jour)")
+
+        print(f"\n=== {n} executions par requete (lieu {lieu}, {jour}, art. {article}) ===")
+        for titre, avant, apres, params in REQUETES:
+            p_avant, p_apres = params(lieu, jour, article)
+            print(f"\n{titre}:")
+            t_avant = bench(cur, "avant", avant, p_avant, n)
+            t_apres = bench(cur, "apres", apres, p_apres, n)
+            print(f"  {'-> gain':<12} {t_avant / t_apres if t_apres else 0:>10.1f}x")
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+ScanTicket V1 — Micro-benchmark serialisation des vecteurs (4096 dims)
+Compare, par requete, l'ancien chemin texte ("[0.0123,...]"::vector) et
+l'adaptateur binaire NumPy (pgvector_adapter). Aucune DB requise.
+Usage:
+    python3 bench_vector_adapter.py            # 500 iterations
+    python3 bench_vector_adapter.py 2000       # N iterations
+"""
+
+import base64
+import random
+import sys
+import time
+
+import numpy as np
+
+from pgvector_adapter import as_vector, decode_text, encode_binary, _copy_stream
+
+DIM = 4096
+
+
+def bench(label, fn, n):
+    fn()
+    start = time.perf_counter()
+    for _ in range(n):
+        out = fn()
+    per_call = (time.perf_counter() - start) / n * 1e6
+    size = len(out.getvalue()) if hasattr(out, "getvalue") else len(out)
+    print(f"  {label:<46} {per_call:>9.1f} us   {size:>7,} octets")
+    return per_call
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rng = random.Random(42)
+    floats = [rng.uniform(-0.1, 0.1) for _ in range(DIM)]
+    vec = np.asarray(floats, dtype=np.float32)
+    b64 = base64.b64encode(vec.tobytes()).decode()
+    text = "[" + ",".join(str(x) for x in floats) + "]"
+
+    print(f"=== Serialisation vecteur {DIM} dims — {n} iterations ===\n")
+
+    print("Reception embedding (Fireworks -> Python):")
+    old_recv = bench("base64 -> list[float] (client openai, ancien)",
+                     lambda: np.frombuffer(base64.b64decode(b64), dtype="float32").tolist(), n)
+    new_recv = bench("base64 -> np.float32 (as_vector)", lambda: as_vector(b64), n)
+
+    print("\nEnvoi vecteur de requete (Python -> PostgreSQL):")
+    old_send = bench("texte '[...]'::vector (ancien)", lambda: "[" + ",".join(str(x) for x in floats) + "]", n)
+    bench("binaire vector_send (valeur seule)", lambda: encode_binary(vec), n)
+    new_send = bench("flux COPY binaire (bind_query_vector)", lambda: _copy_stream(None, [vec]), n)
+
+    print("\nLecture colonne vector (PostgreSQL -> Python):")
+    old_parse = bench("texte -> list[float] (split/float)", lambda: [float(x) for x in text[1:-1].split(",")], n)
+    new_parse = bench("texte -> np.float32 (decode_text)", lambda: decode_text(text), n)
+
+    batch = [vec] * 50
+    ids = list(range(50))
+    print("\nBatch populate_all (50 vecteurs):")
+    old_batch = bench("50 x texte + 50 UPDATE", lambda: "".join(
+        "[" + ",".join(str(x) for x in floats) + "]" for _ in batch), max(1, n // 50))
+    new_batch = bench("1 flux COPY binaire + 1 UPDATE", lambda: _copy_stream(ids, batch), max(1, n // 50))
+
+    print("\nGain par requete (embedding + envoi):")
+    print(f"  ancien: {old_recv + old_send:,.0f} us | nouveau: {new_recv + new_send:,.0f} us "
+          f"| x{(old_recv + old_send) / max(new_recv + new_send, 1e-9):.0f}")
+    print(f"  parse colonne: x{old_parse / max(new_parse, 1e-9):.1f} | batch 50: x{old_batch / max(new_batch, 1e-9):.0f}")
+
+
+if __name__ == "__main__":
+    main()
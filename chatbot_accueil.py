@@ -14,6 +14,8 @@ import psycopg2
 import psycopg2.extras
 from openai import OpenAI
 
+from agents import sql_stats
+
 PG_CONFIG = {
     "host": "172.18.0.3",
     "port": 5432,
@@ -325,7 +327,7 @@ class ChatbotAccueil:
 
     def get_db(self):
         if self.conn is None or self.conn.closed:
-            self.conn = psycopg2.connect(**PG_CONFIG)
+            self.conn = sql_stats.connecter("ChatbotAccueil", **PG_CONFIG)
         return self.conn
 
     # ─── DEMARRAGE ────────────────────────────────────
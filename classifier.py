@@ -420,7 +420,8 @@ def phase4_pass(conn):
                     resultat = COALESCE(%s, resultat),
                     resume_ia = COALESCE(resume_ia, %s),
                     classifie = true,
-                    confiance_classif = %s
+                    confiance_classif = %s,
+                    articles_indexes_at = NULL
                 WHERE id = %s
             """, (
                 result.get("article_csr"), result.get("type_infraction"),
@@ -496,6 +497,7 @@ def embedding_pass(conn):
     svc = get_embedding_service()
     if not svc:
         return 0
+    from pgvector_adapter import update_vectors
 
     cur = conn.cursor()
     cur.execute("""SELECT id, titre, citation, database_id, resume,
@@ -515,8 +517,8 @@ def embedding_pass(conn):
             text = build_embed_text(row)
             if not text.strip(): continue
             emb = svc.embed_single(text)
-            if emb and len(emb) > 0:
-                cur.execute("UPDATE jurisprudence SET embedding = %s::vector WHERE id = %s", (str(emb), row["id"]))
+            if emb is not None and len(emb) > 0:
+                update_vectors(cur, "jurisprudence", "embedding", [row["id"]], [emb])
                 conn.commit()
                 fixed += 1
                 time.sleep(SLEEP_BETWEEN)
@@ -528,6 +530,25 @@ def embedding_pass(conn):
     return fixed
 
 
+# ══════════════════════════════════════════════════════════
+# INDEX ARTICLES CITES (jurisprudence_articles)
+# ══════════════════════════════════════════════════════════
+
+def articles_pass(conn):
+    from agents.article_citations import indexer_jurisprudence
+    total = 0
+    try:
+        while running:
+            n = indexer_jurisprudence(conn, limit=1000)
+            if not n:
+                break
+            total += n
+    except Exception as e:
+        conn.rollback()
+        log(f"    [!] Index articles: {str(e)[:80]}")
+    return total
+
+
 # ══════════════════════════════════════════════════════════
 # STATS
 # ══════════════════════════════════════════════════════════
@@ -544,8 +565,17 @@ def get_stats(conn):
     no_res = cur.fetchone()[0]
     cur.execute("SELECT count(*) FROM jurisprudence WHERE classifie = false")
     no_class = cur.fetchone()[0]
+    cur.execute("SELECT count(*) FROM jurisprudence WHERE articles_indexes_at IS NULL")
+    no_articles = cur.fetchone()[0]
     cur.close()
-    return {"total": total, "no_embed": no_embed, "no_db_id": no_db, "no_resultat": no_res, "no_classif": no_class}
+    try:
+        from agents import metrics
+        for file, n in (("embeddings", no_embed), ("classification", no_class), ("articles_index", no_articles)):
+            metrics.JOBS_FILE.set(n, queue=file)
+    except Exception:
+        pass
+    return {"total": total, "no_embed": no_embed, "no_db_id": no_db, "no_resultat": no_res,
+            "no_classif": no_class, "no_articles": no_articles}
 
 
 # ══════════════════════════════════════════════════════════
@@ -574,7 +604,7 @@ def main():
             log(f"\n--- Cycle {cycle} ---")
             log(f"  DB: {stats['total']} total | {stats['no_embed']} sans embed | "
                 f"{stats['no_db_id']} sans tribunal | {stats['no_resultat']} sans resultat | "
-                f"{stats['no_classif']} non classifies")
+                f"{stats['no_classif']} non classifies | {stats['no_articles']} articles non indexes")
 
             # 1. Classification simple (mots-cles)
             if stats["no_db_id"] > 0 or stats["no_resultat"] > 0:
@@ -601,6 +631,11 @@ def main():
                     log(f"  Phase4: +{p4_ok} OK, {p4_fail} fail (total: {p4_ok_total} OK)")
                 save_phase4_state(p4_ok, p4_fail, stats["no_classif"] - p4_ok)
 
+            # 4. Index des articles cites (nouveaux dossiers + re-classifies en Phase 4)
+            indexed = articles_pass(conn)
+            if indexed > 0:
+                log(f"  Articles: {indexed} dossiers indexes")
+
             conn.close()
 
         except Exception as e:
@@ -0,0 +1,28 @@
+-- ══════════════════════════════════════════════════════════════
+--  MIGRATION: Index des articles cites par la jurisprudence
+--  Date: 2026-10-19
+--  Usage: docker exec seo-agent-postgres psql -U ticketdb_user -d tickets_qc_on -f /tmp/migrate_article_citations.sql
+--  Puis backfill: python3 -m agents.article_citations
+-- ══════════════════════════════════════════════════════════════
+
+-- ── Table: jurisprudence_articles ──
+-- Une ligne par (dossier, loi, article) cite. article = '329.2', article_base = '329'
+-- Recherche "cas citant l'art. 299" = sonde d'index au lieu d'un ILIKE '%art. 299%'
+-- sur titre/resume/mots_cles (leading wildcard -> seq scan de toute la table).
+CREATE TABLE IF NOT EXISTS jurisprudence_articles (
+    jurisprudence_id INTEGER NOT NULL REFERENCES jurisprudence(id) ON DELETE CASCADE,
+    loi VARCHAR(20) NOT NULL DEFAULT '',     -- CSR, HTA, VTL, CPP, POA, CCR, CHARTE ('' = inconnue)
+    article VARCHAR(30) NOT NULL,            -- sans paragraphe: 128(1) -> 128
+    article_base VARCHAR(30) NOT NULL,       -- partie entiere: 329.2 -> 329
+    champ VARCHAR(30),                       -- titre | resume | mots_cles | lois_pertinentes | article_csr
+    PRIMARY KEY (jurisprudence_id, loi, article)
+);
+
+CREATE INDEX IF NOT EXISTS idx_jur_articles_article ON jurisprudence_articles(article, loi);
+CREATE INDEX IF NOT EXISTS idx_jur_articles_base ON jurisprudence_articles(article_base, loi);
+
+-- ── Suivi de l'indexation ──
+-- NULL = a (re)indexer. Remis a NULL par classifier.py quand la Phase 4 change article_csr.
+ALTER TABLE jurisprudence ADD COLUMN IF NOT EXISTS article_csr VARCHAR(50);
+ALTER TABLE jurisprudence ADD COLUMN IF NOT EXISTS articles_indexes_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_jur_articles_a_indexer ON jurisprudence(id) WHERE articles_indexes_at IS NULL;
@@ -0,0 +1,14 @@
+-- ══════════════════════════════════════════════════════════════
+--  MIGRATION: Index sur qc_constats_infraction(id) (compaction raw_data)
+--  Date: 2026-10-19
+--  Usage: docker exec seo-agent-postgres psql -U ticketdb_user -d tickets_qc_on -f /tmp/migrate_constats_id_index.sql
+--  Apres db/migrate_constats_partitions.sql
+-- ══════════════════════════════════════════════════════════════
+
+-- Table partitionnee: plus de cle primaire, donc plus d'index sur id. archive_raw_data.py
+-- lit les lignes a compacter ORDER BY id et les met a jour par lots (WHERE id = ANY):
+-- sans index, chaque lot relit toutes les partitions. Declare sur le parent: cree sur
+-- chaque partition et recopie par partition_load (utils/db.py) sur les annees rechargees.
+CREATE INDEX IF NOT EXISTS idx_qc_constats_id ON qc_constats_infraction(id);
+
+ANALYZE qc_constats_infraction;
@@ -0,0 +1,113 @@
+-- ══════════════════════════════════════════════════════════════
+--  MIGRATION: qc_constats_infraction partitionnee par annee (LIST annee_donnees)
+--  Date: 2026-10-19
+--  Usage: docker exec seo-agent-postgres psql -U ticketdb_user -d tickets_qc_on -f /tmp/migrate_constats_partitions.sql
+-- ══════════════════════════════════════════════════════════════
+
+-- Une partition par annee de donnees (qc_constats_infraction_p<annee>) + une partition
+-- DEFAULT (annee inconnue ou sans partition). Les requetes filtrees par annee ne lisent
+-- que leur partition (pruning); les imports remplacent une annee entiere par bascule
+-- DETACH/ATTACH (utils/db.py: partition_load) au lieu de DELETE + INSERT ligne par ligne.
+-- Plus de PRIMARY KEY globale: une cle unique d'une table partitionnee doit contenir la
+-- cle de partition (nullable ici). id reste unique: meme sequence pour toutes les partitions.
+-- Conversion en une transaction (table deja partitionnee: arret, rien n'est modifie).
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'qc_constats_infraction'::regclass) = 'p' THEN
+        RAISE EXCEPTION 'qc_constats_infraction est deja partitionnee';
+    END IF;
+END $$;
+
+-- ── Ancienne table (heap) mise de cote ──
+ALTER TABLE qc_constats_infraction RENAME TO qc_constats_infraction_heap;
+DROP INDEX idx_qc_constats_date, idx_qc_constats_article, idx_qc_constats_region,
+           idx_qc_constats_annee, idx_qc_constats_vitesse, idx_qc_constats_tsv;
+
+-- ── Table partitionnee ──
+CREATE TABLE qc_constats_infraction (
+    id INTEGER NOT NULL DEFAULT nextval('qc_constats_infraction_id_seq'),
+    annee_donnees INTEGER,
+    date_infraction DATE,
+    heure_infraction TIME,
+    region VARCHAR(100),
+    lieu_infraction TEXT,
+    type_intervention VARCHAR(100),
+    loi VARCHAR(200),
+    reglement VARCHAR(200),
+    article VARCHAR(50),
+    description_infraction TEXT,
+    vitesse_permise INTEGER,
+    vitesse_constatee INTEGER,
+    montant_amende NUMERIC(10,2),
+    points_inaptitude INTEGER,
+    categorie_vehicule VARCHAR(100),
+    raw_data JSONB,
+    source_resource_id VARCHAR(100),
+    imported_at TIMESTAMP DEFAULT NOW(),
+    tsv tsvector GENERATED ALWAYS AS (
+        to_tsvector('french', COALESCE(description_infraction,'') || ' ' || COALESCE(lieu_infraction,'') || ' ' || COALESCE(region,''))
+    ) STORED
+) PARTITION BY LIST (annee_donnees);
+
+CREATE TABLE qc_constats_infraction_defaut PARTITION OF qc_constats_infraction DEFAULT;
+
+DO $$
+DECLARE
+    a INTEGER;
+BEGIN
+    FOR a IN SELECT DISTINCT annee_donnees FROM qc_constats_infraction_heap
+             WHERE annee_donnees IS NOT NULL ORDER BY 1 LOOP
+        EXECUTE format('CREATE TABLE qc_constats_infraction_p%s PARTITION OF qc_constats_infraction '
+                       'FOR VALUES IN (%s)', a, a);
+        EXECUTE format('ALTER TABLE qc_constats_infraction_p%s ADD CONSTRAINT qc_constats_infraction_p%s_cle '
+                       'CHECK (annee_donnees IS NOT NULL AND annee_donnees = %s)', a, a, a);
+    END LOOP;
+END $$;
+
+INSERT INTO qc_constats_infraction
+    (id, annee_donnees, date_infraction, heure_infraction, region, lieu_infraction, type_intervention,
+     loi, reglement, article, description_infraction, vitesse_permise, vitesse_constatee,
+     montant_amende, points_inaptitude, categorie_vehicule, raw_data, source_resource_id, imported_at)
+SELECT id, annee_donnees, date_infraction, heure_infraction, region, lieu_infraction, type_intervention,
+       loi, reglement, article, description_infraction, vitesse_permise, vitesse_constatee,
+       montant_amende, points_inaptitude, categorie_vehicule, raw_data, source_resource_id, imported_at
+FROM qc_constats_infraction_heap;
+
+-- ── Index (crees sur chaque partition, et sur les futures) ──
+-- annee_donnees n'a plus d'index: c'est la cle de partition.
+-- (lieu_infraction, date_infraction): detecteurs par lieu / jour, ErreursAdmin meme lieu meme jour.
+CREATE INDEX idx_qc_constats_date ON qc_constats_infraction(date_infraction);
+CREATE INDEX idx_qc_constats_article ON qc_constats_infraction(article);
+CREATE INDEX idx_qc_constats_region ON qc_constats_infraction(region);
+CREATE INDEX idx_qc_constats_lieu_date ON qc_constats_infraction(lieu_infraction, date_infraction);
+CREATE INDEX idx_qc_constats_vitesse ON qc_constats_infraction(vitesse_permise, vitesse_constatee);
+CREATE INDEX idx_qc_constats_tsv ON qc_constats_infraction USING GIN(tsv);
+
+ALTER SEQUENCE qc_constats_infraction_id_seq OWNED BY qc_constats_infraction.id;
+
+-- Vue rattachee a la nouvelle table (elle suivait l'ancienne au renommage)
+CREATE OR REPLACE VIEW v_qc_infractions_complet AS
+SELECT
+    ci.date_infraction,
+    ci.region,
+    ci.description_infraction,
+    ci.article,
+    ci.vitesse_permise,
+    ci.vitesse_constatee,
+    (ci.vitesse_constatee - ci.vitesse_permise) AS exces_vitesse,
+    ci.montant_amende,
+    ci.points_inaptitude,
+    la.type_responsabilite,
+    la.amende_min,
+    la.amende_max
+FROM qc_constats_infraction ci
+LEFT JOIN lois_articles la ON la.article = ci.article AND la.province = 'QC';
+
+DROP TABLE qc_constats_infraction_heap;
+
+COMMIT;
+
+ANALYZE qc_constats_infraction;
@@ -0,0 +1,71 @@
+-- ══════════════════════════════════════════════════════════════
+--  MIGRATION: Agregats quotidiens des constats (lieu x jour, lieu x jour x article, lieu x jour semaine x heure)
+--  Date: 2026-10-19
+--  Usage: docker exec seo-agent-postgres psql -U ticketdb_user -d tickets_qc_on -f /tmp/migrate_constats_rollups.sql
+-- ══════════════════════════════════════════════════════════════
+
+-- Les detecteurs blitz_daily / pattern_jour_semaine, ErreursAdmin (meme lieu, meme jour)
+-- et /api/day-patterns lisent ces agregats au lieu de recompter qc_constats_infraction.
+-- Tenus a jour par annee de donnees apres chaque import (tickets-db/utils/rollups.py:
+-- refresh_constats_rollups). Lieu inconnu -> '', heure inconnue -> NULL, constats sans date exclus.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS qc_constats_jour (
+    annee_donnees INTEGER,
+    lieu_infraction TEXT NOT NULL,
+    date_infraction DATE NOT NULL,
+    nb INTEGER NOT NULL,
+    nb_agents INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS qc_constats_jour_article (
+    annee_donnees INTEGER,
+    lieu_infraction TEXT NOT NULL,
+    date_infraction DATE NOT NULL,
+    article VARCHAR(50) NOT NULL,
+    nb INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS qc_constats_semaine_heure (
+    annee_donnees INTEGER,
+    lieu_infraction TEXT NOT NULL,
+    jour_semaine SMALLINT NOT NULL,     -- 0 = dimanche (EXTRACT DOW)
+    heure SMALLINT,                     -- NULL: heure inconnue
+    nb INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_qc_constats_jour_lieu ON qc_constats_jour(lieu_infraction, date_infraction);
+CREATE INDEX IF NOT EXISTS idx_qc_constats_jour_annee ON qc_constats_jour(annee_donnees);
+CREATE INDEX IF NOT EXISTS idx_qc_constats_jour_article_lieu ON qc_constats_jour_article(lieu_infraction, article);
+CREATE INDEX IF NOT EXISTS idx_qc_constats_jour_article_annee ON qc_constats_jour_article(annee_donnees);
+CREATE INDEX IF NOT EXISTS idx_qc_constats_semaine_heure_annee ON qc_constats_semaine_heure(annee_donnees);
+
+-- ── Remplissage initial (memes requetes que refresh_constats_rollups) ──
+TRUNCATE qc_constats_jour, qc_constats_jour_article, qc_constats_semaine_heure;
+
+INSERT INTO qc_constats_jour (annee_donnees, lieu_infraction, date_infraction, nb, nb_agents)
+SELECT annee_donnees, COALESCE(lieu_infraction, ''), date_infraction, COUNT(*),
+       COUNT(DISTINCT raw_data->>'IDENT_INTRT')
+FROM qc_constats_infraction
+WHERE date_infraction IS NOT NULL
+GROUP BY 1, 2, 3;
+
+INSERT INTO qc_constats_jour_article (annee_donnees, lieu_infraction, date_infraction, article, nb)
+SELECT annee_donnees, COALESCE(lieu_infraction, ''), date_infraction, COALESCE(article, ''), COUNT(*)
+FROM qc_constats_infraction
+WHERE date_infraction IS NOT NULL
+GROUP BY 1, 2, 3, 4;
+
+INSERT INTO qc_constats_semaine_heure (annee_donnees, lieu_infraction, jour_semaine, heure, nb)
+SELECT annee_donnees, COALESCE(lieu_infraction, ''), EXTRACT(DOW FROM date_infraction)::smallint,
+       EXTRACT(HOUR FROM heure_infraction)::smallint, COUNT(*)
+FROM qc_constats_infraction
+WHERE date_infraction IS NOT NULL
+GROUP BY 1, 2, 3, 4;
+
+COMMIT;
+
+ANALYZE qc_constats_jour;
+ANALYZE qc_constats_jour_article;
+ANALYZE qc_constats_semaine_heure;
@@ -0,0 +1,15 @@
+-- ══════════════════════════════════════════════════════════════
+--  MIGRATION: Empreintes des resources importes (imports conditionnels)
+--  Date: 2026-10-19
+--  Usage: docker exec seo-agent-postgres psql -U ticketdb_user -d tickets_qc_on -f /tmp/migrate_import_fingerprints.sql
+-- ══════════════════════════════════════════════════════════════
+
+-- ── data_source_log.fingerprint ──
+-- {"resource_id"|"url", "last_modified", "size", "rows", "etag", "hash"} du resource au
+-- moment de l'import. Avant de retelecharger, les importeurs comparent avec la derniere
+-- empreinte 'success'/'unchanged' de la meme source: inchange -> ligne 'unchanged' et rien
+-- d'autre; resource en ajout seul qui a grossi -> import a partir de l'ancien nombre de lignes;
+-- sinon rechargement complet du resource (remplacement dans la meme transaction).
+ALTER TABLE data_source_log ADD COLUMN IF NOT EXISTS fingerprint JSONB;
+
+CREATE INDEX IF NOT EXISTS idx_dsl_source_completed ON data_source_log(source_name, completed_at DESC);
@@ -0,0 +1,21 @@
+-- ══════════════════════════════════════════════════════════════
+--  MIGRATION: Quarantaine des lignes refusees a l'import (tickets-db)
+--  Date: 2026-10-19
+--  Usage: docker exec seo-agent-postgres psql -U ticketdb_user -d tickets_qc_on -f /tmp/migrate_import_quarantaine.sql
+-- ══════════════════════════════════════════════════════════════
+
+-- ── Table: import_quarantaine ──
+-- tickets-db/utils/db.py staged_load() charge les lignes par COPY dans une table de
+-- staging; un bloc refuse est repris ligne par ligne et chaque ligne invalide
+-- (type, longueur, caractere NUL...) atterrit ici avec le message PostgreSQL,
+-- au lieu d'etre perdue. Le compte est aussi note dans data_source_log.metadata.
+CREATE TABLE IF NOT EXISTS import_quarantaine (
+    id SERIAL PRIMARY KEY,
+    table_cible VARCHAR(100) NOT NULL,
+    source_name VARCHAR(100),
+    ligne JSONB,
+    erreur TEXT,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_quarantaine_table ON import_quarantaine(table_cible, created_at);
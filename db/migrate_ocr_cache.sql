@@ -0,0 +1,25 @@
+-- ══════════════════════════════════════════════════════════════
+--  MIGRATION: Cache des resultats OCR par photo de constat
+--  Date: 2026-10-19
+--  Usage: docker exec seo-agent-postgres psql -U ticketdb_user -d tickets_qc_on -f /tmp/migrate_ocr_cache.sql
+-- ══════════════════════════════════════════════════════════════
+
+-- ── Table: ocr_cache ──
+-- Une ligne par photo OCRisee (derive "ocr" de agents/images.py).
+-- AgentOCR.extraire_ticket cherche d'abord sha256 (meme fichier: scan chatbot -> analyse),
+-- puis, parmi les photos du meme client, le dHash le plus proche (distance de Hamming
+-- <= OCR_CACHE_DISTANCE, meme cadrage) avant de lancer Mindee -> OCR.space -> Qwen-VL.
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    id SERIAL PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL UNIQUE,     -- octets du derive
+    phash CHAR(64) NOT NULL,             -- dHash 16x16 = 256 bits, hexa
+    ratio REAL NOT NULL,                 -- largeur / hauteur
+    portee VARCHAR(80),                  -- user:<id> | ip:<addr> — correspondance perceptuelle limitee au client
+    moteur VARCHAR(20),                  -- mindee_v2 | ocr_space | qwen_vl
+    resultat JSONB NOT NULL,
+    hits INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    last_hit_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_portee ON ocr_cache(portee, ratio);
@@ -0,0 +1,18 @@
+-- ══════════════════════════════════════════════════════════════
+--  MIGRATION: Cache des analyses vision des photos de preuve
+--  Date: 2026-10-19
+--  Usage: docker exec seo-agent-postgres psql -U ticketdb_user -d tickets_qc_on -f /tmp/migrate_photo_cache.sql
+-- ══════════════════════════════════════════════════════════════
+
+-- ── Table: photo_analyses_cache ──
+-- Une ligne par (photo, contexte). AgentPhotoAnalyse reutilise l'analyse Qwen-VL quand un
+-- client resoumet la meme preuve pour le meme ticket.
+CREATE TABLE IF NOT EXISTS photo_analyses_cache (
+    sha256 CHAR(64) NOT NULL,            -- octets du derive "vision" (agents/images.py)
+    contexte CHAR(16) NOT NULL,          -- sha1(version prompt | infraction | juridiction | lieu | type photo)
+    resultat JSONB NOT NULL,
+    hits INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    last_hit_at TIMESTAMP,
+    PRIMARY KEY (sha256, contexte)
+);
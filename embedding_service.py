@@ -6,10 +6,13 @@ Stocke dans PostgreSQL pgvector — zero PyTorch, zero RAM locale
 
 import os
 import time
+import numpy as np
 import psycopg2
 import psycopg2.extras
 from openai import OpenAI
 
+from pgvector_adapter import as_vector, bind_query_vector, register_vector, update_vectors
+
 # --- Config ---
 FIREWORKS_API_KEY = os.getenv("FIREWORKS_API_KEY", "fw_CVMaHgWPEZyTLgFFHj3E3a")
 EMBEDDING_MODEL = "fireworks/qwen3-embedding-8b"  # 4096 dims, bilingue FR/EN
@@ -33,8 +36,8 @@ class EmbeddingService:
             base_url="https://api.fireworks.ai/inference/v1"
         )
 
-    def embed_texts(self, texts: list[str]) -> list[list[float]]:
-        """Embed une liste de textes via Fireworks API. Retourne les vecteurs."""
+    def embed_texts(self, texts: list[str]) -> list[np.ndarray]:
+        """Embed une liste de textes via Fireworks API. Retourne les vecteurs (float32)."""
         if not texts:
             return []
 
@@ -43,16 +46,19 @@ class EmbeddingService:
 
         resp = self.client.embeddings.create(
             model=EMBEDDING_MODEL,
-            input=cleaned
+            input=cleaned,
+            encoding_format="base64"
         )
-        return [d.embedding for d in resp.data]
+        return [as_vector(d.embedding) for d in resp.data]
 
-    def embed_single(self, text: str) -> list[float]:
+    def embed_single(self, text: str) -> np.ndarray:
         """Embed un seul texte."""
         return self.embed_texts([text])[0]
 
     def get_db(self):
-        return psycopg2.connect(**DB_CONFIG)
+        conn = psycopg2.connect(**DB_CONFIG)
+        register_vector(conn)
+        return conn
 
     def build_embed_text(self, row: dict) -> str:
         """Construit le texte optimal a embedder pour un dossier jurisprudence."""
@@ -126,19 +132,15 @@ class EmbeddingService:
             try:
                 resp = self.client.embeddings.create(
                     model=EMBEDDING_MODEL,
-                    input=texts
+                    input=texts,
+                    encoding_format="base64"
                 )
-                embeddings = [d.embedding for d in resp.data]
+                embeddings = [as_vector(d.embedding) for d in resp.data]
                 total_tokens += resp.usage.prompt_tokens
 
-                # Bulk update PostgreSQL
+                # Bulk update PostgreSQL — COPY binaire + un seul UPDATE par batch
                 update_cur = conn.cursor()
-                for doc_id, emb in zip(ids, embeddings):
-                    vec_str = "[" + ",".join(str(x) for x in emb) + "]"
-                    update_cur.execute(
-                        "UPDATE jurisprudence SET embedding = %s::vector WHERE id = %s",
-                        (vec_str, doc_id)
-                    )
+                update_vectors(update_cur, "jurisprudence", "embedding", ids, embeddings)
                 conn.commit()
                 update_cur.close()
 
@@ -163,13 +165,13 @@ class EmbeddingService:
     def search(self, query: str, top_k: int = 50, juridiction: str = None) -> list[dict]:
         """Recherche semantique pgvector — cosine similarity."""
         query_emb = self.embed_single(query)
-        vec_str = "[" + ",".join(str(x) for x in query_emb) + "]"
 
         conn = self.get_db()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        vec = bind_query_vector(cur, query_emb)
 
         prov_filter = ""
-        params = {"vec": vec_str, "limit": top_k}
+        params = {"limit": top_k}
         if juridiction:
             prov_filter = "AND province = %(prov)s"
             params["prov"] = juridiction
@@ -177,10 +179,10 @@ class EmbeddingService:
         cur.execute(f"""
             SELECT id, titre, citation, tribunal, resume, resultat,
                    province, date_decision,
-                   1 - (embedding <=> %(vec)s::vector) AS similarity
+                   1 - (embedding <=> {vec}) AS similarity
             FROM jurisprudence
             WHERE embedding IS NOT NULL {prov_filter}
-            ORDER BY embedding <=> %(vec)s::vector
+            ORDER BY embedding <=> {vec}
             LIMIT %(limit)s
         """, params)
 
@@ -195,27 +197,26 @@ class EmbeddingService:
         Combine les deux scores avec ponderation.
         """
         query_emb = self.embed_single(query)
-        vec_str = "[" + ",".join(str(x) for x in query_emb) + "]"
 
         conn = self.get_db()
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        vec = bind_query_vector(cur, query_emb)
 
         jur_filter = ""
-        params = []
         if juridiction:
             jur_filter = "AND province = %(jur)s"
-            params_dict = {"query": query, "vec": vec_str, "jur": juridiction, "limit": top_k}
+            params_dict = {"query": query, "jur": juridiction, "limit": top_k}
         else:
-            params_dict = {"query": query, "vec": vec_str, "limit": top_k}
+            params_dict = {"query": query, "limit": top_k}
 
         # Score hybride: 0.4 * keyword + 0.6 * semantic
         cur.execute(f"""
             WITH semantic AS (
                 SELECT id,
-                       1 - (embedding <=> %(vec)s::vector) AS sem_score
+                       1 - (embedding <=> {vec}) AS sem_score
                 FROM jurisprudence
                 WHERE embedding IS NOT NULL {jur_filter}
-                ORDER BY embedding <=> %(vec)s::vector
+                ORDER BY embedding <=> {vec}
                 LIMIT 200
             ),
             keyword AS (
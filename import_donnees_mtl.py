@@ -3,15 +3,17 @@
 Import — Donnees ouvertes Montreal
 Sources: collisions routieres SPVM, escouade mobilite
 API: CKAN Datastore (donnees.montreal.ca)
-Usage: python3 import_donnees_mtl.py [--dry-run] [--source collisions|escouade|all]
+Usage: python3 import_donnees_mtl.py [--dry-run] [--source collisions|escouade|all] [--csv]
+  --csv: collisions lues en flux depuis le CSV complet du resource et chargees par COPY
+         (staged_load de tickets-db) au lieu des pages JSON du DataStore
+Import DataStore interrompu: le lancement suivant reprend a la derniere page committee
+(point de reprise logs/ckan_reprise.json, utils/fetcher.Reprise) au lieu de tout recharger
 """
 
 import os
 import sys
 import json
-import time
 import argparse
-import requests
 import psycopg2
 import psycopg2.extras
 from datetime import datetime
@@ -19,6 +21,12 @@ from datetime import datetime
 # ═══════════════════════════════════════════════════════════
 # CONFIG
 # ═══════════════════════════════════════════════════════════
+# Fetcher CKAN partage avec tickets-db (session, pages paralleles, points de reprise)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tickets-db"))
+from utils.fetcher import ckan_datastore_pages, ckan_resource_show, ckan_dump_url, csv_records, Reprise
+from utils.db import staged_load
+from utils.mapping import compile_mapping
+
 try:
     from dotenv import load_dotenv
     load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
@@ -47,75 +55,55 @@ os.makedirs(LOGDIR, exist_ok=True)
 # HELPERS
 # ═══════════════════════════════════════════════════════════
 
-def fetch_mtl_datastore(resource_id, batch=32000):
-    """Fetch tous les records d'un resource CKAN Montreal"""
-    all_records = []
-    offset = 0
-    while True:
-        try:
-            r = requests.get(f"{MTL_API}/datastore_search", params={
-                "resource_id": resource_id, "limit": batch, "offset": offset
-            }, timeout=120)
-            if r.status_code != 200:
-                print(f"    [ERR] HTTP {r.status_code}")
-                break
-            result = r.json().get("result", {})
-            records = result.get("records", [])
-            total = result.get("total", 0)
-            all_records.extend(records)
-            print(f"    Fetch {len(all_records)}/{total}")
-            if len(records) < batch:
-                break
-            offset += batch
-            time.sleep(0.5)
-        except Exception as e:
-            print(f"    [ERR] {e}")
-            break
-    return all_records
-
-
-def safe_int(val, default=None):
-    if val is None or val == '' or val == 'null':
-        return default
-    try:
-        return int(float(str(val).strip()))
-    except (ValueError, TypeError):
-        return default
+def iter_mtl_datastore(resource_id, batch=32000, debut=0):
+    """(offset, records) par page d'un resource CKAN datastore, en flux: pages suivantes
+    telechargees en parallele (session keep-alive, politesse par hote) pendant que
+    l'appelant insere la courante. Erreurs HTTP relevees apres MAX_RETRIES essais."""
+    return ckan_datastore_pages(MTL_API, resource_id, limit=batch, debut=debut)
 
 
-def safe_float(val, default=None):
-    if val is None or val == '' or val == 'null':
-        return default
+def inserer_page(conn, sql, rows):
+    """INSERT d'une page en une requete (sql: ... VALUES %s), commit par page.
+    Page refusee: reprise ligne par ligne, les lignes invalides sont ecartees.
+    -> nombre de lignes inserees"""
+    if not rows:
+        return 0
     try:
-        return float(str(val).strip().replace(',', '.'))
-    except (ValueError, TypeError):
-        return default
-
-
-def safe_date(val):
-    if not val or val == 'null':
-        return None
-    for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%d/%m/%Y'):
-        try:
-            return datetime.strptime(str(val).strip()[:10], fmt).date()
-        except ValueError:
-            continue
-    return None
+        with conn.cursor() as cur:
+            inseres = psycopg2.extras.execute_values(cur, sql + " RETURNING 1", rows,
+                                                     page_size=len(rows), fetch=True)
+        conn.commit()
+        return len(inseres)
+    except Exception as e:
+        conn.rollback()
+        print(f"    [ERR] page refusee ({e}) — reprise ligne par ligne")
+    inserted = 0
+    with conn.cursor() as cur:
+        for row in rows:
+            try:
+                cur.execute("SAVEPOINT ligne")
+                psycopg2.extras.execute_values(cur, sql, [row])
+                inserted += cur.rowcount
+                cur.execute("RELEASE SAVEPOINT ligne")
+            except Exception:
+                cur.execute("ROLLBACK TO SAVEPOINT ligne")
+    conn.commit()
+    return inserted
 
 
-def safe_time(val):
-    if not val or val == 'null':
-        return None
-    try:
-        v = str(val).strip()
-        if ':' in v:
-            parts = v.split(':')
-            return f"{int(parts[0]):02d}:{int(parts[1]):02d}:00"
-        elif len(v) == 4 and v.isdigit():
-            return f"{v[:2]}:{v[2:]}:00"
-    except Exception:
-        pass
-    return None
+def sans_deja_inseres(conn, table, records):
+    """Records d'une page moins ceux deja en base, reconnus par l'_id CKAN garde dans
+    raw_data. Premiere page d'une reprise: committee avant l'arret, mais le point de
+    reprise n'avait pas encore ete note."""
+    ids = [str(r['_id']) for r in records if r.get('_id') is not None]
+    if not ids:
+        return records
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT raw_data->>'_id' FROM {table} WHERE raw_data->>'_id' = ANY(%s)", (ids,))
+        presents = {r[0] for r in cur.fetchall()}
+    if presents:
+        print(f"    {len(presents)} records deja inseres avant l'arret — ignores")
+    return [r for r in records if str(r.get('_id')) not in presents]
 
 
 def log_import(conn, source_name, module, fetched, inserted, status, error=None):
@@ -136,7 +124,56 @@ def log_import(conn, source_name, module, fetched, inserted, status, error=None)
 # 1. COLLISIONS ROUTIERES MONTREAL
 # ═══════════════════════════════════════════════════════════
 
-def import_collisions_mtl(conn, dry_run=False):
+# Correspondances DataStore / CSV -> colonnes (utils/mapping.py)
+COLLISIONS_MAPPING = compile_mapping({
+    'columns': [
+        ('no_collision', 'NO_SEQ_COLL', 'raw', ''),
+        ('date_collision', 'DT_ACCDN', 'date'),
+        ('heure_collision', 'HEURE_ACCDN', 'time'),
+        ('rue1', 'RUE_ACCDN', 'raw', ''),
+        ('rue2', 'ACCDN_PRES_DE', 'raw', ''),
+        ('latitude', 'LOC_LAT', 'float'),
+        ('longitude', 'LOC_LONG', 'float'),
+        ('gravite', 'GRAVITE', 'raw', ''),
+        ('nombre_deces', 'NB_MORTS', 'int', 0),
+        ('nombre_blesses_graves', 'NB_BLESSES_GRAVES', 'int', 0),
+        ('nombre_blesses_legers', 'NB_BLESSES_LEGERS', 'int', 0),
+        ('type_collision', 'CD_GENRE_ACCDN', 'raw', ''),
+        ('conditions_meteo', 'CD_COND_METEO', 'raw', ''),
+        ('etat_surface', 'CD_ETAT_SURFC', 'raw', ''),
+        ('eclairage', 'CD_ECLRM', 'raw', ''),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+ESCOUADE_MAPPING = compile_mapping({
+    'columns': [
+        ('date_intervention', 'DATE', 'date'),
+        ('type_intervention', ('NATURE INTERVENTION', 'NATURE_INTERVENTION'), 'raw', ''),
+        ('lieu', 'ADRESSE', 'raw', ''),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+
+def import_collisions_mtl_csv(dry_run=False):
+    """Collisions depuis le CSV complet du resource: lecture en flux -> COPY (staged_load).
+    Remplacement de la table dans la meme transaction que le chargement."""
+    url = ckan_dump_url(MTL_API, ckan_resource_show(MTL_API, MTL_COLLISIONS_RID))
+    print(f"  CSV: {url}")
+    records = csv_records(url)
+    if dry_run:
+        fetched = sum(1 for _ in records)
+        print(f"  {fetched} records lus")
+        return fetched, 0
+    charge = staged_load('mtl_collisions', COLLISIONS_MAPPING.columns, COLLISIONS_MAPPING.rows(records),
+                         conflict_column='no_collision', source_name='collisions-mtl',
+                         replace=('TRUE', ()))
+    print(f"  {charge['total']} records lus, {charge['replaced']} remplaces, {charge['rejected']} rejetes")
+    return charge['total'], charge['inserted']
+
+
+def import_collisions_mtl(conn, dry_run=False, csv_dump=False):
     """Import collisions routieres depuis donnees.montreal.ca"""
     print("\n" + "=" * 60)
     print("  COLLISIONS ROUTIERES — Montreal (SPVM/SAAQ)")
@@ -147,63 +184,62 @@ def import_collisions_mtl(conn, dry_run=False):
     existing = cur.fetchone()[0]
     print(f"  Deja en DB: {existing}")
 
-    records = fetch_mtl_datastore(MTL_COLLISIONS_RID)
-    print(f"  {len(records)} records telecharges")
-
-    if dry_run or not records:
-        return len(records)
-
-    # Truncate et reimporter (dataset complet qui se met a jour)
-    if existing > 0:
-        cur.execute("TRUNCATE TABLE mtl_collisions")
-        conn.commit()
-        print("  Table truncated (reimport complet)")
-
-    inserted = 0
-    for rec in records:
+    if csv_dump:
         try:
-            no_coll = rec.get('NO_SEQ_COLL', '')
-            cur.execute("""
-                INSERT INTO mtl_collisions
-                    (no_collision, date_collision, heure_collision,
-                     rue1, rue2, latitude, longitude,
-                     gravite, nombre_deces, nombre_blesses_graves,
-                     nombre_blesses_legers, type_collision,
-                     conditions_meteo, etat_surface, eclairage,
-                     raw_data)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (no_collision) DO NOTHING
-            """, (
-                no_coll,
-                safe_date(rec.get('DT_ACCDN')),
-                safe_time(rec.get('HEURE_ACCDN')),
-                rec.get('RUE_ACCDN', ''),
-                rec.get('ACCDN_PRES_DE', ''),
-                safe_float(rec.get('LOC_LAT')),
-                safe_float(rec.get('LOC_LONG')),
-                rec.get('GRAVITE', ''),
-                safe_int(rec.get('NB_MORTS', 0), 0),
-                safe_int(rec.get('NB_BLESSES_GRAVES', 0), 0),
-                safe_int(rec.get('NB_BLESSES_LEGERS', 0), 0),
-                rec.get('CD_GENRE_ACCDN', ''),
-                rec.get('CD_COND_METEO', ''),
-                rec.get('CD_ETAT_SURFC', ''),
-                rec.get('CD_ECLRM', ''),
-                json.dumps(rec, ensure_ascii=False, default=str),
-            ))
-            inserted += 1
-            if inserted % 10000 == 0:
-                conn.commit()
-                print(f"    ... {inserted} inseres")
+            fetched, inserted = import_collisions_mtl_csv(dry_run)
         except Exception as e:
-            conn.rollback()
-            if inserted == 0:
-                print(f"    [ERR] {e}")
-            continue
+            print(f"    [ERR] {e}")
+            log_import(conn, "collisions-mtl", "import_donnees_mtl", 0, 0, "error", str(e))
+            return 0
+        if dry_run or not fetched:
+            return fetched
+        print(f"  +{inserted} inseres")
+        log_import(conn, "collisions-mtl", "import_donnees_mtl", fetched, inserted, "done")
+        return inserted
+
+    # Reimport interrompu: reprise a la premiere page non committee, sans truncate
+    reprise = Reprise()
+    debut = reprise.offset("collisions-mtl") if not dry_run else 0
+    if debut:
+        print(f"  Reprise a l'offset {debut}")
+        existing = 0
+
+    fetched = 0
+    inserted = 0
+    termine = False
+    try:
+        for offset, records in iter_mtl_datastore(MTL_COLLISIONS_RID, debut=debut):
+            fetched += len(records)
+            if dry_run:
+                continue
+            # Truncate et reimporter (dataset complet qui se met a jour), une fois la
+            # premiere page recue
+            if existing > 0:
+                cur.execute("TRUNCATE TABLE mtl_collisions")
+                conn.commit()
+                existing = 0
+                print("  Table truncated (reimport complet)")
+            if debut and offset == debut:
+                records = sans_deja_inseres(conn, 'mtl_collisions', records)
+            inserted += inserer_page(conn, f"""
+                INSERT INTO mtl_collisions ({', '.join(COLLISIONS_MAPPING.columns)})
+                VALUES %s
+                ON CONFLICT (no_collision) DO NOTHING
+            """, COLLISIONS_MAPPING.batch(records))
+            print(f"    ... {inserted} inseres")
+            reprise.noter("collisions-mtl", offset + len(records))
+        termine = True
+    except Exception as e:
+        print(f"    [ERR] {e} — le prochain lancement reprend a la derniere page committee")
+    if termine and not dry_run:
+        reprise.terminer("collisions-mtl")
+    print(f"  {fetched} records telecharges")
+
+    if dry_run or not fetched:
+        return fetched
 
-    conn.commit()
     print(f"  +{inserted} inseres")
-    log_import(conn, "collisions-mtl", "import_donnees_mtl", len(records), inserted, "done")
+    log_import(conn, "collisions-mtl", "import_donnees_mtl", fetched, inserted, "done")
     return inserted
 
 
@@ -222,44 +258,46 @@ def import_escouade(conn, dry_run=False):
     existing = cur.fetchone()[0]
     print(f"  Deja en DB: {existing}")
 
-    records = fetch_mtl_datastore(MTL_ESCOUADE_RID)
-    print(f"  {len(records)} records telecharges")
-
-    if dry_run or not records:
-        return len(records)
-
-    # Truncate et reimporter
-    if existing > 0:
-        cur.execute("TRUNCATE TABLE mtl_escouade_mobilite")
-        conn.commit()
-        print("  Table truncated (reimport complet)")
+    # Reimport interrompu: reprise a la premiere page non committee, sans truncate
+    reprise = Reprise()
+    debut = reprise.offset("escouade-mobilite-mtl") if not dry_run else 0
+    if debut:
+        print(f"  Reprise a l'offset {debut}")
+        existing = 0
 
+    fetched = 0
     inserted = 0
-    for rec in records:
-        try:
-            cur.execute("""
-                INSERT INTO mtl_escouade_mobilite
-                    (date_intervention, type_intervention, lieu, raw_data)
-                VALUES (%s, %s, %s, %s)
-            """, (
-                safe_date(rec.get('DATE')),
-                rec.get('NATURE INTERVENTION', rec.get('NATURE_INTERVENTION', '')),
-                rec.get('ADRESSE', ''),
-                json.dumps(rec, ensure_ascii=False, default=str),
-            ))
-            inserted += 1
-            if inserted % 5000 == 0:
+    termine = False
+    try:
+        for offset, records in iter_mtl_datastore(MTL_ESCOUADE_RID, debut=debut):
+            fetched += len(records)
+            if dry_run:
+                continue
+            # Truncate et reimporter, une fois la premiere page recue
+            if existing > 0:
+                cur.execute("TRUNCATE TABLE mtl_escouade_mobilite")
                 conn.commit()
-                print(f"    ... {inserted} inseres")
-        except Exception as e:
-            conn.rollback()
-            if inserted == 0:
-                print(f"    [ERR] {e}")
-            continue
+                existing = 0
+                print("  Table truncated (reimport complet)")
+            if debut and offset == debut:
+                records = sans_deja_inseres(conn, 'mtl_escouade_mobilite', records)
+            inserted += inserer_page(conn, f"""
+                INSERT INTO mtl_escouade_mobilite ({', '.join(ESCOUADE_MAPPING.columns)})
+                VALUES %s
+            """, ESCOUADE_MAPPING.batch(records))
+            reprise.noter("escouade-mobilite-mtl", offset + len(records))
+        termine = True
+    except Exception as e:
+        print(f"    [ERR] {e} — le prochain lancement reprend a la derniere page committee")
+    if termine and not dry_run:
+        reprise.terminer("escouade-mobilite-mtl")
+    print(f"  {fetched} records telecharges")
+
+    if dry_run or not fetched:
+        return fetched
 
-    conn.commit()
     print(f"  +{inserted} inseres")
-    log_import(conn, "escouade-mobilite-mtl", "import_donnees_mtl", len(records), inserted, "done")
+    log_import(conn, "escouade-mobilite-mtl", "import_donnees_mtl", fetched, inserted, "done")
     return inserted
 
 
@@ -272,6 +310,8 @@ def main():
     parser.add_argument("--dry-run", action="store_true")
     parser.add_argument("--source", type=str, default="all",
                         help="Source: collisions|escouade|all")
+    parser.add_argument("--csv", action="store_true",
+                        help="Collisions via le CSV complet + COPY (au lieu du DataStore)")
     args = parser.parse_args()
 
     print("=" * 60)
@@ -285,7 +325,7 @@ def main():
 
     try:
         if args.source in ('all', 'collisions'):
-            results['collisions_mtl'] = import_collisions_mtl(conn, args.dry_run)
+            results['collisions_mtl'] = import_collisions_mtl(conn, args.dry_run, args.csv)
 
         if args.source in ('all', 'escouade'):
             results['escouade_mobilite'] = import_escouade(conn, args.dry_run)
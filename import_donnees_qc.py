@@ -9,7 +9,6 @@ Usage: python3 import_donnees_qc.py [--dry-run] [--source constats|radars|lieux|
 import os
 import sys
 import json
-import time
 import argparse
 import requests
 import psycopg2
@@ -21,6 +20,14 @@ import csv
 # ═══════════════════════════════════════════════════════════
 # CONFIG
 # ═══════════════════════════════════════════════════════════
+# Fetcher CKAN partage avec tickets-db (session, pages paralleles, points de reprise, empreintes)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tickets-db"))
+from utils.fetcher import (ckan_datastore_pages, ckan_resource_show, ckan_fingerprint,
+                           import_plan, Reprise)
+from utils.db import partition_load, STATUTS_TERMINES
+from utils.rollups import refresh_constats_rollups
+from utils.mapping import compile_mapping
+
 try:
     from dotenv import load_dotenv
     load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
@@ -68,82 +75,108 @@ SAAQ_S3_BASE = "https://dq-prd-bucket1.s3.ca-central-1.amazonaws.com/saaq/Rappor
 # HELPERS
 # ═══════════════════════════════════════════════════════════
 
-def fetch_datastore(resource_id, batch=32000):
-    """Fetch tous les records d'un resource CKAN datastore"""
-    all_records = []
-    offset = 0
-    while True:
-        try:
-            r = requests.get(f"{QC_API}/datastore_search", params={
-                "resource_id": resource_id, "limit": batch, "offset": offset
-            }, timeout=120)
-            if r.status_code != 200:
-                print(f"    [ERR] HTTP {r.status_code} pour {resource_id}")
-                break
-            result = r.json().get("result", {})
-            records = result.get("records", [])
-            total = result.get("total", 0)
-            all_records.extend(records)
-            print(f"    Fetch {len(all_records)}/{total}")
-            if len(records) < batch:
-                break
-            offset += batch
-            time.sleep(0.5)  # politesse
-        except Exception as e:
-            print(f"    [ERR] {e}")
-            break
-    return all_records
+def iter_datastore(resource_id, batch=32000, debut=0):
+    """(offset, records) par page d'un resource CKAN datastore, en flux: pages suivantes
+    telechargees en parallele (session keep-alive, politesse par hote) pendant que
+    l'appelant insere la courante. Erreurs HTTP relevees apres MAX_RETRIES essais."""
+    return ckan_datastore_pages(QC_API, resource_id, limit=batch, debut=debut)
 
 
-def safe_int(val, default=None):
-    """Convertir en int safe"""
-    if val is None or val == '' or val == 'null':
-        return default
+def inserer_page(conn, sql, rows):
+    """INSERT d'une page en une requete (sql: ... VALUES %s), commit par page.
+    Page refusee: reprise ligne par ligne, les lignes invalides sont ecartees.
+    -> nombre de lignes inserees"""
+    if not rows:
+        return 0
     try:
-        return int(float(str(val).strip()))
-    except (ValueError, TypeError):
-        return default
+        with conn.cursor() as cur:
+            inseres = psycopg2.extras.execute_values(cur, sql + " RETURNING 1", rows,
+                                                     page_size=len(rows), fetch=True)
+        conn.commit()
+        return len(inseres)
+    except Exception as e:
+        conn.rollback()
+        print(f"    [ERR] page refusee ({e}) — reprise ligne par ligne")
+    inserted = 0
+    with conn.cursor() as cur:
+        for row in rows:
+            try:
+                cur.execute("SAVEPOINT ligne")
+                psycopg2.extras.execute_values(cur, sql, [row])
+                inserted += cur.rowcount
+                cur.execute("RELEASE SAVEPOINT ligne")
+            except Exception:
+                cur.execute("ROLLBACK TO SAVEPOINT ligne")
+    conn.commit()
+    return inserted
 
 
-def safe_float(val, default=None):
-    if val is None or val == '' or val == 'null':
-        return default
+def log_import(conn, source_name, source_url, module, fetched, inserted, updated, status, error=None,
+               fingerprint=None):
+    """Log dans data_source_log"""
     try:
-        return float(str(val).strip().replace(',', '.'))
-    except (ValueError, TypeError):
-        return default
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO data_source_log
+                (source_name, source_url, module_name, records_fetched, records_inserted,
+                 records_updated, completed_at, status, error_message, fingerprint)
+            VALUES (%s, %s, %s, %s, %s, %s, NOW(), %s, %s, %s)
+        """, (source_name, source_url, module, fetched, inserted, updated, status, error,
+              json.dumps(fingerprint) if fingerprint else None))
+        conn.commit()
+    except Exception:
+        conn.rollback()
 
 
-def safe_date(val):
-    if not val or val == 'null':
+def empreinte_resource(resource_id):
+    """Empreinte CKAN du resource (last_modified, size, hash, rows), None si indisponible"""
+    try:
+        return ckan_fingerprint(QC_API, ckan_resource_show(QC_API, resource_id))
+    except Exception as e:
+        print(f"    [!] Empreinte indisponible pour {resource_id}: {e}")
         return None
-    for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%d/%m/%Y', '%Y%m%d'):
-        try:
-            return datetime.strptime(str(val).strip()[:10], fmt).date()
-        except ValueError:
-            continue
-    return None
 
 
-def log_import(conn, source_name, source_url, module, fetched, inserted, updated, status, error=None):
-    """Log dans data_source_log"""
+def derniere_empreinte(conn, source_name):
+    """Empreinte du dernier import termine (ou constate inchange) de la source"""
     try:
         cur = conn.cursor()
         cur.execute("""
-            INSERT INTO data_source_log
-                (source_name, source_url, module_name, records_fetched, records_inserted,
-                 records_updated, completed_at, status, error_message)
-            VALUES (%s, %s, %s, %s, %s, %s, NOW(), %s, %s)
-        """, (source_name, source_url, module, fetched, inserted, updated, status, error))
-        conn.commit()
+            SELECT fingerprint FROM data_source_log
+            WHERE source_name = %s AND status = ANY(%s) AND fingerprint IS NOT NULL
+            ORDER BY completed_at DESC NULLS LAST LIMIT 1
+        """, (source_name, STATUTS_TERMINES))
+        row = cur.fetchone()
+        return row[0] if row else None
     except Exception:
         conn.rollback()
+        return None
 
 
 # ═══════════════════════════════════════════════════════════
 # 1. CONSTATS D'INFRACTION CRQ
 # ═══════════════════════════════════════════════════════════
 
+# Correspondance CSV CRQ -> qc_constats_infraction (utils/mapping.py)
+CONSTATS_MAPPING = compile_mapping({
+    'columns': [
+        ('annee_donnees', '$year', 'raw'),
+        ('date_infraction', 'DAT_INFRA_COMMI', 'date'),
+        ('region', 'COD_MUNI_LIEU', 'raw', ''),
+        ('lieu_infraction', 'COD_MUNI_LIEU', 'raw', ''),
+        ('type_intervention', 'TYP_DOCUM_INTRT', 'raw', ''),
+        ('loi', 'CODE_LOI_REGLEMENT', 'raw', ''),
+        ('article', 'NO_ARTCL_L_R', 'raw', ''),
+        ('description_infraction', 'DESCN_CAT_INFRA', 'raw', ''),
+        ('vitesse_permise', 'VITSS_PERMS', 'int'),
+        ('vitesse_constatee', 'VITSS_CNSTA', 'int'),
+        ('categorie_vehicule', 'DESC_TYP_VEH_INFRA', 'raw', ''),
+        ('source_resource_id', '$resource_id', 'raw'),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+
 def import_constats(conn, dry_run=False, years=None):
     """Import constats infraction depuis Donnees ouvertes QC"""
     print("\n" + "=" * 60)
@@ -164,70 +197,114 @@ def import_constats(conn, dry_run=False, years=None):
 
     total_inserted = 0
     total_fetched = 0
+    reprise = Reprise()
+    modifiees = []      # annees dont les agregats quotidiens sont a recalculer
 
     for year in years:
-        if year in existing_years:
-            print(f"\n  [{year}] Deja importe — skip")
-            continue
-
+        cle = f"constats-crq-{year}"
         resource_id = CONSTATS_RESOURCES.get(year)
         if not resource_id:
             continue
+        url = f"donneesquebec.ca/{resource_id}"
+        fp = empreinte_resource(resource_id)
+
+        # complet: l'annee entiere est chargee dans une partition neuve puis basculee
+        # (partition_load); sinon (reprise d'un ajout interrompu, dry-run): pages inserees
+        # a la suite dans la partition existante
+        complet = False
+        if reprise.en_cours(cle):
+            debut = reprise.offset(cle)
+            print(f"\n  [{year}] Reprise a l'offset {debut}...")
+        elif year in existing_years:
+            # Annee deja en base: comparer l'empreinte du resource a celle du dernier import
+            precedente = derniere_empreinte(conn, cle)
+            if fp is None or precedente is None:
+                # Import anterieur aux empreintes: considere a jour, empreinte enregistree
+                print(f"\n  [{year}] Deja importe — skip")
+                if fp and not dry_run:
+                    log_import(conn, cle, url, "import_donnees_qc", 0, 0, 0, "unchanged", fingerprint=fp)
+                continue
+            # Pas d'ajout seul: le fichier annuel est revise sur place (constats corriges ou
+            # retires), un nombre de lignes en hausse ne dit pas que le debut est inchange
+            action, debut = import_plan(precedente, fp)
+            if action == 'skip':
+                print(f"\n  [{year}] Inchange depuis le dernier import — skip")
+                if not dry_run:
+                    log_import(conn, cle, url, "import_donnees_qc", 0, 0, 0, "unchanged", fingerprint=fp)
+                continue
+            print(f"\n  [{year}] Resource modifie — rechargement de la partition {year}...")
+            complet = True
+        else:
+            debut = 0
+            complet = True
+            print(f"\n  [{year}] Telechargement -> nouvelle partition {year}...")
+
+        fetched = 0
+        inserted = 0
+        try:
+            if complet and not dry_run:
+                # Aucun point de reprise: en cas d'erreur la bascule n'a pas lieu et
+                # l'annee en base reste intacte
+                compte = [0]
+
+                def lignes(compte=compte):
+                    for offset, records in iter_datastore(resource_id):
+                        compte[0] += len(records)
+                        print(f"    Fetch {offset + len(records)}")
+                        yield from CONSTATS_MAPPING.batch(records, year=year, resource_id=resource_id)
+
+                charge = partition_load('qc_constats_infraction', 'annee_donnees', year,
+                                        CONSTATS_MAPPING.columns, lignes(), source_name=cle)
+                fetched, inserted = compte[0], charge['inserted']
+                if charge['replaced'] or charge['rejected']:
+                    print(f"    {charge['replaced']} lignes {year} remplacees, {charge['rejected']} en quarantaine")
+            else:
+                for offset, records in iter_datastore(resource_id, debut=debut):
+                    fetched += len(records)
+                    print(f"    Fetch {offset + len(records)}")
+                    if dry_run:
+                        continue
+                    inserted += inserer_page(conn, f"""
+                        INSERT INTO qc_constats_infraction ({', '.join(CONSTATS_MAPPING.columns)})
+                        VALUES %s
+                    """, CONSTATS_MAPPING.batch(records, year=year, resource_id=resource_id))
+                    reprise.noter(cle, offset + len(records))
+        except Exception as e:
+            if complet:
+                print(f"  [{year}] [ERR] {e} — partition {year} inchangee")
+                continue
+            # Point de reprise conserve: le prochain lancement repart de la derniere page committee
+            print(f"  [{year}] [ERR] {e} — +{inserted} inseres avant l'erreur")
+            total_fetched += fetched
+            total_inserted += inserted
+            if inserted:
+                modifiees.append(year)
+            continue
+        total_fetched += fetched
+        if not dry_run and not complet:
+            reprise.terminer(cle)
 
-        print(f"\n  [{year}] Telechargement...")
-        records = fetch_datastore(resource_id)
-        total_fetched += len(records)
-
-        if not records:
+        if not fetched:
             print(f"  [{year}] Aucun record")
             continue
 
-        print(f"  [{year}] {len(records)} records — insertion...")
-
         if dry_run:
-            total_inserted += len(records)
+            total_inserted += fetched
             continue
 
-        inserted = 0
-        for rec in records:
-            try:
-                cur.execute("""
-                    INSERT INTO qc_constats_infraction
-                        (annee_donnees, date_infraction, region, lieu_infraction,
-                         type_intervention, loi, article, description_infraction,
-                         vitesse_permise, vitesse_constatee, categorie_vehicule,
-                         raw_data, source_resource_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    year,
-                    safe_date(rec.get('DAT_INFRA_COMMI')),
-                    rec.get('COD_MUNI_LIEU', ''),
-                    rec.get('COD_MUNI_LIEU', ''),
-                    rec.get('TYP_DOCUM_INTRT', ''),
-                    rec.get('CODE_LOI_REGLEMENT', ''),
-                    rec.get('NO_ARTCL_L_R', ''),
-                    rec.get('DESCN_CAT_INFRA', ''),
-                    safe_int(rec.get('VITSS_PERMS')),
-                    safe_int(rec.get('VITSS_CNSTA')),
-                    rec.get('DESC_TYP_VEH_INFRA', ''),
-                    json.dumps(rec, ensure_ascii=False, default=str),
-                    resource_id
-                ))
-                inserted += 1
-            except Exception as e:
-                conn.rollback()
-                if inserted == 0:
-                    print(f"    [ERR] {e}")
-                continue
-
-        conn.commit()
         total_inserted += inserted
+        modifiees.append(year)
         print(f"  [{year}] +{inserted} inseres")
-        log_import(conn, f"constats-crq-{year}",
-                   f"donneesquebec.ca/{resource_id}", "import_donnees_qc",
-                   len(records), inserted, 0, "done")
+        log_import(conn, cle, url, "import_donnees_qc",
+                   fetched, inserted, 0, "done", fingerprint=fp)
 
     print(f"\n  TOTAL: {total_fetched} fetch, {total_inserted} inseres")
+    if modifiees:
+        # Agregats (lieu x jour...) des seules annees chargees: une partition relue par annee
+        jours, echecs = refresh_constats_rollups(modifiees)
+        print(f"  Agregats quotidiens: {jours}")
+        if echecs:
+            print(f"  [ERR] Agregats non rafraichis: {echecs} (agregats precedents conserves)")
     return total_inserted
 
 
@@ -235,6 +312,22 @@ def import_constats(conn, dry_run=False, years=None):
 # 2. RADAR PHOTO STATS
 # ═══════════════════════════════════════════════════════════
 
+def _type_appareil(moyen):
+    return 'Fixe' if moyen == 'CINP' else 'Mobile' if moyen == 'MOBL' else 'Feu rouge' if moyen == 'FERG' else moyen
+
+
+RADAR_STATS_MAPPING = compile_mapping({
+    'columns': [
+        ('date_rapport', 'Date', 'date'),
+        ('type_appareil', 'Moyen', _type_appareil, ''),
+        ('localisation', 'Site', 'raw', ''),
+        ('nombre_constats', 'Nombre', 'int'),
+        ('source_resource_id', None, 'raw', RADAR_STATS_LATEST),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+
 def import_radar_stats(conn, dry_run=False):
     """Import stats radar photo depuis Donnees ouvertes QC"""
     print("\n" + "=" * 60)
@@ -252,42 +345,27 @@ def import_radar_stats(conn, dry_run=False):
         conn.commit()
         print("  Table truncated (donnees cumulatives)")
 
-    records = fetch_datastore(RADAR_STATS_LATEST, batch=5000)
-    print(f"  {len(records)} records telecharges")
-
-    if dry_run or not records:
-        return len(records)
-
+    fetched = 0
     inserted = 0
-    for rec in records:
-        try:
-            moyen = rec.get('Moyen', '')
-            type_app = 'Fixe' if moyen == 'CINP' else 'Mobile' if moyen == 'MOBL' else 'Feu rouge' if moyen == 'FERG' else moyen
-
-            cur.execute("""
-                INSERT INTO qc_radar_photo_stats
-                    (date_rapport, type_appareil, localisation,
-                     nombre_constats, raw_data, source_resource_id)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                safe_date(rec.get('Date')),
-                type_app,
-                rec.get('Site', ''),
-                safe_int(rec.get('Nombre')),
-                json.dumps(rec, ensure_ascii=False, default=str),
-                RADAR_STATS_LATEST
-            ))
-            inserted += 1
-        except Exception as e:
-            conn.rollback()
-            if inserted == 0:
-                print(f"    [ERR] {e}")
-            continue
+    try:
+        for offset, records in iter_datastore(RADAR_STATS_LATEST, batch=5000):
+            fetched += len(records)
+            if dry_run:
+                continue
+            inserted += inserer_page(conn, f"""
+                INSERT INTO qc_radar_photo_stats ({', '.join(RADAR_STATS_MAPPING.columns)})
+                VALUES %s
+            """, RADAR_STATS_MAPPING.batch(records))
+    except Exception as e:
+        print(f"    [ERR] {e}")
+    print(f"  {fetched} records telecharges")
+
+    if dry_run or not fetched:
+        return fetched
 
-    conn.commit()
     print(f"  +{inserted} inseres")
     log_import(conn, "radar-photo-stats", f"donneesquebec.ca/{RADAR_STATS_LATEST}",
-               "import_donnees_qc", len(records), inserted, 0, "done")
+               "import_donnees_qc", fetched, inserted, 0, "done")
     return inserted
 
 
@@ -295,6 +373,22 @@ def import_radar_stats(conn, dry_run=False):
 # 3. RADAR PHOTO EMPLACEMENTS (WFS MTQ)
 # ═══════════════════════════════════════════════════════════
 
+def _actif(fin_service):
+    return not (fin_service or '').strip()
+
+
+RADAR_LIEUX_MAPPING = compile_mapping({
+    'columns': [
+        ('type_appareil', 'typeAppareil', 'raw', ''),
+        ('municipalite', 'municipalite', 'raw', ''),
+        ('emplacement', 'description', 'raw', ''),
+        ('date_mise_service', 'dateDebutService', 'date'),
+        ('actif', 'dateFinService', _actif, True),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+
 def import_radar_lieux(conn, dry_run=False):
     """Import emplacements radar photo depuis WFS MTQ"""
     print("\n" + "=" * 60)
@@ -326,30 +420,10 @@ def import_radar_lieux(conn, dry_run=False):
     cur.execute("TRUNCATE TABLE qc_radar_photo_lieux")
     conn.commit()
 
-    inserted = 0
-    for row in rows:
-        try:
-            cur.execute("""
-                INSERT INTO qc_radar_photo_lieux
-                    (type_appareil, municipalite, emplacement,
-                     date_mise_service, actif, raw_data)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                row.get('typeAppareil', ''),
-                row.get('municipalite', ''),
-                row.get('description', ''),
-                safe_date(row.get('dateDebutService')),
-                not bool(row.get('dateFinService', '').strip()),
-                json.dumps(row, ensure_ascii=False, default=str),
-            ))
-            inserted += 1
-        except Exception as e:
-            conn.rollback()
-            if inserted == 0:
-                print(f"    [ERR] {e}")
-            continue
-
-    conn.commit()
+    inserted = inserer_page(conn, f"""
+        INSERT INTO qc_radar_photo_lieux ({', '.join(RADAR_LIEUX_MAPPING.columns)})
+        VALUES %s
+    """, RADAR_LIEUX_MAPPING.batch(rows))
     print(f"  +{inserted} inseres")
     log_import(conn, "radar-photo-lieux", url, "import_donnees_qc",
                len(rows), inserted, 0, "done")
@@ -360,6 +434,24 @@ def import_radar_lieux(conn, dry_run=False):
 # 4. COLLISIONS SAAQ (S3 CSV)
 # ═══════════════════════════════════════════════════════════
 
+COLLISIONS_SAAQ_MAPPING = compile_mapping({
+    'columns': [
+        ('annee', ('AN', '$year'), 'int'),
+        ('date_collision', 'DT_ACCDN', 'date'),
+        ('gravite', 'GRAVITE', 'raw', ''),
+        ('nombre_vehicules', 'NB_VEH_IMPLIQUES_ACCDN', 'int'),
+        ('nombre_deces', 'NB_MORTS', 'int', 0),
+        ('nombre_blesses_graves', 'NB_BLESSES_GRAVES', 'int', 0),
+        ('nombre_blesses_legers', 'NB_BLESSES_LEGERS', 'int', 0),
+        ('conditions_meteo', 'CD_COND_METEO', 'raw', ''),
+        ('etat_surface', 'CD_ETAT_SURFC', 'raw', ''),
+        ('eclairage', 'CD_ECLRM', 'raw', ''),
+        ('source_resource_id', '$source', 'raw'),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+
 def import_collisions_saaq(conn, dry_run=False, years=None):
     """Import rapports accident SAAQ depuis S3"""
     print("\n" + "=" * 60)
@@ -406,40 +498,13 @@ def import_collisions_saaq(conn, dry_run=False, years=None):
             continue
 
         inserted = 0
-        for row in rows:
-            try:
-                cur.execute("""
-                    INSERT INTO qc_collisions_saaq
-                        (annee, date_collision, gravite, nombre_vehicules,
-                         nombre_deces, nombre_blesses_graves, nombre_blesses_legers,
-                         conditions_meteo, etat_surface, eclairage,
-                         raw_data, source_resource_id)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    safe_int(row.get('AN', year)),
-                    safe_date(row.get('DT_ACCDN')),
-                    row.get('GRAVITE', ''),
-                    safe_int(row.get('NB_VEH_IMPLIQUES_ACCDN')),
-                    safe_int(row.get('NB_MORTS', 0), 0),
-                    safe_int(row.get('NB_BLESSES_GRAVES', 0), 0),
-                    safe_int(row.get('NB_BLESSES_LEGERS', 0), 0),
-                    row.get('CD_COND_METEO', ''),
-                    row.get('CD_ETAT_SURFC', ''),
-                    row.get('CD_ECLRM', ''),
-                    json.dumps(row, ensure_ascii=False, default=str),
-                    f"saaq-s3-{year}"
-                ))
-                inserted += 1
-                if inserted % 5000 == 0:
-                    conn.commit()
-                    print(f"    ... {inserted} inseres")
-            except Exception as e:
-                conn.rollback()
-                if inserted == 0:
-                    print(f"    [ERR] {e}")
-                continue
+        for debut in range(0, len(rows), 5000):
+            inserted += inserer_page(conn, f"""
+                INSERT INTO qc_collisions_saaq ({', '.join(COLLISIONS_SAAQ_MAPPING.columns)})
+                VALUES %s
+            """, COLLISIONS_SAAQ_MAPPING.batch(rows[debut:debut + 5000], year=year, source=f"saaq-s3-{year}"))
+            print(f"    ... {inserted} inseres")
 
-        conn.commit()
         total_inserted += inserted
         print(f"  [{year}] +{inserted} inseres")
         log_import(conn, f"collisions-saaq-{year}", url, "import_donnees_qc",
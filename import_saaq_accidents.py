@@ -7,13 +7,14 @@ Source: donneesquebec.ca (CSV, gratuit, pas de clé)
 
 import os
 import sys
-import csv
-import io
 import psycopg2
-import psycopg2.extras
-import requests
 from datetime import datetime
 
+# Lecture CSV en flux et chargement COPY partages avec tickets-db
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "tickets-db"))
+from utils.fetcher import csv_records
+from utils.db import staged_load
+
 try:
     from dotenv import load_dotenv
     load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
@@ -72,81 +73,71 @@ CREATE INDEX IF NOT EXISTS idx_saaq_acc_meteo ON saaq_rapports_accident(conditio
 """
 
 
+COLONNES = [
+    'annee', 'no_seq_collision', 'mois', 'heure', 'jour_semaine',
+    'gravite', 'nb_victimes', 'nb_vehicules', 'region_admin',
+    'vitesse_autorisee', 'genre_accident', 'etat_surface',
+    'eclairage', 'environnement', 'categorie_route', 'aspect_route',
+    'localisation', 'configuration_route', 'zone_travaux',
+    'condition_meteo', 'ind_auto', 'ind_veh_lourd', 'ind_moto',
+    'ind_velo', 'ind_pieton',
+]
+
+
+def rapport_rows(records, year):
+    """Tuples saaq_rapports_accident (ordre COLONNES) depuis les lignes CSV (csv_records:
+    champ vide -> None); texte nettoye, vide -> ''. Extraction ecrite a la main et non par
+    utils/mapping.py: champs texte sans conversion, la correspondance compilee n'a rien a
+    retirer et reste plus lente sur ce format (bench_mapping.py)."""
+    for row in records:
+        g = row.get
+        yield (
+            int(g("AN") or year),
+            (g("NO_SEQ_COLL") or "").strip(),
+            (g("MS_ACCDN") or "").strip(),
+            (g("HR_ACCDN") or "").strip(),
+            (g("JR_SEMN_ACCDN") or "").strip(),
+            (g("GRAVITE") or "").strip(),
+            int(g("NB_VICTIMES_TOTAL") or 0),
+            int(g("NB_VEH_IMPLIQUES_ACCDN") or 0),
+            (g("REG_ADM") or "").strip(),
+            (g("VITESSE_AUTOR") or "").strip(),
+            (g("CD_GENRE_ACCDN") or "").strip(),
+            (g("CD_ETAT_SURFC") or "").strip(),
+            (g("CD_ECLRM") or "").strip(),
+            (g("CD_ENVRN_ACCDN") or "").strip(),
+            (g("CD_CATEG_ROUTE") or "").strip(),
+            (g("CD_ASPCT_ROUTE") or "").strip(),
+            (g("CD_LOCLN_ACCDN") or "").strip(),
+            (g("CD_CONFG_ROUTE") or "").strip(),
+            g("CD_ZON_TRAVX_ROUTR").strip() if g("CD_ZON_TRAVX_ROUTR") else None,
+            (g("CD_COND_METEO") or "").strip(),
+            (g("IND_AUTO_CAMION_LEGER") or "N").strip() == "O",
+            (g("IND_VEH_LOURD") or "N").strip() == "O",
+            (g("IND_MOTO_CYCLO") or "N").strip() == "O",
+            (g("IND_VELO") or "N").strip() == "O",
+            (g("IND_PIETON") or "N").strip() == "O",
+        )
+
+
 def import_year(conn, year):
     """Importe les rapports d'accident pour une année"""
     url = f"{BASE_URL}/Rapport_Accident_{year}.csv"
     print(f"  Téléchargement {year}...", end=" ", flush=True)
 
+    # CSV lu en flux -> tuples -> COPY (lignes invalides en quarantaine)
     try:
-        resp = requests.get(url, timeout=60)
-        if resp.status_code != 200:
-            print(f"[ERR] HTTP {resp.status_code}")
-            return 0
+        charge = staged_load('saaq_rapports_accident', COLONNES,
+                             rapport_rows(csv_records(url, timeout=60), year),
+                             conflict_column='annee, no_seq_collision',
+                             source_name=f'saaq_rapports_accident_{year}')
     except Exception as e:
         print(f"[ERR] {e}")
         return 0
 
-    # Decode with BOM handling
-    text = resp.content.decode('utf-8-sig')
-    reader = csv.DictReader(io.StringIO(text))
-    rows = list(reader)
-    print(f"{len(rows)} rapports", end=" ", flush=True)
-
-    cur = conn.cursor()
-    inserted = 0
-    skipped = 0
-
-    for row in rows:
-        try:
-            cur.execute("""
-                INSERT INTO saaq_rapports_accident
-                    (annee, no_seq_collision, mois, heure, jour_semaine,
-                     gravite, nb_victimes, nb_vehicules, region_admin,
-                     vitesse_autorisee, genre_accident, etat_surface,
-                     eclairage, environnement, categorie_route, aspect_route,
-                     localisation, configuration_route, zone_travaux,
-                     condition_meteo, ind_auto, ind_veh_lourd, ind_moto,
-                     ind_velo, ind_pieton)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                ON CONFLICT (annee, no_seq_collision) DO NOTHING
-            """, (
-                int(row.get("AN", year)),
-                row.get("NO_SEQ_COLL", "").strip(),
-                row.get("MS_ACCDN", "").strip(),
-                row.get("HR_ACCDN", "").strip(),
-                row.get("JR_SEMN_ACCDN", "").strip(),
-                row.get("GRAVITE", "").strip(),
-                int(row.get("NB_VICTIMES_TOTAL", 0) or 0),
-                int(row.get("NB_VEH_IMPLIQUES_ACCDN", 0) or 0),
-                row.get("REG_ADM", "").strip(),
-                row.get("VITESSE_AUTOR", "").strip(),
-                row.get("CD_GENRE_ACCDN", "").strip(),
-                row.get("CD_ETAT_SURFC", "").strip(),
-                row.get("CD_ECLRM", "").strip(),
-                row.get("CD_ENVRN_ACCDN", "").strip(),
-                row.get("CD_CATEG_ROUTE", "").strip(),
-                row.get("CD_ASPCT_ROUTE", "").strip(),
-                row.get("CD_LOCLN_ACCDN", "").strip(),
-                row.get("CD_CONFG_ROUTE", "").strip(),
-                row.get("CD_ZON_TRAVX_ROUTR", "").strip() if row.get("CD_ZON_TRAVX_ROUTR") else None,
-                row.get("CD_COND_METEO", "").strip(),
-                row.get("IND_AUTO_CAMION_LEGER", "N").strip() == "O",
-                row.get("IND_VEH_LOURD", "N").strip() == "O",
-                row.get("IND_MOTO_CYCLO", "N").strip() == "O",
-                row.get("IND_VELO", "N").strip() == "O",
-                row.get("IND_PIETON", "N").strip() == "O",
-            ))
-            inserted += 1
-        except Exception as e:
-            conn.rollback()
-            skipped += 1
-            if skipped <= 3:
-                print(f"\n    [ERR] {row.get('NO_SEQ_COLL','?')}: {e}")
-            continue
-
-    conn.commit()
-    print(f"→ +{inserted} insérés, {skipped} ignorés")
-    return inserted
+    print(f"{charge['total']} rapports → +{charge['inserted']} insérés, "
+          f"{charge['ignored']} déjà présents, {charge['rejected']} rejetés")
+    return charge['inserted']
 
 
 def main():
@@ -0,0 +1,135 @@
+"""
+FightMyTicket — Collecteur de metriques en arriere-plan (dashboard admin)
+Chaque section du monitoring a sa propre fonction et son propre intervalle:
+un thread daemon par intervalle les rafraichit dans un instantane en memoire (une
+section DB de plusieurs secondes ne retarde pas les sections a 10 s), /api/monitor
+sert l'instantane sans attendre (age de chaque section inclus).
+
+    collecteur = Collecteur(connecter)
+    collecteur.section("system", _monitor_system, intervalle=10)
+    collecteur.section("tables", _monitor_tables, intervalle=300, db=True)
+    collecteur.demarrer()
+    collecteur.instantane()  -> {nom: {"data", "updated_at", "age_s", "duration_ms", "error"}}
+"""
+
+import threading
+import time
+import traceback
+from datetime import datetime
+
+
+class Collecteur:
+
+    def __init__(self, connecter, pas=1.0):
+        self._connecter = connecter      # () -> connexion psycopg2 (sections db=True)
+        self._pas = pas
+        self._sections = {}
+        self._etat = {}
+        self._verrou = threading.Lock()
+        self._pret = threading.Event()
+        self._threads = []
+        self._forcer = set()
+
+    def section(self, nom, fn, intervalle, db=False):
+        """fn(cur) si db=True, sinon fn(). Le resultat remplace la section en bloc."""
+        self._sections[nom] = {"fn": fn, "intervalle": intervalle, "db": db, "prochain": 0.0}
+
+    def demarrer(self):
+        with self._verrou:
+            if any(t.is_alive() for t in self._threads):
+                return
+            groupes = {}
+            for nom, s in self._sections.items():
+                groupes.setdefault(s["intervalle"], []).append(nom)
+            self._threads = [
+                threading.Thread(target=self._boucle, args=(noms,), name=f"monitor-collecteur-{intervalle}s",
+                                 daemon=True)
+                for intervalle, noms in sorted(groupes.items())
+            ]
+            for t in self._threads:
+                t.start()
+
+    def attendre_premier_tour(self, timeout):
+        return self._pret.wait(timeout)
+
+    def rafraichir(self, *noms):
+        """Force le rafraichissement des sections au prochain tour (toutes si aucun nom)."""
+        with self._verrou:
+            self._forcer.update(noms or self._sections.keys())
+
+    def instantane(self):
+        now = time.time()
+        with self._verrou:
+            etat = dict(self._etat)
+        out = {}
+        for nom in self._sections:
+            e = etat.get(nom)
+            if e is None:
+                out[nom] = {"data": None, "updated_at": None, "age_s": None, "duration_ms": None,
+                            "error": "en attente du premier calcul"}
+                continue
+            out[nom] = dict(e, age_s=round(now - e["ts"], 1))
+            out[nom].pop("ts")
+        return out
+
+    def _boucle(self, noms):
+        """Worker d'une classe d'intervalle: n'execute que ses sections."""
+        while True:
+            now = time.time()
+            with self._verrou:
+                forcees = self._forcer & set(noms)
+                self._forcer -= forcees
+            dues = [n for n in noms if self._sections[n]["prochain"] <= now or n in forcees]
+            if dues:
+                self._executer(dues)
+            with self._verrou:
+                complet = all(n in self._etat for n in self._sections)
+            if complet and not self._pret.is_set():
+                self._pret.set()
+            time.sleep(self._pas)
+
+    def _executer(self, noms):
+        conn = None
+        for nom in noms:
+            s = self._sections[nom]
+            debut = time.time()
+            erreur = None
+            data = None
+            try:
+                if s["db"]:
+                    if conn is None:
+                        conn = self._connecter()
+                    cur = conn.cursor()
+                    try:
+                        data = s["fn"](cur)
+                    finally:
+                        cur.close()
+                        conn.rollback()
+                else:
+                    data = s["fn"]()
+            except Exception as e:
+                erreur = f"{type(e).__name__}: {e}"
+                traceback.print_exc()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+            fin = time.time()
+            s["prochain"] = fin + s["intervalle"]
+            with self._verrou:
+                precedent = self._etat.get(nom)
+                if erreur and precedent and precedent.get("data") is not None:
+                    # Garder la derniere valeur valide, signaler l'erreur
+                    self._etat[nom] = dict(precedent, error=erreur)
+                else:
+                    self._etat[nom] = {
+                        "data": data,
+                        "ts": fin,
+                        "updated_at": datetime.fromtimestamp(fin).isoformat(timespec="seconds"),
+                        "duration_ms": round((fin - debut) * 1000, 1),
+                        "error": erreur,
+                    }
+        if conn is not None:
+            conn.close()
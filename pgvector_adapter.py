@@ -0,0 +1,123 @@
+"""
+ScanTicket V1 — Adaptateur pgvector binaire (NumPy)
+Les vecteurs (4096 dims) ne passent plus par une chaine decimale de ~60-85KB:
+  - Fireworks -> Python: embeddings demandes en base64, decodes avec np.frombuffer
+  - Python -> PostgreSQL: COPY ... (FORMAT binary) (float4 big-endian, format vector_recv)
+  - PostgreSQL -> Python: typecaster vector -> np.ndarray float32 (parse C numpy)
+
+psycopg2 n'envoie les parametres qu'en format texte: le seul canal binaire
+disponible est COPY. Le vecteur de requete est donc pousse dans une table
+temporaire (1 ligne) puis reference par sous-requete dans le ORDER BY.
+"""
+
+import base64
+import io
+
+import numpy as np
+import psycopg2
+import psycopg2.extensions
+
+# En-tete / fin de flux COPY binaire (voir doc PostgreSQL "COPY — Binary Format")
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + b"\x00\x00\x00\x00" + b"\x00\x00\x00\x00"
+_COPY_TRAILER = b"\xff\xff"
+
+QUERY_VEC_TABLE = "_vec_query"
+STAGE_VEC_TABLE = "_vec_stage"
+
+# OID du type vector (depend de l'installation de l'extension) — resolu une fois
+_vector_oid = None
+
+
+def as_vector(embedding):
+    """Normalise un embedding (ndarray, liste de floats ou base64 Fireworks) en float32."""
+    if isinstance(embedding, np.ndarray):
+        return embedding.astype(np.float32, copy=False)
+    if isinstance(embedding, (str, bytes)):
+        return np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def encode_binary(vec):
+    """Encode un vecteur au format binaire pgvector (vector_send): dim, unused, float4[]."""
+    vec = as_vector(vec)
+    return (np.array([vec.shape[0], 0], dtype=">i2").tobytes()
+            + vec.astype(">f4", copy=False).tobytes())
+
+
+def decode_binary(buf):
+    """Decode le format binaire pgvector -> ndarray float32."""
+    dim = int(np.frombuffer(buf, dtype=">i2", count=1)[0])
+    return np.frombuffer(buf, dtype=">f4", count=dim, offset=4).astype(np.float32)
+
+
+def decode_text(value):
+    """Decode la representation texte '[1,2,3]' -> ndarray float32 (parse en C)."""
+    if value is None:
+        return None
+    return np.fromstring(value[1:-1], sep=",", dtype=np.float32)
+
+
+def _typecast_vector(value, cur):
+    return decode_text(value)
+
+
+def register_vector(conn):
+    """Enregistre le typecaster vector -> ndarray pour tout le process (idempotent)."""
+    global _vector_oid
+    if _vector_oid is not None:
+        return _vector_oid
+    cur = conn.cursor()
+    cur.execute("SELECT oid FROM pg_type WHERE typname = 'vector'")
+    row = cur.fetchone()
+    cur.close()
+    if not row:
+        return None
+    _vector_oid = row[0]
+    vector_type = psycopg2.extensions.new_type((_vector_oid,), "VECTOR", _typecast_vector)
+    psycopg2.extensions.register_type(vector_type)
+    return _vector_oid
+
+
+def _copy_stream(ids, vectors):
+    """Construit un flux COPY binaire (id bigint, v vector) sans boucle Python par element."""
+    mat = np.vstack([as_vector(v) for v in vectors])
+    n, dim = mat.shape
+    fields = [("nfields", ">i2")]
+    if ids is not None:
+        fields += [("id_len", ">i4"), ("id", ">i8")]
+    fields += [("vec_len", ">i4"), ("dim", ">i2"), ("unused", ">i2"), ("v", ">f4", (dim,))]
+    rows = np.zeros(n, dtype=np.dtype(fields))
+    rows["nfields"] = 2 if ids is not None else 1
+    if ids is not None:
+        rows["id_len"] = 8
+        rows["id"] = np.asarray(ids, dtype=np.int64)
+    rows["vec_len"] = 4 + 4 * dim
+    rows["dim"] = dim
+    rows["v"] = mat
+    return io.BytesIO(_COPY_HEADER + rows.tobytes() + _COPY_TRAILER)
+
+
+def bind_query_vector(cur, vec):
+    """Pousse le vecteur de requete en binaire dans une table temporaire.
+    Retourne l'expression SQL a utiliser a la place de %s::vector."""
+    cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {QUERY_VEC_TABLE} (v vector) ON COMMIT DELETE ROWS")
+    cur.execute(f"TRUNCATE {QUERY_VEC_TABLE}")
+    cur.copy_expert(f"COPY {QUERY_VEC_TABLE} (v) FROM STDIN WITH (FORMAT binary)",
+                    _copy_stream(None, [vec]))
+    return f"(SELECT v FROM {QUERY_VEC_TABLE})"
+
+
+def update_vectors(cur, table, column, ids, vectors, id_column="id"):
+    """UPDATE en lot d'une colonne vector: COPY binaire vers staging puis un seul UPDATE ... FROM."""
+    if not ids:
+        return 0
+    cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_VEC_TABLE} (id bigint, v vector) ON COMMIT DELETE ROWS")
+    cur.execute(f"TRUNCATE {STAGE_VEC_TABLE}")
+    cur.copy_expert(f"COPY {STAGE_VEC_TABLE} (id, v) FROM STDIN WITH (FORMAT binary)",
+                    _copy_stream(ids, vectors))
+    cur.execute(f"""
+        UPDATE {table} t SET {column} = s.v
+        FROM {STAGE_VEC_TABLE} s
+        WHERE t.{id_column} = s.id
+    """)
+    return cur.rowcount
@@ -0,0 +1,135 @@
+"""
+FightMyTicket — Rapports PDF pre-rendus (data/rapports/<dossier>/<cle>.pdf)
+Le rendu WeasyPrint (plusieurs secondes de CPU) est fait une fois par version de
+l'analyse, dans un pool de threads: pre-rendu des la fin de l'analyse, puis servi
+depuis le disque a chaque telechargement (ETag = cle, Range gere par send_file).
+
+    cache = CacheRapports(RAPPORT_DIR, empreinte, charger, rendre, version)
+    cache.planifier(dossier_uuid)          # apres l'analyse, non bloquant
+    cache.obtenir(dossier_uuid, 60)        # -> (chemin | None, cle) ou None si dossier absent
+
+cle = sha1(version du gabarit + empreinte du contenu en base)[:16]: une analyse
+modifiee ou un gabarit modifie donnent une nouvelle cle, donc un nouveau rendu;
+sinon le fichier existant est servi tel quel. Fichiers ecrits en .tmp puis
+renommes: plusieurs process peuvent partager le dossier sans lire un PDF partiel.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as _Expire
+
+from agents import metrics
+
+RAPPORT_WORKERS = int(os.environ.get("RAPPORT_WORKERS", "1"))
+
+RENDU_DUREE = metrics.histogramme("rapport_render_seconds", "Duree de rendu d'un rapport PDF (WeasyPrint)",
+                                  buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0))
+RENDU_ERREURS = metrics.compteur("rapport_render_errors_total", "Rendus de rapport PDF en echec")
+
+
+class EnPreparation(Exception):
+    """Rendu en cours au-dela du delai d'attente: le client doit reessayer."""
+
+
+class CacheRapports:
+
+    def __init__(self, dossier, empreinte, charger, rendre, version=""):
+        self.dossier = dossier
+        self._empreinte = empreinte    # (dossier_uuid) -> str | None (None: dossier absent)
+        self._charger = charger        # (dossier_uuid) -> data du gabarit
+        self._rendre = rendre          # (data, chemin) -> bool (False: rendu PDF indisponible)
+        self._version = version
+        self._pool = ThreadPoolExecutor(max_workers=RAPPORT_WORKERS, thread_name_prefix="rapport-pdf")
+        self._en_cours = {}
+        self._verrou = threading.Lock()
+
+    def cle(self, empreinte):
+        return hashlib.sha1(f"{self._version}|{empreinte}".encode()).hexdigest()[:16]
+
+    def chemin(self, dossier_uuid, cle):
+        return os.path.join(self.dossier, dossier_uuid, f"{cle}.pdf")
+
+    def planifier(self, dossier_uuid):
+        """Pre-rendu en arriere-plan (empreinte calculee dans le worker)."""
+        self._pool.submit(self._prerendre, dossier_uuid)
+
+    def obtenir(self, dossier_uuid, attente_s):
+        """(chemin, cle) du PDF a jour — rendu si necessaire, attente bornee (EnPreparation).
+        chemin None: rendu PDF impossible (WeasyPrint absent). None: dossier inconnu."""
+        empreinte = self._empreinte(dossier_uuid)
+        if empreinte is None:
+            return None
+        cle = self.cle(empreinte)
+        chemin = self.chemin(dossier_uuid, cle)
+        if os.path.exists(chemin):
+            metrics.CACHE.inc(cache="rapport_pdf", result="hit")
+            return chemin, cle
+        metrics.CACHE.inc(cache="rapport_pdf", result="miss")
+        try:
+            return self._soumettre(dossier_uuid, cle).result(timeout=attente_s), cle
+        except _Expire:
+            raise EnPreparation(dossier_uuid)
+
+    def _prerendre(self, dossier_uuid):
+        try:
+            empreinte = self._empreinte(dossier_uuid)
+            if empreinte is None:
+                return
+            cle = self.cle(empreinte)
+            if not os.path.exists(self.chemin(dossier_uuid, cle)):
+                self._soumettre(dossier_uuid, cle)
+        except Exception:
+            traceback.print_exc()
+
+    def _soumettre(self, dossier_uuid, cle):
+        # Un seul rendu par (dossier, cle) a la fois dans ce process
+        k = (dossier_uuid, cle)
+        with self._verrou:
+            fut = self._en_cours.get(k)
+            if fut is not None:
+                return fut
+            fut = self._pool.submit(self._produire, dossier_uuid, cle)
+            self._en_cours[k] = fut
+        # Hors du verrou: un futur deja termine appelle _terminer tout de suite, dans ce thread
+        fut.add_done_callback(lambda f, k=k: self._terminer(k, f))
+        return fut
+
+    def _terminer(self, k, fut):
+        with self._verrou:
+            # Seulement ce rendu-ci (un rendu plus recent de la meme cle reste en cours)
+            if self._en_cours.get(k) is fut:
+                del self._en_cours[k]
+
+    def _produire(self, dossier_uuid, cle):
+        chemin = self.chemin(dossier_uuid, cle)
+        if os.path.exists(chemin):
+            return chemin
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        tmp = f"{chemin}.{os.getpid()}.tmp"
+        debut = time.perf_counter()
+        try:
+            if not self._rendre(self._charger(dossier_uuid), tmp):
+                return None
+            os.replace(tmp, chemin)
+        except Exception:
+            RENDU_ERREURS.inc()
+            raise
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        RENDU_DUREE.observe(time.perf_counter() - debut)
+        self._purger(dossier_uuid, garder=os.path.basename(chemin))
+        return chemin
+
+    def _purger(self, dossier_uuid, garder):
+        """Supprime les rendus des versions precedentes du dossier."""
+        rep = os.path.join(self.dossier, dossier_uuid)
+        for nom in os.listdir(rep):
+            if nom.endswith(".pdf") and nom != garder:
+                try:
+                    os.remove(os.path.join(rep, nom))
+                except OSError:
+                    pass
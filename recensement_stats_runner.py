@@ -103,7 +103,11 @@ def log(msg, level="INFO"):
 
 
 def get_db():
-    return psycopg2.connect(**PG_CONFIG)
+    # qc_constats_infraction est partitionnee par annee_donnees: les agregats sont
+    # pre-agreges partition par partition (plus petites tables de hachage, plans paralleles).
+    # Les detecteurs groupent par annee de l'infraction (date_infraction), pas par
+    # annee_donnees (annee du fichier CRQ).
+    return psycopg2.connect(**PG_CONFIG, options="-c enable_partitionwise_aggregate=on")
 
 
 def z_score(value, mean, stddev):
@@ -2399,14 +2403,14 @@ def detect_blitz_daily(cur, dry_run=False):
 
     cur.execute("""
         WITH daily_counts AS (
+            -- Agregat lieu x jour (utils/rollups.py), une ligne par jour et par lieu
             SELECT
                 lieu_infraction,
                 date_infraction,
-                COUNT(*) AS nb,
+                SUM(nb)::int AS nb,
                 EXTRACT(DOW FROM date_infraction)::int AS dow
-            FROM qc_constats_infraction
-            WHERE date_infraction IS NOT NULL
-                AND lieu_infraction IS NOT NULL AND lieu_infraction != ''
+            FROM qc_constats_jour
+            WHERE lieu_infraction != ''
             GROUP BY lieu_infraction, date_infraction
         ),
         lieu_stats AS (
@@ -2543,13 +2547,13 @@ def detect_pattern_jour_semaine(cur, dry_run=False):
 
     cur.execute("""
         WITH jour_counts AS (
+            -- Agregat lieu x jour de semaine x heure (utils/rollups.py)
             SELECT
                 lieu_infraction,
-                EXTRACT(DOW FROM date_infraction)::int AS dow,
-                COUNT(*) AS nb
-            FROM qc_constats_infraction
-            WHERE date_infraction IS NOT NULL
-                AND lieu_infraction IS NOT NULL AND lieu_infraction != ''
+                jour_semaine::int AS dow,
+                SUM(nb) AS nb
+            FROM qc_constats_semaine_heure
+            WHERE lieu_infraction != ''
             GROUP BY lieu_infraction, dow
         ),
         lieu_totals AS (
@@ -9,6 +9,9 @@ import json
 import psycopg2
 import psycopg2.extras
 
+from agents import sql_stats
+from agents.article_citations import extraire_article_simple, LOI_PAR_PROVINCE
+
 PG_CONFIG = {
     "host": "172.18.0.3",
     "port": 5432,
@@ -29,7 +32,7 @@ class ScoreJuridique:
 
     def get_db(self):
         if self.conn is None or self.conn.closed:
-            self.conn = psycopg2.connect(**PG_CONFIG)
+            self.conn = sql_stats.connecter("ScoreJuridique", **PG_CONFIG)
         return self.conn
 
     def calculer(self, ticket: dict, preuves_client: list = None) -> dict:
@@ -189,13 +192,36 @@ class ScoreJuridique:
             lang = "french" if province == "QC" else "english"
             tsv_col = "tsv_fr" if province == "QC" else "tsv_en"
 
+            # 1. Jugements citant le meme article (index jurisprudence_articles)
+            refs = extraire_article_simple(article, LOI_PAR_PROVINCE.get(province)) if article else []
+            if refs:
+                loi, art, _base = refs[0]
+                cur.execute("""
+                    SELECT j.id, j.citation, j.database_id, j.tribunal, j.date_decision, j.resume, j.resultat,
+                           j.province, j.mots_cles, 1.0 AS rank
+                    FROM jurisprudence j
+                    WHERE j.province = %s AND j.id IN (
+                        SELECT ja.jurisprudence_id FROM jurisprudence_articles ja
+                        WHERE (ja.article = %s OR ja.article_base = %s) AND ja.loi IN (%s, '')
+                    )
+                    ORDER BY j.date_decision DESC NULLS LAST LIMIT 50
+                """, (province, art, art, loi))
+                results = [dict(row) for row in cur.fetchall()]
+
+            # 2. Completer par plein texte
+            seen_ids = {r["id"] for r in results}
             cur.execute(f"""
                 SELECT id, citation, database_id, tribunal, date_decision, resume, resultat, province, mots_cles,
                        ts_rank({tsv_col}, to_tsquery(%s, %s)) AS rank
                 FROM jurisprudence WHERE province = %s AND {tsv_col} @@ to_tsquery(%s, %s)
                 ORDER BY rank DESC LIMIT 50
             """, (lang, tsquery, province, lang, tsquery))
-            results = [dict(row) for row in cur.fetchall()]
+            for row in cur.fetchall():
+                if len(results) >= 50:
+                    break
+                if row["id"] not in seen_ids:
+                    results.append(dict(row))
+                    seen_ids.add(row["id"])
 
             if len(results) < 10:
                 cur.execute("""
@@ -204,7 +230,6 @@ class ScoreJuridique:
                     FROM jurisprudence WHERE tsv_fr @@ to_tsquery('french', %s)
                     ORDER BY rank DESC LIMIT 50
                 """, (tsquery, tsquery))
-                seen_ids = {r["id"] for r in results}
                 for row in cur.fetchall():
                     row = dict(row)
                     if row["id"] not in seen_ids:
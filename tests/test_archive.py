@@ -0,0 +1,66 @@
+"""Archive froide raw_data (tickets-db/utils/archive.py): segments, reecriture, purge."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tickets-db"))
+
+import pytest
+
+from utils import archive
+
+
+@pytest.fixture(autouse=True)
+def dossier_archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "RAW_ARCHIVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _records(ids, version):
+    return [{"NO_SEQ": i, "version": version} for i in ids]
+
+
+def test_aller_retour_champs_absents():
+    archive.write_segment("mtl_collisions", 2021, [1, 2], [{"a": 1, "b": None}, {"a": 2}])
+    assert list(archive.read_records("mtl_collisions", 2021)) == [(1, {"a": 1, "b": None}), (2, {"a": 2})]
+
+
+def test_second_passage_meme_plage_d_ids():
+    # 1er passage: lignes 1..5; 2e passage: lignes 1 et 5 republiees puis re-archivees
+    # (meme premier et dernier id que le segment existant)
+    ancien = archive.write_segment("mtl_collisions", 2021, [1, 2, 3, 4, 5], _records([1, 2, 3, 4, 5], 1))
+    nouveau = archive.write_segment("mtl_collisions", 2021, [1, 5], _records([1, 5], 2))
+    assert nouveau != ancien
+    assert os.path.exists(ancien)
+
+    # Purge (archive_raw_data.purger): anciens segments, ids existants moins les re-archives
+    ecrits = {nouveau}
+    for annee, chemin, _, _ in archive.segments("mtl_collisions"):
+        if chemin not in ecrits:
+            assert archive.prune_segment("mtl_collisions", annee, chemin, {1, 2, 3, 4, 5} - {1, 5}) == 2
+
+    lignes = sorted(archive.read_records("mtl_collisions", 2021))
+    assert [i for i, _ in lignes] == [1, 2, 3, 4, 5]
+    assert {i: r["version"] for i, r in lignes} == {1: 2, 2: 1, 3: 1, 4: 1, 5: 2}
+
+
+def test_prune_reecrit_sans_ecraser():
+    # Reecriture d'un segment sous la plage d'un autre segment existant: les deux restent
+    autre = archive.write_segment("qc_constats_infraction", 2020, [2, 4], _records([2, 4], 1))
+    chemin = archive.write_segment("qc_constats_infraction", 2020, [1, 2, 3, 4], _records([1, 2, 3, 4], 2))
+    archive.prune_segment("qc_constats_infraction", 2020, chemin, {2, 4})
+    assert not os.path.exists(chemin)
+    assert os.path.exists(autre)
+    assert len(archive.segments("qc_constats_infraction", 2020)) == 2
+    assert sorted(i for i, _ in archive.read_records("qc_constats_infraction", 2020)) == [2, 2, 4, 4]
+
+
+def test_prune_segment_vide_supprime():
+    chemin = archive.write_segment("qc_collisions_saaq", None, [7, 8], _records([7, 8], 1))
+    assert archive.prune_segment("qc_collisions_saaq", None, chemin, set()) == 2
+    assert archive.segments("qc_collisions_saaq") == []
+
+
+def test_anciens_noms_de_segment():
+    chemin = archive.write_segment("mtl_collisions", 2019, [3, 9], _records([3, 9], 1))
+    os.rename(chemin, os.path.join(os.path.dirname(chemin), "0000000003-0000000009.zip"))
+    assert [(a, p, d) for a, _, p, d in archive.segments("mtl_collisions")] == [(2019, 3, 9)]
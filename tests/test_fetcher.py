@@ -0,0 +1,148 @@
+"""Fetcher CKAN (tickets-db/utils/fetcher.py) contre un faux CKAN local: pagination
+DataStore, reprise depuis un point Reprise, politesse par hote."""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tickets-db"))
+
+import pytest
+
+from utils import fetcher
+from utils.fetcher import Reprise, ckan_datastore_pages
+
+RESOURCE = "0f1e2d3c-4b5a-6978-8796-a5b4c3d2e1f0"
+
+
+class FauxCkan(ThreadingHTTPServer):
+    """datastore_search sur `lignes` records tries par _id; note les requetes en vol."""
+    daemon_threads = True
+
+    def __init__(self, lignes, latence=0.0):
+        super().__init__(("127.0.0.1", 0), _Requete)
+        self.records = [{"_id": i, "NO_SEQ": f"S{i:05d}"} for i in range(1, lignes + 1)]
+        self.latence = latence
+        self.verrou = threading.Lock()
+        self.en_vol = 0
+        self.max_en_vol = 0
+        self.departs = []
+        self.offsets = []
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/3/action"
+
+
+class _Requete(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        srv = self.server
+        with srv.verrou:
+            srv.en_vol += 1
+            srv.max_en_vol = max(srv.max_en_vol, srv.en_vol)
+            srv.departs.append(time.monotonic())
+        try:
+            url = urlsplit(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if not url.path.endswith("/datastore_search") or params.get("resource_id") != RESOURCE:
+                self.send_error(404)
+                return
+            if srv.latence:
+                time.sleep(srv.latence)
+            offset, limit = int(params.get("offset", 0)), int(params.get("limit", 100))
+            with srv.verrou:
+                srv.offsets.append(offset)
+            corps = json.dumps({"success": True, "result": {
+                "records": srv.records[offset:offset + limit], "total": len(srv.records)}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corps)))
+            self.end_headers()
+            self.wfile.write(corps)
+        finally:
+            with srv.verrou:
+                srv.en_vol -= 1
+
+
+@pytest.fixture
+def ckan(monkeypatch):
+    monkeypatch.setattr(fetcher, "REQUEST_DELAY", 0.01)
+    monkeypatch.setattr(fetcher, "_hotes", {})
+    serveurs = []
+
+    def demarrer(lignes, latence=0.0):
+        srv = FauxCkan(lignes, latence)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        serveurs.append(srv)
+        return srv
+
+    yield demarrer
+    for srv in serveurs:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_pagination_pages_paralleles_dans_l_ordre(ckan):
+    srv = ckan(95)
+    pages = list(ckan_datastore_pages(srv.base_url, RESOURCE, limit=10, paralleles=3))
+    assert [offset for offset, _ in pages] == list(range(0, 95, 10))
+    assert [r["_id"] for _, records in pages for r in records] == list(range(1, 96))
+    assert sorted(srv.offsets) == list(range(0, 95, 10))
+
+
+def test_reprise_apres_interruption(ckan, tmp_path):
+    srv = ckan(95)
+    reprise = Reprise(str(tmp_path / "ckan_reprise.json"))
+    cle = f"constats_{RESOURCE}"
+    charges = []
+
+    # 1er lancement: arret apres la 3e page committee
+    pages = ckan_datastore_pages(srv.base_url, RESOURCE, limit=10, paralleles=2,
+                                 debut=reprise.offset(cle))
+    for n, (offset, records) in enumerate(pages, 1):
+        charges.extend(r["_id"] for r in records)
+        reprise.noter(cle, offset + len(records))
+        if n == 3:
+            pages.close()
+            break
+    assert reprise.en_cours(cle) and reprise.offset(cle) == 30
+
+    # 2e lancement: repart de la premiere ligne non committee
+    srv.offsets.clear()
+    for offset, records in ckan_datastore_pages(srv.base_url, RESOURCE, limit=10, paralleles=2,
+                                                debut=reprise.offset(cle)):
+        charges.extend(r["_id"] for r in records)
+        reprise.noter(cle, offset + len(records))
+    reprise.terminer(cle)
+
+    assert charges == list(range(1, 96))
+    assert min(srv.offsets) == 30
+    assert not reprise.en_cours(cle) and reprise.offset(cle) == 0
+
+
+def test_politesse_par_hote(ckan, monkeypatch):
+    monkeypatch.setattr(fetcher, "HOST_MAX_CONCURRENT", 2)
+    monkeypatch.setattr(fetcher, "REQUEST_DELAY", 0.05)
+    srv = ckan(80, latence=0.15)
+    pages = list(ckan_datastore_pages(srv.base_url, RESOURCE, limit=10, paralleles=4))
+    assert sum(len(records) for _, records in pages) == 80
+    # 4 pages demandees en parallele, au plus 2 requetes en vol vers l'hote
+    assert srv.max_en_vol == 2
+
+    # Departs espaces de REQUEST_DELAY: sans latence, n requetes s'etalent sur au moins
+    # n - 1 intervalles. Mesure sur l'etendue, pas ecart par ecart: l'heure d'arrivee vue
+    # par le serveur a sa propre gigue (connexion, ordonnancement des threads).
+    srv.latence = 0.0
+    srv.departs.clear()
+    list(ckan_datastore_pages(srv.base_url, RESOURCE, limit=10, paralleles=4))
+    n = len(srv.departs)
+    assert n >= 8
+    assert srv.departs[-1] - srv.departs[0] >= (n - 1) * 0.05 - 0.02
@@ -0,0 +1,93 @@
+"""Correspondances compilees (tickets-db/utils/mapping.py): la fonction de lot generee
+(cas courant) et la conversion par colonnes donnent les memes tuples."""
+import os
+import random
+import sys
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tickets-db"))
+
+from utils.mapping import RowMapper, compile_mapping
+
+SPEC = {
+    'columns': [
+        ('annee', ('AN', '$year'), 'int'),
+        ('code', 'CODE', 'strip', ''),
+        ('code_nul', 'CODE', 'strip'),
+        ('nb', 'NB', 'int', 0),
+        ('nb_nul', 'NB', 'int'),
+        ('montant', 'MONTANT', 'float'),
+        ('montant_zero', 'MONTANT', 'float', 0.0),
+        ('jour', 'JOUR', 'date'),
+        ('heure', 'HEURE', 'time'),
+        ('lieu', 'LIEU', 'text'),
+        ('lieu_defaut', 'LIEU', 'text', '?'),
+        ('brut', 'LIEU', 'raw'),
+        ('brut_defaut', 'LIEU', 'raw', '-'),
+        ('pieton', 'PIETON', 'flag'),
+        ('majuscule', 'LIEU', lambda v: v.upper() if v else None, ''),
+        ('absente', 'PAS_LA', 'int', 7),
+        ('source', '$resource_id', 'raw'),
+    ],
+    'raw': ('raw_data', 'all'),
+}
+
+
+class ParColonnes(RowMapper):
+    """Reference: conversion par colonnes seulement."""
+
+    def _generer(self, plan):
+        return None
+
+
+def _record(rng, texte_seulement):
+    valeurs = {
+        'AN': ['2021', ' 2022 ', None, ''],
+        'CODE': [' 31 ', 'A', '', None, '  '],
+        'NB': ['0', '3', '', None, ' 4 '],
+        'MONTANT': ['12.5', '50,00', '', None, 'abc'],
+        'JOUR': ['2021-03-04', '04/03/2021', '', None],
+        'HEURE': ['08:15', '0815', '', None],
+        'LIEU': ['Laval', '', None],
+        'PIETON': ['O', 'N', ' O', '', None],
+    }
+    if not texte_seulement:
+        valeurs['NB'] += [5, 0, '2.0', 'null']
+        valeurs['CODE'] += [31]
+        valeurs['MONTANT'] += [7, 1.5]
+    return {k: rng.choice(v) for k, v in valeurs.items()}
+
+
+def _lot(graine, texte_seulement, n=400):
+    rng = random.Random(graine)
+    return [_record(rng, texte_seulement) for _ in range(n)]
+
+
+def test_lot_genere_identique_aux_colonnes():
+    compile_ = compile_mapping(SPEC)
+    reference = ParColonnes(SPEC)
+    for graine in range(20):
+        records = _lot(graine, texte_seulement=True)
+        assert compile_.batch(records, year=2020, resource_id='rid') == \
+            reference.batch(records, year=2020, resource_id='rid')
+    assert all(f is not None for f in compile_._lots.values())
+
+
+def test_hors_cas_courant_repli_par_colonnes():
+    compile_ = compile_mapping(SPEC)
+    reference = ParColonnes(SPEC)
+    for graine in range(20):
+        records = _lot(graine, texte_seulement=False)
+        assert compile_.batch(records, year=2020, resource_id='rid') == \
+            reference.batch(records, year=2020, resource_id='rid')
+    # Lots suivants du meme plan: conversion par colonnes
+    assert list(compile_._lots.values()) == [None]
+
+
+def test_alias_resolus_par_lot():
+    mapping = compile_mapping({'columns': [('annee', ('ANNEE', 'annee'), 'int'),
+                                           ('jour', ('DATE', 'date'), 'date')]})
+    assert mapping.batch([{'annee': '2021', 'date': '2021-01-02'}] * 2) == [(2021, date(2021, 1, 2))] * 2
+    assert mapping.batch([{'ANNEE': '2022', 'DATE': ''}]) == [(2022, None)]
+    # Cles du premier record pour tout le lot: record heterogene -> None (par colonnes)
+    assert mapping.batch([{'ANNEE': '2022', 'DATE': ''}, {'annee': '2023'}]) == [(2022, None), (None, None)]
@@ -0,0 +1,58 @@
+"""Tsqueries construites par precedents_engine.requete() a partir des requetes des agents."""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.agent_precedents_on import AgentPrecedentsON
+from agents.agent_precedents_qc import AgentPrecedentsQC
+from agents.precedents_engine import FTS_EN, FTS_FR, requete, tsquery
+
+# lexeme (operateur lexeme)*, ! seulement devant un lexeme
+VALIDE = re.compile(r"^!?[^\W_]+( [&|] !?[^\W_]+)*$", re.UNICODE)
+
+
+def _agent(cls):
+    # Pas de connexion DB / Chroma: seules les methodes pures sont appelees
+    return cls.__new__(cls)
+
+
+def test_contexte_qc_infraction_multi_mots():
+    ctx = _agent(AgentPrecedentsQC)._extraire_contexte_ticket(
+        {"infraction": "Conduite d'un véhicule sans permis valide", "loi": "art. 93.1 CSR"})
+    assert ctx["queries_specifiques"]
+    for query in ctx["queries_specifiques"]:
+        term = requete(query[:50], FTS_FR, query)["term"]
+        assert VALIDE.match(term), term
+    assert requete("x", FTS_FR, ctx["queries_specifiques"][0])["term"] == "conduite & d & un & véhicule & sans"
+
+
+def test_requetes_on_article_entre_parentheses():
+    queries = _agent(AgentPrecedentsON)._generer_requetes_on("Fail to remain 200(1)(a)")
+    for query in queries:
+        term = requete(query[:50], FTS_EN, query)["term"]
+        assert VALIDE.match(term), term
+
+
+def test_tsquery_operateurs():
+    assert tsquery("a | | b &") == "a | b"
+    assert tsquery("& ! x y") == "!x & y"
+    assert tsquery("  ' () ") == ""
+
+
+def test_tsquery_parentheses():
+    # Groupes conserves (priorite: & lie plus fort que |)
+    assert tsquery("(red & light) | x") == "( red & light ) | x"
+    assert tsquery("a & (b | c)") == "a & ( b | c )"
+    assert tsquery("!(a | b) c") == "!( a | b ) & c"
+    # Un seul lexeme entre parentheses (article): pas de groupe
+    assert tsquery("200(1)(a)") == "200 & 1 & a"
+    # Parentheses non appariees ou groupes vides
+    assert tsquery("((a b)") == "( a & b )"
+    assert tsquery("a ) | (") == "a"
+    assert tsquery("a & () | b") == "a & b"
+
+
+def test_terme_vide_ignore():
+    assert requete("x", FTS_FR, "'()")["term"] == ""
@@ -26,15 +26,28 @@ MONTREAL_BASE = 'https://data.montreal.ca/api/3/action'
 CANLII_BASE = 'https://api.canlii.org/v1'
 
 # Rate limiting
-REQUEST_DELAY = 0.5       # secondes entre requetes (CKAN)
+REQUEST_DELAY = 0.5       # secondes entre deux departs de requete vers un meme hote (CKAN)
+HOST_MAX_CONCURRENT = int(os.environ.get('HOST_MAX_CONCURRENT', 4))  # requetes simultanees par hote
+CKAN_PARALLEL = int(os.environ.get('CKAN_PARALLEL', 3))              # pages DataStore en vol par resource
+IMPORT_PARALLEL = int(os.environ.get('IMPORT_PARALLEL', 4))          # modules d'import simultanes (main.py)
 CANLII_DELAY = 1.0        # secondes entre requetes CanLII (respecter leurs limites)
 MAX_RETRIES = 3
 
 # Limites d'import
 CKAN_BATCH_SIZE = 32000   # records par requete CKAN
+# Gros resources (constats CRQ, collisions MTL): 'datastore' = pages JSON datastore_search,
+# 'csv' = fichier CSV complet telecharge une fois et lu en flux vers COPY
+CKAN_INGEST_MODE = os.environ.get('CKAN_INGEST_MODE', 'datastore')
 CANLII_BATCH_SIZE = 100   # decisions par requete CanLII
 CANLII_MAX_PER_DB = 50000 # max decisions par tribunal (qccq et oncj en ont 20K-40K+)
 
+# Archive froide des raw_data complets (utils/archive.py): segments en colonnes compressees
+# par source et par annee; la table chaude ne garde que les champs non mappes
+RAW_ARCHIVE_DIR = os.environ.get('RAW_ARCHIVE_DIR',
+                                 os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                              'data', 'raw_archive'))
+
 # Logging
 LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')
 LOG_FILE = os.path.join(LOG_DIR, 'import.log')
+CKAN_RESUME_FILE = os.path.join(LOG_DIR, 'ckan_reprise.json')   # offsets des imports interrompus
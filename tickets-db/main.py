@@ -18,7 +18,13 @@ Usage:
     python3 main.py --static     # Donnees statiques seulement
     python3 main.py --seed       # Seed cases curates (135+) seulement
     python3 main.py --status     # Afficher le status des tables
+    python3 main.py --quebec --csv-dump  # Gros resources CKAN via le fichier CSV complet
+    python3 main.py --jobs 1     # Modules un a la fois (ordre historique)
+
+Les modules independants (hotes et tables differents) tournent en parallele;
+resume par module (statut, duree, records) en fin d'import.
 """
+import importlib
 import logging
 import sys
 import os
@@ -27,15 +33,16 @@ import argparse
 # Ajouter le repertoire courant au path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from config import LOG_DIR, LOG_FILE
+from config import LOG_DIR, LOG_FILE, IMPORT_PARALLEL
 from utils.db import execute_schema, get_table_counts
+from utils.scheduler import run_modules, log_summary
 
 # Creer le repertoire de logs
 os.makedirs(LOG_DIR, exist_ok=True)
 
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+    format='%(asctime)s [%(levelname)s] %(threadName)s %(name)s: %(message)s',
     handlers=[
         logging.FileHandler(LOG_FILE),
         logging.StreamHandler(sys.stdout)
@@ -43,6 +50,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Modules d'import: (module, drapeau CLI, message d'etape), dans l'ordre historique.
+# Dependances et ressources (hotes, tables) declarees par chaque module (SCHEDULE).
+MODULES = [
+    ('static_data', 'static', "Etape 3: Import donnees statiques (jurisprudence cle, articles loi)..."),
+    ('seed_import', 'seed', "Etape 3b: Import seed cases curates (135+ QC/ON)..."),
+    ('ckan_quebec', 'quebec', "Etape 4: Import Donnees Quebec (SAAQ, radars, constats)..."),
+    ('ckan_montreal', 'montreal', "Etape 5: Import Montreal Open Data (collisions, SPVM)..."),
+    ('canlii', 'canlii', "Etape 6: Import CanLII (jurisprudence QC + ON)..."),
+    ('a2aj', 'a2aj', "Etape 7: Import A2AJ (jurisprudence texte integral)..."),
+    ('canlii_legislation', 'legislation', "Etape 8: Import CanLII Legislation Browse..."),
+    ('ontario', 'ontario', "Etape 9: Import Ontario Open Data..."),
+    ('ckan_collisions_saaq', 'collisions', "Etape 10: Import Collisions SAAQ (Donnees Quebec)..."),
+    ('on_set_fines_import', 'setfines', "Etape 11: Import Ontario Set Fines (Court schedules)..."),
+    ('ckan_vehicules', 'vehicules', "Etape 12: Import Vehicules en circulation SAAQ..."),
+]
+
 
 def print_status():
     """Affiche le nombre de lignes dans chaque table."""
@@ -80,8 +103,17 @@ def main():
     parser.add_argument('--static', action='store_true', help='Donnees statiques seulement')
     parser.add_argument('--seed', action='store_true', help='Seed cases curates (135+) seulement')
     parser.add_argument('--status', action='store_true', help='Afficher status des tables')
+    parser.add_argument('--jobs', type=int, default=IMPORT_PARALLEL,
+                        help=f'Modules executes en parallele (defaut {IMPORT_PARALLEL}, 1 = sequentiel)')
+    parser.add_argument('--csv-dump', action='store_true',
+                        help='Constats CRQ et collisions MTL via le CSV complet (au lieu du DataStore)')
     args = parser.parse_args()
 
+    if args.csv_dump:
+        # Mode par defaut de ckan_resource_records (lu a chaque appel)
+        from utils import fetcher
+        fetcher.CKAN_INGEST_MODE = 'csv'
+
     # Si --status, juste afficher et sortir
     if args.status:
         print_status()
@@ -106,77 +138,23 @@ def main():
         print_status()
         return
 
-    # Etape 2 : Donnees statiques
-    if run_all or args.static:
-        logger.info("Etape 3: Import donnees statiques (jurisprudence cle, articles loi)...")
-        from modules.static_data import run as run_static
-        run_static()
-
-    # Etape 3b : Seed cases curates (135+ cas detailles)
-    if run_all or args.seed:
-        logger.info("Etape 3b: Import seed cases curates (135+ QC/ON)...")
-        from modules.seed_import import run as run_seed
-        run_seed()
-
-    # Etape 4 : Donnees Quebec
-    if run_all or args.quebec:
-        logger.info("Etape 4: Import Donnees Quebec (SAAQ, radars, constats)...")
-        from modules.ckan_quebec import run as run_qc
-        run_qc()
-
-    # Etape 5 : Montreal Open Data
-    if run_all or args.montreal:
-        logger.info("Etape 5: Import Montreal Open Data (collisions, SPVM)...")
-        from modules.ckan_montreal import run as run_mtl
-        run_mtl()
-
-    # Etape 6 : CanLII
-    if run_all or args.canlii:
-        logger.info("Etape 6: Import CanLII (jurisprudence QC + ON)...")
-        from modules.canlii import run as run_canlii
-        run_canlii()
-
-    # Etape 7 : A2AJ (jurisprudence texte integral)
-    if run_all or args.a2aj:
-        logger.info("Etape 7: Import A2AJ (jurisprudence texte integral)...")
-        from modules.a2aj import run as run_a2aj
-        run_a2aj()
-
-    # Etape 8 : CanLII Legislation Browse
-    if run_all or args.legislation:
-        logger.info("Etape 8: Import CanLII Legislation Browse...")
-        from modules.canlii_legislation import run as run_legislation
-        run_legislation()
-
-    # Etape 9 : Ontario
-    if run_all or args.ontario:
-        logger.info("Etape 9: Import Ontario Open Data...")
-        from modules.ontario import run as run_ontario
-        run_ontario()
-
-    # Etape 10 : Collisions SAAQ
-    if run_all or args.collisions:
-        logger.info("Etape 10: Import Collisions SAAQ (Donnees Quebec)...")
-        from modules.ckan_collisions_saaq import run as run_collisions
-        run_collisions()
-
-    # Etape 11 : Ontario Set Fines
-    if run_all or args.setfines:
-        logger.info("Etape 11: Import Ontario Set Fines (Court schedules)...")
-        from modules.on_set_fines_import import run as run_setfines
-        run_setfines()
-
-    # Etape 12 : Vehicules en circulation SAAQ
-    if run_all or args.vehicules:
-        logger.info("Etape 12: Import Vehicules en circulation SAAQ...")
-        from modules.ckan_vehicules import run as run_vehicules
-        run_vehicules()
+    # Etapes 2+ : modules selectionnes, en parallele selon leurs dependances et
+    # ressources (SCHEDULE de chaque module)
+    tasks = []
+    for name, flag, label in MODULES:
+        if run_all or getattr(args, flag):
+            module = importlib.import_module(f'modules.{name}')
+            tasks.append(dict(getattr(module, 'SCHEDULE', {}), name=name, label=label, run=module.run))
+    report = run_modules(tasks, workers=args.jobs)
+    log_summary(report)
 
     logger.info("=" * 60)
     logger.info("IMPORT TERMINE")
     logger.info("=" * 60)
 
     print_status()
+    if any(r['status'] != 'ok' for r in report):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
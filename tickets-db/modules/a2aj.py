@@ -185,6 +185,16 @@ def insert_a2aj_cases(cases, province, source_query):
     return inserted
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    # Texte integral A2AJ par-dessus les metadonnees CanLII (ON CONFLICT DO UPDATE)
+    'after': ['canlii'],
+    'hosts': [A2AJ_BASE],
+    'tables': ['jurisprudence'],
+}
+
+
 def run():
     """Point d'entree du module A2AJ."""
     logger.info("=" * 50)
@@ -344,6 +344,16 @@ def insert_citations(source_canlii_id, citations_data):
     return inserted
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    # Les cas curates (seed) passent avant: meme canlii_id, derniere ecriture gagnante
+    'after': ['seed_import'],
+    'hosts': [CANLII_BASE],
+    'tables': ['jurisprudence', 'jurisprudence_citations', 'jurisprudence_legislation'],
+}
+
+
 def run():
     """Point d'entree du module CanLII."""
     global _request_count
@@ -420,6 +430,17 @@ def run():
     # Sauvegarder compteur
     _save_counter()
 
+    # Invalider le graphe de citations en memoire des agents (agents/citation_graph.py)
+    if total_citations:
+        stamp = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                             'data', 'citation_graph.stamp')
+        try:
+            os.makedirs(os.path.dirname(stamp), exist_ok=True)
+            with open(stamp, 'a'):
+                os.utime(stamp, None)
+        except OSError as e:
+            logger.warning(f"  Stamp graphe citations: {e}")
+
     logger.info(f"CanLII total: {total_inserted} decisions, {total_citations} citations")
     logger.info(f"CanLII requetes utilisees: {_request_count}/{DAILY_LIMIT}")
     return results
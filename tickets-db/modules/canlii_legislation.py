@@ -172,6 +172,16 @@ def insert_legislation(legislations, province):
     return inserted
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    # static_data vide puis recharge lois_articles
+    'after': ['static_data'],
+    'hosts': [CANLII_BASE],
+    'tables': ['lois_articles'],
+}
+
+
 def run():
     """Point d'entree du module legislation CanLII."""
     logger.info("=" * 50)
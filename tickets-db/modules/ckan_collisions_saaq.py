@@ -5,11 +5,11 @@ Source: https://www.donneesquebec.ca/recherche/dataset/rapports-d-accident
 Les fichiers CSV sont heberges sur S3 (pas dans le DataStore API).
 """
 import logging
-import json
 import csv
 import io
-import requests
-from utils.db import bulk_insert, log_import
+from utils.fetcher import fetch_if_changed
+from utils.db import staged_load, log_import, last_fingerprint
+from utils.mapping import compile_mapping
 
 logger = logging.getLogger(__name__)
 
@@ -30,20 +30,36 @@ COLLISION_CSV_URLS = {
 }
 
 
-def _safe_int(val):
-    if val is None or val == '':
-        return None
-    try:
-        return int(float(str(val).replace(',', '').strip()))
-    except (ValueError, TypeError):
-        return None
-
-
-def _clean(val):
-    if val is None:
-        return None
-    val = str(val).strip()
-    return val if val else None
+# Ligne CSV SAAQ -> qc_collisions_saaq (utils/mapping.py).
+# CSV: AN, NO_SEQ_COLL, MS_ACCDN, HR_ACCDN, JR_SEMN_ACCDN, GRAVITE,
+#      NB_VICTIMES_TOTAL, NB_VEH_IMPLIQUES_ACCDN, REG_ADM, VITESSE_AUTOR,
+#      CD_GENRE_ACCDN, CD_ETAT_SURFC, CD_ECLRM, CD_ENVRN_ACCDN,
+#      CD_CATEG_ROUTE, CD_ASPCT_ROUTE, CD_LOCLN_ACCDN, CD_CONFG_ROUTE,
+#      CD_ZON_TRAVX_ROUTR, CD_COND_METEO, IND_AUTO_CAMION_LEGER,
+#      IND_VEH_LOURD, IND_MOTO_CYCLO, IND_VELO, IND_PIETON
+COLLISION_MAPPING = compile_mapping({
+    'columns': [
+        ('annee', 'AN', 'int'),
+        ('date_collision', None, 'raw'),        # seulement le mois (MS_ACCDN)
+        ('heure_collision', 'HR_ACCDN', 'strip'),
+        ('region_admin', 'REG_ADM', 'strip'),
+        ('municipalite', None, 'raw'),          # absent de ce jeu de donnees
+        ('route', None, 'raw'),
+        ('type_route', 'CD_CATEG_ROUTE', 'strip'),
+        ('gravite', 'GRAVITE', 'strip'),
+        ('nombre_vehicules', 'NB_VEH_IMPLIQUES_ACCDN', 'int'),
+        ('nombre_victimes', 'NB_VICTIMES_TOTAL', 'int'),
+        ('nombre_deces', None, 'raw'),          # pas de colonne separee
+        ('nombre_blesses_graves', None, 'raw'),
+        ('nombre_blesses_legers', None, 'raw'),
+        ('eclairage', 'CD_ECLRM', 'strip'),
+        ('etat_surface', 'CD_ETAT_SURFC', 'strip'),
+        ('conditions_meteo', 'CD_COND_METEO', 'strip'),
+        ('source_resource_id', '$source', 'raw'),
+    ],
+    'raw': ('raw_data', 'nonempty'),
+})
+COLLISION_COLUMNS = COLLISION_MAPPING.columns
 
 
 def fetch_collisions_saaq():
@@ -53,71 +69,50 @@ def fetch_collisions_saaq():
 
     for year, url in sorted(COLLISION_CSV_URLS.items()):
         logger.info(f"  Downloading {year} from {url}...")
+        source = f'qc_collisions_saaq_{year}'
         try:
-            resp = requests.get(url, timeout=120)
-            resp.raise_for_status()
+            # GET conditionnel (ETag / Last-Modified / sha256 du dernier import)
+            body, fp = fetch_if_changed(url, last_fingerprint(source), timeout=120)
         except Exception as e:
             logger.error(f"  Error downloading {year}: {e}")
-            log_import(f'qc_collisions_saaq_{year}', url, 'ckan_collisions_saaq',
+            log_import(source, url, 'ckan_collisions_saaq',
                        0, 0, 'error', str(e))
             continue
+        if body is None:
+            logger.info(f"    {year}: unchanged since last import, skipping.")
+            log_import(source, url, 'ckan_collisions_saaq', 0, 0, 'unchanged', fingerprint=fp)
+            continue
 
-        # Decode CSV (BOM-aware)
-        content = resp.content.decode('utf-8-sig')
-        reader = csv.DictReader(io.StringIO(content))
-
-        rows = []
-        for r in reader:
-            # Map CSV columns to DB columns
-            # CSV: AN, NO_SEQ_COLL, MS_ACCDN, HR_ACCDN, JR_SEMN_ACCDN, GRAVITE,
-            #      NB_VICTIMES_TOTAL, NB_VEH_IMPLIQUES_ACCDN, REG_ADM, VITESSE_AUTOR,
-            #      CD_GENRE_ACCDN, CD_ETAT_SURFC, CD_ECLRM, CD_ENVRN_ACCDN,
-            #      CD_CATEG_ROUTE, CD_ASPCT_ROUTE, CD_LOCLN_ACCDN, CD_CONFG_ROUTE,
-            #      CD_ZON_TRAVX_ROUTR, CD_COND_METEO, IND_AUTO_CAMION_LEGER,
-            #      IND_VEH_LOURD, IND_MOTO_CYCLO, IND_VELO, IND_PIETON
-            rows.append((
-                _safe_int(r.get('AN')),
-                None,  # date_collision (not directly available, only month MS_ACCDN)
-                _clean(r.get('HR_ACCDN')),
-                _clean(r.get('REG_ADM')),
-                None,  # municipalite (not in this dataset)
-                None,  # route (not in this dataset)
-                _clean(r.get('CD_CATEG_ROUTE')),
-                _clean(r.get('GRAVITE')),
-                _safe_int(r.get('NB_VEH_IMPLIQUES_ACCDN')),
-                _safe_int(r.get('NB_VICTIMES_TOTAL')),
-                None,  # nombre_deces (not separate column)
-                None,  # nombre_blesses_graves
-                None,  # nombre_blesses_legers
-                _clean(r.get('CD_ECLRM')),
-                _clean(r.get('CD_ETAT_SURFC')),
-                _clean(r.get('CD_COND_METEO')),
-                json.dumps({k: v for k, v in r.items() if v}),
-                f'saaq_csv_{year}',
-            ))
-
-        if rows:
-            columns = [
-                'annee', 'date_collision', 'heure_collision',
-                'region_admin', 'municipalite', 'route', 'type_route',
-                'gravite', 'nombre_vehicules', 'nombre_victimes',
-                'nombre_deces', 'nombre_blesses_graves', 'nombre_blesses_legers',
-                'eclairage', 'etat_surface', 'conditions_meteo',
-                'raw_data', 'source_resource_id'
-            ]
-            count = bulk_insert('qc_collisions_saaq', columns, rows)
+        # CSV lu en flux depuis le contenu telecharge (BOM-aware), lignes envoyees
+        # directement au COPY sans liste intermediaire
+        reader = csv.DictReader(io.TextIOWrapper(io.BytesIO(body), encoding='utf-8-sig', newline=''))
+        rows = COLLISION_MAPPING.rows(reader, source=f'saaq_csv_{year}')
+        # Fichier modifie: l'annee est rechargee en entier
+        charge = staged_load('qc_collisions_saaq', COLLISION_COLUMNS, rows, source_name=source,
+                             replace=('source_resource_id = %s', (f'saaq_csv_{year}',)))
+        if charge['total']:
+            count = charge['inserted']
             total_inserted += count
             logger.info(f"    {year}: {count} collision records inserted.")
-            log_import(f'qc_collisions_saaq_{year}', url, 'ckan_collisions_saaq',
-                       len(rows), count)
+            log_import(source, url, 'ckan_collisions_saaq',
+                       charge['total'], count, metadata={'rejected': charge['rejected']}, fingerprint=fp)
         else:
             logger.warning(f"    {year}: No rows parsed.")
-            log_import(f'qc_collisions_saaq_{year}', url, 'ckan_collisions_saaq',
+            log_import(source, url, 'ckan_collisions_saaq',
                        0, 0, 'warning', 'No rows parsed')
 
     return total_inserted
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    'after': [],
+    'hosts': list(COLLISION_CSV_URLS.values()),
+    'tables': ['qc_collisions_saaq'],
+}
+
+
 def run():
     """Point d'entree du module collisions SAAQ."""
     logger.info("=" * 50)
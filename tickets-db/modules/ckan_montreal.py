@@ -9,10 +9,11 @@ Datasets :
 - Interventions escouade mobilite
 """
 import logging
-import json
 from config import MONTREAL_BASE
-from utils.fetcher import ckan_datastore_fetch_all, ckan_get_resources
-from utils.db import bulk_insert, log_import
+from utils.fetcher import (ckan_datastore_records, ckan_get_resources, ckan_fingerprint, ckan_resource_show,
+                           ckan_resource_records)
+from utils.db import staged_load, log_import, resource_plan
+from utils.mapping import compile_mapping
 
 logger = logging.getLogger(__name__)
 
@@ -20,67 +21,88 @@ COLLISIONS_RESOURCE = '05deae93-d9fc-4acb-9779-e0942b5e962f'
 SIGNALISATION_RESOURCE = '7f1d4ae9-1a12-46d7-953e-6b9c18c78680'
 
 
-def _get(r, *keys):
-    for k in keys:
-        v = r.get(k)
-        if v is not None and v != '':
-            return v
-    return None
-
-
-def _safe_int(val, default=0):
-    if val is None or val == '':
-        return default
-    try:
-        return int(float(val))
-    except (ValueError, TypeError):
-        return default
-
-
-def _safe_float(val):
-    if val is None or val == '':
-        return None
-    try:
-        return float(val)
-    except (ValueError, TypeError):
-        return None
-
-
-def fetch_collisions():
-    """Fetch collisions routieres Montreal (depuis 2012)."""
+# Correspondances source -> colonnes (utils/mapping.py): alias MAJUSCULES (DataStore / CSV)
+# puis noms de colonnes
+COLLISIONS_MAPPING = compile_mapping({
+    'columns': [
+        ('no_collision', ('NO_COLLISION', 'no_collision'), 'text'),
+        ('date_collision', ('DT_ACCDN', 'date_collision'), 'text'),
+        ('heure_collision', ('HR_ACCDN', 'heure_collision'), 'text'),
+        ('arrondissement', ('ARRONDISSEMENT', 'arrondissement'), 'text'),
+        ('rue1', ('RUE_ACCDN', 'rue1'), 'text'),
+        ('rue2', ('ACCDN_PRES_DE', 'rue2'), 'text'),
+        ('latitude', ('LATITUDE', 'latitude'), 'float'),
+        ('longitude', ('LONGITUDE', 'longitude'), 'float'),
+        ('gravite', ('GRAVITE', 'gravite'), 'text'),
+        ('nombre_deces', ('NB_MORTS', 'nombre_deces'), 'int', 0),
+        ('nombre_blesses_graves', ('NB_BLESSES_GRAVES', 'nombre_blesses_graves'), 'int', 0),
+        ('nombre_blesses_legers', ('NB_BLESSES_LEGERS', 'nombre_blesses_legers'), 'int', 0),
+        ('type_collision', ('TYPE_COLLISION', 'type_collision'), 'text'),
+        ('conditions_meteo', ('CD_COND_METEO', 'conditions_meteo'), 'text'),
+        ('etat_surface', ('CD_ETAT_SURFC', 'etat_surface'), 'text'),
+        ('eclairage', ('CD_ECLRM', 'eclairage'), 'text'),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+ACTES_CRIMINELS_MAPPING = compile_mapping({
+    'columns': [
+        ('categorie', ('CATEGORIE', 'categorie'), 'text'),
+        ('date_evenement', ('DATE', 'date'), 'text'),
+        ('quart', ('QUART', 'quart'), 'text'),
+        ('pdq', ('PDQ', 'pdq'), 'int'),
+        ('arrondissement', ('ARRONDISSEMENT', 'arrondissement'), 'text'),
+        ('latitude', ('LATITUDE', 'latitude'), 'float'),
+        ('longitude', ('LONGITUDE', 'longitude'), 'float'),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+SIGNALISATION_MAPPING = compile_mapping({
+    'columns': [
+        ('panneau_id', ('PANNEAU_ID', 'panneau_id'), 'text'),
+        ('code_rpa', ('CODE_RPA', 'code_rpa'), 'text'),
+        ('description_rpa', ('DESCRIPTION_RPA', 'description_rpa'), 'text'),
+        ('fleche', ('FLECHE', 'fleche'), 'text'),
+        ('latitude', ('LATITUDE', 'latitude'), 'float'),
+        ('longitude', ('LONGITUDE', 'longitude'), 'float'),
+        ('rue', ('RUE', 'rue'), 'text'),
+        ('arrondissement', ('ARRONDISSEMENT', 'arrondissement'), 'text'),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+ESCOUADE_MAPPING = compile_mapping({
+    'columns': [
+        ('date_intervention', ('DATE', 'date_intervention'), 'text'),
+        ('type_intervention', ('TYPE_INTERVENTION', 'type_intervention'), 'text'),
+        ('arrondissement', ('ARRONDISSEMENT', 'arrondissement'), 'text'),
+        ('lieu', ('LIEU', 'lieu'), 'text'),
+        ('latitude', ('LATITUDE', 'latitude'), 'float'),
+        ('longitude', ('LONGITUDE', 'longitude'), 'float'),
+    ],
+    'raw': ('raw_data', 'all'),
+})
+
+
+def fetch_collisions(mode=None):
+    """Fetch collisions routieres Montreal (depuis 2012).
+    mode: 'datastore' ou 'csv' (defaut CKAN_INGEST_MODE)."""
     logger.info("Fetching collisions routieres Montreal...")
-    records = ckan_datastore_fetch_all(MONTREAL_BASE, COLLISIONS_RESOURCE)
-    rows = []
-    for r in records:
-        rows.append((
-            _get(r, 'NO_COLLISION', 'no_collision'),
-            _get(r, 'DT_ACCDN', 'date_collision'),
-            _get(r, 'HR_ACCDN', 'heure_collision'),
-            _get(r, 'ARRONDISSEMENT', 'arrondissement'),
-            _get(r, 'RUE_ACCDN', 'rue1'),
-            _get(r, 'ACCDN_PRES_DE', 'rue2'),
-            _safe_float(_get(r, 'LATITUDE', 'latitude')),
-            _safe_float(_get(r, 'LONGITUDE', 'longitude')),
-            _get(r, 'GRAVITE', 'gravite'),
-            _safe_int(_get(r, 'NB_MORTS', 'nombre_deces')),
-            _safe_int(_get(r, 'NB_BLESSES_GRAVES', 'nombre_blesses_graves')),
-            _safe_int(_get(r, 'NB_BLESSES_LEGERS', 'nombre_blesses_legers')),
-            _get(r, 'TYPE_COLLISION', 'type_collision'),
-            _get(r, 'CD_COND_METEO', 'conditions_meteo'),
-            _get(r, 'CD_ETAT_SURFC', 'etat_surface'),
-            _get(r, 'CD_ECLRM', 'eclairage'),
-            json.dumps(r),
-        ))
-    columns = [
-        'no_collision', 'date_collision', 'heure_collision', 'arrondissement',
-        'rue1', 'rue2', 'latitude', 'longitude', 'gravite',
-        'nombre_deces', 'nombre_blesses_graves', 'nombre_blesses_legers',
-        'type_collision', 'conditions_meteo', 'etat_surface', 'eclairage',
-        'raw_data'
-    ]
-    count = bulk_insert('mtl_collisions', columns, rows, conflict_column='no_collision')
-    log_import('mtl_collisions', 'donnees.montreal.ca', 'ckan_montreal', len(records), count)
-    return count
+    res = ckan_resource_show(MONTREAL_BASE, COLLISIONS_RESOURCE)
+    fp = ckan_fingerprint(MONTREAL_BASE, res)
+    action, _ = resource_plan('mtl_collisions', fp, 'donnees.montreal.ca', 'ckan_montreal')
+    if action == 'skip':
+        return 0
+    records = ckan_resource_records(MONTREAL_BASE, dict(res, id=COLLISIONS_RESOURCE), mode=mode)
+    rows = COLLISIONS_MAPPING.rows(records)
+    columns = COLLISIONS_MAPPING.columns
+    # no_collision unique: une collision republiee (gravite, bilan corrige) est mise a jour
+    charge = staged_load('mtl_collisions', columns, rows, conflict_column='no_collision', update=True,
+                         source_name='mtl_collisions')
+    log_import('mtl_collisions', 'donnees.montreal.ca', 'ckan_montreal', charge['total'], charge['inserted'],
+               records_updated=charge['updated'], metadata={'rejected': charge['rejected']}, fingerprint=fp)
+    return charge['inserted']
 
 
 def fetch_actes_criminels():
@@ -93,56 +115,41 @@ def fetch_actes_criminels():
             continue
         resource_id = res['id']
         try:
-            records = ckan_datastore_fetch_all(MONTREAL_BASE, resource_id)
-            rows = []
-            for r in records:
-                rows.append((
-                    _get(r, 'CATEGORIE', 'categorie'),
-                    _get(r, 'DATE', 'date'),
-                    _get(r, 'QUART', 'quart'),
-                    _safe_int(_get(r, 'PDQ', 'pdq'), default=None),
-                    _get(r, 'ARRONDISSEMENT', 'arrondissement'),
-                    _safe_float(_get(r, 'LATITUDE', 'latitude')),
-                    _safe_float(_get(r, 'LONGITUDE', 'longitude')),
-                    json.dumps(r),
-                ))
-            columns = [
-                'categorie', 'date_evenement', 'quart', 'pdq',
-                'arrondissement', 'latitude', 'longitude', 'raw_data'
-            ]
-            count = bulk_insert('mtl_actes_criminels', columns, rows)
-            total += count
+            # Journal d'evenements: la resource courante ne recoit que des ajouts
+            fp = ckan_fingerprint(MONTREAL_BASE, res)
+            action, debut = resource_plan('mtl_actes_criminels', fp, res.get('url'), 'ckan_montreal',
+                                          append_only=True)
+            if action == 'skip':
+                break
+            records = ckan_datastore_records(MONTREAL_BASE, resource_id, debut=debut)
+            rows = ACTES_CRIMINELS_MAPPING.rows(records)
+            charge = staged_load('mtl_actes_criminels', ACTES_CRIMINELS_MAPPING.columns, rows, source_name='mtl_actes_criminels',
+                                 replace=None if action == 'append' else ('TRUE', ()))
+            log_import('mtl_actes_criminels', res.get('url'), 'ckan_montreal', charge['total'], charge['inserted'],
+                       metadata={'rejected': charge['rejected'], 'action': action}, fingerprint=fp)
+            total += charge['inserted']
             break  # Prendre la resource la plus recente
         except Exception as e:
             logger.error(f"  Error actes criminels: {e}")
-    log_import('mtl_actes_criminels', '', 'ckan_montreal', total, total)
+            log_import('mtl_actes_criminels', res.get('url'), 'ckan_montreal', 0, 0, 'error', str(e))
     return total
 
 
 def fetch_signalisation():
     """Fetch signalisation stationnement sur rue."""
     logger.info("Fetching signalisation stationnement Montreal...")
-    records = ckan_datastore_fetch_all(MONTREAL_BASE, SIGNALISATION_RESOURCE)
-    rows = []
-    for r in records:
-        rows.append((
-            _get(r, 'PANNEAU_ID', 'panneau_id'),
-            _get(r, 'CODE_RPA', 'code_rpa'),
-            _get(r, 'DESCRIPTION_RPA', 'description_rpa'),
-            _get(r, 'FLECHE', 'fleche'),
-            _safe_float(_get(r, 'LATITUDE', 'latitude')),
-            _safe_float(_get(r, 'LONGITUDE', 'longitude')),
-            _get(r, 'RUE', 'rue'),
-            _get(r, 'ARRONDISSEMENT', 'arrondissement'),
-            json.dumps(r),
-        ))
-    columns = [
-        'panneau_id', 'code_rpa', 'description_rpa', 'fleche',
-        'latitude', 'longitude', 'rue', 'arrondissement', 'raw_data'
-    ]
-    count = bulk_insert('mtl_signalisation_stationnement', columns, rows)
-    log_import('mtl_signalisation', '', 'ckan_montreal', len(records), count)
-    return count
+    fp = ckan_fingerprint(MONTREAL_BASE, ckan_resource_show(MONTREAL_BASE, SIGNALISATION_RESOURCE))
+    action, _ = resource_plan('mtl_signalisation', fp, '', 'ckan_montreal')
+    if action == 'skip':
+        return 0
+    records = ckan_datastore_records(MONTREAL_BASE, SIGNALISATION_RESOURCE)
+    rows = SIGNALISATION_MAPPING.rows(records)
+    # Inventaire complet des panneaux: remplace le precedent
+    charge = staged_load('mtl_signalisation_stationnement', SIGNALISATION_MAPPING.columns, rows, source_name='mtl_signalisation',
+                         replace=('TRUE', ()))
+    log_import('mtl_signalisation', '', 'ckan_montreal', charge['total'], charge['inserted'],
+               metadata={'rejected': charge['rejected']}, fingerprint=fp)
+    return charge['inserted']
 
 
 def fetch_escouade():
@@ -155,31 +162,36 @@ def fetch_escouade():
             continue
         resource_id = res['id']
         try:
-            records = ckan_datastore_fetch_all(MONTREAL_BASE, resource_id)
-            rows = []
-            for r in records:
-                rows.append((
-                    _get(r, 'DATE', 'date_intervention'),
-                    _get(r, 'TYPE_INTERVENTION', 'type_intervention'),
-                    _get(r, 'ARRONDISSEMENT', 'arrondissement'),
-                    _get(r, 'LIEU', 'lieu'),
-                    _safe_float(_get(r, 'LATITUDE', 'latitude')),
-                    _safe_float(_get(r, 'LONGITUDE', 'longitude')),
-                    json.dumps(r),
-                ))
-            columns = [
-                'date_intervention', 'type_intervention', 'arrondissement',
-                'lieu', 'latitude', 'longitude', 'raw_data'
-            ]
-            count = bulk_insert('mtl_escouade_mobilite', columns, rows)
-            total += count
+            # Journal d'evenements: la resource courante ne recoit que des ajouts
+            fp = ckan_fingerprint(MONTREAL_BASE, res)
+            action, debut = resource_plan('mtl_escouade_mobilite', fp, res.get('url'), 'ckan_montreal',
+                                          append_only=True)
+            if action == 'skip':
+                break
+            records = ckan_datastore_records(MONTREAL_BASE, resource_id, debut=debut)
+            rows = ESCOUADE_MAPPING.rows(records)
+            charge = staged_load('mtl_escouade_mobilite', ESCOUADE_MAPPING.columns, rows, source_name='mtl_escouade_mobilite',
+                                 replace=None if action == 'append' else ('TRUE', ()))
+            log_import('mtl_escouade_mobilite', res.get('url'), 'ckan_montreal', charge['total'], charge['inserted'],
+                       metadata={'rejected': charge['rejected'], 'action': action}, fingerprint=fp)
+            total += charge['inserted']
             break
         except Exception as e:
             logger.error(f"  Error escouade: {e}")
-    log_import('mtl_escouade_mobilite', '', 'ckan_montreal', total, total)
+            log_import('mtl_escouade_mobilite', res.get('url'), 'ckan_montreal', 0, 0, 'error', str(e))
     return total
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    'after': [],
+    'hosts': [MONTREAL_BASE],
+    'tables': ['mtl_collisions', 'mtl_actes_criminels', 'mtl_signalisation_stationnement',
+               'mtl_escouade_mobilite'],
+}
+
+
 def run():
     """Point d'entree du module Montreal."""
     logger.info("=" * 50)
@@ -10,10 +10,12 @@ Datasets :
 - Collisions SAAQ
 """
 import logging
-import json
+from itertools import chain
 from config import DONNEES_QC_BASE
-from utils.fetcher import ckan_datastore_fetch_all, ckan_get_resources
-from utils.db import bulk_insert, log_import
+from utils.fetcher import ckan_datastore_records, ckan_get_resources, ckan_fingerprint, ckan_resource_records
+from utils.db import staged_load, partition_load, log_import, resource_plan
+from utils.mapping import compile_mapping
+from utils.rollups import refresh_constats_rollups
 
 logger = logging.getLogger(__name__)
 
@@ -23,94 +25,148 @@ RADAR_LIEUX_SLUG = 'radar-photo'
 VEHICULES_SLUG = 'vehicules-en-circulation'
 
 
-def _safe_int(val):
-    """Convertit en int ou None."""
-    if val is None or val == '':
-        return None
-    try:
-        return int(float(val))
-    except (ValueError, TypeError):
-        return None
+# Correspondances source -> colonnes (utils/mapping.py): alias MAJUSCULES (CSV) / minuscules
+CONSTATS_MAPPING = compile_mapping({
+    'columns': [
+        ('annee_donnees', ('ANNEE', 'annee'), 'int'),
+        ('date_infraction', ('DATE_INFRACTION', 'date_infraction'), 'text'),
+        ('heure_infraction', ('HEURE_INFRACTION', 'heure_infraction'), 'text'),
+        ('region', ('REGION', 'region'), 'text'),
+        ('lieu_infraction', ('LIEU_INFRACTION', 'lieu_infraction'), 'text'),
+        ('type_intervention', ('TYPE_INTERVENTION', 'type_intervention'), 'text'),
+        ('loi', ('LOI', 'loi'), 'text'),
+        ('reglement', ('REGLEMENT', 'reglement'), 'text'),
+        ('article', ('ARTICLE', 'article'), 'text'),
+        ('description_infraction', ('DESCRIPTION_INFRACTION', 'description_infraction'), 'text'),
+        ('vitesse_permise', ('VITESSE_PERMISE', 'vitesse_permise'), 'int'),
+        ('vitesse_constatee', ('VITESSE_CONSTATEE', 'vitesse_constatee'), 'int'),
+        ('montant_amende', ('MONTANT_AMENDE', 'montant_amende'), 'float'),
+        ('points_inaptitude', ('POINTS_INAPTITUDE', 'points_inaptitude'), 'int'),
+        ('categorie_vehicule', ('CATEGORIE_VEHICULE', 'categorie_vehicule'), 'text'),
+        ('source_resource_id', '$resource_id', 'raw'),
+    ],
+    'raw': ('raw_data', 'all'),
+})
 
+RADAR_STATS_MAPPING = compile_mapping({
+    'columns': [
+        ('date_rapport', ('DATE_RAPPORT', 'date_rapport'), 'text'),
+        ('type_appareil', ('TYPE_APPAREIL', 'type_appareil'), 'text'),
+        ('localisation', ('LOCALISATION', 'localisation'), 'text'),
+        ('municipalite', ('MUNICIPALITE', 'municipalite'), 'text'),
+        ('route', ('ROUTE', 'route'), 'text'),
+        ('direction', ('DIRECTION', 'direction'), 'text'),
+        ('vitesse_limite', ('VITESSE_LIMITE', 'vitesse_limite'), 'int'),
+        ('nombre_constats', ('NOMBRE_CONSTATS', 'nombre_constats'), 'int'),
+        ('periode', ('PERIODE', 'periode'), 'text'),
+        ('source_resource_id', '$resource_id', 'raw'),
+    ],
+    'raw': ('raw_data', 'all'),
+})
 
-def _safe_float(val):
-    """Convertit en float ou None."""
-    if val is None or val == '':
-        return None
-    try:
-        return float(val)
-    except (ValueError, TypeError):
-        return None
+RADAR_LIEUX_MAPPING = compile_mapping({
+    'columns': [
+        ('type_appareil', ('TYPE_APPAREIL', 'type_appareil'), 'text'),
+        ('municipalite', ('MUNICIPALITE', 'municipalite'), 'text'),
+        ('route', ('ROUTE', 'route'), 'text'),
+        ('emplacement', ('EMPLACEMENT', 'emplacement'), 'text'),
+        ('direction', ('DIRECTION', 'direction'), 'text'),
+        ('vitesse_limite', ('VITESSE_LIMITE', 'vitesse_limite'), 'int'),
+        ('latitude', ('LATITUDE', 'latitude'), 'float'),
+        ('longitude', ('LONGITUDE', 'longitude'), 'float'),
+        ('date_mise_service', ('DATE_MISE_SERVICE', 'date_mise_service'), 'text'),
+        ('actif', None, 'raw', True),
+    ],
+    'raw': ('raw_data', 'all'),
+})
 
+VEHICULES_MAPPING = compile_mapping({
+    'columns': [
+        ('annee', ('ANNEE', 'annee'), 'int'),
+        ('region', ('REGION', 'region'), 'text'),
+        ('type_vehicule', ('TYPE_VEHICULE', 'type_vehicule'), 'text'),
+        ('nombre_vehicules', ('NOMBRE_VEHICULES', 'nombre_vehicules'), 'int'),
+    ],
+    'raw': ('raw_data', 'all'),
+})
 
-def _get(r, *keys):
-    """Recupere la premiere valeur non-None parmi les cles."""
-    for k in keys:
-        v = r.get(k)
-        if v is not None and v != '':
-            return v
-    return None
 
+ANNEE = CONSTATS_MAPPING.columns.index('annee_donnees')
 
-def fetch_constats():
-    """Fetch les constats d'infraction de Controle routier QC (toutes annees)."""
+
+def _noter_annees(rows, annees, position=ANNEE):
+    """Laisse passer les lignes en notant leurs annees (agregats a recalculer)."""
+    for row in rows:
+        annees.add(row[position])
+        yield row
+
+
+def _annee_fichier(rows):
+    """(annee de la premiere ligne, rows intact). Un fichier publie couvre une annee:
+    les lignes d'une autre annee sont refusees par le CHECK de la partition (quarantaine)."""
+    rows = iter(rows)
+    premiere = next(rows, None)
+    if premiere is None:
+        return None, iter(())
+    return premiere[ANNEE], chain([premiere], rows)
+
+
+def fetch_constats(mode=None):
+    """Fetch les constats d'infraction de Controle routier QC (toutes annees).
+    mode: 'datastore' ou 'csv' (defaut CKAN_INGEST_MODE)."""
     logger.info("Fetching constats d'infraction Controle routier QC...")
     resources = ckan_get_resources(DONNEES_QC_BASE, CONSTATS_SLUG)
 
     total_inserted = 0
+    rejected = 0
+    annees = set()
     for res in resources:
         if res.get('format', '').upper() != 'CSV':
             continue
         resource_id = res['id']
         name = res.get('name', resource_id)
         logger.info(f"  Processing resource: {name} ({resource_id})")
+        source = f'qc_constats_{resource_id}'
 
         try:
-            records = ckan_datastore_fetch_all(DONNEES_QC_BASE, resource_id)
-            if not records:
+            # Pas d'ajout seul: un fichier annuel publie est revise sur place (constats
+            # corriges ou retires); toute modification recharge le fichier entier
+            fp = ckan_fingerprint(DONNEES_QC_BASE, res)
+            action, _ = resource_plan(source, fp, res.get('url'), 'ckan_quebec')
+            if action == 'skip':
+                continue
+            records = ckan_resource_records(DONNEES_QC_BASE, res, mode=mode)
+            rows = _noter_annees(CONSTATS_MAPPING.rows(records, resource_id=resource_id), annees)
+            annee, rows = _annee_fichier(rows)
+            if annee is not None:
+                # L'annee entiere dans une partition neuve, bascule atomique
+                charge = partition_load('qc_constats_infraction', 'annee_donnees', annee,
+                                        CONSTATS_MAPPING.columns, rows, source_name=source)
+            else:
+                # Annee inconnue -> partition DEFAULT: remplacement des lignes du resource
+                charge = staged_load('qc_constats_infraction', CONSTATS_MAPPING.columns, rows, source_name=source,
+                                     replace=('source_resource_id = %s', (resource_id,)))
+            log_import(source, res.get('url'), 'ckan_quebec', charge['total'], charge['inserted'],
+                       metadata={'rejected': charge['rejected'], 'action': action}, fingerprint=fp)
+            if not charge['total']:
                 logger.info(f"    No records in DataStore, skipping.")
                 continue
-
-            rows = []
-            for r in records:
-                rows.append((
-                    _safe_int(_get(r, 'ANNEE', 'annee')),
-                    _get(r, 'DATE_INFRACTION', 'date_infraction'),
-                    _get(r, 'HEURE_INFRACTION', 'heure_infraction'),
-                    _get(r, 'REGION', 'region'),
-                    _get(r, 'LIEU_INFRACTION', 'lieu_infraction'),
-                    _get(r, 'TYPE_INTERVENTION', 'type_intervention'),
-                    _get(r, 'LOI', 'loi'),
-                    _get(r, 'REGLEMENT', 'reglement'),
-                    _get(r, 'ARTICLE', 'article'),
-                    _get(r, 'DESCRIPTION_INFRACTION', 'description_infraction'),
-                    _safe_int(_get(r, 'VITESSE_PERMISE', 'vitesse_permise')),
-                    _safe_int(_get(r, 'VITESSE_CONSTATEE', 'vitesse_constatee')),
-                    _safe_float(_get(r, 'MONTANT_AMENDE', 'montant_amende')),
-                    _safe_int(_get(r, 'POINTS_INAPTITUDE', 'points_inaptitude')),
-                    _get(r, 'CATEGORIE_VEHICULE', 'categorie_vehicule'),
-                    json.dumps(r),
-                    resource_id,
-                ))
-
-            columns = [
-                'annee_donnees', 'date_infraction', 'heure_infraction',
-                'region', 'lieu_infraction', 'type_intervention',
-                'loi', 'reglement', 'article', 'description_infraction',
-                'vitesse_permise', 'vitesse_constatee', 'montant_amende',
-                'points_inaptitude', 'categorie_vehicule',
-                'raw_data', 'source_resource_id'
-            ]
-            count = bulk_insert('qc_constats_infraction', columns, rows)
-            total_inserted += count
+            total_inserted += charge['inserted']
+            rejected += charge['rejected']
 
         except Exception as e:
             logger.error(f"    Error processing {name}: {e}")
-            log_import(f'qc_constats_{name}', res.get('url'), 'ckan_quebec', 0, 0, 'error', str(e))
+            log_import(source, res.get('url'), 'ckan_quebec', 0, 0, 'error', str(e))
 
+    echecs = []
+    if annees:
+        _, echecs = refresh_constats_rollups(sorted(annees, key=lambda a: (a is None, a)))
+        if echecs:
+            logger.error(f"  Agregats constats non rafraichis: {echecs}")
     log_import('qc_constats_infraction',
                f'https://www.donneesquebec.ca/recherche/dataset/{CONSTATS_SLUG}',
-               'ckan_quebec', total_inserted, total_inserted)
+               'ckan_quebec', total_inserted, total_inserted,
+               metadata={'rejected': rejected, 'rollups_echecs': echecs})
     return total_inserted
 
 
@@ -119,37 +175,28 @@ def fetch_radar_stats():
     logger.info("Fetching statistiques radar-photo...")
     resources = ckan_get_resources(DONNEES_QC_BASE, RADAR_STATS_SLUG)
     total = 0
+    rejected = 0
     for res in resources:
         if res.get('format', '').upper() != 'CSV':
             continue
         resource_id = res['id']
+        source = f'qc_radar_stats_{resource_id}'
         try:
-            records = ckan_datastore_fetch_all(DONNEES_QC_BASE, resource_id)
-            rows = []
-            for r in records:
-                rows.append((
-                    _get(r, 'DATE_RAPPORT', 'date_rapport'),
-                    _get(r, 'TYPE_APPAREIL', 'type_appareil'),
-                    _get(r, 'LOCALISATION', 'localisation'),
-                    _get(r, 'MUNICIPALITE', 'municipalite'),
-                    _get(r, 'ROUTE', 'route'),
-                    _get(r, 'DIRECTION', 'direction'),
-                    _safe_int(_get(r, 'VITESSE_LIMITE', 'vitesse_limite')),
-                    _safe_int(_get(r, 'NOMBRE_CONSTATS', 'nombre_constats')),
-                    _get(r, 'PERIODE', 'periode'),
-                    json.dumps(r),
-                    resource_id,
-                ))
-            columns = [
-                'date_rapport', 'type_appareil', 'localisation',
-                'municipalite', 'route', 'direction', 'vitesse_limite',
-                'nombre_constats', 'periode', 'raw_data', 'source_resource_id'
-            ]
-            count = bulk_insert('qc_radar_photo_stats', columns, rows)
-            total += count
+            fp = ckan_fingerprint(DONNEES_QC_BASE, res)
+            action, debut = resource_plan(source, fp, res.get('url'), 'ckan_quebec')
+            if action == 'skip':
+                continue
+            records = ckan_datastore_records(DONNEES_QC_BASE, resource_id, debut=debut)
+            rows = RADAR_STATS_MAPPING.rows(records, resource_id=resource_id)
+            charge = staged_load('qc_radar_photo_stats', RADAR_STATS_MAPPING.columns, rows, source_name=source,
+                                 replace=('source_resource_id = %s', (resource_id,)))
+            log_import(source, res.get('url'), 'ckan_quebec', charge['total'], charge['inserted'],
+                       metadata={'rejected': charge['rejected'], 'action': action}, fingerprint=fp)
+            total += charge['inserted']
+            rejected += charge['rejected']
         except Exception as e:
             logger.error(f"  Error radar stats: {e}")
-    log_import('qc_radar_photo_stats', '', 'ckan_quebec', total, total)
+    log_import('qc_radar_photo_stats', '', 'ckan_quebec', total, total, metadata={'rejected': rejected})
     return total
 
 
@@ -158,38 +205,28 @@ def fetch_radar_lieux():
     logger.info("Fetching localisation radars photo...")
     resources = ckan_get_resources(DONNEES_QC_BASE, RADAR_LIEUX_SLUG)
     total = 0
+    rejected = 0
     for res in resources:
         fmt = res.get('format', '').upper()
         if fmt not in ('CSV', 'GEOJSON', 'JSON'):
             continue
         resource_id = res['id']
+        source = f'qc_radar_lieux_{resource_id}'
         try:
-            records = ckan_datastore_fetch_all(DONNEES_QC_BASE, resource_id)
-            rows = []
-            for r in records:
-                rows.append((
-                    _get(r, 'TYPE_APPAREIL', 'type_appareil'),
-                    _get(r, 'MUNICIPALITE', 'municipalite'),
-                    _get(r, 'ROUTE', 'route'),
-                    _get(r, 'EMPLACEMENT', 'emplacement'),
-                    _get(r, 'DIRECTION', 'direction'),
-                    _safe_int(_get(r, 'VITESSE_LIMITE', 'vitesse_limite')),
-                    _safe_float(_get(r, 'LATITUDE', 'latitude')),
-                    _safe_float(_get(r, 'LONGITUDE', 'longitude')),
-                    _get(r, 'DATE_MISE_SERVICE', 'date_mise_service'),
-                    True,
-                    json.dumps(r),
-                ))
-            columns = [
-                'type_appareil', 'municipalite', 'route', 'emplacement',
-                'direction', 'vitesse_limite', 'latitude', 'longitude',
-                'date_mise_service', 'actif', 'raw_data'
-            ]
-            count = bulk_insert('qc_radar_photo_lieux', columns, rows)
-            total += count
+            fp = ckan_fingerprint(DONNEES_QC_BASE, res)
+            action, debut = resource_plan(source, fp, res.get('url'), 'ckan_quebec')
+            if action == 'skip':
+                continue
+            records = ckan_datastore_records(DONNEES_QC_BASE, resource_id, debut=debut)
+            rows = RADAR_LIEUX_MAPPING.rows(records)
+            charge = staged_load('qc_radar_photo_lieux', RADAR_LIEUX_MAPPING.columns, rows, source_name=source)
+            log_import(source, res.get('url'), 'ckan_quebec', charge['total'], charge['inserted'],
+                       metadata={'rejected': charge['rejected'], 'action': action}, fingerprint=fp)
+            total += charge['inserted']
+            rejected += charge['rejected']
         except Exception as e:
             logger.error(f"  Error radar lieux: {e}")
-    log_import('qc_radar_photo_lieux', '', 'ckan_quebec', total, total)
+    log_import('qc_radar_photo_lieux', '', 'ckan_quebec', total, total, metadata={'rejected': rejected})
     return total
 
 
@@ -198,30 +235,40 @@ def fetch_vehicules():
     logger.info("Fetching vehicules en circulation...")
     resources = ckan_get_resources(DONNEES_QC_BASE, VEHICULES_SLUG)
     total = 0
+    rejected = 0
     for res in resources:
         if res.get('format', '').upper() != 'CSV':
             continue
         resource_id = res['id']
+        source = f'qc_vehicules_ds_{resource_id}'
         try:
-            records = ckan_datastore_fetch_all(DONNEES_QC_BASE, resource_id)
-            rows = []
-            for r in records:
-                rows.append((
-                    _safe_int(_get(r, 'ANNEE', 'annee')),
-                    _get(r, 'REGION', 'region'),
-                    _get(r, 'TYPE_VEHICULE', 'type_vehicule'),
-                    _safe_int(_get(r, 'NOMBRE_VEHICULES', 'nombre_vehicules')),
-                    json.dumps(r),
-                ))
-            columns = ['annee', 'region', 'type_vehicule', 'nombre_vehicules', 'raw_data']
-            count = bulk_insert('qc_vehicules_circulation', columns, rows)
-            total += count
+            fp = ckan_fingerprint(DONNEES_QC_BASE, res)
+            action, debut = resource_plan(source, fp, res.get('url'), 'ckan_quebec', append_only=True)
+            if action == 'skip':
+                continue
+            records = ckan_datastore_records(DONNEES_QC_BASE, resource_id, debut=debut)
+            rows = VEHICULES_MAPPING.rows(records)
+            charge = staged_load('qc_vehicules_circulation', VEHICULES_MAPPING.columns, rows, source_name=source)
+            log_import(source, res.get('url'), 'ckan_quebec', charge['total'], charge['inserted'],
+                       metadata={'rejected': charge['rejected'], 'action': action}, fingerprint=fp)
+            total += charge['inserted']
+            rejected += charge['rejected']
         except Exception as e:
             logger.error(f"  Error vehicules: {e}")
-    log_import('qc_vehicules_circulation', '', 'ckan_quebec', total, total)
+    log_import('qc_vehicules_circulation', '', 'ckan_quebec', total, total, metadata={'rejected': rejected})
     return total
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    'after': [],
+    'hosts': [DONNEES_QC_BASE],
+    'tables': ['qc_constats_infraction', 'qc_radar_photo_stats', 'qc_radar_photo_lieux',
+               'qc_vehicules_circulation'],
+}
+
+
 def run():
     """Point d'entree du module Quebec."""
     logger.info("=" * 50)
@@ -8,9 +8,9 @@ import logging
 import json
 import csv
 import io
-import requests
 from collections import Counter
-from utils.db import bulk_insert, log_import
+from utils.fetcher import fetch_if_changed
+from utils.db import staged_load, log_import, last_fingerprint
 
 logger = logging.getLogger(__name__)
 
@@ -66,17 +66,22 @@ def fetch_vehicules():
 
     for year, url in sorted(VEHICULES_CSV_URLS.items()):
         logger.info(f"  Downloading {year} from {url}...")
+        source = f'qc_vehicules_{year}'
         try:
-            resp = requests.get(url, timeout=300, stream=True)
-            resp.raise_for_status()
+            # GET conditionnel (ETag / Last-Modified / sha256 du dernier import)
+            body, fp = fetch_if_changed(url, last_fingerprint(source), timeout=300)
         except Exception as e:
             logger.error(f"  Error downloading {year}: {e}")
-            log_import(f'qc_vehicules_{year}', url, 'ckan_vehicules',
+            log_import(source, url, 'ckan_vehicules',
                        0, 0, 'error', str(e))
             continue
+        if body is None:
+            logger.info(f"    {year}: unchanged since last import, skipping.")
+            log_import(source, url, 'ckan_vehicules', 0, 0, 'unchanged', fingerprint=fp)
+            continue
 
         # Decode CSV (BOM-aware), aggregate by region + type
-        content = resp.content.decode('utf-8-sig')
+        content = body.decode('utf-8-sig')
         reader = csv.DictReader(io.StringIO(content))
 
         # Aggregate: (region, type_vehicule) -> count
@@ -109,18 +114,31 @@ def fetch_vehicules():
 
         if rows:
             columns = ['annee', 'region', 'type_vehicule', 'nombre_vehicules', 'raw_data']
-            count = bulk_insert('qc_vehicules_circulation', columns, rows)
+            # Fichier modifie: les agregats de ce fichier sont remplaces
+            charge = staged_load('qc_vehicules_circulation', columns, rows, source_name=source,
+                                 replace=("raw_data->>'source_url' = %s", (url,)))
+            count = charge['inserted']
             total_inserted += count
             logger.info(f"    {year}: {count} aggregated records inserted.")
-            log_import(f'qc_vehicules_{year}', url, 'ckan_vehicules',
-                       total_lines, count)
+            log_import(source, url, 'ckan_vehicules',
+                       total_lines, count, metadata={'rejected': charge['rejected']}, fingerprint=fp)
         else:
-            log_import(f'qc_vehicules_{year}', url, 'ckan_vehicules',
+            log_import(source, url, 'ckan_vehicules',
                        0, 0, 'warning', 'No rows parsed')
 
     return total_inserted
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    # Meme table que les agregats DataStore de ckan_quebec
+    'after': ['ckan_quebec'],
+    'hosts': list(VEHICULES_CSV_URLS.values()),
+    'tables': ['qc_vehicules_circulation'],
+}
+
+
 def run():
     """Point d'entree du module vehicules en circulation."""
     logger.info("=" * 50)
@@ -8,7 +8,7 @@ import json
 import re
 import requests
 from bs4 import BeautifulSoup
-from utils.db import bulk_insert, log_import
+from utils.db import staged_load, log_import
 
 logger = logging.getLogger(__name__)
 
@@ -115,10 +115,12 @@ def fetch_set_fines():
                 'amende_fixe', 'suramende', 'frais_cour', 'total_payable',
                 'points_inaptitude', 'date_mise_a_jour', 'raw_data'
             ]
-            count = bulk_insert('on_set_fines', columns, rows)
+            charge = staged_load('on_set_fines', columns, rows,
+                                 source_name=f'on_set_fines_{schedule_key}')
+            count = charge['inserted']
             total_inserted += count
             log_import(f'on_set_fines_{schedule_key}', url, 'on_set_fines_import',
-                       len(rows), count)
+                       len(rows), count, metadata={'rejected': charge['rejected']})
         else:
             log_import(f'on_set_fines_{schedule_key}', url, 'on_set_fines_import',
                        0, 0, 'warning', 'No rows parsed')
@@ -126,6 +128,15 @@ def fetch_set_fines():
     return total_inserted
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    'after': [],
+    'hosts': list(SET_FINES_URLS.values()),
+    'tables': ['on_set_fines'],
+}
+
+
 def run():
     """Point d'entree du module Ontario Set Fines."""
     logger.info("=" * 50)
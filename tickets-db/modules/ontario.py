@@ -7,8 +7,8 @@ import logging
 import csv
 import io
 import json
-from utils.fetcher import fetch_csv_url, fetch_json
-from utils.db import bulk_insert, log_import
+from utils.fetcher import fetch_if_changed, fetch_json
+from utils.db import staged_load, log_import, last_fingerprint
 
 logger = logging.getLogger(__name__)
 
@@ -38,8 +38,13 @@ def fetch_opp_traffic():
     """
     logger.info("Fetching Ontario OPP traffic offences...")
     try:
-        content = fetch_csv_url(OPP_TRAFFIC_CSV)
-        lines = content.splitlines()
+        body, fp = fetch_if_changed(OPP_TRAFFIC_CSV, last_fingerprint('on_traffic_offences_opp'))
+        if body is None:
+            logger.info("  OPP CSV unchanged since last import, skipping.")
+            log_import('on_traffic_offences_opp', OPP_TRAFFIC_CSV, 'ontario', 0, 0, 'unchanged',
+                       fingerprint=fp)
+            return 0
+        lines = body.decode('utf-8-sig', errors='replace').splitlines()
         # Skip row 1 (title), use row 2 as header
         if len(lines) < 3:
             logger.error("  CSV too short")
@@ -87,9 +92,12 @@ def fetch_opp_traffic():
             'annee', 'type_infraction', 'nombre_infractions',
             'variation_annuelle', 'source_dataset', 'raw_data'
         ]
-        count = bulk_insert('on_traffic_offences', columns, rows)
+        charge = staged_load('on_traffic_offences', columns, rows, source_name='on_traffic_offences_opp',
+                             replace=('source_dataset = %s', ('opp_traffic_offences',)))
+        count = charge['inserted']
         logger.info(f"  Inserted {count} OPP traffic offences.")
-        log_import('on_traffic_offences_opp', OPP_TRAFFIC_CSV, 'ontario', len(rows), count)
+        log_import('on_traffic_offences_opp', OPP_TRAFFIC_CSV, 'ontario', len(rows), count,
+                   metadata={'rejected': charge['rejected']}, fingerprint=fp)
         return count
     except Exception as e:
         logger.error(f"  Error fetching OPP data: {e}")
@@ -122,6 +130,15 @@ def fetch_toronto_parking():
         log_import('to_parking_tickets', '', 'ontario', 0, 0, 'skipped', str(e))
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    'after': [],
+    'hosts': [OPP_TRAFFIC_CSV, TORONTO_PARKING_CKAN],
+    'tables': ['on_traffic_offences'],
+}
+
+
 def run():
     """Point d'entree du module Ontario."""
     logger.info("=" * 50)
@@ -113,6 +113,15 @@ def import_seed_cases(cases, province):
     return inserted
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    'after': [],
+    'hosts': [],
+    'tables': ['jurisprudence'],
+}
+
+
 def run():
     """Point d'entree du module seed import."""
     logger.info("=" * 50)
@@ -145,6 +145,15 @@ ARTICLES_LOI = [
 ]
 
 
+# Ordonnancement par main.py (utils/scheduler.py): modules prealables, hotes distants,
+# tables ecrites
+SCHEDULE = {
+    'after': [],
+    'hosts': [],
+    'tables': ['ref_jurisprudence_cle', 'lois_articles'],
+}
+
+
 def run():
     """Insere les donnees statiques de reference."""
     logger.info("=" * 50)
@@ -21,16 +21,41 @@ CREATE TABLE IF NOT EXISTS data_source_log (
     completed_at TIMESTAMP,
     status VARCHAR(20) DEFAULT 'running',
     error_message TEXT,
-    metadata JSONB
+    metadata JSONB,
+    fingerprint JSONB
 );
 
+-- Empreinte du resource importe (last_modified, size, rows, etag, hash): un resource
+-- inchange depuis le dernier import n'est pas retelecharge (utils/fetcher.py import_plan)
+ALTER TABLE data_source_log ADD COLUMN IF NOT EXISTS fingerprint JSONB;
+CREATE INDEX IF NOT EXISTS idx_dsl_source_completed ON data_source_log(source_name, completed_at DESC);
+
+-- ============================================================
+-- QUARANTAINE DES IMPORTS
+-- Lignes refusees par le COPY de utils/db.py staged_load()
+-- (type invalide, longueur, caractere NUL...), une ligne JSONB par rejet
+-- ============================================================
+CREATE TABLE IF NOT EXISTS import_quarantaine (
+    id SERIAL PRIMARY KEY,
+    table_cible VARCHAR(100) NOT NULL,
+    source_name VARCHAR(100),
+    ligne JSONB,
+    erreur TEXT,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_quarantaine_table ON import_quarantaine(table_cible, created_at);
+
 -- ============================================================
 -- QUEBEC : CONSTATS D'INFRACTION (Controle routier QC)
 -- Source : donneesquebec.ca - SAAQ
 -- Dataset ID : 6b794b52-c074-4064-bfb4-61a9e1fc2d6f
 -- ============================================================
+-- Partitionnee par annee (LIST annee_donnees): qc_constats_infraction_p<annee>, creees par
+-- les imports (utils/db.py: partition_load, bascule atomique d'une annee) + DEFAULT.
+-- Pas de PRIMARY KEY globale (devrait contenir la cle de partition); id unique par sequence.
 CREATE TABLE IF NOT EXISTS qc_constats_infraction (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     annee_donnees INTEGER,
     date_infraction DATE,
     heure_infraction TIME,
@@ -53,15 +78,60 @@ CREATE TABLE IF NOT EXISTS qc_constats_infraction (
     tsv tsvector GENERATED ALWAYS AS (
         to_tsvector('french', COALESCE(description_infraction,'') || ' ' || COALESCE(lieu_infraction,'') || ' ' || COALESCE(region,''))
     ) STORED
-);
-
+) PARTITION BY LIST (annee_donnees);
+
+-- Partition DEFAULT: seulement si la table est deja partitionnee. Une base anterieure garde
+-- sa table ordinaire (CREATE TABLE IF NOT EXISTS ci-dessus sans effet) jusqu'a la migration
+-- db/migrate_constats_partitions.sql; ce schema, execute a chaque import, ne doit pas echouer.
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = 'qc_constats_infraction'::regclass) = 'p' THEN
+        CREATE TABLE IF NOT EXISTS qc_constats_infraction_defaut
+            PARTITION OF qc_constats_infraction DEFAULT;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_qc_constats_id ON qc_constats_infraction(id);
 CREATE INDEX IF NOT EXISTS idx_qc_constats_date ON qc_constats_infraction(date_infraction);
 CREATE INDEX IF NOT EXISTS idx_qc_constats_article ON qc_constats_infraction(article);
 CREATE INDEX IF NOT EXISTS idx_qc_constats_region ON qc_constats_infraction(region);
-CREATE INDEX IF NOT EXISTS idx_qc_constats_annee ON qc_constats_infraction(annee_donnees);
+CREATE INDEX IF NOT EXISTS idx_qc_constats_lieu_date ON qc_constats_infraction(lieu_infraction, date_infraction);
 CREATE INDEX IF NOT EXISTS idx_qc_constats_vitesse ON qc_constats_infraction(vitesse_permise, vitesse_constatee);
 CREATE INDEX IF NOT EXISTS idx_qc_constats_tsv ON qc_constats_infraction USING GIN(tsv);
 
+-- Agregats quotidiens (utils/rollups.py: refresh_constats_rollups, par annee apres chaque import).
+-- Lus par les detecteurs blitz_daily / pattern_jour_semaine, ErreursAdmin et /api/day-patterns.
+-- Lieu inconnu -> '', heure inconnue -> NULL, constats sans date exclus.
+CREATE TABLE IF NOT EXISTS qc_constats_jour (
+    annee_donnees INTEGER,
+    lieu_infraction TEXT NOT NULL,
+    date_infraction DATE NOT NULL,
+    nb INTEGER NOT NULL,
+    nb_agents INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS qc_constats_jour_article (
+    annee_donnees INTEGER,
+    lieu_infraction TEXT NOT NULL,
+    date_infraction DATE NOT NULL,
+    article VARCHAR(50) NOT NULL,
+    nb INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS qc_constats_semaine_heure (
+    annee_donnees INTEGER,
+    lieu_infraction TEXT NOT NULL,
+    jour_semaine SMALLINT NOT NULL,     -- 0 = dimanche (EXTRACT DOW)
+    heure SMALLINT,                     -- NULL: heure inconnue
+    nb INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_qc_constats_jour_lieu ON qc_constats_jour(lieu_infraction, date_infraction);
+CREATE INDEX IF NOT EXISTS idx_qc_constats_jour_annee ON qc_constats_jour(annee_donnees);
+CREATE INDEX IF NOT EXISTS idx_qc_constats_jour_article_lieu ON qc_constats_jour_article(lieu_infraction, article);
+CREATE INDEX IF NOT EXISTS idx_qc_constats_jour_article_annee ON qc_constats_jour_article(annee_donnees);
+CREATE INDEX IF NOT EXISTS idx_qc_constats_semaine_heure_annee ON qc_constats_semaine_heure(annee_donnees);
+
 -- ============================================================
 -- QUEBEC : STATISTIQUES RADAR PHOTO
 -- Source : donneesquebec.ca
@@ -327,6 +397,28 @@ CREATE TABLE IF NOT EXISTS jurisprudence_legislation (
 
 CREATE INDEX IF NOT EXISTS idx_legis_case ON jurisprudence_legislation(case_canlii_id);
 
+-- ============================================================
+-- ARTICLES CITES PAR LA JURISPRUDENCE
+-- Index (loi, article) extrait de titre/resume/mots_cles/lois_pertinentes
+-- Remplace les ILIKE '%art. N%' (scan complet) par une sonde B-tree
+-- Rempli par classifier.py / python3 -m agents.article_citations
+-- ============================================================
+CREATE TABLE IF NOT EXISTS jurisprudence_articles (
+    jurisprudence_id INTEGER NOT NULL REFERENCES jurisprudence(id) ON DELETE CASCADE,
+    loi VARCHAR(20) NOT NULL DEFAULT '',
+    article VARCHAR(30) NOT NULL,
+    article_base VARCHAR(30) NOT NULL,
+    champ VARCHAR(30),
+    PRIMARY KEY (jurisprudence_id, loi, article)
+);
+
+CREATE INDEX IF NOT EXISTS idx_jur_articles_article ON jurisprudence_articles(article, loi);
+CREATE INDEX IF NOT EXISTS idx_jur_articles_base ON jurisprudence_articles(article_base, loi);
+
+ALTER TABLE jurisprudence ADD COLUMN IF NOT EXISTS article_csr VARCHAR(50);
+ALTER TABLE jurisprudence ADD COLUMN IF NOT EXISTS articles_indexes_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_jur_articles_a_indexer ON jurisprudence(id) WHERE articles_indexes_at IS NULL;
+
 -- ============================================================
 -- LOIS ET ARTICLES (CSR + HTA + Code criminel)
 -- Texte complet des articles
@@ -452,6 +544,40 @@ CREATE TABLE IF NOT EXISTS analyses_completes (
 CREATE INDEX IF NOT EXISTS idx_analyses_uuid ON analyses_completes(dossier_uuid);
 CREATE INDEX IF NOT EXISTS idx_analyses_date ON analyses_completes(created_at);
 
+-- ============================================================
+-- CACHE OCR (photos de constats deja lues)
+-- Cle: sha256 du derive "ocr", sinon dHash 256 bits le plus proche
+-- Voir agents/agent_ocr.py et db/migrate_ocr_cache.sql
+-- ============================================================
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    id SERIAL PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL UNIQUE,
+    phash CHAR(64) NOT NULL,
+    ratio REAL NOT NULL,
+    portee VARCHAR(80),
+    moteur VARCHAR(20),
+    resultat JSONB NOT NULL,
+    hits INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    last_hit_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ocr_cache_portee ON ocr_cache(portee, ratio);
+
+-- ============================================================
+-- CACHE ANALYSE PHOTOS DE PREUVE (Qwen-VL)
+-- Cle: sha256 du derive "vision" + contexte du ticket (agents/agent_photo_analyse.py)
+-- ============================================================
+CREATE TABLE IF NOT EXISTS photo_analyses_cache (
+    sha256 CHAR(64) NOT NULL,
+    contexte CHAR(16) NOT NULL,
+    resultat JSONB NOT NULL,
+    hits INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    last_hit_at TIMESTAMP,
+    PRIMARY KEY (sha256, contexte)
+);
+
 -- ============================================================
 -- AGENT RUNS (telemetrie des agents)
 -- ============================================================
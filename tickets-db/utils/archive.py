@@ -0,0 +1,166 @@
+"""
+Archive froide des enregistrements sources complets (raw_data), en colonnes compressees.
+
+    <RAW_ARCHIVE_DIR>/<source>/<annee>/<premier id>-<dernier id>-<ecriture>.zip
+
+Un segment = un zip LZMA avec un membre JSON par champ source: les valeurs d'un meme
+champ se suivent (codes, dates, municipalites repetes: tres bon taux de compression)
+et un lecteur ne decompresse que les champs demandes.
+    _meta.json   {"source", "annee", "lignes", "champs": [...], "absents": {i: [positions]}, "cree"}
+    _id.json     id de chaque ligne dans la table source (ordre croissant)
+    c/<i>.json   valeurs du champ champs[i] (null aussi pour un champ absent: voir absents)
+
+    write_segment('qc_constats_infraction', 2021, ids, records)
+    for id_, record in read_records('qc_constats_infraction', 2021, ids=[1234]):   # audit
+        ...
+    for id_, record in read_records('mtl_collisions'):                             # re-import
+        ...
+
+Segment nomme par sa plage d'ids et son instant d'ecriture: une ecriture ne remplace
+jamais un segment existant, meme de plage identique (lignes re-archivees, reecriture par
+prune_segment). Une ligne ecrite deux fois (reprise apres arret entre l'ecriture et la
+compaction en base, ligne republiee puis re-archivee) et les lignes remplacees en base
+(annee rechargee, resource recharge) sont retirees des anciens segments par prune_segment().
+Stdlib seulement (zipfile + lzma).
+"""
+import json
+import os
+import zipfile
+from datetime import datetime
+
+from config import RAW_ARCHIVE_DIR
+
+SANS_ANNEE = 'sans_annee'
+
+
+def segment_dir(source, year=None):
+    return os.path.join(RAW_ARCHIVE_DIR, source, str(year) if year is not None else SANS_ANNEE)
+
+
+def _nouveau_chemin(dossier, ids):
+    """Chemin libre pour la plage d'ids (suffixe: instant d'ecriture, puis compteur)."""
+    base = f"{ids[0]:010d}-{ids[-1]:010d}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    chemin = os.path.join(dossier, f"{base}.zip")
+    n = 0
+    while os.path.exists(chemin):
+        n += 1
+        chemin = os.path.join(dossier, f"{base}_{n}.zip")
+    return chemin
+
+
+def write_segment(source, year, ids, records):
+    """Ecrit un segment (ids croissants, records: dicts raw_data) -> chemin du fichier."""
+    if not ids:
+        return None
+    champs = []
+    index = {}
+    for r in records:
+        for k in r:
+            if k not in index:
+                index[k] = len(champs)
+                champs.append(k)
+    colonnes = [[] for _ in champs]
+    absents = {}
+    for pos, r in enumerate(records):
+        for i, k in enumerate(champs):
+            if k in r:
+                colonnes[i].append(r[k])
+            else:
+                colonnes[i].append(None)
+                absents.setdefault(i, []).append(pos)
+
+    dossier = segment_dir(source, year)
+    os.makedirs(dossier, exist_ok=True)
+    chemin = _nouveau_chemin(dossier, ids)
+    tmp = f"{chemin}.{os.getpid()}.tmp"
+    meta = {'source': source, 'annee': year, 'lignes': len(ids), 'champs': champs,
+            'absents': absents, 'cree': datetime.now().isoformat(timespec='seconds')}
+    with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_LZMA) as z:
+        z.writestr('_meta.json', json.dumps(meta, ensure_ascii=False))
+        z.writestr('_id.json', json.dumps(ids))
+        for i, valeurs in enumerate(colonnes):
+            z.writestr(f'c/{i}.json', json.dumps(valeurs, ensure_ascii=False, default=str))
+    with open(tmp, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, chemin)
+    return chemin
+
+
+def segments(source, year=None):
+    """Segments d'une source (d'une annee) -> [(annee, chemin, premier id, dernier id)]."""
+    base = os.path.join(RAW_ARCHIVE_DIR, source)
+    if not os.path.isdir(base):
+        return []
+    annees = [os.path.basename(segment_dir(source, year))] if year is not None else sorted(os.listdir(base))
+    out = []
+    for a in annees:
+        dossier = os.path.join(base, a)
+        if not os.path.isdir(dossier):
+            continue
+        for nom in sorted(os.listdir(dossier)):
+            if not nom.endswith('.zip'):
+                continue
+            premier, dernier = (int(x) for x in nom[:-4].split('-')[:2])
+            out.append((None if a == SANS_ANNEE else int(a), os.path.join(dossier, nom), premier, dernier))
+    return out
+
+
+def read_segment(path, fields=None):
+    """Lecture en colonnes -> (ids, {champ: valeurs}, meta); fields limite les champs
+    decompresses. Un champ absent d'un enregistrement vaut None dans sa colonne (meta['absents'])."""
+    with zipfile.ZipFile(path) as z:
+        meta = json.loads(z.read('_meta.json'))
+        ids = json.loads(z.read('_id.json'))
+        colonnes = {}
+        for i, champ in enumerate(meta['champs']):
+            if fields is None or champ in fields:
+                colonnes[champ] = json.loads(z.read(f'c/{i}.json'))
+    return ids, colonnes, meta
+
+
+def segment_ids(path):
+    """Ids d'un segment (sans decompresser les champs)."""
+    with zipfile.ZipFile(path) as z:
+        return json.loads(z.read('_id.json'))
+
+
+def _segment_records(path, fields=None, voulus=None):
+    seg_ids, colonnes, meta = read_segment(path, fields)
+    absents = {meta['champs'][int(i)]: set(pos) for i, pos in meta['absents'].items()}
+    noms = list(colonnes)
+    valeurs = [colonnes[c] for c in noms]
+    for pos, id_ in enumerate(seg_ids):
+        if voulus is not None and id_ not in voulus:
+            continue
+        yield id_, {c: v[pos] for c, v in zip(noms, valeurs)
+                    if c not in absents or pos not in absents[c]}
+
+
+def read_records(source, year=None, fields=None, ids=None):
+    """(id, raw_data) des segments d'une source, enregistrements reconstitues a l'identique
+    (champs absents omis). fields: sous-ensemble des champs; ids: seulement ces lignes
+    (les segments hors de leur plage ne sont pas ouverts)."""
+    voulus = set(ids) if ids is not None else None
+    for _, chemin, premier, dernier in segments(source, year):
+        if voulus is not None and not any(premier <= i <= dernier for i in voulus):
+            continue
+        yield from _segment_records(chemin, fields, voulus)
+
+
+def prune_segment(source, year, path, keep):
+    """Ne garde dans un segment que les ids de keep: segment supprime s'il n'en reste
+    aucun, reecrit sous un nouveau nom sinon. Retourne le nombre d'ids retires."""
+    ids = segment_ids(path)
+    gardes = [i for i in ids if i in keep]
+    if len(gardes) == len(ids):
+        return 0
+    if gardes:
+        records = dict(_segment_records(path, voulus=set(gardes)))
+        write_segment(source, year, gardes, [records[i] for i in gardes])
+    os.remove(path)
+    return len(ids) - len(gardes)
+
+
+def archive_size(source):
+    """Octets occupes sur disque par les segments d'une source."""
+    return sum(os.path.getsize(chemin) for _, chemin, _, _ in segments(source))
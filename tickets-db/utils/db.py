@@ -1,11 +1,15 @@
 """
-Helpers PostgreSQL : connexion, bulk insert, logging des imports.
+Helpers PostgreSQL : connexion, chargement en masse (COPY + staging), logging des imports.
 """
 import psycopg2
 import psycopg2.extras
+import io
 import json
 import logging
+import re
+from itertools import islice
 from config import DB_CONFIG
+from utils.fetcher import import_plan
 
 logger = logging.getLogger(__name__)
 
@@ -27,43 +31,237 @@ def execute_schema(schema_file='schema.sql'):
     logger.info("Schema cree/mis a jour avec succes.")
 
 
-def bulk_insert(table, columns, rows, conflict_column=None):
+COPY_CHUNK = 5000          # lignes par COPY (un SAVEPOINT par bloc)
+
+
+def _copy_value(v):
+    """Valeur Python -> champ COPY (format text)."""
+    if v is None:
+        return '\\N'
+    if isinstance(v, bool):
+        return 't' if v else 'f'
+    if isinstance(v, (dict, list)):
+        v = json.dumps(v)
+    return (str(v).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _copy_buffer(rows):
+    return io.StringIO(''.join('\t'.join(_copy_value(v) for v in row) + '\n' for row in rows))
+
+
+def _copy_chunk(cur, staging, cols, chunk, rejected):
+    """COPY d'un bloc dans la table de staging. Si le bloc est refuse (type, longueur,
+    caractere NUL, NOT NULL, CHECK...), reprise ligne par ligne: les lignes invalides vont dans rejected."""
+    cur.execute("SAVEPOINT copy_bloc")
+    try:
+        cur.copy_expert(f"COPY {staging} ({cols}) FROM STDIN", _copy_buffer(chunk))
+        cur.execute("RELEASE SAVEPOINT copy_bloc")
+        return
+    except psycopg2.Error:
+        cur.execute("ROLLBACK TO SAVEPOINT copy_bloc")
+    for row in chunk:
+        cur.execute("SAVEPOINT copy_ligne")
+        try:
+            cur.copy_expert(f"COPY {staging} ({cols}) FROM STDIN", _copy_buffer([row]))
+            cur.execute("RELEASE SAVEPOINT copy_ligne")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT copy_ligne")
+            rejected.append((row, str(e).strip().split('\n')[0]))
+
+
+def _quarantine(cur, table, source_name, columns, rejected):
+    """Lignes refusees -> import_quarantaine (une ligne JSONB par rejet)."""
+    values = []
+    for row, error in rejected:
+        ligne = json.dumps(dict(zip(columns, row)), default=str).replace('\\u0000', '')
+        values.append((table, source_name, ligne, error))
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO import_quarantaine (table_cible, source_name, ligne, erreur)
+        VALUES %s
+    """, values)
+
+
+def _creer_staging(cur, staging, table, columns):
+    """Table de staging temporaire LIKE table: memes types, NOT NULL et CHECK, pour que
+    les lignes qui echoueraient a la fusion soient refusees des le COPY (quarantaine) au
+    lieu de faire echouer tout le lot. Les colonnes hors columns (id serial, defauts)
+    restent NULL dans le staging: leur NOT NULL est retire, la fusion ne les lit pas."""
+    cur.execute(f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING CONSTRAINTS) ON COMMIT DROP")
+    cur.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attnotnull
+    """, (staging,))
+    for (col,) in cur.fetchall():
+        if col not in columns:
+            cur.execute(f"ALTER TABLE {staging} ALTER COLUMN {col} DROP NOT NULL")
+
+
+def staged_load(table, columns, rows, conflict_column=None, update=False, source_name=None,
+                replace=None):
     """
-    Insert en masse.
-    Si conflict_column est defini, fait ON CONFLICT DO NOTHING sur cette colonne.
+    Chargement en masse par COPY :
+      1. table de staging temporaire (non journalisee, privee a la session) avec
+         les types et les contraintes NOT NULL / CHECK des colonnes cibles
+      2. COPY FROM STDIN par blocs de COPY_CHUNK lignes (rows peut etre un generateur);
+         lignes invalides (type, NOT NULL, CHECK) -> import_quarantaine
+      3. fusion en une seule requete INSERT ... SELECT ... ON CONFLICT
+    Si conflict_column est defini: ON CONFLICT (conflict_column) DO NOTHING, ou DO UPDATE
+    si update=True (derniere occurrence gagnante en cas de doublon dans le lot).
+    replace=(where_sql, params): les lignes existantes correspondantes sont supprimees
+    juste avant la fusion (rechargement complet d'un resource, meme transaction; rien
+    n'est supprime si rows est vide).
+    Retourne {'total', 'inserted', 'updated', 'rejected', 'ignored', 'replaced'} — total: lignes
+    lues dans rows, ignored: doublons deja presents, replaced: lignes supprimees par replace.
+    Tout se fait dans une transaction: en cas d'erreur de fusion, rien n'est ecrit.
     """
-    if not rows:
-        return 0
+    stats = {'total': 0, 'inserted': 0, 'updated': 0, 'rejected': 0, 'ignored': 0, 'replaced': 0}
+    if update and not conflict_column:
+        raise ValueError("staged_load: update=True exige conflict_column")
+
+    cols = ', '.join(columns)
+    staging = f"_stg_{table}"
+    if conflict_column and update:
+        maj = ', '.join(f"{c} = EXCLUDED.{c}" for c in columns if c != conflict_column)
+        # ON CONFLICT DO UPDATE refuse de toucher deux fois la meme ligne: une seule
+        # occurrence par cle (la derniere chargee); les cles NULL ne sont jamais en conflit
+        select = (f"SELECT {cols} FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY {conflict_column} "
+                  f"ORDER BY ctid DESC) AS _rang FROM {staging}) s "
+                  f"WHERE _rang = 1 OR {conflict_column} IS NULL")
+        conflict = f"ON CONFLICT ({conflict_column}) DO UPDATE SET {maj}"
+    else:
+        select = f"SELECT {cols} FROM {staging}"
+        conflict = f"ON CONFLICT ({conflict_column}) DO NOTHING" if conflict_column else "ON CONFLICT DO NOTHING"
 
     conn = get_connection()
+    total = 0
+    rejected = []
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                _creer_staging(cur, staging, table, columns)
+                it = iter(rows)
+                while True:
+                    chunk = list(islice(it, COPY_CHUNK))
+                    if not chunk:
+                        break
+                    total += len(chunk)
+                    _copy_chunk(cur, staging, cols, chunk, rejected)
+                if not total:
+                    return stats
+                if rejected:
+                    _quarantine(cur, table, source_name, columns, rejected)
+                if replace:
+                    cur.execute(f"DELETE FROM {table} WHERE {replace[0]}", replace[1])
+                    stats['replaced'] = cur.rowcount
+                # xmax = 0: ligne creee par cet INSERT; sinon ligne existante mise a jour
+                cur.execute(f"""
+                    WITH fusion AS (
+                        INSERT INTO {table} ({cols}) {select}
+                        {conflict}
+                        RETURNING (xmax = 0) AS insere
+                    )
+                    SELECT COUNT(*) FILTER (WHERE insere), COUNT(*) FILTER (WHERE NOT insere) FROM fusion
+                """)
+                stats['inserted'], stats['updated'] = cur.fetchone()
+    finally:
+        conn.close()
+
+    stats['total'] = total
+    stats['rejected'] = len(rejected)
+    stats['ignored'] = total - stats['inserted'] - stats['updated'] - stats['rejected']
+    logger.info(f"  {table}: {total} rows -> {stats['inserted']} inserted, {stats['updated']} updated, "
+                f"{stats['ignored']} ignored, {stats['rejected']} rejected"
+                + (f", {stats['replaced']} replaced." if replace else "."))
+    return stats
+
+
+def _partition_indexes(cur, table, partition):
+    """CREATE INDEX de chaque index du parent partitionne, cibles sur partition. Construits
+    apres le COPY (une passe) au lieu d'etre maintenus ligne par ligne; ATTACH les
+    rattache ensuite aux index du parent sans les reconstruire."""
+    cur.execute("SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass", (table,))
+    return [re.sub(r'^CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+',
+                   lambda m: f"CREATE {m.group(1) or ''}INDEX ON {partition}", d)
+            for (d,) in cur.fetchall()]
+
+
+def partition_load(table, key_column, value, columns, rows, source_name=None):
+    """
+    Remplacement atomique d'une partition LIST complete (ex: une annee de constats):
+      1. table neuve (LIKE parent: defauts, sequence, colonnes generees, NOT NULL et CHECK) avec
+         CHECK (key_column = value); COPY par blocs de COPY_CHUNK lignes, lignes invalides
+         ou hors valeur -> import_quarantaine
+      2. index du parent construits sur la table chargee, ANALYZE
+      3. bascule: DETACH + DROP de l'ancienne partition <table>_p<value> (et des lignes
+         de la valeur egarees dans la partition DEFAULT), ATTACH de la neuve (sans re-scan
+         grace au CHECK), renommage
+    Une seule transaction: les lecteurs voient l'ancienne partition ou la nouvelle, jamais
+    une annee a moitie chargee; le verrou exclusif sur le parent n'est pris qu'a la bascule.
+    rows vide: rien n'est remplace.
+    Retourne {'total', 'inserted', 'rejected', 'replaced'}.
+    """
+    stats = {'total': 0, 'inserted': 0, 'rejected': 0, 'replaced': 0}
     cols = ', '.join(columns)
-    placeholders = ', '.join(['%s'] * len(columns))
+    partition = f"{table}_p{value}"
+    neuve = f"{partition}_neuve"
 
-    if conflict_column:
-        sql = f"INSERT INTO {table} ({cols}) VALUES ({placeholders}) ON CONFLICT ({conflict_column}) DO NOTHING"
-    else:
-        sql = f"INSERT INTO {table} ({cols}) VALUES ({placeholders}) ON CONFLICT DO NOTHING"
+    conn = get_connection()
+    rejected = []
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {neuve}")
+                cur.execute(f"CREATE TABLE {neuve} (LIKE {table} INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING CONSTRAINTS)")
+                cur.execute(f"ALTER TABLE {neuve} ADD CONSTRAINT {neuve}_cle "
+                            f"CHECK ({key_column} IS NOT NULL AND {key_column} = %s)", (value,))
+                it = iter(rows)
+                while True:
+                    chunk = list(islice(it, COPY_CHUNK))
+                    if not chunk:
+                        break
+                    stats['total'] += len(chunk)
+                    _copy_chunk(cur, neuve, cols, chunk, rejected)
+                if not stats['total']:
+                    conn.rollback()
+                    return stats
+                if rejected:
+                    _quarantine(cur, table, source_name, columns, rejected)
+                for ddl in _partition_indexes(cur, table, neuve):
+                    cur.execute(ddl)
+                cur.execute(f"ANALYZE {neuve}")
 
-    inserted = 0
-    with conn:
-        with conn.cursor() as cur:
-            for batch_start in range(0, len(rows), 1000):
-                batch = rows[batch_start:batch_start + 1000]
-                for row in batch:
-                    try:
-                        cur.execute(sql, row)
-                        inserted += cur.rowcount
-                    except psycopg2.IntegrityError:
-                        conn.rollback()
-                        continue
-                    except psycopg2.Error as e:
-                        logger.warning(f"Insert error in {table}: {e}")
-                        conn.rollback()
-                        continue
+                # Bascule
+                cur.execute("SELECT to_regclass(%s)", (partition,))
+                if cur.fetchone()[0]:
+                    cur.execute(f"SELECT COUNT(*) FROM {partition}")
+                    stats['replaced'] = cur.fetchone()[0]
+                    cur.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+                    cur.execute(f"DROP TABLE {partition}")
+                cur.execute("""
+                    SELECT c.oid::regclass::text FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = %s::regclass AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'
+                """, (table,))
+                defaut = cur.fetchone()
+                if defaut:
+                    cur.execute(f"DELETE FROM {defaut[0]} WHERE {key_column} = %s", (value,))
+                    stats['replaced'] += cur.rowcount
+                cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {neuve} FOR VALUES IN (%s)", (value,))
+                cur.execute(f"ALTER TABLE {neuve} RENAME TO {partition}")
+                cur.execute(f"ALTER TABLE {partition} RENAME CONSTRAINT {neuve}_cle TO {partition}_cle")
+    finally:
+        conn.close()
 
-    conn.close()
-    logger.info(f"  {table}: {inserted}/{len(rows)} rows inserted.")
-    return inserted
+    stats['rejected'] = len(rejected)
+    stats['inserted'] = stats['total'] - stats['rejected']
+    logger.info(f"  {partition}: {stats['total']} rows -> {stats['inserted']} loaded, "
+                f"{stats['rejected']} rejected, {stats['replaced']} replaced (partition swap).")
+    return stats
+
+
+def bulk_insert(table, columns, rows, conflict_column=None):
+    """Compatibilite: staged_load() sans mise a jour, retourne le nombre de lignes inserees."""
+    return staged_load(table, columns, rows, conflict_column)['inserted']
 
 
 def bulk_insert_fast(table, columns, rows):
@@ -129,17 +327,52 @@ def get_table_counts():
     return counts
 
 
+# Statuts data_source_log d'un import termine: 'success' (modules tickets-db), 'done'
+# (scripts autonomes a la racine), 'unchanged' (resource inchange, empreinte notee)
+STATUTS_TERMINES = ['success', 'done', 'unchanged']
+
+
 def log_import(source_name, source_url, module_name, records_fetched, records_inserted,
-               status='success', error_message=None, metadata=None):
-    """Log un import dans data_source_log."""
+               status='success', error_message=None, metadata=None, records_updated=0,
+               fingerprint=None):
+    """Log un import dans data_source_log (fingerprint: voir utils.fetcher.import_plan)."""
     conn = get_connection()
     with conn:
         with conn.cursor() as cur:
             cur.execute("""
                 INSERT INTO data_source_log
                 (source_name, source_url, module_name, records_fetched, records_inserted,
-                 status, error_message, completed_at, metadata)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), %s)
+                 records_updated, status, error_message, completed_at, metadata, fingerprint)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s, %s)
             """, (source_name, source_url, module_name, records_fetched, records_inserted,
-                  status, error_message, json.dumps(metadata) if metadata else None))
+                  records_updated, status, error_message, json.dumps(metadata) if metadata else None,
+                  json.dumps(fingerprint) if fingerprint else None))
     conn.close()
+
+
+def last_fingerprint(source_name):
+    """Empreinte du dernier import reussi (ou constate inchange) de cette source, sinon None."""
+    try:
+        rows = execute_query("""
+            SELECT fingerprint FROM data_source_log
+            WHERE source_name = %s AND status = ANY(%s) AND fingerprint IS NOT NULL
+            ORDER BY completed_at DESC NULLS LAST LIMIT 1
+        """, (source_name, STATUTS_TERMINES))
+    except psycopg2.Error as e:
+        logger.warning(f"last_fingerprint({source_name}): {e}")
+        return None
+    return rows[0]['fingerprint'] if rows else None
+
+
+def resource_plan(source_name, fingerprint, source_url, module_name, append_only=False):
+    """
+    import_plan() contre la derniere empreinte de la source -> (action, offset).
+    Un resource inchange est journalise ici ('unchanged', avec son empreinte).
+    """
+    action, offset = import_plan(last_fingerprint(source_name), fingerprint, append_only)
+    if action == 'skip':
+        logger.info(f"  {source_name}: unchanged since last import, skipped.")
+        log_import(source_name, source_url, module_name, 0, 0, 'unchanged', fingerprint=fingerprint)
+    elif action == 'append':
+        logger.info(f"  {source_name}: {fingerprint.get('rows')} rows (was {offset}), importing new rows only.")
+    return action, offset
@@ -1,56 +1,249 @@
 """
-HTTP fetch avec retry, rate limiting et pagination CKAN.
+HTTP fetch avec retry, politesse par hote et pagination CKAN.
+  - session HTTP partagee (keep-alive, pool de connexions par hote)
+  - politesse par hote: HOST_MAX_CONCURRENT requetes en vol, REQUEST_DELAY entre deux departs
+  - DataStore: la premiere page donne `total`, les offsets suivants sont telecharges
+    en parallele (CKAN_PARALLEL pages en vol) et rendus dans l'ordre
+  - Reprise: offsets notes apres chaque commit, un import interrompu repart de la
+  - Empreintes de resources (last_modified, taille, lignes, ETag, sha256): un resource
+    inchange depuis le dernier import n'est pas retelecharge (import_plan)
+  - Dumps CSV: le fichier complet d'un resource lu en flux (csv_records), memes dicts
+    que le DataStore, pour les gros resources (CKAN_INGEST_MODE='csv')
+
+    reprise = Reprise()
+    cle = f'constats_{resource_id}'
+    for offset, records in ckan_datastore_pages(base_url, resource_id, debut=reprise.offset(cle)):
+        ... insert + commit ...
+        reprise.noter(cle, offset + len(records))
+    reprise.terminer(cle)
+
+base_url est un parametre partout: un faux CKAN local (http://127.0.0.1:port/api/3/action)
+suffit pour tester.
 """
-import requests
-import time
+import csv
+import hashlib
+import io
+import json
 import logging
-from config import REQUEST_DELAY, MAX_RETRIES
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (REQUEST_DELAY, MAX_RETRIES, HOST_MAX_CONCURRENT, CKAN_PARALLEL, CKAN_RESUME_FILE,
+                    CKAN_INGEST_MODE)
 
 logger = logging.getLogger(__name__)
 
+_session = None
+_hotes = {}
+_verrou = threading.Lock()
+
+
+class _Hote:
+    """Politesse envers un hote: requetes simultanees bornees, departs espaces."""
+
+    def __init__(self, max_actives):
+        self._actives = threading.BoundedSemaphore(max_actives)
+        self._verrou = threading.Lock()
+        self._prochain = 0.0
+
+    def entrer(self, intervalle):
+        self._actives.acquire()
+        with self._verrou:
+            now = time.monotonic()
+            depart = max(now, self._prochain)
+            self._prochain = depart + intervalle
+        if depart > now:
+            time.sleep(depart - now)
+
+    def sortir(self):
+        self._actives.release()
+
+
+def get_session():
+    """Session requests partagee entre threads (connexions keep-alive reutilisees)."""
+    global _session
+    with _verrou:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max(HOST_MAX_CONCURRENT, CKAN_PARALLEL))
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def _hote(url):
+    netloc = urlsplit(url).netloc
+    with _verrou:
+        h = _hotes.get(netloc)
+        if h is None:
+            h = _hotes[netloc] = _Hote(HOST_MAX_CONCURRENT)
+        return h
+
 
 def fetch_json(url, params=None, retries=None, delay=None, timeout=60):
-    """Fetch JSON avec retry et rate limiting."""
+    """Fetch JSON avec retry. delay: secondes minimum entre deux departs vers cet hote
+    (None: REQUEST_DELAY, 0: l'appelant gere son propre rythme)."""
     retries = retries or MAX_RETRIES
-    delay = delay or REQUEST_DELAY
+    delay = REQUEST_DELAY if delay is None else delay
+    hote = _hote(url)
 
     for attempt in range(retries):
+        hote.entrer(delay)
         try:
-            time.sleep(delay)
-            resp = requests.get(url, params=params, timeout=timeout)
+            resp = get_session().get(url, params=params, timeout=timeout)
             resp.raise_for_status()
             return resp.json()
         except requests.exceptions.RequestException as e:
             logger.warning(f"Attempt {attempt+1}/{retries} failed for {url}: {e}")
             if attempt == retries - 1:
                 raise
-            time.sleep(delay * (attempt + 1))
+        finally:
+            hote.sortir()
+        time.sleep((delay or REQUEST_DELAY) * (attempt + 1))
 
 
 def fetch_csv_url(url, timeout=120):
     """Telecharge un CSV directement et retourne le contenu texte."""
-    resp = requests.get(url, timeout=timeout)
-    resp.raise_for_status()
-    return resp.text
+    hote = _hote(url)
+    hote.entrer(REQUEST_DELAY)
+    try:
+        resp = get_session().get(url, timeout=timeout)
+        resp.raise_for_status()
+        return resp.text
+    finally:
+        hote.sortir()
 
 
-def ckan_datastore_fetch_all(base_url, resource_id, limit=32000):
-    """Fetch toutes les lignes d'un DataStore CKAN avec pagination."""
-    all_records = []
-    offset = 0
+def _datastore_page(base_url, resource_id, limit, offset):
+    # Tri par _id: offsets stables entre pages paralleles et entre deux imports (ajouts en fin)
+    params = {'resource_id': resource_id, 'limit': limit, 'offset': offset, 'sort': '_id'}
+    result = fetch_json(f"{base_url}/datastore_search", params).get('result', {})
+    return result.get('records', []), result.get('total')
+
+
+def ckan_datastore_pages(base_url, resource_id, limit=32000, paralleles=None, debut=0):
+    """
+    (offset, records) pour chaque page d'un DataStore CKAN, dans l'ordre, a partir de debut.
+    Les pages suivantes sont telechargees en parallele pendant que l'appelant traite la
+    courante; au plus `paralleles` pages en vol, donc memoire bornee (paralleles + 1 pages)
+    quelle que soit la taille du resource. Les erreurs HTTP sont relevees cote appelant.
+    """
+    paralleles = max(paralleles or CKAN_PARALLEL, 1)
+    records, total = _datastore_page(base_url, resource_id, limit, debut)
+    if not records:
+        return
+    vus = len(records)
+    logger.info(f"  Fetched {debut + vus}/{total if total is not None else '?'} records...")
+    yield debut, records
+    if len(records) < limit:
+        return
+
+    offset = debut + limit
+    fin = total if total is not None else offset
+    en_vol = deque()
+    with ThreadPoolExecutor(max_workers=paralleles, thread_name_prefix=f"ckan-{resource_id[:8]}") as pool:
+        try:
+            while offset < fin or en_vol:
+                while offset < fin and len(en_vol) < paralleles:
+                    en_vol.append((offset, pool.submit(_datastore_page, base_url, resource_id, limit, offset)))
+                    offset += limit
+                page_offset, fut = en_vol.popleft()
+                records, _ = fut.result()
+                if records:
+                    vus += len(records)
+                    logger.info(f"  Fetched {page_offset + len(records)}/{total} records...")
+                    yield page_offset, records
+                if len(records) < limit:
+                    # Fin reelle atteinte avant `total` (resource raccourci entre-temps)
+                    return
+        finally:
+            # Appelant arrete en cours de route (erreur, break): abandonner les pages en vol
+            for _, fut in en_vol:
+                fut.cancel()
+    # `total` a grossi pendant l'import (ou absent): continuer page par page
     while True:
-        url = f"{base_url}/datastore_search"
-        params = {'resource_id': resource_id, 'limit': limit, 'offset': offset}
-        data = fetch_json(url, params)
-        records = data.get('result', {}).get('records', [])
+        records, _ = _datastore_page(base_url, resource_id, limit, offset)
         if not records:
-            break
-        all_records.extend(records)
-        offset += limit
-        logger.info(f"  Fetched {len(all_records)} records so far...")
+            return
+        yield offset, records
         if len(records) < limit:
-            break
-    return all_records
+            return
+        offset += limit
+
+
+def ckan_datastore_records(base_url, resource_id, limit=32000, paralleles=None, debut=0):
+    """Records d'un DataStore CKAN un par un (voir ckan_datastore_pages)."""
+    for _, page in ckan_datastore_pages(base_url, resource_id, limit, paralleles, debut):
+        yield from page
+
+
+def ckan_datastore_fetch_all(base_url, resource_id, limit=32000):
+    """Fetch toutes les lignes d'un DataStore CKAN en memoire (petits resources)."""
+    return list(ckan_datastore_records(base_url, resource_id, limit))
+
+
+def ckan_dump_url(base_url, resource):
+    """URL du CSV complet d'un resource: le fichier publie s'il s'agit d'un CSV,
+    sinon l'export du DataStore (/datastore/dump/<id>)."""
+    url = resource.get('url') or ''
+    if url.lower().split('?')[0].endswith('.csv'):
+        return url
+    site = base_url.split('/api/')[0]
+    return f"{site}/datastore/dump/{resource['id']}"
+
+
+def csv_records(url, debut=0, timeout=300):
+    """
+    Lignes d'un CSV distant une par une (dict par ligne), sans charger le fichier:
+    reponse HTTP lue en flux, decodee (BOM, gzip) et parsee par le lecteur csv natif.
+    Champs vides -> None, comme les records du DataStore; debut: lignes a sauter.
+    La connexion reste occupee (et comptee dans la politesse de l'hote) jusqu'a la
+    fin de la lecture ou la fermeture du generateur.
+    """
+    hote = _hote(url)
+    hote.entrer(REQUEST_DELAY)
+    try:
+        with get_session().get(url, stream=True, timeout=timeout) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            resp.raw.auto_close = False     # sinon TextIOWrapper voit le flux ferme a la fin du corps
+            # Donnees ouvertes QC/MTL: UTF-8 (BOM frequent); text/csv sans charset serait
+            # annonce ISO-8859-1 par requests, donc l'encodage de la reponse est ignore
+            texte = io.TextIOWrapper(resp.raw, encoding='utf-8-sig', errors='replace', newline='')
+            lecteur = csv.reader(texte)
+            entetes = next(lecteur, None)
+            if not entetes:
+                return
+            entetes = [e.strip() for e in entetes]
+            n = 0
+            for ligne in lecteur:
+                if not ligne:
+                    continue
+                n += 1
+                if n <= debut:
+                    continue
+                yield {k: (v if v != '' else None) for k, v in zip(entetes, ligne)}
+                if n % 100000 == 0:
+                    logger.info(f"  Read {n} CSV rows...")
+    finally:
+        hote.sortir()
+
+
+def ckan_resource_records(base_url, resource, debut=0, mode=None):
+    """Records d'un resource selon le mode d'ingestion: 'datastore' (pages JSON paralleles)
+    ou 'csv' (fichier complet en flux). Memes cles dans les deux cas; valeurs en texte
+    pour le CSV, d'ou les conversions _safe_* des modules."""
+    if (mode or CKAN_INGEST_MODE) == 'csv':
+        return csv_records(ckan_dump_url(base_url, resource), debut=debut)
+    return ckan_datastore_records(base_url, resource['id'], debut=debut)
 
 
 def ckan_get_resources(base_url, dataset_slug):
@@ -59,3 +252,140 @@ def ckan_get_resources(base_url, dataset_slug):
     data = fetch_json(url, params={'id': dataset_slug})
     resources = data.get('result', {}).get('resources', [])
     return resources
+
+
+# ═══════════════════════════════════════════════════════════
+# EMPREINTES DE RESOURCES (imports conditionnels)
+# ═══════════════════════════════════════════════════════════
+
+FINGERPRINT_KEYS = ('hash', 'etag', 'last_modified', 'size', 'rows')
+
+
+def ckan_resource_show(base_url, resource_id):
+    """Metadonnees d'un resource CKAN (last_modified, size, hash, url...)."""
+    return fetch_json(f"{base_url}/resource_show", params={'id': resource_id}).get('result', {})
+
+
+def ckan_fingerprint(base_url, resource):
+    """
+    Empreinte d'un resource DataStore a partir de package_show/resource_show,
+    plus le nombre de lignes (datastore_search limit=0, une requete legere).
+    """
+    fp = {
+        'resource_id': resource.get('id'),
+        'last_modified': resource.get('last_modified') or resource.get('metadata_modified'),
+        'size': resource.get('size'),
+        'hash': resource.get('hash') or None,
+    }
+    try:
+        data = fetch_json(f"{base_url}/datastore_search",
+                          params={'resource_id': resource['id'], 'limit': 0})
+        fp['rows'] = data.get('result', {}).get('total')
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"  No DataStore row count for {resource.get('id')}: {e}")
+    return fp
+
+
+def fetch_if_changed(url, previous=None, timeout=120):
+    """
+    GET conditionnel d'un fichier (CSV S3, page HTML...) -> (contenu bytes | None, empreinte).
+    If-None-Match / If-Modified-Since depuis l'empreinte precedente; 304, ou meme sha256
+    que la derniere fois (serveur sans validateurs), -> contenu None: rien a importer.
+    """
+    previous = previous or {}
+    headers = {}
+    if previous.get('etag'):
+        headers['If-None-Match'] = previous['etag']
+    if previous.get('last_modified'):
+        headers['If-Modified-Since'] = previous['last_modified']
+    hote = _hote(url)
+    hote.entrer(REQUEST_DELAY)
+    try:
+        resp = get_session().get(url, headers=headers, timeout=timeout)
+        if resp.status_code == 304:
+            return None, previous
+        resp.raise_for_status()
+        content = resp.content
+    finally:
+        hote.sortir()
+    fp = {
+        'url': url,
+        'etag': resp.headers.get('ETag'),
+        'last_modified': resp.headers.get('Last-Modified'),
+        'size': len(content),
+        'hash': hashlib.sha256(content).hexdigest(),
+    }
+    if previous.get('hash') == fp['hash']:
+        return None, fp
+    return content, fp
+
+
+def fingerprint_unchanged(previous, current):
+    """Vrai si toutes les cles connues des deux cotes sont egales (au moins une)."""
+    if not previous or not current:
+        return False
+    communes = [k for k in FINGERPRINT_KEYS
+                if previous.get(k) is not None and current.get(k) is not None]
+    return bool(communes) and all(previous[k] == current[k] for k in communes)
+
+
+def import_plan(previous, current, append_only=False):
+    """
+    Que faire d'un resource d'apres ses empreintes -> (action, offset):
+      ('skip', 0)      inchange depuis le dernier import reussi
+      ('append', n)    resource en ajout seul qui a grossi: importer a partir de la ligne n
+      ('full', 0)      premier import ou modification: tout recharger (remplacement)
+    """
+    if fingerprint_unchanged(previous, current):
+        return 'skip', 0
+    if (append_only and previous and previous.get('rows') is not None
+            and current.get('rows') is not None and current['rows'] > previous['rows']):
+        return 'append', previous['rows']
+    return 'full', 0
+
+
+class Reprise:
+    """
+    Points de reprise des imports pagines (fichier JSON, ecriture atomique).
+    cle -> {'offset', 'maj'}: offset = premiere ligne pas encore committee.
+    A noter seulement apres le commit des lignes precedentes.
+    """
+
+    def __init__(self, chemin=None):
+        self.chemin = chemin or CKAN_RESUME_FILE
+        self._verrou = threading.Lock()
+
+    def _lire(self):
+        try:
+            with open(self.chemin) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _ecrire(self, etat):
+        os.makedirs(os.path.dirname(self.chemin), exist_ok=True)
+        tmp = f"{self.chemin}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(etat, f, indent=2)
+        os.replace(tmp, self.chemin)
+
+    def offset(self, cle):
+        """Offset de reprise (0 si aucun import en cours pour cette cle)."""
+        with self._verrou:
+            return self._lire().get(cle, {}).get('offset', 0)
+
+    def en_cours(self, cle):
+        with self._verrou:
+            return cle in self._lire()
+
+    def noter(self, cle, offset):
+        with self._verrou:
+            etat = self._lire()
+            etat[cle] = {'offset': offset, 'maj': datetime.now().isoformat()}
+            self._ecrire(etat)
+
+    def terminer(self, cle):
+        with self._verrou:
+            etat = self._lire()
+            if etat.pop(cle, None) is not None:
+                self._ecrire(etat)
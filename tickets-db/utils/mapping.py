@@ -0,0 +1,385 @@
+"""
+Correspondances declaratives source -> colonnes, compilees en transformateurs de lignes.
+Chaque source decrit ses colonnes une fois:
+
+    CONSTATS = compile_mapping({
+        'columns': [
+            # (colonne, cles source par ordre de preference, type[, defaut])
+            ('annee_donnees', ('ANNEE', 'annee'), 'int'),
+            ('description_infraction', ('DESCRIPTION_INFRACTION', 'description_infraction'), 'text'),
+            ('nombre_deces', 'NB_MORTS', 'int', 0),
+            ('actif', None, 'raw', True),                     # constante
+            ('source_resource_id', '$resource_id', 'raw'),    # $nom: parametre de l'appel
+        ],
+        'raw': ('raw_data', 'all'),     # colonne + politique all | nonempty (absent: pas de raw)
+    })
+    rows = CONSTATS.rows(records, resource_id=rid)    # generateur de tuples, ordre CONSTATS.columns
+
+Compilation: convertisseurs resolus une fois. Par lot de BATCH records, les alias sont
+resolus contre les cles du premier record (en-tete CSV, champs DataStore: memes cles pour
+tout le lot). Pour chaque plan de cles ainsi resolu, une fonction de lot est generee: une
+comprehension qui construit chaque tuple d'un coup, conversions du cas courant ecrites en
+ligne (r['NB'].strip() or '', int(r['AN'])...), sans sonder les alias ni transposer le lot.
+Une valeur hors du cas courant (nombre dans une colonne texte, entier illisible, cle
+absente) leve une exception: le lot est alors converti colonne par colonne (extraction
+itemgetter puis conversion d'un bloc, exacte pour toute valeur) et le plan y reste.
+
+Types: raw (valeur telle quelle), text (vide -> None), strip (texte nettoye, vide -> None),
+int, float (virgule decimale acceptee), date, time, flag (O/N -> bool), ou une fonction
+valeur -> valeur. Valeur illisible -> None. Le defaut remplace None apres conversion
+(colonne non nulle).
+"""
+import json
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+
+BATCH = 5000
+
+_NULS = (None, '', 'null')
+
+
+def _raw(v):
+    return v
+
+
+def _text(v):
+    return None if v == '' else v
+
+
+def _strip(v):
+    if v is None:
+        return None
+    return str(v).strip() or None
+
+
+def _int(v):
+    if v in _NULS:
+        return None
+    try:
+        return int(v)
+    except (ValueError, TypeError):
+        pass
+    try:
+        return int(float(str(v).strip().replace(',', '.')))
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _float(v):
+    if v in _NULS:
+        return None
+    try:
+        return float(v)
+    except (ValueError, TypeError):
+        pass
+    try:
+        return float(str(v).strip().replace(',', '.'))
+    except (ValueError, TypeError):
+        return None
+
+
+@lru_cache(maxsize=8192)
+def _date(v):
+    if v in _NULS:
+        return None
+    if isinstance(v, datetime):
+        return v.date()
+    if isinstance(v, date):
+        return v
+    s = str(v).strip()[:10]
+    try:
+        # Cas courant (ISO) sans passer par strptime
+        return date.fromisoformat(s)
+    except ValueError:
+        pass
+    for fmt in ('%d/%m/%Y', '%Y%m%d'):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=8192)
+def _time(v):
+    if v in _NULS:
+        return None
+    s = str(v).strip()
+    try:
+        if ':' in s:
+            h, m = s.split(':')[:2]
+            return f"{int(h):02d}:{int(m):02d}:00"
+        if len(s) == 4 and s.isdigit():
+            return f"{s[:2]}:{s[2:]}:00"
+    except ValueError:
+        pass
+    return None
+
+
+def _flag(v):
+    return v is not None and str(v).strip() == 'O'
+
+
+TYPES = {
+    'raw': _raw,
+    'text': _text,
+    'strip': _strip,
+    'int': _int,
+    'float': _float,
+    'date': _date,
+    'time': _time,
+    'flag': _flag,
+}
+
+
+# Conversion d'une colonne entiere: le cas courant (texte deja propre) reste dans des
+# comprehensions / map sans appel de fonction Python par valeur; le reste passe par
+# le convertisseur valeur par valeur ci-dessus. date/time: peu de valeurs distinctes
+# (jours, minutes) -> lru_cache.
+
+def _raw_col(values):
+    return values
+
+
+def _text_col(values):
+    return [None if v == '' else v for v in values]
+
+
+def _strip_col(values):
+    try:
+        out = list(map(str.strip, values))
+    except TypeError:           # None / nombres (DataStore)
+        return [_strip(v) for v in values]
+    if '' in out:
+        out = [v or None for v in out]
+    return out
+
+
+def _int_col(values):
+    try:
+        return list(map(int, values))
+    except (ValueError, TypeError):
+        return [int(v) if v.__class__ is str and v.isdecimal() else _int(v) for v in values]
+
+
+def _float_col(values):
+    try:
+        return list(map(float, values))
+    except (ValueError, TypeError):
+        return [_float(v) for v in values]
+
+
+def _cached_col(conv):
+    def col(values):
+        try:
+            return list(map(conv, values))
+        except TypeError:       # valeur non hashable
+            return [conv.__wrapped__(v) for v in values]
+    return col
+
+
+_OUI_NON = frozenset(('O', 'N'))
+
+
+def _flag_col(values):
+    if _OUI_NON.issuperset(values):
+        return list(map('O'.__eq__, values))
+    return [_flag(v) for v in values]
+
+
+COLUMN_TYPES = {
+    'raw': _raw_col,
+    'text': _text_col,
+    'strip': _strip_col,
+    'int': _int_col,
+    'float': _float_col,
+    'date': _cached_col(_date),
+    'time': _cached_col(_time),
+    'flag': _flag_col,
+}
+
+
+# Encodeurs construits une fois (json.dumps avec options en recree un a chaque appel)
+_JSON = json.JSONEncoder(ensure_ascii=False, default=str)
+
+
+def _json_all(r):
+    return _JSON.encode(r)
+
+
+def _json_nonempty(r):
+    return _JSON.encode({k: v for k, v in r.items() if v})
+
+
+RAW_POLICIES = {
+    'all': _json_all,
+    'nonempty': _json_nonempty,
+}
+
+
+def _sinon(v, defaut):
+    return defaut if v is None else v
+
+
+# Erreurs du cas courant dans une fonction de lot generee -> conversion par colonnes
+_HORS_CAS_COURANT = (KeyError, AttributeError, TypeError, ValueError, OverflowError)
+
+
+def _expression(kind, cle, var, defaut):
+    """Expression Python d'une colonne pour le record r (texte ou None: champ vide d'un CSV
+    lu par csv_records), meme resultat que le convertisseur de colonne ou une exception. var: variable locale
+    de la valeur (une seule lecture du record); defaut: nom de la variable du defaut
+    (None: pas de defaut)."""
+    v = f"r[{cle!r}]"
+    lu = f"({var} := {v})"
+    d = defaut or 'None'
+    if kind == 'raw':
+        return v if defaut is None else f"({d} if {lu} is None else {var})"
+    if kind == 'text':
+        return (f"({d} if {lu} == '' or {var} is None else {var})" if defaut
+                else f"(None if {lu} == '' else {var})")
+    if kind == 'strip':
+        return f"({d} if {lu} is None else {var}.strip() or {d})"
+    if kind == 'int':
+        return f"({d} if {lu} is None or {var} == '' else int({var}))"
+    if kind == 'flag':
+        return f"({lu} == 'O' or ({var} != 'N' and _flag({var})))"
+    conv = {'float': '_float', 'date': '_date', 'time': '_time'}[kind]
+    return f"{conv}({v})" if defaut is None else f"_sinon({conv}({v}), {d})"
+
+
+class RowMapper:
+    """Transformateur compile d'une correspondance (voir compile_mapping)."""
+
+    def __init__(self, spec):
+        self._specs = []
+        self._kinds = []
+        for entry in spec['columns']:
+            column, keys, kind = entry[:3]
+            default = entry[3] if len(entry) > 3 else None
+            if keys is None:
+                keys = ()
+            elif isinstance(keys, str):
+                keys = (keys,)
+            if callable(kind):
+                conv, col_conv = kind, (lambda values, f=kind: list(map(f, values)))
+            else:
+                conv, col_conv = TYPES[kind], COLUMN_TYPES[kind]
+            self._specs.append((column, tuple(keys), conv, col_conv, default))
+            self._kinds.append(kind)
+        self._raw = None
+        self._lots = {}         # plan -> fonction de lot generee (None: conversion par colonnes)
+        self.columns = [s[0] for s in self._specs]
+        # Champs sources repris dans des colonnes typees (tous les alias): ce que la
+        # compaction de raw_data peut retirer de la table chaude (archive_raw_data.py)
+        self.source_keys = frozenset(k for s in self._specs for k in s[1] if not k.startswith('$'))
+        if spec.get('raw'):
+            raw_column, policy = spec['raw']
+            self._raw = RAW_POLICIES[policy]
+            self.columns.append(raw_column)
+
+    def _resolve(self, first):
+        """Cle source de chaque colonne pour un lot: ('key', k) | ('param', nom) | None."""
+        plan = []
+        for _, keys, _, _, _ in self._specs:
+            source = None
+            for key in keys:
+                if key.startswith('$'):
+                    source = ('param', key[1:])
+                    break
+                if key in first:
+                    source = ('key', key)
+                    break
+            plan.append(source)
+        return plan
+
+    def _generer(self, plan):
+        """Fonction de lot (records, *constantes) -> [tuples] pour un plan de cles."""
+        env = {'_sinon': _sinon, '_flag': _flag, '_float': _float, '_date': _date, '_time': _time,
+               '_raw': self._raw}
+        args = []
+        exprs = []
+        for i, ((_, _, conv, _, default), kind, src) in enumerate(zip(self._specs, self._kinds, plan)):
+            if src is None or src[0] == 'param':
+                args.append(f"c{i}")
+                exprs.append(f"c{i}")
+                continue
+            if default is not None:
+                env[f"d{i}"] = default
+            if callable(kind):
+                env[f"f{i}"] = kind
+                v = f"f{i}(r[{src[1]!r}])"
+                exprs.append(v if default is None else f"_sinon({v}, d{i})")
+            else:
+                exprs.append(_expression(kind, src[1], f"v{i}", f"d{i}" if default is not None else None))
+        if self._raw is not None:
+            exprs.append("_raw(r)")
+        source = (f"def _lot(records, {', '.join(args)}):\n"
+                  f"    return [({', '.join(exprs)},) for r in records]\n")
+        exec(compile(source, f"<mapping {', '.join(self.columns[:3])}...>", 'exec'), env)
+        return env['_lot']
+
+    def _extract(self, records, keys):
+        """Colonnes brutes des cles, en une passe (itemgetter + transposition)."""
+        if not keys:
+            return []
+        try:
+            if len(keys) == 1:
+                return [list(map(itemgetter(keys[0]), records))]
+            return list(zip(*map(itemgetter(*keys), records)))
+        except KeyError:
+            # Records heterogenes (rare): cle absente -> None
+            return [[r.get(k) for r in records] for k in keys]
+
+    def batch(self, records, **params):
+        """Liste de records -> liste de tuples (ordre self.columns)."""
+        if not records:
+            return []
+        n = len(records)
+        plan = tuple(self._resolve(records[0]))
+        if plan not in self._lots:
+            self._lots[plan] = self._generer(plan)
+        lot = self._lots[plan]
+        if lot is not None:
+            constantes = []
+            for (_, _, conv, _, default), src in zip(self._specs, plan):
+                if src is None or src[0] == 'param':
+                    value = conv(params[src[1]] if src else None)
+                    constantes.append(default if value is None else value)
+            try:
+                return lot(records, *constantes)
+            except _HORS_CAS_COURANT:
+                # Valeur hors du cas courant: ce plan passe desormais par les colonnes
+                self._lots[plan] = None
+        keys = [src[1] for src in plan if src is not None and src[0] == 'key']
+        extracted = iter(self._extract(records, keys))
+        cols = []
+        for (_, _, conv, col_conv, default), src in zip(self._specs, plan):
+            if src is None or src[0] == 'param':
+                # Constante du lot: cle absente (conv(None)) ou parametre de l'appel
+                value = conv(params[src[1]] if src else None)
+                values = [default if value is None else value] * n
+            else:
+                values = col_conv(next(extracted))
+                if default is not None and None in values:
+                    values = [default if v is None else v for v in values]
+            cols.append(values)
+        if self._raw is not None:
+            cols.append(list(map(self._raw, records)))
+        return list(zip(*cols))
+
+    def rows(self, records, **params):
+        """Tuples un par un depuis un iterable de records (generateur, lots de BATCH)."""
+        records = iter(records)
+        while True:
+            lot = list(islice(records, BATCH))
+            if not lot:
+                return
+            yield from self.batch(lot, **params)
+
+
+def compile_mapping(spec):
+    """Compile une correspondance declarative -> RowMapper (.columns, .batch(), .rows())."""
+    return RowMapper(spec)
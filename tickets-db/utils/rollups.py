@@ -0,0 +1,94 @@
+"""
+Agregats quotidiens des constats d'infraction, tenus a jour par les imports.
+
+    qc_constats_jour            (annee_donnees, lieu_infraction, date_infraction) -> nb, nb_agents
+    qc_constats_jour_article    (annee_donnees, lieu_infraction, date_infraction, article) -> nb
+    qc_constats_semaine_heure   (annee_donnees, lieu_infraction, jour_semaine, heure) -> nb
+
+Les detecteurs (blitz_daily, pattern_jour_semaine), ErreursAdmin (meme lieu / meme jour)
+et /api/day-patterns lisent ces tables (quelques milliers de lignes) au lieu de recompter
+les constats. Constats sans date exclus; lieu inconnu -> ''; heure inconnue -> NULL.
+
+Rafraichissement par annee de donnees (= une partition de qc_constats_infraction):
+les lignes de l'annee sont recalculees depuis sa seule partition, dans une transaction
+(les lecteurs voient l'ancien agregat ou le nouveau). Appele apres chaque chargement:
+
+    jours, echecs = refresh_constats_rollups([2021])   # annees chargees / modifiees
+    jours, echecs = refresh_constats_rollups()         # toutes les annees (reconstruction)
+"""
+import logging
+
+from utils.db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# table -> (colonnes agregees, expressions SELECT, GROUP BY)
+ROLLUPS = {
+    'qc_constats_jour': (
+        'annee_donnees, lieu_infraction, date_infraction, nb, nb_agents',
+        "annee_donnees, COALESCE(lieu_infraction, ''), date_infraction, COUNT(*), "
+        "COUNT(DISTINCT raw_data->>'IDENT_INTRT')",
+        '1, 2, 3',
+    ),
+    'qc_constats_jour_article': (
+        'annee_donnees, lieu_infraction, date_infraction, article, nb',
+        "annee_donnees, COALESCE(lieu_infraction, ''), date_infraction, COALESCE(article, ''), COUNT(*)",
+        '1, 2, 3, 4',
+    ),
+    'qc_constats_semaine_heure': (
+        'annee_donnees, lieu_infraction, jour_semaine, heure, nb',
+        "annee_donnees, COALESCE(lieu_infraction, ''), EXTRACT(DOW FROM date_infraction)::smallint, "
+        "EXTRACT(HOUR FROM heure_infraction)::smallint, COUNT(*)",
+        '1, 2, 3, 4',
+    ),
+}
+
+
+def _filtre(annee):
+    # IS NULL: seule la partition DEFAULT est lue (= %s ne trouverait rien)
+    if annee is None:
+        return 'annee_donnees IS NULL', ()
+    return 'annee_donnees = %s', (annee,)
+
+
+def refresh_constats_rollups(years=None):
+    """Recalcule les agregats des annees donnees (None: toutes les annees en base).
+    Une transaction par annee: une annee en erreur est annulee (ses agregats restent
+    ceux d'avant), les suivantes sont quand meme recalculees.
+    Retourne ({annee: nb de jours x lieu}, [annees en erreur])."""
+    conn = get_connection()
+    resultat = {}
+    echecs = []
+    try:
+        if years is None:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT DISTINCT annee_donnees FROM qc_constats_infraction")
+                    years = [r[0] for r in cur.fetchall()]
+                    # Annees disparues de la table source
+                    cur.execute("SELECT DISTINCT annee_donnees FROM qc_constats_jour")
+                    years += [r[0] for r in cur.fetchall() if r[0] not in years]
+        for annee in years:
+            where, params = _filtre(annee)
+            try:
+                with conn:
+                    with conn.cursor() as cur:
+                        for table, (colonnes, select, group_by) in ROLLUPS.items():
+                            cur.execute(f"DELETE FROM {table} WHERE {where}", params)
+                            cur.execute(f"""
+                                INSERT INTO {table} ({colonnes})
+                                SELECT {select} FROM qc_constats_infraction
+                                WHERE {where} AND date_infraction IS NOT NULL
+                                GROUP BY {group_by}
+                            """, params)
+                            if table == 'qc_constats_jour':
+                                jours = cur.rowcount
+            except Exception as e:
+                logger.error(f"Erreur rafraichissement agregats constats {annee}: {e}")
+                echecs.append(annee)
+                continue
+            resultat[annee] = jours
+            logger.info(f"  Agregats constats {annee}: {jours} jours x lieu")
+    finally:
+        conn.close()
+    return resultat, echecs
@@ -0,0 +1,131 @@
+"""
+Ordonnanceur des modules d'import (main.py).
+Chaque module declare SCHEDULE = {'after': [...], 'hosts': [...], 'tables': [...]}:
+  - after: modules a terminer avant lui (ignores s'ils ne sont pas selectionnes)
+  - hosts: hotes distants (URL ou nom d'hote) — un seul module a la fois par hote,
+    les limites propres a chaque API (quota CanLII, delais A2AJ) restent donc valables
+  - tables: tables ecrites — un seul module ecrivain a la fois par table
+Les modules prets sans ressource en commun tournent en parallele (IMPORT_PARALLEL
+threads), pris dans l'ordre de declaration: avec un seul thread, l'ordre historique
+de main.py est conserve. Un module en erreur fait sauter ceux qui en dependent.
+
+    rapport = run_modules([{'name': 'ckan_quebec', 'label': '...', 'run': run_qc, **SCHEDULE}, ...])
+    log_summary(rapport)
+"""
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+from config import IMPORT_PARALLEL
+
+logger = logging.getLogger(__name__)
+
+
+def _resources(task):
+    """Ressources exclusives d'un module: ('host', netloc) et ('table', nom)."""
+    hosts = {('host', urlsplit(h).netloc if '://' in h else h) for h in task.get('hosts', ())}
+    tables = {('table', t) for t in task.get('tables', ())}
+    return hosts | tables
+
+
+def _count(result):
+    """Nombre de records d'un run(): int, ou somme des valeurs d'un dict de resultats."""
+    if isinstance(result, dict):
+        return sum(v for v in result.values() if isinstance(v, int) and not isinstance(v, bool))
+    if isinstance(result, int) and not isinstance(result, bool):
+        return result
+    return None
+
+
+def _execute(task, t0):
+    # Nom du thread = module: les lignes de log des modules paralleles restent lisibles
+    threading.current_thread().name = task['name']
+    start = time.perf_counter()
+    if task.get('label'):
+        logger.info(task['label'])
+    try:
+        result = task['run']()
+        status, error = 'ok', None
+    except Exception as e:
+        logger.error(f"Module {task['name']} en erreur: {e}\n{traceback.format_exc()}")
+        result, status, error = None, 'error', str(e)
+    end = time.perf_counter()
+    return {'status': status, 'records': _count(result), 'start': start - t0,
+            'duration': end - start, 'error': error}
+
+
+def run_modules(tasks, workers=None):
+    """
+    Execute les modules selon leurs dependances et ressources.
+    tasks: [{'name', 'label', 'run', 'after', 'hosts', 'tables'}] dans l'ordre de declaration.
+    Retourne le rapport, dans le meme ordre: [{'name', 'status' (ok|error|skipped),
+    'records', 'start', 'duration', 'error'}] — start: secondes depuis le debut.
+    """
+    workers = max(workers or IMPORT_PARALLEL, 1)
+    names = {t['name'] for t in tasks}
+    after = {t['name']: [d for d in t.get('after', ()) if d in names] for t in tasks}
+    resources = {t['name']: _resources(t) for t in tasks}
+
+    report = {}
+    pending = list(tasks)
+    running = {}
+    held = set()
+    t0 = time.perf_counter()
+
+    def skip(task, reason):
+        pending.remove(task)
+        report[task['name']] = {'status': 'skipped', 'records': None, 'start': None,
+                                'duration': 0.0, 'error': reason}
+        logger.warning(f"Module {task['name']} saute: {reason}")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import') as pool:
+        while pending or running:
+            for task in list(pending):
+                if len(running) >= workers:
+                    break
+                deps = [report.get(d) for d in after[task['name']]]
+                failed = [d for d, r in zip(after[task['name']], deps) if r and r['status'] != 'ok']
+                if failed:
+                    skip(task, f"dependance en echec: {', '.join(failed)}")
+                    continue
+                if any(r is None for r in deps) or resources[task['name']] & held:
+                    continue
+                pending.remove(task)
+                held |= resources[task['name']]
+                running[pool.submit(_execute, task, t0)] = task
+            if not running:
+                # Rien en cours et rien de pret: dependances circulaires
+                for task in list(pending):
+                    skip(task, 'dependance circulaire')
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                task = running.pop(fut)
+                held -= resources[task['name']]
+                report[task['name']] = fut.result()
+
+    return [dict(report[t['name']], name=t['name']) for t in tasks]
+
+
+def log_summary(report):
+    """Tableau de fin d'import: statut, debut, duree et records par module."""
+    logger.info("=" * 60)
+    logger.info("RESUME DES MODULES")
+    logger.info("=" * 60)
+    logger.info(f"  {'module':<22} {'statut':<8} {'debut':>8} {'duree':>9} {'records':>10}")
+    for r in report:
+        start = f"+{r['start']:.1f}s" if r['start'] is not None else '-'
+        records = f"{r['records']:,}" if r['records'] is not None else '-'
+        line = f"  {r['name']:<22} {r['status']:<8} {start:>8} {r['duration']:>8.1f}s {records:>10}"
+        if r['error']:
+            line += f"  {r['error'][:80]}"
+        logger.info(line)
+    ran = [r for r in report if r['start'] is not None]
+    if ran:
+        wall = max(r['start'] + r['duration'] for r in ran)
+        total = sum(r['duration'] for r in ran)
+        logger.info(f"  Duree totale {wall:.1f}s (somme des modules {total:.1f}s, "
+                    f"gain du parallelisme {total / wall if wall else 1:.1f}x)")